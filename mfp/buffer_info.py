@@ -1,3 +1,9 @@
+import mmap
+import os
+
+import numpy
+from posix_ipc import SharedMemory
+
 
 class BufferInfo(object):
     def __init__(self, buf_id, size, channels, rate, offset=0):
@@ -11,3 +17,49 @@ class BufferInfo(object):
         return "<buf_id=%s, channels=%d, size=%d, rate=%d>" % (self.buf_id, self.channels, self.size, self.rate)
 
 
+class BufferMap(object):
+    '''
+    The POSIX shared memory segment of a buffer~, mapped once, with a
+    numpy array per channel that views it in place. The views see
+    whatever the DSP side writes, and are read-only unless the map was
+    made writable.
+
+    A new segment (the buffer~ was resized) needs a new BufferMap.
+    Views handed out of an old one stay valid until they're dropped.
+    '''
+    FLOAT_SIZE = 4
+
+    def __init__(self, buf_id, size, channels, writable=False):
+        self.buf_id = buf_id
+        self.size = size
+        self.writable = writable
+
+        shm = SharedMemory(buf_id)
+        try:
+            # touching a page past the end of the segment would be SIGBUS
+            if os.fstat(shm.fd).st_size < size * channels * self.FLOAT_SIZE:
+                raise ValueError("buffer %s is smaller than %d x %d" % (buf_id, channels, size))
+            self.mmap = mmap.mmap(
+                shm.fd, size * channels * self.FLOAT_SIZE,
+                access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ
+            )
+        finally:
+            shm.close_fd()
+
+        self.channels = [
+            numpy.frombuffer(self.mmap, dtype=numpy.float32, count=size,
+                             offset=c * size * self.FLOAT_SIZE)
+            for c in range(channels)
+        ]
+
+    @classmethod
+    def from_info(cls, info, writable=False):
+        return cls(info.buf_id, info.size, info.channels, writable)
+
+    def close(self):
+        self.channels = []
+        try:
+            self.mmap.close()
+        except BufferError:
+            # someone still holds a view; the mapping goes when they do
+            pass
@@ -58,6 +58,8 @@ def register():
     plugin.register()
     from . import loadbang
     loadbang.register()
+    from . import switch
+    switch.register()
     from . import oscutils
     oscutils.register()
     from . import delay
@@ -84,6 +86,8 @@ def register():
     vcfreq.register()
     from . import hold
     hold.register()
+    from . import diskplay
+    diskplay.register()
     from . import replay
     replay.register()
     from . import breakpoint
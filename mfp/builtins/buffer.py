@@ -5,15 +5,12 @@ p_buffer.py:  Builtin POSIX shared memory buffer
 Copyright (c) 2011 Bill Gribble <grib@billgribble.com>
 '''
 
-import numpy
-import os
 from mfp import Bang
 from mfp import log
 
 from mfp.processor import Processor
 from ..mfp_app import MFPApp
-from posix_ipc import SharedMemory
-from ..buffer_info import BufferInfo
+from ..buffer_info import BufferInfo, BufferMap
 
 
 class Buffer(Processor):
@@ -31,7 +28,8 @@ class Buffer(Processor):
 
     doc_tooltip_obj = "Capture a signal to a shared buffer"
     doc_tooltip_inlet = ["Signal input/control messages"]
-    doc_tooltip_outlet = ["Signal output", "Array output (for @slice)",
+    doc_tooltip_outlet = ["Signal output",
+                          "Array output (for @slice and @views, list or numpy array)",
                           "BufferInfo and status output"]
 
     def __init__(self, init_type, init_args, patch, scope, name):
@@ -53,7 +51,13 @@ class Buffer(Processor):
         self.rate = None
         self.buf_offset = 0
 
-        self.shm_obj = None
+        # mapped when first needed, see BufferMap
+        self.buf_map = None
+        self.buf_map_rw = None
+
+        # with arrays=True, @slice outputs a numpy view of the shared
+        # buffer instead of a list copied out of it
+        self.output_arrays = bool(kwargs.get("arrays", False))
 
         self.dsp_inlets = list(range(self.init_channels))
         self.dsp_outlets = list(range(self.init_channels))
@@ -68,9 +72,7 @@ class Buffer(Processor):
         if resp_id in (self.RESP_TRIGGERED, self.RESP_LOOPSTART):
             self.outlets[2] = resp_value
         elif resp_id == self.RESP_BUFID:
-            if self.shm_obj:
-                self.shm_obj.close_fd()
-                self.shm_obj = None
+            self.unmap()
             self.buf_id = resp_value
         elif resp_id == self.RESP_BUFSIZE:
             self.size = resp_value
@@ -94,15 +96,35 @@ class Buffer(Processor):
             await self.dsp_obj.setparam("rec_enabled", 0)
         elif isinstance(incoming, dict):
             for k, v in incoming.items():
+                if k == "arrays":
+                    self.output_arrays = bool(v)
+                    continue
                 if k == "size":
                     v = v*MFPApp().samplerate/1000.0
                 setattr(self, k, v)
                 await self.dsp_obj.setparam(k, v)
 
-    def slice(self, start, end, channel=0):
-        if self.shm_obj is None:
-            self.shm_obj = SharedMemory(self.buf_id)
+    def unmap(self):
+        for buf_map in (self.buf_map, self.buf_map_rw):
+            if buf_map is not None:
+                buf_map.close()
+        self.buf_map = None
+        self.buf_map_rw = None
+
+    def channel_views(self, writable=False):
+        """
+        A numpy array per channel, viewing the shared buffer in place
+        """
+        if writable:
+            if self.buf_map_rw is None:
+                self.buf_map_rw = BufferMap(self.buf_id, self.size, self.channels, True)
+            return self.buf_map_rw.channels
+
+        if self.buf_map is None:
+            self.buf_map = BufferMap(self.buf_id, self.size, self.channels)
+        return self.buf_map.channels
 
+    def slice(self, start, end, channel=0):
         if start < 0:
             start = 0
         if start >= self.size:
@@ -114,9 +136,11 @@ class Buffer(Processor):
             end = self.size-1
 
         try:
-            os.lseek(self.shm_obj.fd, self.offset(channel, start), os.SEEK_SET)
-            slc = os.read(self.shm_obj.fd, (end - start) * self.FLOAT_SIZE)
-            self.outlets[1] = list(numpy.fromstring(slc, dtype=numpy.float32))
+            view = self.channel_views()[channel][start:end]
+            if self.output_arrays:
+                self.outlets[1] = view
+            else:
+                self.outlets[1] = view.tolist()
         except Exception as e:
             import traceback
             tb = traceback.format_exc()
@@ -124,6 +148,16 @@ class Buffer(Processor):
             self.error(tb)
             return None
 
+    def views(self, writable=False):
+        try:
+            self.outlets[1] = self.channel_views(writable)
+        except Exception as e:
+            import traceback
+            tb = traceback.format_exc()
+            log.debug("buffer~: views error '%s" % e)
+            self.error(tb)
+            return None
+
     def bufinfo(self):
         self.outlets[2] = BufferInfo(self.buf_id, self.size, self.channels, self.rate,
                                      self.buf_offset)
@@ -0,0 +1,99 @@
+#! /usr/bin/env python
+'''
+diskplay.py: Stream a sound file from disk
+
+Copyright (c) 2020 Bill Gribble <grib@billgribble.com>
+'''
+
+from mfp import Bang
+
+from ..processor import Processor
+from ..mfp_app import MFPApp
+from .file import EOF
+
+
+class DiskPlay(Processor):
+    RESP_OPENED = 0
+    RESP_CHANNELS = 1
+    RESP_FRAMES = 2
+    RESP_RATE = 3
+    RESP_EOF = 4
+    RESP_UNDERRUNS = 5
+    RESP_ERROR = 6
+
+    doc_tooltip_obj = "Play a sound file, streaming it from disk"
+    doc_tooltip_inlet = ["Filename to open, True/False to play/stop, Bang to play from "
+                         "the start, number to seek (ms)"]
+
+    def __init__(self, init_type, init_args, patch, scope, name):
+        initargs, kwargs = patch.parse_args(init_args)
+
+        self.filename = None
+        self.init_channels = 1
+        if len(initargs):
+            self.filename = initargs[0]
+        if len(initargs) > 1:
+            self.init_channels = initargs[1]
+
+        # ms of the file read ahead of the play position
+        self.init_prefetch = kwargs.get("prefetch", 1000)
+        self.init_loop = bool(kwargs.get("loop", False))
+
+        Processor.__init__(self, 1, self.init_channels+1, init_type, init_args,
+                           patch, scope, name)
+
+        self.doc_tooltip_outlet = (
+            ["Signal output"] * self.init_channels
+            + ["File info, EOF and underrun count output"]
+        )
+
+        self.file_info = {}
+        self.underruns = 0
+        self.dsp_outlets = list(range(self.init_channels))
+
+    async def setup(self):
+        params = dict(prefetch=self.init_prefetch, loop=self.init_loop)
+        if self.filename is not None:
+            params["filename"] = self.filename
+        await self.dsp_init("diskplay~", **params)
+
+    async def trigger(self):
+        incoming = self.inlets[0]
+        if incoming is Bang:
+            await self.dsp_obj.setparam("seek", 0)
+            await self.dsp_obj.setparam("play", 1)
+        elif incoming is True:
+            await self.dsp_obj.setparam("play", 1)
+        elif incoming is False:
+            await self.dsp_obj.setparam("play", 0)
+        elif isinstance(incoming, str):
+            self.filename = incoming
+            await self.dsp_obj.setparam("filename", incoming)
+        elif isinstance(incoming, (int, float)):
+            await self.dsp_obj.setparam("seek", incoming)
+        elif isinstance(incoming, dict):
+            for k, v in incoming.items():
+                await self.dsp_obj.setparam(k, v)
+
+    def dsp_response(self, resp_id, resp_value):
+        status = self.init_channels
+        if resp_id == self.RESP_CHANNELS:
+            self.file_info = dict(channels=resp_value)
+        elif resp_id == self.RESP_FRAMES:
+            self.file_info["frames"] = resp_value
+        elif resp_id == self.RESP_RATE:
+            self.file_info["rate"] = resp_value
+        elif resp_id == self.RESP_OPENED:
+            self.file_info["filename"] = resp_value
+            self.outlets[status] = dict(self.file_info)
+        elif resp_id == self.RESP_EOF:
+            self.outlets[status] = EOF()
+        elif resp_id == self.RESP_UNDERRUNS:
+            self.underruns = resp_value
+            self.outlets[status] = dict(underruns=resp_value)
+        elif resp_id == self.RESP_ERROR:
+            self.error("diskplay~: %s" % resp_value)
+
+
+def register():
+    MFPApp().register("diskplay~", DiskPlay)
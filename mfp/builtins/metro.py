@@ -5,10 +5,12 @@ metro.py: Metronome control processor
 Copyright (c) 2010-2016 Bill Gribble <grib@billgribble.com>
 '''
 
+import inspect
+
 from ..timer import MultiTimer
 from ..processor import Processor
+from ..dsp_object import event_stamp
 from ..mfp_app import MFPApp
-from datetime import datetime, timedelta
 from .. import Bang, Uninit
 from mfp import log
 
@@ -17,33 +19,168 @@ class TimerTick (object):
         self.payload = payload
 
 
-class Throttle (Processor):
+class TimedProcessor (Processor):
+    '''
+    Base for processors that send themselves TimerTicks from the shared
+    MultiTimer. Anything still scheduled is cancelled when the processor
+    is deleted.
+
+    Times are now() seconds. When the patch's DSP context publishes its
+    clock, that's audio time (context frame / samplerate), so ticks keep
+    to the sample clock rather than time.monotonic(). Each tick then
+    fires lookahead seconds early, with its output stamped with the
+    tick's frame, so DSP setparams it causes land on that frame.
+    '''
+    # automatic lookahead, on top of one DSP block
+    LOOKAHEAD_MARGIN = 0.01
+
+    def __init__(self, inlets, outlets, init_type, init_args, patch, scope, name):
+        Processor.__init__(self, inlets, outlets, init_type, init_args, patch, scope, name)
+
+        parsed_args, kwargs = self.parse_args(init_args)
+
+        # seconds; None is a DSP block plus LOOKAHEAD_MARGIN
+        self.lookahead = None
+        if "lookahead" in kwargs:
+            self.lookahead = kwargs["lookahead"] / 1000.0
+
+        # the DSPContext whose clock this runs on, set in setup()
+        self.clock = None
+        self.clock_offset = None
+        self.reset_timing()
+
+    async def setup(self):
+        context = self.patch.context if self.patch else None
+        if context and context.clock_synced is None:
+            await context.sync_clock()
+        if context and context.clock_page is not None and context.read_clock():
+            self.clock = context
+
+    def now(self):
+        now = MultiTimer.now()
+        if self.clock is None or not self.clock.read_clock():
+            return now
+        return self.clock.frame_of(now) / self.clock.samplerate
+
+    def schedule_call(self, deadline, callback, data=[]):
+        '''
+        Call callback(*data) at now() time deadline. Its output is
+        stamped with the deadline
+        '''
+        frame = None
+        when = wake = deadline
+        if self.clock is not None and self.clock.read_clock():
+            frame = int(round(deadline * self.clock.samplerate))
+            when = self.clock.time_of(frame)
+            if self.lookahead is None:
+                wake = when - (self.clock.blocksize or 0) / self.clock.samplerate \
+                    - self.LOOKAHEAD_MARGIN
+            else:
+                wake = when - self.lookahead
+
+        return MultiTimer.shared().schedule(
+            wake, self._timer_fire, [callback, data, wake, frame, when], owner=self
+        )
+
+    def schedule_tick(self, deadline, payload=None):
+        return self.schedule_call(deadline, self.send, [TimerTick(payload)])
+
+    def cancel_ticks(self):
+        return MultiTimer.shared().cancel_owner(self)
+
+    async def _timer_fire(self, callback, data, wake, frame, when):
+        fired = MultiTimer.now()
+        self._note_timing(fired - wake, None if frame is None else when - fired)
+
+        token = event_stamp.set((self.clock, frame, when))
+        try:
+            rv = callback(*data)
+            if inspect.isawaitable(rv):
+                await rv
+        finally:
+            event_stamp.reset(token)
+
+    def reset_timing(self):
+        self.timing = dict(ticks=0, missed=0, late_total=0.0, late_sq=0.0,
+                           late_max=0.0, lead_min=None)
+        self.clock_offset = None
+
+    def _note_timing(self, late, lead):
+        t = self.timing
+        t["ticks"] += 1
+        t["late_total"] += late
+        t["late_sq"] += late * late
+        t["late_max"] = max(t["late_max"], late)
+        if lead is not None:
+            t["lead_min"] = lead if t["lead_min"] is None else min(t["lead_min"], lead)
+            if lead < 0:
+                t["missed"] += 1
+
+        # how far the sample clock has moved against time.monotonic()
+        # since the first tick
+        if self.clock is not None and self.clock_offset is None:
+            self.clock_offset = self._clock_offset()
+
+    def _clock_offset(self):
+        return self.clock.clock_time - self.clock.clock_frame / self.clock.samplerate
+
+    def timing_stats(self):
+        '''
+        Seconds, over the ticks since reset_timing(): late_avg and
+        late_max behind their wakeup, jitter (std deviation of lateness),
+        lead_min (least time a tick was sent ahead of when it plays) and
+        missed (ticks sent after it). drift is how far the DSP clock has
+        moved against time.monotonic(), if this runs on it
+        '''
+        t = self.timing
+        ticks = t["ticks"]
+        late_avg = t["late_total"] / ticks if ticks else 0.0
+        jitter = max(0.0, t["late_sq"] / ticks - late_avg * late_avg) ** 0.5 if ticks else 0.0
+        drift = None
+        if self.clock is not None and self.clock_offset is not None:
+            drift = self._clock_offset() - self.clock_offset
+
+        return dict(
+            clock="dsp" if self.clock is not None else "monotonic",
+            ticks=ticks,
+            missed=t["missed"],
+            late_avg=late_avg,
+            late_max=t["late_max"],
+            jitter=jitter,
+            lead_min=t["lead_min"],
+            drift=drift
+        )
+
+    def show_timing(self):
+        log.info("[%s] timing: %s" % (self.name, self.timing_stats()))
+
+    async def delete(self):
+        self.cancel_ticks()
+        await Processor.delete(self)
+
+
+class Throttle (TimedProcessor):
     doc_tooltip_obj = "Pass through input, but at a limited rate"
     doc_tooltip_inlet = ["Passthru input",
                          "Minimum time between outputs (ms) (default: initarg 0)" ]
     doc_tooltip_outlet = ["Passthru output" ]
 
-    _timer = None
-
     def __init__(self, init_type, init_args, patch, scope, name):
-        Processor.__init__(self, 2, 1, init_type, init_args, patch, scope, name)
+        TimedProcessor.__init__(self, 2, 1, init_type, init_args, patch, scope, name)
 
         self.started = False
         self.interval = False
         self.count = 0
         self.queue = []
 
-        if Throttle._timer is None:
-            Throttle._timer = MultiTimer()
-
         parsed_args, kwargs = self.parse_args(init_args)
 
         if len(parsed_args):
-            self.interval = timedelta(milliseconds=int(parsed_args[0]))
+            self.interval = int(parsed_args[0]) / 1000.0
 
     async def trigger(self):
         if self.inlets[1] is not Uninit:
-            self.interval = timedelta(milliseconds=int(self.inlets[1]))
+            self.interval = int(self.inlets[1]) / 1000.0
             self.inlets[1] = Uninit
 
         if isinstance(self.inlets[0], TimerTick):
@@ -52,148 +189,117 @@ class Throttle (Processor):
                 self.queue = self.queue[1:]
                 self.outlets[0] = d
                 self.count += 1
-                self._timer.schedule(self.started + self.count * self.interval, self.timer_cb)
+                self.schedule_tick(self.started + self.count * self.interval)
             else:
                 self.started = False
         elif self.started:
             self.queue.append(self.inlets[0])
         else:
-            self.started = datetime.now()
+            self.started = self.now()
             self.count = 1
-            self._timer.schedule(self.started + self.interval, self.timer_cb)
+            self.schedule_tick(self.started + self.interval)
             self.outlets[0] = self.inlets[0]
 
-    async def timer_cb(self):
-        await self.send(TimerTick())
 
 
-class Delay (Processor):
+class Delay (TimedProcessor):
     doc_tooltip_obj = "Pass through input messages, delayed by a specified amount"
     doc_tooltip_inlet = ["Passthru input", "Delay (ms) (default: initarg 0)" ]
     doc_tooltip_outlet = ["Passthru output"]
 
-    _timer = None
-
     def __init__(self, init_type, init_args, patch, scope, name):
-        Processor.__init__(self, 2, 1, init_type, init_args, patch, scope, name)
+        TimedProcessor.__init__(self, 2, 1, init_type, init_args, patch, scope, name)
 
         self.delay = False
 
-        if Delay._timer is None:
-            Delay._timer = MultiTimer()
-
         parsed_args, kwargs = self.parse_args(init_args)
 
         if len(parsed_args):
-            self.delay = timedelta(milliseconds=int(parsed_args[0]))
+            self.delay = int(parsed_args[0]) / 1000.0
 
     async def trigger(self):
         if self.inlets[1] is not Uninit:
-            self.delay = timedelta(milliseconds=int(self.inlets[1]))
+            self.delay = int(self.inlets[1]) / 1000.0
             self.inlets[1] = Uninit
 
         if isinstance(self.inlets[0], TimerTick):
             self.outlets[0] = self.inlets[0].payload
         else:
-            self._timer.schedule(datetime.now() + self.delay, self.timer_cb, [self.inlets[0]])
+            self.schedule_tick(self.now() + self.delay, self.inlets[0])
             self.started = False
 
-    async def timer_cb(self, data):
-        await self.send(TimerTick(data))
 
 
-class Metro (Processor):
+class Metro (TimedProcessor):
     doc_tooltip_obj = "Emit a Bang at specified interval"
     doc_tooltip_inlet = ["Control input (True/Bang/nonzero to start, False/None/zero to stop)",
                          "Interval between Bang (ms) (default: initarg 0)" ]
     doc_tooltip_outlet = ["Metronome output"]
-    _timer = None
-
     def __init__(self, init_type, init_args, patch, scope, name):
-        Processor.__init__(self, 2, 1, init_type, init_args, patch, scope, name)
+        TimedProcessor.__init__(self, 2, 1, init_type, init_args, patch, scope, name)
 
         self.started = False
         self.interval = False
         self.count = 0
 
-        if Metro._timer is None:
-            Metro._timer = MultiTimer()
-
         parsed_args, kwargs = self.parse_args(init_args)
 
         if len(parsed_args):
-            self.interval = timedelta(milliseconds=int(parsed_args[0]))
+            self.interval = int(parsed_args[0]) / 1000.0
 
     async def trigger(self):
         if self.inlets[1] is not Uninit:
-            self.interval = timedelta(milliseconds=int(self.inlets[1]))
+            self.interval = int(self.inlets[1]) / 1000.0
             self.inlets[1] = Uninit
             if self.started:
-                self.started = datetime.now()
+                self.started = self.now()
                 self.count = 0
 
         if isinstance(self.inlets[0], TimerTick):
             if self.started:
                 self.outlets[0] = Bang
                 self.count += 1
-                self._timer.schedule(self.started + self.count * self.interval, self.timer_cb)
+                self.schedule_tick(self.started + self.count * self.interval)
         elif self.inlets[0]:
-            self.started = datetime.now()
+            self.started = self.now()
             self.count = 1
-            self._timer.schedule(self.started + self.interval, self.timer_cb)
+            self.schedule_tick(self.started + self.interval)
             self.outlets[0] = Bang
         else:
             self.started = False
+            self.cancel_ticks()
 
-    async def timer_cb(self):
-        await self.send(TimerTick())
 
-class BeatChase (Processor):
+class BeatChase (TimedProcessor):
     doc_tooltip_obj = "Chase a series of bangs, potentially adjusting timing"
     doc_tooltip_inlet = ["Bang/True/False to chase/start/stop",
                          "Multiplier of beat (higher is faster)",
                          "Beat slip (milliseconds)"]
-    _timer = None
-
     RUNNING = 2
     STARTING = 1
     STOPPED = 0
 
     def __init__(self, init_type, init_args, patch, scope, name):
-        Processor.__init__(self, 3, 1, init_type, init_args, patch, scope, name)
+        TimedProcessor.__init__(self, 3, 1, init_type, init_args, patch, scope, name)
 
         self.run = BeatChase.STOPPED
         self.chase_lastbang = False
         self.chase_interval = False
         self.multiplier = 1.0
         self.interval = None
-        self.slip = timedelta()
+        self.slip = 0.0
         self.baseline_count = 0
         self.baseline_time = False
 
-        if BeatChase._timer is None:
-            BeatChase._timer = MultiTimer()
-
         parsed_args, kwargs = self.parse_args(init_args)
         if len(parsed_args) > 1:
-            self.slip = timedelta(milliseconds=parsed_args[1])
+            self.slip = parsed_args[1] / 1000.0
         if len(parsed_args) > 0:
             self.multiplier = parsed_args[0]
 
     async def trigger(self):
-        def interval_div(intvl, divisor):
-            ts = intvl.total_seconds() / float(divisor)
-            int_sec = int(ts)
-            frac_sec = ts - int_sec
-            return timedelta(seconds=int_sec, microseconds=int(frac_sec * 1000000))
-        def interval_mul(intvl, mult):
-            ts = intvl.total_seconds() * float(mult)
-            int_sec = int(ts)
-            frac_sec = ts - int_sec
-            return timedelta(seconds=int_sec, microseconds=int(frac_sec * 1000000))
-
         if self.inlets[2] is not Uninit:
-            self.slip = timedelta(milliseconds=int(self.inlets[2]))
+            self.slip = int(self.inlets[2]) / 1000.0
             self.inlets[2] = Uninit
 
         ticker = self.inlets[0]
@@ -204,26 +310,25 @@ class BeatChase (Processor):
             if self.inlets[1] is not Uninit:
                 self.baseline_count *= (1.0 * self.inlets[1] / self.multiplier)
                 self.multiplier = self.inlets[1]
-                self.interval = interval_div(self.chase_interval, self.multiplier)
+                self.interval = self.chase_interval / float(self.multiplier)
                 self.inlets[1] = Uninit
 
             if self.run:
                 self.outlets[0] = Bang
-                self._timer.schedule(self.baseline_time + self.slip
-                                     + interval_mul(self.interval, self.baseline_count),
-                                     self.timer_cb)
+                self.schedule_tick(self.baseline_time + self.slip
+                                   + self.interval * self.baseline_count)
         elif isinstance(ticker, type(Bang)):
-            bangtime = datetime.now()
+            bangtime = self.now()
             if self.chase_lastbang:
                 self.chase_interval = bangtime - self.chase_lastbang
-                self.interval = interval_div(self.chase_interval, self.multiplier)
+                self.interval = self.chase_interval / float(self.multiplier)
                 self.chase_lastbang = bangtime
                 if self.run == BeatChase.STARTING:
                     self.baseline_time = self.chase_lastbang
                     self.baseline_count = 1
                     self.run = BeatChase.RUNNING
                     deadline = self.baseline_time + self.slip + self.interval
-                    self._timer.schedule(deadline, self.timer_cb)
+                    self.schedule_tick(deadline)
                     self.outlets[0] = Bang
             else:
                 self.chase_lastbang = bangtime
@@ -232,8 +337,6 @@ class BeatChase (Processor):
         else:
             self.run = BeatChase.STOPPED
 
-    async def timer_cb(self):
-        await self.send(TimerTick())
 
 
 
@@ -361,7 +361,7 @@ class PyCompareRoute(Processor):
         if len(initargs) == 1:
             self.inlets[1] = initargs[0]
 
-    async def trigger(self):
+    def trigger(self):
         if self.inlets[1] is not Uninit:
             cmpval = bool(self.function(self.inlets[0], self.inlets[1]))
         else:
@@ -387,7 +387,7 @@ class PyBinary(Processor):
         if len(initargs) == 1:
             self.inlets[1] = initargs[0]
 
-    async def trigger(self):
+    def trigger(self):
         if self.inlets[1] is not Uninit:
             self.outlets[0] = self.function(self.inlets[0], self.inlets[1])
         else:
@@ -404,7 +404,7 @@ class PyUnary(Processor):
         if self.function.__doc__:
             self.doc_tooltip_obj = self.function.__doc__.split("\n")[0]
 
-    async def trigger(self):
+    def trigger(self):
         self.outlets[0] = self.function(self.inlets[0])
 
 class PyNullary(Processor):
@@ -415,7 +415,7 @@ class PyNullary(Processor):
         if self.function.__doc__:
             self.doc_tooltip_obj = self.function.__doc__.split("\n")[0]
 
-    async def trigger(self):
+    def trigger(self):
         self.outlets[0] = self.function()
 
 
@@ -0,0 +1,47 @@
+#! /usr/bin/env python
+'''
+switch.py: turn DSP processing for a patch on and off
+
+Copyright (c) 2012 Bill Gribble <grib@billgribble.com>
+'''
+
+from ..processor import Processor
+from ..mfp_app import MFPApp
+from .. import Bang, Uninit
+
+
+class Switch(Processor):
+    doc_tooltip_obj = "Turn DSP for the enclosing patch on or off (off costs no CPU)"
+    doc_tooltip_inlet = ["True/nonzero to turn DSP on, False/0 to turn it off, Bang to toggle "
+                         "(default: initarg True)"]
+    doc_tooltip_outlet = ["Current DSP state"]
+
+    def __init__(self, init_type, init_args, patch, scope, name):
+        Processor.__init__(self, 1, 1, init_type, init_args, patch, scope, name)
+
+        initargs, kwargs = self.parse_args(init_args)
+        if len(initargs):
+            self.dsp_on = bool(initargs[0])
+        else:
+            self.dsp_on = True
+
+    async def onload(self, phase):
+        # the rest of the patch exists by now
+        if phase == 0 and not self.dsp_on:
+            await self.patch.dsp_activate(False)
+
+    async def trigger(self):
+        if self.inlets[0] is Bang:
+            dsp_on = not self.dsp_on
+        else:
+            dsp_on = bool(self.inlets[0])
+        self.inlets[0] = Uninit
+
+        if dsp_on != self.dsp_on:
+            self.dsp_on = dsp_on
+            await self.patch.dsp_activate(dsp_on)
+        self.outlets[0] = self.dsp_on
+
+
+def register():
+    MFPApp().register("switch~", Switch)
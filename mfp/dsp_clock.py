@@ -0,0 +1,46 @@
+import mmap
+import os
+import struct
+
+from posix_ipc import SharedMemory
+
+
+class ClockPage(object):
+    '''
+    The clock page of a DSP context (mfp_clock_page in mfp_dsp.h), a
+    POSIX shared memory segment mapped read-only. The DSP thread
+    rewrites it at the start of every block, so reading the clock
+    costs a memory copy instead of an RPC round trip.
+    '''
+    # seq, samplerate, frame, usec, blocksize, reserved
+    LAYOUT = struct.Struct("=Iiqqii")
+    SEQ = struct.Struct("=I")
+
+    # tries at a consistent read before giving up; the DSP thread only
+    # holds seq odd for a few stores
+    RETRIES = 100
+
+    def __init__(self, shm_id):
+        self.shm_id = shm_id
+
+        shm = SharedMemory(shm_id)
+        try:
+            if os.fstat(shm.fd).st_size < self.LAYOUT.size:
+                raise ValueError("clock page %s is too small" % shm_id)
+            self.mmap = mmap.mmap(shm.fd, self.LAYOUT.size, access=mmap.ACCESS_READ)
+        finally:
+            shm.close_fd()
+
+    def read(self):
+        '''
+        (frame, usec, samplerate, blocksize) at the start of the latest
+        block, or None if the DSP thread kept writing it
+        '''
+        for attempt in range(self.RETRIES):
+            seq, samplerate, frame, usec, blocksize, _ = self.LAYOUT.unpack_from(self.mmap)
+            if not (seq & 1) and self.SEQ.unpack_from(self.mmap)[0] == seq:
+                return (frame, usec, samplerate, blocksize)
+        return None
+
+    def close(self):
+        self.mmap.close()
@@ -6,12 +6,42 @@ Classes to represent DSP objects
 Copyright (c) 2010 Bill Gribble <grib@billgribble.com>
 '''
 
-from carp.service import apiclass
+import asyncio
+import contextvars
+import time
+
+from carp.service import apiclass, noresp
+
+from . import log
+
+
+# when the message being handled is meant to take effect, set by timed
+# processors (metro and the like) while their output propagates, as
+# (DSPContext or None, frame or None, time.monotonic() time).  DSP
+# setparams made meanwhile are applied at that point in the audio
+event_stamp = contextvars.ContextVar("event_stamp", default=None)
+
+
+def stamp_frame(context):
+    '''
+    The frame of context that the current event stamp is for, or None
+    '''
+    stamp = event_stamp.get()
+    if stamp is None or not context:
+        return None
+    stamp_context, frame, when = stamp
+    if frame is not None and stamp_context == context:
+        return frame
+    return context.frame_of(when)
 
 
 class DSPContext:
     registry = {}
 
+    # seconds before frame_at() asks the DSP for the clock again, so
+    # drift between the sample clock and time.monotonic() stays small
+    CLOCK_MAX_AGE = 1.0
+
     def __init__(self, node_id, context_id, context_name=""):
         self.node_id = node_id
         self.context_id = context_id
@@ -19,6 +49,17 @@ class DSPContext:
         self.input_latency = 0
         self.output_latency = 0
 
+        # the context was at clock_frame at time.monotonic() clock_time
+        self.samplerate = None
+        self.blocksize = None
+        self.clock_frame = None
+        self.clock_time = None
+        self.clock_synced = None
+
+        # the DSP side's clock page, if it could be mapped; with it the
+        # clock is read directly instead of with sync_clock()
+        self.clock_page = None
+
     @classmethod
     def create(cls, node_id, context_id, context_name):
         ctxt = DSPContext(node_id, context_id, context_name)
@@ -32,6 +73,80 @@ class DSPContext:
     def get_latency(self):
         return (self.input_latency, self.output_latency)
 
+    async def sync_clock(self):
+        from .mfp_app import MFPApp
+        app = MFPApp()
+
+        # require() would wait forever for a DSP host that isn't coming
+        if (app.no_dsp or app.rpc_host is None
+                or not app.rpc_host.services_remote.get("DSPObject")):
+            return False
+
+        DSPObjectFactory = await app.rpc_host.require(DSPObject)
+        clock = await DSPObjectFactory.clock(self.context_id)
+        if not clock:
+            return False
+
+        # the DSP side stamps blocks with g_get_monotonic_time(), the
+        # same clock as time.monotonic()
+        frame, usec, self.samplerate = clock[:3]
+        self.clock_frame = frame
+        self.clock_time = usec / 1000000.0
+        self.clock_synced = time.monotonic()
+
+        if self.clock_page is None and len(clock) > 3 and clock[3]:
+            from .dsp_clock import ClockPage
+            try:
+                self.clock_page = ClockPage(clock[3])
+            except Exception as e:
+                log.warning(f"[dsp] Can't map clock page {clock[3]}: {e}")
+        return True
+
+    def read_clock(self):
+        '''
+        Refresh the clock from the clock page. True if the clock is
+        known, from the page or the last sync_clock()
+        '''
+        if self.clock_page is not None:
+            clock = self.clock_page.read()
+            if clock is not None and clock[1]:
+                frame, usec, self.samplerate, self.blocksize = clock
+                self.clock_frame = frame
+                self.clock_time = usec / 1000000.0
+                self.clock_synced = time.monotonic()
+        return bool(self.clock_time)
+
+    def frame_of(self, when):
+        '''
+        The context frame that plays at time.monotonic() time when, by
+        the clock as last read, or None if it isn't known
+        '''
+        if not self.clock_time:
+            return None
+        return int(round(self.clock_frame + (when - self.clock_time) * self.samplerate))
+
+    def time_of(self, frame):
+        '''
+        The time.monotonic() time that frame plays at, by the clock as
+        last read, or None if it isn't known
+        '''
+        if not self.clock_time:
+            return None
+        return self.clock_time + (frame - self.clock_frame) / self.samplerate
+
+    async def frame_at(self, when):
+        '''
+        The context frame that plays at time.monotonic() time when, or 0
+        (as soon as possible) if the context isn't running yet
+        '''
+        if self.clock_page is not None:
+            self.read_clock()
+        elif (self.clock_synced is None
+                or time.monotonic() - self.clock_synced > self.CLOCK_MAX_AGE):
+            await self.sync_clock()
+        frame = self.frame_of(when)
+        return 0 if frame is None else frame
+
     def __eq__(self, other):
         if isinstance(other, DSPContext):
             return (self.node_id == other.node_id) and (self.context_id == other.context_id)
@@ -65,4 +180,211 @@ class DSPObject:
     def disconnect(self, outlet, target, inlet):
         pass
 
+    def activate(self, active):
+        pass
+
+    def autosleep(self, blocks):
+        pass
+
+    @noresp
+    def post(self, ops):
+        pass
+
+    def queue_stats(self):
+        pass
+
+    def level_stats(self, context_id, first_level):
+        pass
+
+    def buffer_stats(self, context_id):
+        pass
+
+    def render(self, context_id, frames, outfile, infile):
+        pass
+
+    def clock(self, context_id):
+        pass
+
+
+class DSPBatch:
+    """
+    Requests for a single DSP host, collected during one pass of the
+    event loop and sent as one DSPObject.post() call. Setting the
+    same parameter on the same object more than once in a batch only
+    sends the latest value, in the place of the last setting.
+
+    post() has no reply, so a batch is done once it's written to the
+    socket and the next one can follow without waiting on the DSP
+    side. Batches go out in the order they were started, which keeps
+    each object's requests in order.
+    """
+    pending = {}
+
+    # since the last reset_stats()
+    batches = 0
+    calls = 0
+    ops_sent = 0
+    max_ops = 0
+    send_time = 0.0
+    max_send_time = 0.0
+    rpc_calls = 0
+    rpc_time = 0.0
+    max_rpc_time = 0.0
+
+    def __init__(self, proxy):
+        loop = asyncio.get_event_loop()
+        self.proxy = proxy
+        self.ops = []
+        self.params = {}
+        self.started = time.monotonic()
+        self.done = loop.create_future()
+        loop.call_soon(lambda: asyncio.ensure_future(self.send()))
+
+    @classmethod
+    def add(cls, proxy, op, key=None):
+        host_id = proxy._service.host_id
+        batch = cls.pending.get(host_id)
+        if batch is None:
+            batch = cls.pending[host_id] = DSPBatch(proxy)
+
+        DSPBatch.calls += 1
+        if key is not None:
+            # the earlier op is dropped rather than overwritten in
+            # place, so the new one stays after anything sent since
+            if key in batch.params:
+                batch.ops[batch.params[key]] = None
+            batch.params[key] = len(batch.ops)
+        batch.ops.append(op)
+        return batch.done
+
+    @classmethod
+    async def flush(cls, proxy):
+        batch = cls.pending.get(proxy._service.host_id)
+        if batch is not None:
+            await batch.done
+
+    @classmethod
+    async def call(cls, proxy, method, *args):
+        """
+        Call a DSPObject method that has a reply, after any pending
+        batch, timing the round trip
+        """
+        await cls.flush(proxy)
+        started = time.monotonic()
+        try:
+            return await getattr(proxy, method)(*args)
+        finally:
+            elapsed = time.monotonic() - started
+            DSPBatch.rpc_calls += 1
+            DSPBatch.rpc_time += elapsed
+            DSPBatch.max_rpc_time = max(DSPBatch.max_rpc_time, elapsed)
+
+    async def send(self):
+        if self.pending.get(self.proxy._service.host_id) is self:
+            del self.pending[self.proxy._service.host_id]
+        ops = [op for op in self.ops if op is not None]
+        try:
+            self.done.set_result(await self.proxy.post(ops))
+        except Exception as e:
+            self.done.set_exception(e)
+
+        elapsed = time.monotonic() - self.started
+        DSPBatch.batches += 1
+        DSPBatch.ops_sent += len(ops)
+        DSPBatch.max_ops = max(DSPBatch.max_ops, len(ops))
+        DSPBatch.send_time += elapsed
+        DSPBatch.max_send_time = max(DSPBatch.max_send_time, elapsed)
+
+    @classmethod
+    def stats(cls):
+        """
+        Requests per batch, how long a batch takes from its first
+        request to being written, and the round trip of calls with a
+        reply (getparam), in seconds
+        """
+        batches = max(cls.batches, 1)
+        rpc_calls = max(cls.rpc_calls, 1)
+        return dict(
+            batches=cls.batches,
+            calls=cls.calls,
+            ops=cls.ops_sent,
+            calls_per_batch=cls.calls / batches,
+            ops_per_batch=cls.ops_sent / batches,
+            max_ops=cls.max_ops,
+            avg_send=cls.send_time / batches,
+            max_send=cls.max_send_time,
+            rpc_calls=cls.rpc_calls,
+            avg_rpc=cls.rpc_time / rpc_calls,
+            max_rpc=cls.max_rpc_time
+        )
+
+    @classmethod
+    def reset_stats(cls):
+        cls.batches = cls.calls = cls.ops_sent = cls.max_ops = 0
+        cls.send_time = cls.max_send_time = 0.0
+        cls.rpc_calls = 0
+        cls.rpc_time = cls.max_rpc_time = 0.0
+
+
+class DSPObjectProxy:
+    """
+    Stands in for the RPC proxy of a DSPObject. Requests that go
+    through the DSP request queue are batched with DSPBatch, and
+    return once their batch is written; getparam waits for any
+    pending batch so it sees earlier setparams.
+    """
+    __slots__ = ('proxy', '_id', 'context')
+
+    def __init__(self, proxy, context=None):
+        self.proxy = proxy
+        self._id = proxy._id
+        self.context = context
+
+    @classmethod
+    async def create(cls, proxy, proc_name, num_inlets, num_outlets, params,
+                     context, patch_id):
+        """
+        Create the DSP object that proxy stands for. Its id is the
+        proxy's, picked on this side, so the create is batched like
+        the requests that follow it rather than waiting a round trip
+        """
+        await DSPBatch.add(proxy, [
+            "create", proxy._id, proc_name, num_inlets, num_outlets, params,
+            context.context_id, patch_id
+        ])
+        return DSPObjectProxy(proxy, context)
+
+    async def reset(self):
+        await DSPBatch.add(self.proxy, ["reset", self._id])
+
+    async def delete(self):
+        await DSPBatch.add(self.proxy, ["delete", self._id])
+
+    async def getparam(self, param):
+        return await DSPBatch.call(self.proxy, "getparam", param)
+
+    async def setparam(self, param, value, frame=None):
+        if frame is None:
+            frame = stamp_frame(self.context)
+        if frame is None:
+            await DSPBatch.add(self.proxy, ["setparam", self._id, param, value],
+                               (self._id, param))
+        else:
+            # timed setparams are all kept, each applied at its frame
+            await DSPBatch.add(self.proxy, ["setparam", self._id, param, value, int(frame)])
+
+    async def connect(self, outlet, target, inlet):
+        await DSPBatch.add(self.proxy, ["connect", self._id, outlet, target, inlet])
+
+    async def disconnect(self, outlet, target, inlet):
+        await DSPBatch.add(self.proxy, ["disconnect", self._id, outlet, target, inlet])
+
+    async def activate(self, active):
+        await DSPBatch.add(self.proxy, ["activate", self._id, int(active)],
+                           (self._id, "_active"))
+
+    async def autosleep(self, blocks):
+        await DSPBatch.add(self.proxy, ["autosleep", self._id, int(blocks)],
+                           (self._id, "_autosleep"))
+
 
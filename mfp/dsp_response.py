@@ -0,0 +1,257 @@
+#! /usr/bin/env python
+'''
+dsp_response.py
+Read DSP responses from the shared memory ring of an mfpdsp process
+
+Copyright (c) 2020 Bill Gribble <grib@billgribble.com>
+'''
+
+import asyncio
+import mmap
+import os
+import struct
+
+import posix_ipc
+
+from . import log
+from .utils import QuittableThread
+
+
+class ResponseRing:
+    '''
+    The response ring of one DSP process (mfp_response_header in
+    mfp_dsp.h), a POSIX shared memory segment and a semaphore both
+    named /mfp_response_<pid>. Records are fixed-size; a string
+    response's bytes follow it in the next records.
+    '''
+    RESPONSE_INT = 0
+    RESPONSE_FLOAT = 1
+    RESPONSE_STR = 2
+
+    # offsets into the header
+    HEAD = 0
+    CAPACITY = 4
+    RECORD_SIZE = 8
+    OVERFLOWS = 12
+    TAIL = 64
+    READER_PID = 68
+    HEADER_SIZE = 128
+
+    UINT = struct.Struct("=I")
+    RECORD = struct.Struct("=iiiid")
+
+    def __init__(self, owner_pid):
+        self.name = "/mfp_response_%05d" % owner_pid
+        self.sem = posix_ipc.Semaphore(self.name)
+
+        shm = posix_ipc.SharedMemory(self.name)
+        try:
+            self.mmap = mmap.mmap(shm.fd, os.fstat(shm.fd).st_size)
+        finally:
+            shm.close_fd()
+
+        self.capacity = self._uint(self.CAPACITY)
+        if self._uint(self.RECORD_SIZE) != self.RECORD.size:
+            self.close()
+            raise ValueError("%s has records of %d bytes, not %d" % (
+                self.name, self._uint(self.RECORD_SIZE), self.RECORD.size))
+        self.tail = self._uint(self.TAIL)
+
+    def _uint(self, offset):
+        return self.UINT.unpack_from(self.mmap, offset)[0]
+
+    def attach(self):
+        '''
+        Start taking responses. Until then the DSP side sends them as RPC
+        '''
+        self.UINT.pack_into(self.mmap, self.READER_PID, os.getpid())
+
+    def detach(self):
+        self.UINT.pack_into(self.mmap, self.READER_PID, 0)
+
+    def overflows(self):
+        return self._uint(self.OVERFLOWS)
+
+    def _record_offset(self, index):
+        return self.HEADER_SIZE + (index % self.capacity) * self.RECORD.size
+
+    def _read_string(self, index, length):
+        chunks = []
+        while length > 0:
+            offset = self._record_offset(index)
+            chunk = min(length, self.RECORD.size)
+            chunks.append(self.mmap[offset:offset + chunk])
+            length -= chunk
+            index += 1
+        return b''.join(chunks).decode(errors="replace")
+
+    def read(self):
+        '''
+        Everything in the ring, as a list of (proc_id, resp_type,
+        value_type, value), up to a ring's worth. Once it's caught up the
+        tail is published and head checked again, so the DSP side knows
+        to post the semaphore for the next one
+        '''
+        records = []
+        while True:
+            head = self._uint(self.HEAD)
+            if head == self.tail or len(records) >= self.capacity:
+                if records:
+                    self.UINT.pack_into(self.mmap, self.TAIL, self.tail)
+                    if len(records) < self.capacity and self._uint(self.HEAD) != self.tail:
+                        continue
+                return records
+
+            while self.tail != head:
+                proc_id, resp_type, value_type, length, value = self.RECORD.unpack_from(
+                    self.mmap, self._record_offset(self.tail))
+                self.tail = (self.tail + 1) & 0xffffffff
+                if value_type == self.RESPONSE_STR:
+                    value = self._read_string(self.tail, length)
+                    self.tail = (self.tail + (length + self.RECORD.size - 1)
+                                 // self.RECORD.size) & 0xffffffff
+                elif value_type == self.RESPONSE_INT:
+                    value = int(value)
+                records.append((proc_id, resp_type, value_type, value))
+
+    def close(self):
+        self.sem.close()
+        self.mmap.close()
+
+
+def coalesce(records):
+    '''
+    Only the last float response of each type from each processor
+    is kept; those are levels and values (snap~, hold~), where the
+    latest is all anyone wants. Other responses are events and all
+    stay, in order
+    '''
+    latest = {}
+    for num, (proc_id, resp_type, value_type, value) in enumerate(records):
+        if value_type == ResponseRing.RESPONSE_FLOAT:
+            latest[(proc_id, resp_type)] = num
+
+    return [
+        r for num, r in enumerate(records)
+        if r[2] != ResponseRing.RESPONSE_FLOAT or latest[(r[0], r[1])] == num
+    ]
+
+
+class ResponseReader:
+    '''
+    Drains one ResponseRing from a single task, delivering each batch
+    to its processors in one Processor.send_many() run. A thread waits
+    on the semaphore so the task can sleep while the ring is empty
+    '''
+    # seconds the waiting thread sleeps before checking anyway, so a
+    # missed post or a DSP process that went away is only that late
+    WAIT_TIMEOUT = 0.25
+
+    readers = {}
+
+    def __init__(self, owner_pid, ring, loop):
+        self.owner_pid = owner_pid
+        self.ring = ring
+        self.loop = loop
+        self.wakeup = asyncio.Event()
+        self.quitreq = False
+        self.thread = None
+
+        self.batches = 0
+        self.received = 0
+        self.delivered = 0
+
+    @classmethod
+    def start(cls, owner_pid):
+        '''
+        Start reading responses from the DSP process owner_pid, if
+        it has a response ring. Returns the reader or None
+        '''
+        from .mfp_app import MFPApp
+
+        reader = cls.readers.get(owner_pid)
+        if reader is not None:
+            return reader
+        try:
+            ring = ResponseRing(owner_pid)
+        except Exception as e:
+            log.debug(f"[dsp] No response ring for process {owner_pid}: {e}")
+            return None
+
+        reader = ResponseReader(owner_pid, ring, MFPApp().async_task.asyncio_loop)
+        cls.readers[owner_pid] = reader
+        reader.thread = QuittableThread(target=reader._wait_thread)
+        reader.thread.start()
+        MFPApp().async_task(reader.run())
+        ring.attach()
+        return reader
+
+    def _owner_alive(self):
+        try:
+            os.kill(self.owner_pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def _wait_thread(self, thread):
+        while not thread.join_req and not self.quitreq:
+            try:
+                self.ring.sem.acquire(self.WAIT_TIMEOUT)
+            except posix_ipc.BusyError:
+                if not self._owner_alive():
+                    break
+            self._wake()
+
+        self.quitreq = True
+        self._wake()
+
+    def _wake(self):
+        try:
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+        except RuntimeError:
+            # the loop is closed
+            self.quitreq = True
+
+    async def run(self):
+        from .processor import Processor
+        from .mfp_app import MFPApp
+
+        while not self.quitreq:
+            self.wakeup.clear()
+            records = self.ring.read()
+            if not records:
+                await self.wakeup.wait()
+                continue
+
+            self.batches += 1
+            self.received += len(records)
+            records = coalesce(records)
+            self.delivered += len(records)
+
+            items = []
+            for proc_id, resp_type, value_type, value in records:
+                obj = MFPApp().recall(proc_id)
+                if isinstance(obj, Processor):
+                    items.append((obj, (resp_type, value), -1))
+            await Processor.send_many(items)
+
+        # the DSP side goes back to RPC, if it's still there
+        del self.readers[self.owner_pid]
+        self.ring.detach()
+        await self.loop.run_in_executor(None, self.thread.join)
+        self.ring.close()
+
+    def stats(self):
+        return dict(
+            batches=self.batches,
+            received=self.received,
+            delivered=self.delivered,
+            coalesced=self.received - self.delivered,
+            overflows=self.ring.overflows()
+        )
+
+    def finish(self):
+        self.quitreq = True
+        self.wakeup.set()
@@ -5,8 +5,10 @@ evaluator.py:  Augmented Python eval for strings in user interface
 Copyright (c) 2011 Bill Gribble <grib@billgribble.com>
 '''
 
+import functools
 import tokenize
 import inspect
+from collections import ChainMap
 from io import StringIO
 
 from mfp import log
@@ -20,6 +22,82 @@ class LazyExpr(object):
         return self.thunk()
 
 
+class EvalEnviron (dict):
+    """
+    Namespace for a single eval()
+
+    Holds only the per-call bindings; anything else is looked up in
+    the evaluator's layered local/global names without copying them.
+    """
+
+    def __init__(self, names, bindings):
+        dict.__init__(self, bindings)
+        self.names = names
+
+    def __missing__(self, key):
+        return self.names[key]
+
+
+def _eval_collect_args(*args, **kwargs):
+    return (args, kwargs)
+
+
+def _rewrite(str2eval, collect):
+    # lazy evaluation special form
+    #   ,expression
+    # rewrites to:
+    #   LazyEval(lambda: expression)
+    # this expression will be evaluated the first time the LazyExpr is
+    # passed from one object to another.
+    #
+    # this can be nested (i.e. ,,,expr is a "3 times lazy" expression that
+    # will go off after 3 links)
+
+    def lazyrecurse(evalstr):
+        return (("LazyExpr(lambda: %s)" % lazyrecurse(evalstr[1:]))
+                if evalstr[0] == ',' else evalstr)
+    str2eval = lazyrecurse(str2eval)
+
+    sio = StringIO(str2eval)
+
+    tokens = [t for t in tokenize.generate_tokens(sio.read)
+              if t[1] != '']
+
+    # Method call special form:
+    #   @method(arg1, arg2, ..., kwarg=val, kwarg2=val)
+    # rewrites to:
+    #   MethodCall("method", arg1, arg2, ... kwarg=val, kwarg2=val
+    #
+    # @foo is a synonym for @foo()
+    if tokens[0][1] == '@' and len(tokens) >= 2:
+        methname = tokens[1][1]
+        if len(tokens) == 2:
+            str2eval = ''.join(["MethodCall(", '"', methname, '"', ')'])
+        else:
+            if tokens[2][1] != '(':
+                raise SyntaxError()
+            str2eval = ''.join(["MethodCall(", '"', methname, '",']
+                               + [t[1] for t in tokens[3:]])
+
+    if collect:
+        str2eval = "_eval_collect_args(%s)" % str2eval
+    elif len(tokens) > 2 and tokens[1][1] == '=':
+        # setparam special form:
+        #   foo='bar', bax='baz'
+        # rewrites to
+        #   dict(foo='bar', bax='baz')
+        str2eval = ''.join(["dict("] + [t[1] for t in tokens] + [')'])
+
+    return str2eval
+
+
+@functools.lru_cache(maxsize=1024)
+def _compile(str2eval, collect):
+    # message boxes and patch loading evaluate the same few strings
+    # over and over, so keep the rewritten and compiled code around
+    return compile(_rewrite(str2eval, collect), "<mfp eval>", "eval")
+
+
 class Evaluator (object):
     global_names = {}
 
@@ -27,6 +105,7 @@ class Evaluator (object):
         self.local_names = {}
         if local_bindings:
             self.local_names.update(**local_bindings)
+        self.names = ChainMap(self.local_names, self.global_names)
 
     @classmethod
     def bind_global(self, name, obj):
@@ -46,73 +125,28 @@ class Evaluator (object):
         return rv
 
     def eval(self, evalstr, collect=False, **extra_bindings):
-        def _eval_collect_args(*args, **kwargs):
-            return (args, kwargs)
-
         str2eval = evalstr.strip()
         if not len(str2eval):
             return None
 
-        # lazy evaluation special form
-        #   ,expression
-        # rewrites to:
-        #   LazyEval(lambda: expression)
-        # this expression will be evaluated the first time the LazyExpr is
-        # passed from one object to another.
-        #
-        # this can be nested (i.e. ,,,expr is a "3 times lazy" expression that
-        # will go off after 3 links)
-
-        def lazyrecurse(evalstr):
-            return (("LazyExpr(lambda: %s)" % lazyrecurse(evalstr[1:]))
-                    if evalstr[0] == ',' else evalstr)
-        str2eval = lazyrecurse(str2eval)
-
-        sio = StringIO(str2eval)
-
-        tokens = [t for t in tokenize.generate_tokens(sio.read)
-                  if t[1] != '']
-
-        # Method call special form:
-        #   @method(arg1, arg2, ..., kwarg=val, kwarg2=val)
-        # rewrites to:
-        #   MethodCall("method", arg1, arg2, ... kwarg=val, kwarg2=val
-        #
-        # @foo is a synonym for @foo()
-        if tokens[0][1] == '@' and len(tokens) >= 2:
-            methname = tokens[1][1]
-            if len(tokens) == 2:
-                str2eval = ''.join(["MethodCall(", '"', methname, '"', ')'])
-            else:
-                if tokens[2][1] != '(':
-                    raise SyntaxError()
-                str2eval = ''.join(["MethodCall(", '"', methname, '",']
-                                   + [t[1] for t in tokens[3:]])
+        code = _compile(str2eval, collect)
 
         if collect:
-            str2eval = "_eval_collect_args(%s)" % str2eval
             extra_bindings['_eval_collect_args'] = _eval_collect_args
-        elif len(tokens) > 2 and tokens[1][1] == '=':
-            # setparam special form:
-            #   foo='bar', bax='baz'
-            # rewrites to
-            #   dict(foo='bar', bax='baz')
-            str2eval = ''.join(["dict("] + [t[1] for t in tokens] + [')'])
-
-        environ = {
-            name: val
-            for name, val in (
-                list(self.global_names.items()) + list(self.local_names.items())
-                + list(extra_bindings.items())
-            )
-        }
-        if "__self__" in environ:
-            environ["self"] = environ["__self__"]
-        if "__patch__" in environ:
-            environ["patch"] = environ["__patch__"]
-
-        rv = eval(str2eval, environ)
-        return rv
+        if "__self__" in extra_bindings:
+            extra_bindings["self"] = extra_bindings["__self__"]
+        if "__patch__" in extra_bindings:
+            extra_bindings["patch"] = extra_bindings["__patch__"]
+
+        return eval(code, EvalEnviron(self.names, extra_bindings))
+
+    @classmethod
+    def cache_info(cls):
+        return _compile.cache_info()
+
+    @classmethod
+    def cache_clear(cls):
+        _compile.cache_clear()
 
     def exec_str(self, pystr):
         exec(pystr, self.global_names)
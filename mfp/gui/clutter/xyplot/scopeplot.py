@@ -11,16 +11,11 @@ from gi.repository import Clutter
 from .xyplot import XYPlot
 from mfp import log
 from mfp.utils import catchall
-from posix_ipc import SharedMemory
+from mfp.buffer_info import BufferMap
 from mfp.gui_main import MFPGUI
 
-import os 
-import numpy 
-
 
 class ScopePlot (XYPlot):
-    
-    FLOAT_SIZE = 4
 
     def __init__(self, element, width, height, samplerate):
         self.orig_x = 0
@@ -28,7 +23,7 @@ class ScopePlot (XYPlot):
 
         self.samplerate = samplerate 
         self.buf_info = None
-        self.shm_obj = None
+        self.buf_map = None
         self.colors = [(0, 0, 1, 1), (0, 1, 0, 1), (0, 1, 1, 1), (1, 0, 1, 1), 
                        (1, 1, 0, 1), (1, 0, 0, 1) ]
         self.data = []
@@ -53,7 +48,8 @@ class ScopePlot (XYPlot):
 
 
     def draw_curve_simple(self, ctx, curve):
-        dataslice = self.data[curve][self.data_start:self.data_end] 
+        # plain floats are much quicker to loop over than numpy scalars
+        dataslice = self.data[curve][self.data_start:self.data_end].tolist()
         xbase = self.data_start * 1000.0 / self.samplerate
         xincr = 1000.0 / self.samplerate 
 
@@ -67,7 +63,7 @@ class ScopePlot (XYPlot):
         ctx.stroke()
 
     def draw_curve_minmax(self, ctx, curve): 
-        dataslice = self.data[curve][self.data_start:self.data_end] 
+        dataslice = self.data[curve][self.data_start:self.data_end].tolist()
         xbase = self.data_start * 1000.0 / self.samplerate
         xincr = 1000.0 / self.samplerate 
         dscale = 2*self.plot_w / float(len(dataslice)) 
@@ -134,21 +130,16 @@ class ScopePlot (XYPlot):
         return {}
 
     def _grab(self):
-        def offset(channel):
-            return channel * self.buf_info.size * self.FLOAT_SIZE
         if self.buf_info is None:
             return None
-        if self.shm_obj is None:
-            self.shm_obj = SharedMemory(self.buf_info.buf_id)
-
-        self.data = []
 
         try:
-            for c in range(self.buf_info.channels):
-                os.lseek(self.shm_obj.fd, offset(c), os.SEEK_SET)
-                slc = os.read(self.shm_obj.fd, int(self.buf_info.size * self.FLOAT_SIZE))
-                self.data.append(list(numpy.fromstring(slc, dtype=numpy.float32)))
-                self.set_bounds(0, None, len(self.data[0])*1000/self.samplerate, None)
+            # the curves are views of the buffer~, so a grab only has
+            # to map it the first time
+            if self.buf_map is None:
+                self.buf_map = BufferMap.from_info(self.buf_info)
+            self.data = self.buf_map.channels
+            self.set_bounds(0, None, len(self.data[0])*1000/self.samplerate, None)
         except Exception as e:
             log.debug("scopeplot: error grabbing data", e)
             import traceback
@@ -158,7 +149,10 @@ class ScopePlot (XYPlot):
     def command(self, action, data):
         if action == "buffer":
             self.buf_info = data
-            self.shm_obj = None 
+            if self.buf_map is not None:
+                self.data = []
+                self.buf_map.close()
+                self.buf_map = None
             self.plot.invalidate()
         elif action == "grab":
             self._grab()
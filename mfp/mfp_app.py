@@ -53,6 +53,8 @@ class MFPApp (Singleton, SignalMixin):
         self.samplerate = 44100
         self.blocksize = 256
         self.max_blocksize = 2048
+        self.dsp_queue_size = 2048
+        self.dsp_threads = 0
         self.in_latency = 0
         self.out_latency = 0
         self.socket_path = "/tmp/mfp_rpcsock"
@@ -61,6 +63,11 @@ class MFPApp (Singleton, SignalMixin):
         self.batch_args = None
         self.batch_eval = False
         self.batch_input_file = None
+        self.render_mode = False
+        self.render_patch = None
+        self.render_duration = None
+        self.render_in = None
+        self.render_out = None
 
         # RPC host
         self.rpc_listener = None
@@ -225,6 +232,18 @@ class MFPApp (Singleton, SignalMixin):
         # start the reader
         await reader.send(MethodCall("readline"))
 
+    async def exec_render(self):
+        patch = await self.open_file(self.render_patch, show_gui=False)
+        stats = await self.dsp_render(self.render_duration, self.render_out, self.render_in)
+        if stats is None:
+            log.error("Render of %s failed" % self.render_patch)
+            return
+
+        print("%s: %.2f s to %s, %d blocks in %.3f s (%.0f blocks/s, %.1fx realtime)" % (
+            patch.name, stats["frames"] / self.samplerate, self.render_out or "(nowhere)",
+            stats["blocks"], stats["seconds"], stats["blocks_per_sec"], stats["realtime"]
+        ))
+
     def start_midi(self):
         from . import midi
         if self.midi_mgr:
@@ -243,8 +262,12 @@ class MFPApp (Singleton, SignalMixin):
         dspcommand = [
             # "valgrind", "--leak-check=full",
             "mfpdsp", self.socket_path, self.max_blocksize,
-            self.dsp_inputs, self.dsp_outputs,
+            self.dsp_inputs, self.dsp_outputs, self.dsp_queue_size,
+            self.dsp_threads,
         ]
+        if self.render_mode:
+            # an offline context, run by render() instead of JACK
+            dspcommand.extend([self.samplerate, self.blocksize])
         if not self.no_dsp:
             self.dsp_process = AsyncExecMonitor(
                 *dspcommand, log_module="dsp", log_raw=self.debug_remote
@@ -330,7 +353,7 @@ class MFPApp (Singleton, SignalMixin):
             log.debug("Finished cleaning up patches")
 
     async def open_file(self, file_name, context=None, show_gui=True):
-        from datetime import datetime
+        from datetime import datetime, timedelta
 
         starttime = datetime.now()
         patch = None
@@ -369,11 +392,19 @@ class MFPApp (Singleton, SignalMixin):
 
         self.patches[patch.name] = patch
         if show_gui:
+            guitime = datetime.now()
             await patch.create_gui()
+            patch.load_timing("gui", guitime)
         patch.mark_ready()
 
         loadtime = datetime.now() - starttime
-        log.debug("Patch loaded, elapsed time %s" % loadtime)
+        log.debug("Patch loaded, elapsed time %s (%s)" % (
+            loadtime,
+            ', '.join(
+                "%s %s" % (phase, patch.load_timings.get(phase, timedelta()))
+                for phase in ("parse", "create", "connect", "gui", "onload")
+            )
+        ))
         if show_gui and patch.gui_created:
             await MFPApp().gui_command.select(patch.obj_id)
         return patch
@@ -382,7 +413,10 @@ class MFPApp (Singleton, SignalMixin):
         fullpath = utils.find_file_in_path(libname, self.extpath)
         log.warning(f"mfp_app.load_extension: not implemented completely, path={fullpath}")
 
-    async def create(self, init_type, init_args, patch, scope, name):
+    async def create(self, init_type, init_args, patch, scope, name, setup=True):
+        # if setup is False, the caller is responsible for calling
+        # obj.setup() and obj.mark_ready() on the returned object
+
         # first try: is a factory registered?
         ctor = self.registry.get(init_type)
 
@@ -442,7 +476,7 @@ class MFPApp (Singleton, SignalMixin):
             if inspect.isawaitable(obj):
                 obj = await obj
 
-            if obj and obj.obj_id:
+            if obj and obj.obj_id and setup:
                 await obj.setup()
                 obj.mark_ready()
             return obj
@@ -454,6 +488,15 @@ class MFPApp (Singleton, SignalMixin):
             await self.cleanup()
             return None
 
+    async def create_pool(self, init_type, init_args, patch, scope, name, size):
+        '''
+        Create a PatchPool holding size ready-to-use instances of init_type
+        '''
+        from .patch_pool import PatchPool
+        pool = PatchPool(init_type, init_args, patch, scope, name)
+        await pool.fill(size)
+        return pool
+
     async def cleanup(self):
         garbage = []
         for _, obj in self.objects.items():
@@ -553,6 +596,9 @@ class MFPApp (Singleton, SignalMixin):
         log.debug("MFPApp.finish: reaping threads...")
         QuittableThread.finish_all()
 
+        log.debug("MFPApp.finish: eval cache", self.eval_cache_stats(),
+                  "template cache", self.template_cache_stats())
+
         log.debug("MFPApp.finish: all children reaped, good-bye!")
 
     def finish_soon(self):
@@ -598,7 +644,8 @@ class MFPApp (Singleton, SignalMixin):
 
         for attr in ("no_gui", "no_dsp", "dsp_inputs", "dsp_outputs",
                      "midi_inputs", "midi_outputs",
-                     "osc_port", "searchpath", "extpath", "max_blocksize"):
+                     "osc_port", "searchpath", "extpath", "max_blocksize",
+                     "dsp_queue_size", "dsp_threads"):
             val = getattr(self, attr)
             if isinstance(val, str):
                 val = '"%s"' % val
@@ -626,7 +673,8 @@ class MFPApp (Singleton, SignalMixin):
 
         for attr in ("no_gui", "no_dsp", "dsp_inputs", "dsp_outputs",
                      "midi_inputs", "midi_outputs",
-                     "osc_port", "searchpath", "extpath", "max_blocksize"):
+                     "osc_port", "searchpath", "extpath", "max_blocksize",
+                     "dsp_queue_size", "dsp_threads"):
             try:
                 val = cp.get("mfp", attr)
                 setattr(self, attr, eval(val))
@@ -700,3 +748,83 @@ class MFPApp (Singleton, SignalMixin):
         else:
             Processor.paused = True
         return Processor.paused
+
+    def eval_cache_stats(self):
+        from .evaluator import Evaluator
+        info = Evaluator.cache_info()
+        return dict(hits=info.hits, misses=info.misses,
+                    size=info.currsize, maxsize=info.maxsize)
+
+    def template_cache_stats(self):
+        return Patch.template_cache_info()
+
+    async def dsp_queue_stats(self):
+        from .dsp_object import DSPObject
+        if self.no_dsp:
+            return None
+        DSPObjectFactory = await self.rpc_host.require(DSPObject)
+        stats = await DSPObjectFactory.queue_stats()
+        keys = ("capacity", "count", "high_water", "overflows")
+        return dict(requests=dict(zip(keys, stats[:4])),
+                    responses=dict(zip(keys, stats[4:])))
+
+    def dsp_rpc_stats(self, reset=False):
+        from .dsp_object import DSPBatch
+        stats = DSPBatch.stats()
+        if reset:
+            DSPBatch.reset_stats()
+        return stats
+
+    async def dsp_level_stats(self, context_id=0):
+        from .dsp_object import DSPObject
+        if self.no_dsp:
+            return None
+        DSPObjectFactory = await self.rpc_host.require(DSPObject)
+        keys = ("depth", "procs", "parallel", "blocks", "avg_nsec", "max_nsec")
+        levels = []
+        while True:
+            stats = await DSPObjectFactory.level_stats(context_id, len(levels))
+            if not stats:
+                break
+            for pos in range(0, len(stats), len(keys)):
+                levels.append(dict(zip(keys, stats[pos:pos+len(keys)])))
+        return levels
+
+    async def dsp_buffer_stats(self, context_id=0):
+        from .dsp_object import DSPObject
+        if self.no_dsp:
+            return None
+        DSPObjectFactory = await self.rpc_host.require(DSPObject)
+        stats = await DSPObjectFactory.buffer_stats(context_id)
+        if not stats:
+            return None
+        keys = ("buffers", "bytes")
+        return dict(unshared=dict(zip(keys, stats[0:2])),
+                    shared=dict(zip(keys, stats[2:4])),
+                    pool=stats[4])
+
+    async def dsp_render(self, duration, outfile, infile=None, context_id=0):
+        """
+        Render duration seconds of an offline context (mfp --render) into
+        outfile, with infile as its input. Either may be None; with no
+        outfile it only measures blocks/second
+        """
+        from .dsp_object import DSPObject, DSPBatch
+        if self.no_dsp:
+            return None
+
+        # the render has to see everything the patch has asked for so far
+        for batch in list(DSPBatch.pending.values()):
+            await batch.done
+
+        DSPObjectFactory = await self.rpc_host.require(DSPObject)
+        stats = await DSPObjectFactory.render(
+            context_id, int(duration * self.samplerate), outfile or '', infile or ''
+        )
+        if not stats:
+            return None
+        frames, blocks, seconds = stats
+        seconds = max(seconds, 1e-9)
+        return dict(frames=frames, blocks=blocks, seconds=seconds,
+                    blocks_per_sec=blocks / seconds,
+                    realtime=frames / self.samplerate / seconds)
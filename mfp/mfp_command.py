@@ -229,6 +229,7 @@ class MFPCommand:
 
     def open_context(self, node_id, context_id, owner_pid, samplerate):
         from .dsp_object import DSPContext
+        from .dsp_response import ResponseReader
         from .mfp_app import MFPApp
         try:
             ctxt_name = open("/proc/%d/cmdline" % owner_pid, "r").read().split("\x00")[0]
@@ -241,6 +242,10 @@ class MFPCommand:
                       (MFPApp().samplerate, samplerate))
             MFPApp().samplerate = samplerate
 
+        # responses from the process's DSP objects come through shared
+        # memory if it can, else as dsp_response() calls
+        ResponseReader.start(owner_pid)
+
         if DSPContext.create(node_id, context_id, ctxt_name):
             return True
         return False
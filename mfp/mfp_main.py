@@ -142,6 +142,13 @@ async def main():
                         help="Log all child console output")
     parser.add_argument("--max-bufsize", default=2048,
                         help="Maximum JACK buffer size to support (default: 2048 frames)")
+    parser.add_argument("--dsp-queue-size", default=2048, type=int,
+                        help="Slots in the DSP request/response queues (default: 2048)")
+    parser.add_argument("--dsp-threads", default=0, type=int,
+                        help="Threads to run each DSP block on, 1 for per-level "
+                        "timing only (default: 0, a plain loop). Workers are "
+                        "woken for each parallel level, which costs some "
+                        "latency per level")
     parser.add_argument("--no-gui", action="store_true",
                         help="Do not launch the GUI engine")
     parser.add_argument("--no-dsp", action="store_true",
@@ -169,6 +176,21 @@ async def main():
     parser.add_argument("-e", "--batch-eval", action="store_true",
                         help="Call eval() on input before sending")
 
+    # offline render options
+    parser.add_argument("--render", default=None, metavar="PATCHFILE",
+                        help="Render PATCHFILE offline, faster than realtime, and exit")
+    parser.add_argument("--duration", default=10.0, type=float,
+                        help="Seconds to render (default: 10)")
+    parser.add_argument("--render-out", default=None,
+                        help="Render output file, .wav or raw float "
+                        "(default: patch name + .wav)")
+    parser.add_argument("--render-in", default=None,
+                        help="Render input file, .wav or raw float (default: silence)")
+    parser.add_argument("--render-samplerate", default=44100, type=int,
+                        help="Render sample rate (default: 44100)")
+    parser.add_argument("--render-blocksize", default=256, type=int,
+                        help="Render block size (default: 256 frames)")
+
     args = vars(parser.parse_args())
 
     # test imports to make sure everything is installed properly
@@ -192,6 +214,8 @@ async def main():
     app.searchpath = ':'.join(args.get("patch_path"))
     app.extpath = ':'.join(args.get("lib_path"))
     app.max_blocksize = args.get("max_bufsize")
+    app.dsp_queue_size = args.get("dsp_queue_size")
+    app.dsp_threads = args.get("dsp_threads")
     app.socket_path = args.get("socket_path")
     app.debug = args.get("debug")
 
@@ -206,6 +230,22 @@ async def main():
         app.no_gui = True
         log.log_quiet = True
 
+    if args.get('render'):
+        render_patch = args.get("render")
+        app.render_mode = True
+        app.render_patch = render_patch
+        app.render_duration = args.get("duration")
+        app.render_out = os.path.abspath(
+            args.get("render_out")
+            or os.path.splitext(os.path.basename(render_patch))[0] + ".wav"
+        )
+        if args.get("render_in"):
+            app.render_in = os.path.abspath(args.get("render_in"))
+        app.samplerate = args.get("render_samplerate")
+        app.blocksize = args.get("render_blocksize")
+        app.no_gui = True
+        app.no_default = True
+
     if args.get("verbose"):
         log.log_verbose = True
         log.log_force_console = True
@@ -299,6 +339,12 @@ async def main():
             finally:
                 await app.finish()
 
+        elif app.render_mode:
+            try:
+                await app.exec_render()
+            finally:
+                await app.finish()
+
         else:
             # create initial patch
             if len(patchfiles):
@@ -7,6 +7,7 @@ Copyright (c) 2010 Bill Gribble <grib@billgribble.com>
 '''
 
 import os
+from datetime import datetime, timedelta
 
 from .processor import Processor, AsyncOutput
 from .evaluator import Evaluator
@@ -14,6 +15,7 @@ from .scope import LexicalScope
 from .bang import Uninit, Unbound
 from .utils import TaskNibbler
 from .step_debugger import StepDebugger
+from .template_cache import TemplateCache
 
 from mfp import log
 
@@ -26,6 +28,9 @@ class Patch(Processor):
 
     task_nibbler = None
 
+    # decoded .mfp files for file-backed types
+    templates = TemplateCache()
+
     def __init__(self, init_type, init_args, patch, scope, name, context=None):
         Processor.__init__(self, 1, 0, init_type, init_args, patch, scope, name)
         if context is None:
@@ -52,6 +57,9 @@ class Patch(Processor):
 
         self.step_debugger = StepDebugger()
 
+        # time spent in each phase of loading from file
+        self.load_timings = {}
+
         self.init_bindings()
         self.parsed_initargs, self.parsed_kwargs = self.parse_args(init_args)
 
@@ -452,24 +460,32 @@ class Patch(Processor):
 
         searchpath = MFPApp().searchpath or ""
         searchdirs = splitpath(searchpath)
-        jsdata = None
-        filepath = None
-
-        for d in searchdirs:
-            path = os.path.join(d, filename)
-            try:
-                os.stat(path)
-                jsdata = open(path, 'r').read()
-                filepath = path
-            except OSError:
-                pass
+
+        starttime = datetime.now()
+        filepath, jsdata = Patch.templates.load(filename, searchdirs)
+        self.load_timing("parse", starttime)
 
         if jsdata is not None:
-            await self.json_deserialize(jsdata)
+            await self.json_unpack_patch(jsdata)
             self.file_origin = filepath
             self.gui_params["dsp_context"] = self.context.context_name
             if not MFPApp().no_onload:
+                starttime = datetime.now()
                 await self._run_onload(list(self.objects.values()))
+                self.load_timing("onload", starttime)
+
+    @classmethod
+    def template_cache_info(klass):
+        return klass.templates.cache_info()
+
+    def load_timing(self, phase, starttime):
+        """
+        Add the time since starttime to the total for a load phase,
+        returning the current time to use as the start of the next one
+        """
+        now = datetime.now()
+        self.load_timings[phase] = self.load_timings.get(phase, timedelta()) + (now - starttime)
+        return now
 
     async def _run_onload(self, objects):
         from .mfp_app import MFPApp
@@ -561,3 +577,4 @@ class Patch(Processor):
 from . import patch_json  # noqa
 from . import patch_lv2  # noqa
 from . import patch_clonescope  # noqa
+from . import patch_pool  # noqa
@@ -6,6 +6,9 @@ Methods to save and load JSON patch data
 Copyright (c) 2012 Bill Gribble <grib@billgribble.com>
 '''
 
+import asyncio
+from datetime import datetime
+
 import simplejson as json
 from .patch import Patch
 from .utils import extends
@@ -81,9 +84,16 @@ def extended_decoder_hook(saved):
 
 @extends(Patch)
 async def json_deserialize(self, json_data):
+    starttime = datetime.now()
+    f = json.loads(json_data, object_hook=extended_decoder_hook)
+    self.load_timing("parse", starttime)
+    await self.json_unpack_patch(f)
+
+
+@extends(Patch)
+async def json_unpack_patch(self, f):
     from .scope import NaiveScope
 
-    f = json.loads(json_data, object_hook=extended_decoder_hook)
     self.init_type = f.get('type')
 
     # don't swap Patch gui_params if this isn't a top-level patch
@@ -146,7 +156,9 @@ async def json_deserialize(self, json_data):
             obj.scope = self.default_scope
 
     # make connections
+    starttime = datetime.now()
     await self.json_unpack_connections(f, idmap)
+    self.load_timing("connect", starttime)
 
     inlets = len(self.inlet_objects)
     if not inlets:
@@ -157,23 +169,34 @@ async def json_deserialize(self, json_data):
     if hot is not None:
         self.hot_inlets = hot
 
+    starttime = datetime.now()
     for oid, obj in self.objects.items():
         await obj.onload(-1)
+    self.load_timing("onload", starttime)
 
 
 @extends(Patch)
 async def json_unpack_connections(self, data, idmap):
+    # each connection to a DSP object is an RPC to the DSP engine, so
+    # issue them together rather than waiting for each one in turn.
+    # The message-only part of connect() completes before its first
+    # await, so the order of message connections is preserved.
+    pending = []
     for oid, prms in data.get('objects', {}).items():
         oid = int(oid)
         conn = prms.get("connections", [])
         srcobj = idmap.get(oid)
+        if srcobj is None:
+            continue
         for outlet in range(0, len(conn)):
             connlist = conn[outlet]
             for c in connlist:
                 dstobj = idmap.get(c[0])
                 inlet = c[1]
                 if dstobj is not None:
-                    await srcobj.connect(outlet, dstobj, inlet)
+                    pending.append(srcobj.connect(outlet, dstobj, inlet))
+
+    await asyncio.gather(*pending)
 
 
 @extends(Patch)
@@ -184,6 +207,27 @@ async def json_unpack_objects(self, data, scope):
     idlist.sort(key=lambda x: int(x))
     need_gui = []
 
+    async def _setup(newobj, prms):
+        # setup() is where DSP objects are created in the DSP engine
+        try:
+            await newobj.setup()
+            newobj.mark_ready()
+        except Exception as e:
+            log.error("Caught exception while trying to set up %s (%s)"
+                      % (newobj.init_type, newobj.init_args))
+            log.debug(e)
+            log.debug_traceback()
+            await newobj.delete()
+            return None
+
+        newobj.patch = self
+        newobj.load(prms)
+        return newobj
+
+    # construct objects in id order, then set them all up at once so
+    # that the DSP round-trips overlap instead of running back to back
+    starttime = datetime.now()
+    created = []
     for oid in idlist:
         prms = data.get('objects')[oid]
 
@@ -191,13 +235,24 @@ async def json_unpack_objects(self, data, scope):
         oargs = prms.get('initargs')
         oname = prms.get('name')
 
-        newobj = await MFPApp().create(otype, oargs, self, scope, oname)
-        newobj.patch = self
-        newobj.load(prms)
+        newobj = await MFPApp().create(otype, oargs, self, scope, oname, setup=False)
+        if newobj is None:
+            log.error("json_unpack_objects: could not create %s (%s), continuing"
+                      % (otype, oargs))
+            continue
+        created.append((int(oid), newobj, prms))
+
+    ready = await asyncio.gather(*[
+        _setup(newobj, prms) for _, newobj, prms in created
+    ])
+
+    for (oid, _, _), newobj in zip(created, ready):
+        if newobj is None:
+            continue
         if self.gui_created:
             need_gui.append(newobj)
-
-        idmap[int(oid)] = newobj
+        idmap[oid] = newobj
+    starttime = self.load_timing("create", starttime)
 
     # find mapping for self to catch vias
     defscope = data.get('scopes').get('__patch__')
@@ -207,6 +262,7 @@ async def json_unpack_objects(self, data, scope):
     self.update_export_bounds()
     for obj in need_gui:
         await obj.create_gui()
+    self.load_timing("gui", starttime)
 
     return idmap
 
@@ -0,0 +1,123 @@
+#! /usr/bin/env python
+'''
+patch_pool.py: pre-built patch instances for fast allocation
+(e.g. one synth voice per MIDI note)
+'''
+
+import asyncio
+
+from .utils import extends
+from .patch import Patch
+from . import log
+
+
+@extends(Patch)
+def dsp_objects(self):
+    '''
+    Every object with a DSP counterpart in this patch and its subpatches
+    '''
+    for obj in self.objects.values():
+        if isinstance(obj, Patch):
+            yield from obj.dsp_objects()
+        elif obj.dsp_obj is not None:
+            yield obj
+
+
+@extends(Patch)
+async def dsp_activate(self, active):
+    # all the requests go in the same DSPBatch, so this is one RPC
+    # however many DSP objects there are
+    await asyncio.gather(*[
+        obj.dsp_obj.activate(active) for obj in self.dsp_objects()
+    ])
+
+
+@extends(Patch)
+async def dsp_reset_all(self):
+    await asyncio.gather(*[
+        obj.dsp_obj.reset() for obj in self.dsp_objects()
+    ])
+
+
+class PatchPool:
+    '''
+    Instances of one patch type, created ahead of time with their DSP
+    graph built but inactive. acquire() and release() only switch DSP
+    processing on and off (release also resets DSP state), which costs
+    one batched RPC instead of a full MFPApp().create().
+
+    If the pool runs dry, acquire() creates another instance the slow
+    way and counts it as a miss.
+    '''
+
+    def __init__(self, init_type, init_args, patch, scope, name):
+        self.init_type = init_type
+        self.init_args = init_args
+        self.patch = patch
+        self.scope = scope
+        self.name = name
+        self.free = []
+        self.in_use = set()
+        self.created = 0
+        self.acquires = 0
+        self.misses = 0
+
+    async def _new_instance(self):
+        from .mfp_app import MFPApp
+        instance = await MFPApp().create(
+            self.init_type, self.init_args, self.patch, self.scope,
+            "%s_%d" % (self.name, self.created)
+        )
+        if instance is None:
+            log.error("PatchPool: could not create %s (%s)"
+                      % (self.init_type, self.init_args))
+            return None
+        self.created += 1
+        return instance
+
+    async def fill(self, count):
+        '''
+        Create instances until count are waiting to be acquired
+        '''
+        needed = count - len(self.free)
+        if needed <= 0:
+            return
+
+        instances = [await self._new_instance() for _ in range(needed)]
+        instances = [i for i in instances if i is not None]
+        await asyncio.gather(*[i.dsp_activate(False) for i in instances])
+        self.free.extend(instances)
+
+    async def acquire(self):
+        self.acquires += 1
+        if self.free:
+            instance = self.free.pop()
+        else:
+            self.misses += 1
+            instance = await self._new_instance()
+            if instance is None:
+                return None
+
+        self.in_use.add(instance)
+        await instance.dsp_activate(True)
+        return instance
+
+    async def release(self, instance):
+        if instance not in self.in_use:
+            log.warning("PatchPool: %s was not acquired from this pool" % instance.name)
+            return
+
+        self.in_use.discard(instance)
+        await asyncio.gather(instance.dsp_activate(False), instance.dsp_reset_all())
+        self.free.append(instance)
+
+    async def delete(self):
+        for instance in self.free + list(self.in_use):
+            await instance.delete()
+        self.free = []
+        self.in_use = set()
+
+    def stats(self):
+        return dict(free=len(self.free), in_use=len(self.in_use),
+                    created=self.created, acquires=self.acquires,
+                    misses=self.misses)
@@ -9,7 +9,9 @@ import asyncio
 import inspect
 import threading
 
-from .dsp_object import DSPObject
+from carp.service import ApiProxyObject
+
+from .dsp_object import DSPObject, DSPObjectProxy
 from .method import MethodCall
 from .evaluator import LazyExpr
 from .bang import Uninit, Bang
@@ -20,16 +22,48 @@ from . import log
 
 
 class AsyncOutput:
+    __slots__ = ('outlet_num', 'value')
+
     def __init__(self, value, outlet):
         self.outlet_num = outlet
         self.value = value
 
 
 class MultiOutput:
+    __slots__ = ('values',)
+
     def __init__(self):
         self.values = []
 
 
+class LazyContainer:
+    """
+    Descriptor for rarely-used container attributes of Processor
+
+    The value is kept in the slot named '_' + attribute name and the
+    container is only created the first time it is accessed.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.slot = None
+
+    def __set_name__(self, owner, name):
+        self.slot = '_' + name
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        value = getattr(obj, self.slot)
+        if value is None:
+            value = self.factory()
+            setattr(obj, self.slot, value)
+        return value
+
+    def __set__(self, obj, value):
+        setattr(obj, self.slot, value)
+
+
 class Processor:
     """
     Processor - parent class of all the types of processor
@@ -37,6 +71,17 @@ class Processor:
     Way too much stuff in here
     """
 
+    # fields touched on every message or held by every object are
+    # slots; subclasses still get a __dict__ for their own state
+    __slots__ = (
+        '__dict__', 'obj_id', 'init_type', 'init_args', 'name', 'patch',
+        'scope', 'status', 'inlets', 'outlets', '_outlet_order',
+        'dispatch_table', 'connections_out', 'connections_in',
+        'count_in', 'count_out', 'count_trigger', 'count_errors',
+        'dsp_obj', 'gui_created',
+        '_tags', '_properties', '_error_info', '_osc_methods',
+    )
+
     PORT_IN = 0
     PORT_OUT = 1
 
@@ -53,10 +98,35 @@ class Processor:
 
     paused = False
 
+    # True if trigger() is a plain function rather than a coroutine.
+    # Computed for each subclass in __init_subclass__; processors with
+    # synchronous triggers can be run by send() without creating
+    # coroutines (see _send_sync)
+    sync_trigger = False
+
     doc_tooltip_obj = "No documentation found"
     doc_tooltip_inlet = []
     doc_tooltip_outlet = []
 
+    # tags are labels shown in notify bubble
+    tags = LazyContainer(dict)
+    properties = LazyContainer(dict)
+    error_info = LazyContainer(dict)
+
+    # MIDI event listener
+    midi_mode = None
+    midi_filters = None
+    midi_cbid = None
+    midi_learn_cbid = None
+
+    # OSC handling
+    osc_pathbase = None
+    osc_methods = LazyContainer(list)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.sync_trigger = not inspect.iscoroutinefunction(cls.trigger)
+
     def __init__(self, inlets, outlets, init_type, init_args, patch, scope, name):
         from .mfp_app import MFPApp
 
@@ -69,8 +139,10 @@ class Processor:
         self.outlet_order = list(reversed(range(outlets)))
 
         self.status = Processor.CTOR
-        self.tags = {}          # tags are labels shown in notify bubble
-        self.properties = {}
+        self._tags = None
+        self._properties = None
+        self._error_info = None
+        self._osc_methods = None
         self.name = None
         self.patch = None
         self.scope = None
@@ -81,17 +153,6 @@ class Processor:
         self.count_trigger = 0
         self.count_errors = 0
 
-        # MIDI event listener
-        self.midi_mode = None
-        self.midi_filters = None
-        self.midi_cbid = None
-        self.midi_learn_cbid = None
-        self.error_info = {}
-
-        # OSC handling
-        self.osc_pathbase = None
-        self.osc_methods = []
-
         self.gui_created = False
 
         # gui_params are passed back and forth to the UI process
@@ -126,6 +187,15 @@ class Processor:
             name = self.display_type
         self.assign(patch, scope, name)
 
+    @property
+    def outlet_order(self):
+        return self._outlet_order
+
+    @outlet_order.setter
+    def outlet_order(self, order):
+        self._outlet_order = order
+        self.dispatch_table = None
+
     async def setup(self):
         # called after constructor
         pass
@@ -194,7 +264,7 @@ class Processor:
                 for msg, count in self.error_info.items():
                     lines.append('              %s: %s' % (count, msg))
 
-            if len(self.properties):
+            if self._properties:
                 lines.append('      <b>Properties:</b>')
 
                 for k, v in self.properties.items():
@@ -211,7 +281,7 @@ class Processor:
             # OSC controllers
             lines.append('      <b>OSC handlers:</b>')
             minfo = {}
-            for m in self.osc_methods:
+            for m in self._osc_methods or []:
                 s = minfo.setdefault(m[0], [])
                 s.append(m[1])
             for m in sorted(minfo.keys()):
@@ -452,8 +522,8 @@ class Processor:
         from .mfp_app import MFPApp
         if self.patch.context:
             DSPObjectFactory = await MFPApp().rpc_host.require(DSPObject)
-            self.dsp_obj = await DSPObjectFactory(
-                self.obj_id,
+            self.dsp_obj = await DSPObjectProxy.create(
+                ApiProxyObject(DSPObjectFactory, self.obj_id),
                 proc_name,
                 len(self.dsp_inlets),
                 len(self.dsp_outlets), params,
@@ -473,8 +543,29 @@ class Processor:
     async def dsp_reset(self):
         await self.dsp_obj.reset()
 
-    async def dsp_setparam(self, param, value):
-        await self.dsp_obj.setparam(param, value)
+    async def dsp_activate(self, active):
+        await self.dsp_obj.activate(active)
+
+    async def dsp_autosleep(self, blocks):
+        '''
+        Put this object's patch to sleep once its first signal outlet has
+        been silent for blocks DSP blocks, e.g. on a voice's envelope.
+        Any message to a DSP object in the patch wakes it; 0 turns it off
+        '''
+        await self.dsp_obj.autosleep(blocks)
+
+    async def dsp_setparam(self, param, value, at=None, frame=None):
+        '''
+        With frame (a frame of the patch's DSP context) or at (a
+        time.monotonic() time) the value is applied at that point in
+        the audio: at its own sample for sample-accurate DSP objects like
+        *~ and sig~, at the start of its block for the rest. Without
+        either, a value sent while the output of a [metro] or other
+        timed processor is propagating goes at the frame of that tick
+        '''
+        if at is not None and frame is None:
+            frame = await self.patch.context.frame_at(at)
+        await self.dsp_obj.setparam(param, value, frame)
 
     async def dsp_getparam(self, param, value):
         return await self.dsp_obj.getparam(param, value)
@@ -611,6 +702,7 @@ class Processor:
             existing = self.connections_out[outlet]
             if (target, inlet) not in existing:
                 existing.append((target, inlet))
+                self.dispatch_table = None
         except Exception:
             # this can happen normally in a creation race, don't
             # flag it (Patch.connect wil retry)
@@ -649,6 +741,7 @@ class Processor:
         existing = self.connections_out[outlet]
         if (target, inlet) in existing:
             existing.remove((target, inlet))
+            self.dispatch_table = None
 
         existing = target.connections_in[inlet]
         if (self, outlet) in existing:
@@ -682,11 +775,21 @@ class Processor:
         w_target = None
 
         try:
-            work = await self._send(value, inlet)
-
-            while len(work):
-                w_target, w_val, w_inlet = work[0]
-                work[:1] = await w_target._send(w_val, w_inlet)
+            work = self._send_sync(value, inlet)
+            if work is None:
+                work = await self._send(value, inlet)
+
+            # work is used as a stack, so new items are pushed in
+            # reverse order to be popped in the order they were generated
+            work.reverse()
+
+            while work:
+                w_target, w_val, w_inlet = work.pop()
+                w_work = w_target._send_sync(w_val, w_inlet)
+                if w_work is None:
+                    w_work = await w_target._send(w_val, w_inlet)
+                if w_work:
+                    work.extend(reversed(w_work))
         except Exception as e:
             import traceback
             tb = traceback.format_exc()
@@ -697,6 +800,33 @@ class Processor:
             if w_target:
                 w_target.error("%s" % e.args, tb)
 
+    @staticmethod
+    async def send_many(items):
+        """
+        Deliver (target, value, inlet) items, in order, in one
+        trampoline run, e.g. a batch of DSP responses. A failure in
+        one item's chain is logged and the rest carry on
+        """
+        work = list(reversed(items))
+
+        while work:
+            w_target, w_val, w_inlet = work.pop()
+            try:
+                w_work = w_target._send_sync(w_val, w_inlet)
+                if w_work is None:
+                    w_work = await w_target._send(w_val, w_inlet)
+            except Exception as e:
+                import traceback
+                tb = traceback.format_exc()
+                log.error("%s (%s): send to inlet %d failed: '%s'" %
+                          (w_target.name, w_target.init_type, w_inlet, w_val))
+                log.error("Exception: %s" % e.args)
+                log.debug_traceback()
+                w_target.error("%s" % e.args, tb)
+                continue
+            if w_work:
+                work.extend(reversed(w_work))
+
     async def _send(self, value, inlet=0, step_execute=False):
         """
         Workhorse of processor triggering.
@@ -776,6 +906,52 @@ class Processor:
 
         return send_tasks
 
+    def _send_sync(self, value, inlet=0):
+        """
+        Fast path of _send for processors with a synchronous trigger()
+
+        Runs the same phases as _send without creating any coroutines.
+        Returns None if the message needs the async path: the trigger
+        is a coroutine, the step debugger is active, the value is a
+        DSP parameter or a method call (which may need to await)
+        """
+        if not self.sync_trigger or self.patch is None:
+            return None
+
+        debugger = self.patch.step_debugger
+        if debugger.enabled or isinstance(value, MethodCall):
+            return None
+
+        if (
+            (inlet in self.dsp_inlets)
+            and not isinstance(value, bool)
+            and isinstance(value, (float, int))
+        ):
+            return None
+
+        if self.paused:
+            return []
+
+        if inlet >= 0:
+            self.inlets[inlet] = value
+
+        self.count_in += 1
+
+        if inlet in self.hot_inlets or inlet == -1:
+            self._send__activate_sync(value, inlet)
+
+            # step mode could be activated in trigger
+            if debugger.enabled:
+                debugger.add_task(
+                    self._send__propagate(),
+                    f"Send outputs from {self.name} to connected processors",
+                    self
+                )
+                return []
+            return self._send__propagate_sync()
+
+        return []
+
     async def _send__activate(self, value, inlet):
         if self.clear_outlets:
             self.outlets = [Uninit] * len(self.outlets)
@@ -792,51 +968,91 @@ class Processor:
                 self.add_output(value.outlet_num, value.value)
                 self.inlets[inlet] = Uninit
         else:
-            await self.trigger()
+            rv = self.trigger()
+            if inspect.isawaitable(rv):
+                await rv
+            self.count_trigger += 1
+
+    def _send__activate_sync(self, value, inlet):
+        if self.clear_outlets:
+            self.outlets = [Uninit] * len(self.outlets)
+
+        if inlet == -1:
+            self.dsp_response(value[0], value[1])
+        elif isinstance(value, AsyncOutput):
+            if value.outlet_num not in range(len(self.outlets)):
+                log.error("_send: object %s has no outlet '%s'" % (self.name,
+                                                                   value.outlet_num))
+            else:
+                self.add_output(value.outlet_num, value.value)
+                self.inlets[inlet] = Uninit
+        else:
+            self.trigger()
             self.count_trigger += 1
 
     async def _send__propagate(self):
+        return self._send__propagate_sync()
+
+    def _send__propagate_sync(self):
         """
         Pass outputs along the data flow path
 
         'work' is our trampoline worklist. Note that the contents are
         different if we are in debugging mode.
         """
-        output_pairs = list(zip(self.connections_out, self.outlets))
+        dispatch = self.dispatch_table
+        if dispatch is None:
+            dispatch = self._build_dispatch()
+
+        outlets = self.outlets
         work = []
 
-        for conns, val in [output_pairs[i] for i in self.outlet_order]:
+        for outlet, targets in dispatch:
+            val = outlets[outlet]
             if val is Uninit:
                 continue
 
             if isinstance(val, LazyExpr):
                 val = val.call()
             if isinstance(val, MultiOutput):
-                values = val.values
+                for v in val.values:
+                    self.count_out += 1
+                    work.extend((target, v, tinlet) for target, tinlet in targets)
             else:
-                values = [val]
-
-            for val in values:
                 self.count_out += 1
-                for target, tinlet in conns:
-                    if target is not None:
-                        if self.step_debug_manager().enabled:
-                            work.append((
-                                self._send__propagate_value(target, val, tinlet),
-                                f"Send output to {target.name} inlet {tinlet}",
-                                target,
-                            ))
-                        else:
-                            work.append((target, val, tinlet))
-                    else:
-                        log.warning("Bad output connection: obj_id=%s" % self.obj_id)
-
-        if self.step_debug_manager().enabled and work:
-            self.step_debug_manager().prepend_tasks(work)
+                work.extend((target, val, tinlet) for target, tinlet in targets)
+
+        if work and self.step_debug_manager().enabled:
+            self.step_debug_manager().prepend_tasks([
+                (
+                    self._send__propagate_value(target, val, tinlet),
+                    f"Send output to {target.name} inlet {tinlet}",
+                    target,
+                )
+                for target, val, tinlet in work
+            ])
             return []
 
         return work
 
+    def _build_dispatch(self):
+        """
+        Flatten connections_out into (outlet, ((target, inlet), ...))
+        pairs in outlet_order. Invalidated by connect, disconnect,
+        resize and changes to outlet_order
+        """
+        table = []
+        for outlet in self.outlet_order:
+            targets = []
+            for target, tinlet in self.connections_out[outlet]:
+                if target is None:
+                    log.warning("Bad output connection: obj_id=%s" % self.obj_id)
+                else:
+                    targets.append((target, tinlet))
+            table.append((outlet, tuple(targets)))
+        self.dispatch_table = tuple(table)
+        return self.dispatch_table
+
     async def _send__propagate_value(self, target, val, inlet):
         """
         Helper used by step debugger.
@@ -915,7 +1131,7 @@ class Processor:
         self.count_in = 0
         self.count_out = 0
         self.count_errors = 0
-        self.error_info = {}
+        self.error_info = None
         self.count_trigger = 0
         self.set_tag("errorcount", self.count_errors)
 
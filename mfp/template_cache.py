@@ -0,0 +1,125 @@
+#! /usr/bin/env python
+'''
+template_cache.py
+Decoded .mfp files shared by every instance of a file-backed patch type
+
+Copyright (c) 2010 Bill Gribble <grib@billgribble.com>
+'''
+
+import os
+import pickle
+
+from mfp import log
+
+
+class PatchTemplate:
+    '''
+    One decoded .mfp file. The decoded structure is kept pickled, and
+    every instance unpickles its own copy, so nothing loaded into one
+    patch is shared with another. If the structure can't be pickled
+    the JSON text is kept instead and parsed for each instance.
+    '''
+    __slots__ = ('path', 'mtime', 'size', 'blob', 'text')
+
+    def __init__(self, path, stat, text):
+        from .patch_json import extended_decoder_hook
+        import simplejson as json
+
+        self.path = path
+        self.mtime = stat.st_mtime_ns
+        self.size = stat.st_size
+        self.blob = None
+        self.text = None
+
+        data = json.loads(text, object_hook=extended_decoder_hook)
+        try:
+            self.blob = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            log.debug("PatchTemplate: can't pickle %s (%s), will parse each time"
+                      % (path, e))
+            self.text = text
+
+    def matches(self, stat):
+        return self.mtime == stat.st_mtime_ns and self.size == stat.st_size
+
+    def instance_data(self):
+        if self.blob is not None:
+            return pickle.loads(self.blob)
+
+        from .patch_json import extended_decoder_hook
+        import simplejson as json
+        return json.loads(self.text, object_hook=extended_decoder_hook)
+
+
+class TemplateCache:
+    '''
+    Templates for file-backed patch types, keyed by resolved path.
+
+    Resolving a filename against the search path is remembered too, so
+    an instantiation costs one os.stat() of the resolved file to check
+    that it hasn't changed. A changed mtime or size reloads the file;
+    a missing file drops the entry and searches the path again.
+    '''
+
+    def __init__(self):
+        self.templates = {}
+        self.resolved = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _resolve(self, filename, searchdirs):
+        # same rule as a plain search-path walk: the last directory
+        # that has the file wins
+        found = None
+        for d in searchdirs:
+            path = os.path.join(d, filename)
+            try:
+                found = (path, os.stat(path))
+            except OSError:
+                pass
+        return found
+
+    def load(self, filename, searchdirs):
+        '''
+        Return (path, decoded patch data) for filename, or (None, None)
+        if it isn't in the search path. The data belongs to the caller.
+        '''
+        key = (filename, tuple(searchdirs))
+        path = self.resolved.get(key)
+        stat = None
+
+        if path is not None:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                del self.resolved[key]
+                path = None
+
+        if path is None:
+            found = self._resolve(filename, searchdirs)
+            if found is None:
+                return (None, None)
+            path, stat = found
+            self.resolved[key] = path
+
+        template = self.templates.get(path)
+        if template is not None and template.matches(stat):
+            self.hits += 1
+        else:
+            if template is not None:
+                self.invalidations += 1
+            self.misses += 1
+            with open(path, 'r') as jsfile:
+                template = PatchTemplate(path, stat, jsfile.read())
+            self.templates[path] = template
+
+        return (path, template.instance_data())
+
+    def clear(self):
+        self.templates = {}
+        self.resolved = {}
+
+    def cache_info(self):
+        return dict(hits=self.hits, misses=self.misses,
+                    invalidations=self.invalidations, size=len(self.templates))
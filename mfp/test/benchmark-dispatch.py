@@ -0,0 +1,67 @@
+'''
+benchmark-dispatch.py: message throughput of the send() trampoline
+
+Not collected by the default test run; run explicitly with
+nosetests -s mfp/test/benchmark-dispatch.py
+'''
+
+import threading
+import asyncio
+import time
+from unittest import IsolatedAsyncioTestCase
+from mfp.mfp_app import MFPApp
+from mfp.patch import Patch
+from mfp.scope import NaiveScope
+from mfp import Bang, log, builtins
+from mfp.processor import Processor
+
+
+class Counter (Processor):
+    def __init__(self, patch):
+        self.count = 0
+        Processor.__init__(self, 1, 1, 'counter', '', patch, None, None)
+
+    def trigger(self):
+        self.count += 1
+        self.outlets[0] = self.inlets[0]
+
+
+class DispatchBenchmark(IsolatedAsyncioTestCase):
+    ITERATIONS = 100
+
+    async def asyncSetUp(self):
+        MFPApp().no_gui = True
+        MFPApp().no_dsp = True
+        MFPApp().next_obj_id = 0
+        MFPApp().objects = {}
+        log.log_quiet = True
+        log.log_thread = threading.get_ident()
+        log.log_loop = asyncio.get_event_loop()
+        await MFPApp().setup()
+        builtins.register()
+        self.patch = Patch('default', '', None, NaiveScope(), 'default')
+
+    async def _run(self, label, source, sink_count, messages):
+        start = time.perf_counter()
+        for _ in range(self.ITERATIONS):
+            await source.send(Bang)
+        elapsed = time.perf_counter() - start
+        self.assertEqual(sink_count(), self.ITERATIONS)
+        print("\n     %s: %d msgs/sec" % (label, messages * self.ITERATIONS / elapsed))
+
+    async def test_chain_1000(self):
+        '''test_chain_1000: messages/sec through a 1000-node chain'''
+        procs = [Counter(self.patch) for _ in range(1000)]
+        for src, dst in zip(procs[:-1], procs[1:]):
+            await src.connect(0, dst, 0)
+
+        await self._run("chain 1000", procs[0], lambda: procs[-1].count, 1000)
+
+    async def test_fanout_500(self):
+        '''test_fanout_500: messages/sec from one outlet to 500 inlets'''
+        source = Counter(self.patch)
+        sinks = [Counter(self.patch) for _ in range(500)]
+        for s in sinks:
+            await source.connect(0, s, 0)
+
+        await self._run("fanout 1-500", source, lambda: sinks[-1].count, 501)
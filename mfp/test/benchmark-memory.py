@@ -0,0 +1,52 @@
+'''
+benchmark-memory.py: memory used per processor in a large patch
+
+Not collected by the default test run; run explicitly with
+nosetests -s mfp/test/benchmark-memory.py
+'''
+
+import threading
+import asyncio
+import tracemalloc
+from unittest import IsolatedAsyncioTestCase
+from mfp.mfp_app import MFPApp
+from mfp.patch import Patch
+from mfp.scope import NaiveScope
+from mfp import log, builtins
+
+
+class MemoryBenchmark(IsolatedAsyncioTestCase):
+    OBJECTS = 10000
+
+    async def asyncSetUp(self):
+        MFPApp().no_gui = True
+        MFPApp().no_dsp = True
+        MFPApp().next_obj_id = 0
+        MFPApp().objects = {}
+        log.log_quiet = True
+        log.log_thread = threading.get_ident()
+        log.log_loop = asyncio.get_event_loop()
+        await MFPApp().setup()
+        builtins.register()
+        self.patch = Patch('default', '', None, NaiveScope(), 'default')
+
+    async def _measure(self, init_type, init_args):
+        procs = []
+        tracemalloc.start()
+        before, _ = tracemalloc.get_traced_memory()
+        for i in range(self.OBJECTS):
+            procs.append(await MFPApp().create(init_type, init_args, self.patch,
+                                               None, "%s_%d" % (init_type, i)))
+        after, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        self.assertEqual(len([p for p in procs if p is not None]), self.OBJECTS)
+        print("\n     [%s]: %d bytes/object" % (init_type, (after - before) / self.OBJECTS))
+
+    async def test_var(self):
+        '''test_var: bytes per [var] in a 10,000 object patch'''
+        await self._measure("var", "0")
+
+    async def test_route(self):
+        '''test_route: bytes per [route] in a 10,000 object patch'''
+        await self._measure("route", "1, 2, 3")
@@ -0,0 +1,94 @@
+import asyncio
+
+from unittest import IsolatedAsyncioTestCase
+
+from mfp.dsp_object import DSPBatch, DSPObjectProxy
+
+
+class FakeService:
+    host_id = "test-host"
+
+
+class FakeProxy:
+    '''
+    Stands in for a DSPObject RPC proxy, keeping what is posted
+    '''
+    def __init__(self, obj_id):
+        self._id = obj_id
+        self._service = FakeService()
+        self.posted = []
+
+    async def post(self, ops):
+        self.posted.append(ops)
+
+
+class FakeContext:
+    def __init__(self, context_id):
+        self.context_id = context_id
+
+
+class DSPBatchTests (IsolatedAsyncioTestCase):
+    def setUp(self):
+        DSPBatch.pending = {}
+        DSPBatch.reset_stats()
+        self.proxy = FakeProxy(1)
+        self.obj = DSPObjectProxy(self.proxy)
+
+    def proxy_for(self, obj_id):
+        '''
+        Another object on the same host, posting where self.proxy does
+        '''
+        proxy = FakeProxy(obj_id)
+        proxy.posted = self.proxy.posted
+        return proxy
+
+    async def test_coalesce(self):
+        '''test_coalesce: only the last setparam of a parameter is sent'''
+        await asyncio.gather(*[
+            self.obj.setparam("_sig_1", float(f)) for f in range(10)
+        ])
+        assert self.proxy.posted == [[["setparam", 1, "_sig_1", 9.0]]]
+
+    async def test_coalesce_order(self):
+        '''test_coalesce_order: a coalesced setparam stays after ops added since the first'''
+        await asyncio.gather(
+            self.obj.setparam("_sig_1", 1.0),
+            self.obj.setparam("_sig_1", 2.0, frame=4800),
+            self.obj.connect(0, 2, 0),
+            self.obj.setparam("_sig_1", 3.0),
+            self.obj.setparam("_sig_2", 0.5),
+        )
+        assert self.proxy.posted == [[
+            ["setparam", 1, "_sig_1", 2.0, 4800],
+            ["connect", 1, 0, 2, 0],
+            ["setparam", 1, "_sig_1", 3.0],
+            ["setparam", 1, "_sig_2", 0.5],
+        ]]
+        stats = DSPBatch.stats()
+        assert stats["calls"] == 5
+        assert stats["ops"] == 4
+
+    async def test_create(self):
+        '''test_create: creates are batched with the requests that follow them'''
+        context = FakeContext(3)
+
+        async def make(obj_id):
+            obj = await DSPObjectProxy.create(
+                self.proxy_for(obj_id), "osc~", 1, 1, dict(_sig_1=440.0), context, 7
+            )
+            await obj.connect(0, 1, 0)
+            return obj
+
+        objs = await asyncio.gather(*[make(obj_id) for obj_id in (2, 3)])
+        assert [obj._id for obj in objs] == [2, 3]
+        assert objs[0].context is context
+        assert self.proxy.posted == [
+            [
+                ["create", 2, "osc~", 1, 1, dict(_sig_1=440.0), 3, 7],
+                ["create", 3, "osc~", 1, 1, dict(_sig_1=440.0), 3, 7],
+            ],
+            [
+                ["connect", 2, 0, 1, 0],
+                ["connect", 3, 0, 1, 0],
+            ]
+        ]
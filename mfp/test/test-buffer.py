@@ -0,0 +1,59 @@
+import mmap
+import os
+
+import numpy
+from posix_ipc import SharedMemory, O_CREX
+from unittest import TestCase
+
+from mfp.buffer_info import BufferInfo, BufferMap
+
+
+class BufferMapTests (TestCase):
+    SIZE = 100
+    CHANNELS = 2
+
+    def setUp(self):
+        # laid out like a buffer~: each channel's samples in one run
+        self.shm = SharedMemory("/mfp_test_buffer_%d" % os.getpid(), O_CREX,
+                                size=self.SIZE * self.CHANNELS * 4)
+        data = numpy.arange(self.SIZE * self.CHANNELS, dtype=numpy.float32)
+        with mmap.mmap(self.shm.fd, self.SIZE * self.CHANNELS * 4) as m:
+            m[:] = data.tobytes()
+        self.info = BufferInfo(self.shm.name, self.SIZE, self.CHANNELS, 44100)
+
+    def tearDown(self):
+        self.shm.close_fd()
+        self.shm.unlink()
+
+    def test_views(self):
+        '''test_views: one view per channel, in place'''
+        bmap = BufferMap.from_info(self.info)
+        assert len(bmap.channels) == self.CHANNELS
+        assert bmap.channels[0][0] == 0.0
+        assert bmap.channels[1][0] == self.SIZE
+        assert len(bmap.channels[1]) == self.SIZE
+        bmap.close()
+
+    def test_readonly(self):
+        '''test_readonly: views can't be written unless asked for'''
+        bmap = BufferMap.from_info(self.info)
+        with self.assertRaises(ValueError):
+            bmap.channels[0][0] = 1.0
+
+        rw_map = BufferMap.from_info(self.info, writable=True)
+        rw_map.channels[1][5] = -1.0
+        assert bmap.channels[1][5] == -1.0
+        rw_map.close()
+        bmap.close()
+
+    def test_held_view(self):
+        '''test_held_view: a view outlives close() of its map'''
+        bmap = BufferMap.from_info(self.info)
+        view = bmap.channels[0][10:20]
+        bmap.close()
+        assert view[0] == 10.0
+
+    def test_too_small(self):
+        '''test_too_small: mapping past the end of the segment is refused'''
+        with self.assertRaises(ValueError):
+            BufferMap(self.shm.name, self.SIZE * 2, self.CHANNELS)
@@ -0,0 +1,80 @@
+import mmap
+import os
+
+from posix_ipc import SharedMemory, O_CREX
+from unittest import TestCase
+
+from mfp.dsp_clock import ClockPage
+from mfp.dsp_object import DSPContext, event_stamp, stamp_frame
+
+
+class ClockPageTests (TestCase):
+    def setUp(self):
+        self.shm = SharedMemory("/mfp_test_clock_%d" % os.getpid(), O_CREX,
+                                size=ClockPage.LAYOUT.size)
+        self.mmap = mmap.mmap(self.shm.fd, ClockPage.LAYOUT.size)
+        self.write(2, 48000, 4800, 1000000, 256)
+
+        self.context = DSPContext("node", 0)
+        self.context.clock_page = ClockPage(self.shm.name)
+
+    def tearDown(self):
+        self.context.clock_page.close()
+        self.mmap.close()
+        self.shm.close_fd()
+        self.shm.unlink()
+
+    def write(self, seq, samplerate, frame, usec, blocksize):
+        ClockPage.LAYOUT.pack_into(self.mmap, 0, seq, samplerate, frame, usec,
+                                   blocksize, 0)
+
+    def test_read(self):
+        '''test_read: the page reads back as written'''
+        assert self.context.clock_page.read() == (4800, 1000000, 48000, 256)
+
+    def test_torn(self):
+        '''test_torn: a page that's being written isn't read'''
+        self.write(3, 48000, 9600, 1100000, 256)
+        assert self.context.clock_page.read() is None
+        assert self.context.read_clock() is False
+
+    def test_not_running(self):
+        '''test_not_running: a context that hasn't run a block has no clock'''
+        self.write(0, 0, 0, 0, 0)
+        assert self.context.read_clock() is False
+        assert self.context.frame_of(1.0) is None
+
+    def test_convert(self):
+        '''test_convert: frames and time.monotonic() times map both ways'''
+        assert self.context.read_clock()
+        assert self.context.frame_of(1.0) == 4800
+        assert self.context.frame_of(1.5) == 4800 + 24000
+        assert self.context.time_of(4800 + 480) == 1.01
+
+        # a later block moves the mapping along
+        self.write(4, 48000, 9600, 1200000, 256)
+        self.context.read_clock()
+        assert self.context.frame_of(1.2) == 9600
+
+    def test_stamp(self):
+        '''test_stamp: an event stamp gives a frame in any context with a clock'''
+        self.context.read_clock()
+        other = DSPContext("node", 1)
+        assert stamp_frame(self.context) is None
+
+        token = event_stamp.set((self.context, 5000, 1.5))
+        try:
+            # the same context takes the frame as is, another goes by time
+            assert stamp_frame(self.context) == 5000
+            assert stamp_frame(other) is None
+            other.clock_frame, other.clock_time, other.samplerate = 0, 1.0, 1000
+            assert stamp_frame(other) == 500
+            assert stamp_frame(None) is None
+        finally:
+            event_stamp.reset(token)
+
+        token = event_stamp.set((None, None, 1.5))
+        try:
+            assert stamp_frame(self.context) == 4800 + 24000
+        finally:
+            event_stamp.reset(token)
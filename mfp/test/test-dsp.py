@@ -1,5 +1,9 @@
+import array
 import asyncio
+import os
+import tempfile
 import threading
+import time
 
 from unittest import IsolatedAsyncioTestCase
 
@@ -37,6 +41,103 @@ class DSPObjectTests (IsolatedAsyncioTestCase):
         f = await o.dsp_obj.getparam("_sig_1")
         assert f == 500
 
+    async def test_batch_setparam(self):
+        '''test_batch_setparam: [dsp] only the last of several setparams is kept'''
+        o = await mkproc(self, "osc~", "500")
+        await asyncio.gather(*[
+            o.dsp_obj.setparam("_sig_1", float(f)) for f in range(100, 1100, 100)
+        ])
+        f = await o.dsp_obj.getparam("_sig_1")
+        assert f == 1000
+
+    async def test_rpc_stats(self):
+        '''test_rpc_stats: [dsp] requests per batch and getparam round trips are counted'''
+        o = await mkproc(self, "osc~", "500")
+        MFPApp().dsp_rpc_stats(reset=True)
+        await asyncio.gather(
+            o.dsp_obj.setparam("_sig_1", 600.0),
+            o.dsp_obj.setparam("_sig_1", 700.0),
+            o.dsp_obj.setparam("_sig_2", 0.5),
+        )
+        assert await o.dsp_obj.getparam("_sig_1") == 700
+        stats = MFPApp().dsp_rpc_stats()
+        assert stats["batches"] == 1
+        assert stats["calls"] == 3
+        assert stats["ops"] == 2
+        assert stats["rpc_calls"] == 1
+        assert 0 < stats["avg_rpc"] <= stats["max_rpc"]
+
+    async def test_queue_stats(self):
+        '''test_queue_stats: [dsp] request/response queue stats are reported'''
+        await mkproc(self, "osc~", "500")
+        stats = await MFPApp().dsp_queue_stats()
+        assert stats["requests"]["capacity"] >= MFPApp().dsp_queue_size
+        assert stats["requests"]["high_water"] >= 1
+        assert stats["requests"]["overflows"] == 0
+
+    async def test_level_stats(self):
+        '''test_level_stats: [dsp] with the worker pool, each depth is timed as a level'''
+        # levels are only run (and timed) with the worker pool on
+        MFPApp().dsp_threads = 2
+        try:
+            await MFPApp().start_dsp()
+            self.patch = Patch('default', '', None, NaiveScope(), 'default')
+            osc_1 = await mkproc(self, "osc~", "500")
+            osc_2 = await mkproc(self, "osc~", "600")
+            mul = await mkproc(self, "*~")
+            await osc_1.connect(0, mul, 0)
+            await osc_2.connect(0, mul, 1)
+            await asyncio.sleep(0.2)
+            stats = await MFPApp().dsp_level_stats()
+        finally:
+            MFPApp().dsp_threads = 0
+
+        assert [(level["depth"], level["procs"]) for level in stats] == [(0, 2), (1, 1)]
+        assert stats[0]["parallel"] == 1
+        for level in stats:
+            assert level["blocks"] >= 1
+            assert level["avg_nsec"] <= level["max_nsec"]
+
+    async def test_buffer_stats(self):
+        '''test_buffer_stats: [dsp] shared buffers are never more than unshared'''
+        await mkproc(self, "osc~", "500")
+        stats = await MFPApp().dsp_buffer_stats()
+        assert stats["shared"]["buffers"] <= stats["unshared"]["buffers"]
+        assert stats["shared"]["bytes"] <= stats["unshared"]["bytes"]
+
+    async def test_activate(self):
+        '''test_activate: [dsp] deactivate and reactivate a DSP object'''
+        o = await mkproc(self, "osc~", "500")
+        await o.dsp_obj.activate(False)
+        await o.dsp_obj.activate(True)
+        f = await o.dsp_obj.getparam("_sig_1")
+        assert f == 500
+
+    async def test_autosleep(self):
+        '''test_autosleep: [dsp] turn autosleep on and off'''
+        o = await mkproc(self, "osc~", "500")
+        await o.dsp_autosleep(4)
+        await o.dsp_autosleep(0)
+        f = await o.dsp_obj.getparam("_sig_1")
+        assert f == 500
+
+    async def test_timed_setparam(self):
+        '''test_timed_setparam: [dsp] a setparam for a later frame waits for it'''
+        o = await mkproc(self, "osc~", "500")
+        now = await self.patch.context.frame_at(time.monotonic())
+        assert now >= 0
+        await o.dsp_setparam("_sig_1", 1000, frame=now + 10 * MFPApp().samplerate)
+        f = await o.dsp_obj.getparam("_sig_1")
+        assert f == 500
+
+    async def test_clock_page(self):
+        '''test_clock_page: [dsp] the context clock is read from shared memory'''
+        context = self.patch.context
+        await context.sync_clock()
+        assert context.clock_page is not None
+        assert context.read_clock()
+        assert context.frame_of(time.monotonic()) >= context.clock_frame
+
     async def test_connect_disconnect(self):
         '''test_connect_disconnect: [dsp] make/break connections'''
         inp = await mkproc(self, "in~", "0")
@@ -55,3 +156,42 @@ class DSPObjectTests (IsolatedAsyncioTestCase):
 
     async def asyncTearDown(self):
         await MFPApp().finish()
+
+
+class RenderTests (IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        MFPApp().no_gui = True
+        MFPApp().no_restart = True
+        MFPApp().render_mode = True
+        MFPApp().next_obj_id = 0
+        MFPApp().objects = {}
+        log.log_quiet = True
+        log.log_thread = threading.get_ident()
+        log.log_loop = asyncio.get_event_loop()
+        await MFPApp().setup()
+        builtins.register()
+        self.patch = Patch('default', '', None, NaiveScope(), 'default')
+
+    async def test_render(self):
+        '''test_render: [dsp] offline render of sig~ into a raw file'''
+        sig = await mkproc(self, "sig~", "0.5")
+        outp = await mkproc(self, "out~", "0")
+        await sig.connect(0, outp, 0)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            outfile = os.path.join(tmpdir, "render.raw")
+            stats = await MFPApp().dsp_render(0.1, outfile)
+            samples = array.array('f')
+            with open(outfile, "rb") as f:
+                samples.frombytes(f.read())
+
+        frames = int(0.1 * MFPApp().samplerate)
+        assert stats["frames"] == frames
+        assert stats["blocks"] == -(-frames // MFPApp().blocksize)
+        assert len(samples) == frames * MFPApp().dsp_outputs
+        assert samples[0] == 0.5
+        assert samples[1] == 0.0
+
+    async def asyncTearDown(self):
+        MFPApp().render_mode = False
+        await MFPApp().finish()
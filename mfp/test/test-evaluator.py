@@ -0,0 +1,83 @@
+from unittest import TestCase
+
+from mfp.evaluator import Evaluator
+
+
+class Thing:
+    def __init__(self, value):
+        self.value = value
+
+
+class EvaluatorTests (TestCase):
+    def setUp(self):
+        Evaluator.cache_clear()
+        self.saved_globals = dict(Evaluator.global_names)
+        self.evaluator = Evaluator()
+
+    def tearDown(self):
+        Evaluator.global_names.clear()
+        Evaluator.global_names.update(self.saved_globals)
+
+    def test_cache(self):
+        '''test_cache: a string is compiled once, then found in the cache'''
+        assert self.evaluator.eval("1 + 2") == 3
+        assert self.evaluator.eval("1 + 2") == 3
+        assert self.evaluator.eval("  1 + 2  ") == 3
+        assert self.evaluator.eval_arglist("1 + 2") == ((3,), {})
+        info = Evaluator.cache_info()
+        assert info.misses == 2
+        assert info.hits == 2
+        assert info.currsize == 2
+
+    def test_cache_clear(self):
+        '''test_cache_clear: clearing empties the cache and resets its counts'''
+        self.evaluator.eval("1 + 2")
+        self.evaluator.eval("1 + 2")
+        Evaluator.cache_clear()
+        info = Evaluator.cache_info()
+        assert (info.hits, info.misses, info.currsize) == (0, 0, 0)
+        assert self.evaluator.eval("1 + 2") == 3
+        assert Evaluator.cache_info().misses == 1
+
+    def test_cache_bindings(self):
+        '''test_cache_bindings: cached code sees the names of each call'''
+        assert self.evaluator.eval("x * 2", x=2) == 4
+        assert self.evaluator.eval("x * 2", x=5) == 10
+        assert Evaluator.cache_info().hits == 1
+
+    def test_local_over_global(self):
+        '''test_local_over_global: a local name hides a global one'''
+        Evaluator.bind_global("eval_test_name", "global")
+        other = Evaluator()
+        self.evaluator.bind_local("eval_test_name", "local")
+        assert self.evaluator.eval("eval_test_name") == "local"
+        assert other.eval("eval_test_name") == "global"
+        assert self.evaluator.eval("eval_test_name", eval_test_name="extra") == "extra"
+
+    def test_late_global(self):
+        '''test_late_global: a global bound after the evaluator is made is seen'''
+        Evaluator.bind_global("eval_test_late", 7)
+        assert self.evaluator.eval("eval_test_late") == 7
+
+    def test_lambda_scope(self):
+        '''test_lambda_scope: a lambda sees local, global and extra names'''
+        Evaluator.bind_global("eval_test_global", 100)
+        self.evaluator.bind_local("eval_test_local", 10)
+        fn = self.evaluator.eval("lambda x: x + eval_test_local + eval_test_global + y", y=1)
+        assert fn(2) == 113
+
+    def test_comprehension_scope(self):
+        '''test_comprehension_scope: a comprehension sees names, and its variable doesn't leak'''
+        self.evaluator.bind_local("eval_test_local", 10)
+        assert self.evaluator.eval(
+            "[x + eval_test_local + y for x in range(3)]", y=1) == [11, 12, 13]
+        assert self.evaluator.eval("{k: k * y for k in 'ab'}", y=2) == {'a': 'aa', 'b': 'bb'}
+        self.assertRaises(NameError, self.evaluator.eval, "[x for x in range(3)] and x")
+
+    def test_self(self):
+        '''test_self: __self__ and __patch__ are bound as self and patch'''
+        thing = Thing(42)
+        assert self.evaluator.eval("self.value", __self__=thing) == 42
+        assert self.evaluator.eval("patch.value + 1", __patch__=thing) == 43
+        assert self.evaluator.eval("self.value", __self__=Thing(7)) == 7
+        self.assertRaises(NameError, self.evaluator.eval, "self")
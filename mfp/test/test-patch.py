@@ -2,11 +2,14 @@
 from unittest import IsolatedAsyncioTestCase
 from mfp.patch import Patch
 from mfp.scope import NaiveScope
+from mfp.dsp_object import DSPContext
 from ..mfp_app import MFPApp
 from mfp import log, builtins
 import simplejson as json
 import threading
 import asyncio
+import os
+import tempfile
 
 
 async def mkproc(case, init_type, init_args=None):
@@ -83,3 +86,143 @@ class PatchTests (IsolatedAsyncioTestCase):
         await self.patch.send(True)
 
         self.assertEqual(p2.outlets[0], True)
+
+    async def test_load_order(self):
+        """
+        Objects are created in id order and fan-out connections keep
+        their saved order when a patch is loaded
+        """
+        src = await mkproc(self, "var")
+        sinks = []
+        for i in range(10):
+            sink = await MFPApp().create("var", None, self.patch, None, "sink_%d" % i)
+            await src.connect(0, sink, 0)
+            sinks.append(sink)
+
+        json_1 = await self.patch.json_serialize()
+        await self.patch.delete()
+
+        p2 = Patch('default', '', None, NaiveScope(), 'default')
+        await p2.json_deserialize(json_1)
+
+        loaded = sorted(p2.objects.values(), key=lambda o: o.obj_id)
+        self.assertEqual([o.name for o in loaded],
+                         ["var"] + ["sink_%d" % i for i in range(10)])
+        self.assertEqual([t.name for t, _ in loaded[0].connections_out[0]],
+                         ["sink_%d" % i for i in range(10)])
+
+        for phase in ("parse", "create", "connect", "onload"):
+            self.assertIn(phase, p2.load_timings)
+
+    async def test_template_cache(self):
+        """
+        A file-backed type is read and parsed once for any number of
+        instances, and again when the file changes
+        """
+        src = await mkproc(self, "var", "1")
+        json_1 = await self.patch.json_serialize()
+
+        tmpdir = tempfile.mkdtemp()
+        path = os.path.join(tmpdir, "cachevoice.mfp")
+        with open(path, "w") as f:
+            f.write(json_1)
+
+        # file-backed patches take their DSP context from the parent
+        parent = Patch('parent', '', None, NaiveScope(), 'parent',
+                       DSPContext("test", 0, "default"))
+
+        old_searchpath = MFPApp().searchpath
+        MFPApp().searchpath = tmpdir
+        Patch.templates.clear()
+        try:
+            name, factory = Patch.register_file("cachevoice.mfp")
+            before = Patch.template_cache_info()
+
+            voices = [await MFPApp().create(name, "", parent, None, "v_%d" % i)
+                      for i in range(4)]
+            after = Patch.template_cache_info()
+            self.assertEqual(after["misses"] - before["misses"], 1)
+            self.assertEqual(after["hits"] - before["hits"], 3)
+
+            # instances don't share loaded data
+            v0, v1 = voices[0], voices[1]
+            v0.gui_params["layers"].append(["extra", "__patch__"])
+            self.assertNotEqual(v0.gui_params["layers"], v1.gui_params["layers"])
+            self.assertEqual(len(v1.objects), 1)
+
+            # change the file: the next instance reloads it
+            await MFPApp().create("var", "2", self.patch, None, "var_2")
+            with open(path, "w") as f:
+                f.write(await self.patch.json_serialize())
+            stat = os.stat(path)
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000))
+
+            v4 = await MFPApp().create(name, "", parent, None, "v_4")
+            final = Patch.template_cache_info()
+            self.assertEqual(final["invalidations"] - after["invalidations"], 1)
+            self.assertEqual(len([o for o in v4.objects.values() if o.init_type == "var"]), 2)
+        finally:
+            MFPApp().searchpath = old_searchpath
+            os.unlink(path)
+            os.rmdir(tmpdir)
+
+    async def test_patch_pool(self):
+        """
+        A pool hands out pre-built instances and takes them back, and
+        only creates more when it runs dry
+        """
+        await mkproc(self, "var", "1")
+        tmpdir = tempfile.mkdtemp()
+        path = os.path.join(tmpdir, "poolvoice.mfp")
+        with open(path, "w") as f:
+            f.write(await self.patch.json_serialize())
+
+        parent = Patch('parent', '', None, NaiveScope(), 'parent',
+                       DSPContext("test", 0, "default"))
+        old_searchpath = MFPApp().searchpath
+        MFPApp().searchpath = tmpdir
+        try:
+            name, factory = Patch.register_file("poolvoice.mfp")
+            pool = await MFPApp().create_pool(name, "", parent, None, "voice", 2)
+            self.assertEqual(pool.stats()["free"], 2)
+
+            v1 = await pool.acquire()
+            v2 = await pool.acquire()
+            v3 = await pool.acquire()
+            self.assertEqual(len({v1, v2, v3}), 3)
+            self.assertEqual(pool.stats()["misses"], 1)
+            self.assertEqual(pool.stats()["in_use"], 3)
+
+            await pool.release(v2)
+            self.assertIs(await pool.acquire(), v2)
+            self.assertEqual(pool.stats()["created"], 3)
+
+            await pool.delete()
+            self.assertEqual(pool.stats()["free"] + pool.stats()["in_use"], 0)
+        finally:
+            MFPApp().searchpath = old_searchpath
+            os.unlink(path)
+            os.rmdir(tmpdir)
+
+    async def test_switch(self):
+        """
+        [switch~] turns DSP for its patch on and off and outputs
+        the new state
+        """
+        from mfp import Bang
+        sw = await mkproc(self, "switch~")
+        await sw.send(False)
+        self.assertEqual(sw.outlets[0], False)
+        await sw.send(Bang)
+        self.assertEqual(sw.outlets[0], True)
+
+    async def test_timed_no_dsp(self):
+        """
+        A timed processor in a patch with a DSP context doesn't wait
+        for a clock when there's no DSP host
+        """
+        self.patch = Patch('clocked', '', None, NaiveScope(), 'clocked',
+                           DSPContext("test", 0, "default"))
+        metro = await asyncio.wait_for(mkproc(self, "metro", "100"), 1.0)
+        self.assertIsNone(metro.clock)
+        self.assertFalse(await asyncio.wait_for(self.patch.context.sync_clock(), 1.0))
@@ -0,0 +1,100 @@
+import mmap
+import os
+
+from posix_ipc import SharedMemory, Semaphore, O_CREX
+from unittest import TestCase
+
+from mfp.dsp_response import ResponseRing, coalesce
+
+
+class ResponseRingTests (TestCase):
+    CAPACITY = 8
+
+    def setUp(self):
+        # laid out like mfpdsp's /mfp_response_<pid>
+        name = "/mfp_response_%05d" % os.getpid()
+        size = ResponseRing.HEADER_SIZE + self.CAPACITY * ResponseRing.RECORD.size
+        self.sem = Semaphore(name, O_CREX)
+        self.shm = SharedMemory(name, O_CREX, size=size)
+        self.mmap = mmap.mmap(self.shm.fd, size)
+        ResponseRing.UINT.pack_into(self.mmap, ResponseRing.CAPACITY, self.CAPACITY)
+        ResponseRing.UINT.pack_into(self.mmap, ResponseRing.RECORD_SIZE,
+                                    ResponseRing.RECORD.size)
+        self.head = 0
+        self.ring = ResponseRing(os.getpid())
+
+    def tearDown(self):
+        self.ring.close()
+        self.mmap.close()
+        self.shm.close_fd()
+        self.shm.unlink()
+        self.sem.unlink()
+
+    def push(self, proc_id, resp_type, value_type, value, text=b''):
+        size = ResponseRing.RECORD.size
+        ResponseRing.RECORD.pack_into(
+            self.mmap, ResponseRing.HEADER_SIZE + (self.head % self.CAPACITY) * size,
+            proc_id, resp_type, value_type, len(text), value)
+        self.head += 1
+        for start in range(0, len(text), size):
+            offset = ResponseRing.HEADER_SIZE + (self.head % self.CAPACITY) * size
+            chunk = text[start:start + size]
+            self.mmap[offset:offset + len(chunk)] = chunk
+            self.head += 1
+        ResponseRing.UINT.pack_into(self.mmap, ResponseRing.HEAD, self.head)
+
+    def tail(self):
+        return ResponseRing.UINT.unpack_from(self.mmap, ResponseRing.TAIL)[0]
+
+    def test_attach(self):
+        '''test_attach: the DSP side is told when someone is reading'''
+        self.ring.attach()
+        assert ResponseRing.UINT.unpack_from(self.mmap, ResponseRing.READER_PID)[0] == os.getpid()
+        self.ring.detach()
+        assert ResponseRing.UINT.unpack_from(self.mmap, ResponseRing.READER_PID)[0] == 0
+
+    def test_read(self):
+        '''test_read: records come back typed and in order, and tail follows'''
+        assert self.ring.read() == []
+        self.push(3, 0, ResponseRing.RESPONSE_FLOAT, 0.5)
+        self.push(3, 1, ResponseRing.RESPONSE_INT, 7)
+        assert self.ring.read() == [
+            (3, 0, ResponseRing.RESPONSE_FLOAT, 0.5),
+            (3, 1, ResponseRing.RESPONSE_INT, 7)
+        ]
+        assert self.tail() == 2
+        assert self.ring.read() == []
+
+    def test_string(self):
+        '''test_string: a string runs on through records, around the end'''
+        for n in range(5):
+            self.push(1, 0, ResponseRing.RESPONSE_INT, n)
+        self.ring.read()
+
+        text = b'/tmp/a sound file with a longish name.wav'
+        self.push(2, 6, ResponseRing.RESPONSE_STR, 0, text)
+        self.push(2, 1, ResponseRing.RESPONSE_INT, 1)
+        assert self.ring.read() == [
+            (2, 6, ResponseRing.RESPONSE_STR, text.decode()),
+            (2, 1, ResponseRing.RESPONSE_INT, 1)
+        ]
+        assert self.tail() == self.head
+
+    def test_coalesce(self):
+        '''test_coalesce: only the latest value of a float response is kept'''
+        records = [
+            (1, 0, ResponseRing.RESPONSE_FLOAT, 0.1),
+            (2, 0, ResponseRing.RESPONSE_INT, 1),
+            (1, 0, ResponseRing.RESPONSE_FLOAT, 0.2),
+            (2, 0, ResponseRing.RESPONSE_INT, 0),
+            (1, 1, ResponseRing.RESPONSE_FLOAT, 5.0),
+            (3, 0, ResponseRing.RESPONSE_FLOAT, 1.0),
+            (1, 0, ResponseRing.RESPONSE_FLOAT, 0.3),
+        ]
+        assert coalesce(records) == [
+            (2, 0, ResponseRing.RESPONSE_INT, 1),
+            (2, 0, ResponseRing.RESPONSE_INT, 0),
+            (1, 1, ResponseRing.RESPONSE_FLOAT, 5.0),
+            (3, 0, ResponseRing.RESPONSE_FLOAT, 1.0),
+            (1, 0, ResponseRing.RESPONSE_FLOAT, 0.3),
+        ]
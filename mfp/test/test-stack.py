@@ -24,6 +24,13 @@ class LimitedIncr (Processor):
             self.lastval = self.outlets[0]
 
 
+class SyncIncr (LimitedIncr):
+    def trigger(self):
+        if self.inlets[0] < self.limit:
+            self.outlets[0] = self.inlets[0] + 1
+            self.lastval = self.outlets[0]
+
+
 class FanOut (Processor):
     trail = []
 
@@ -83,6 +90,51 @@ class StackDepthTest(IsolatedAsyncioTestCase):
         self.assertEqual(self.inc.lastval, 100000)
 
 
+class SyncStackDepthTest(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        MFPApp().no_gui = True
+        MFPApp().no_dsp = True
+        MFPApp().next_obj_id = 0
+        MFPApp().objects = {}
+        log.log_quiet = True
+        log.log_thread = threading.get_ident()
+        log.log_loop = asyncio.get_event_loop()
+        await MFPApp().setup()
+        builtins.register()
+        self.patch = Patch('default', '', None, NaiveScope(), 'default')
+        self.var = await mkproc(self, "var", "0")
+        self.inc = SyncIncr(self.patch)
+        await self.var.connect(0, self.inc, 0)
+        await self.inc.connect(0, self.var, 0)
+
+    async def test_sync_trigger(self):
+        '''test_sync_trigger: plain trigger() methods are detected'''
+        self.assertTrue(SyncIncr.sync_trigger)
+        self.assertTrue(self.var.sync_trigger)
+        self.assertFalse(LimitedIncr.sync_trigger)
+
+    async def test_100000(self):
+        '''test_100000: 100000 synchronous recursions don't overflow stack'''
+        self.inc.limit = 100000
+        await self.var.send(0, 0)
+        self.assertEqual(self.var.status, Processor.READY)
+        self.assertEqual(self.inc.lastval, 100000)
+        self.assertEqual(self.inc.count_trigger, 100001)
+
+    async def test_step_debug(self):
+        '''test_step_debug: sync processors still run under the step debugger'''
+        self.inc.limit = 10
+        self.patch.step_debugger.enabled = True
+        await self.var.send(0, 0)
+        self.assertIsNone(self.inc.lastval)
+
+        debugger = self.patch.step_debugger
+        while debugger.tasklist:
+            task, _, _ = debugger.tasklist.pop(0)
+            await task
+        self.assertEqual(self.inc.lastval, 10)
+
+
 class DepthFirstTest(IsolatedAsyncioTestCase):
     async def asyncSetUp(self):
         MFPApp().no_gui = True
@@ -0,0 +1,150 @@
+import asyncio
+
+from unittest import IsolatedAsyncioTestCase
+
+from mfp.dsp_object import DSPBatch, DSPObjectProxy
+from mfp.timer import MultiTimer
+
+
+class FakeService:
+    host_id = "test-host"
+
+
+class FakeProxy:
+    '''
+    Stands in for a DSPObject RPC proxy, keeping what is posted
+    '''
+    def __init__(self, obj_id):
+        self._id = obj_id
+        self._service = FakeService()
+        self.posted = []
+
+    async def post(self, ops):
+        self.posted.append(ops)
+
+
+class MultiTimerTests (IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.timer = MultiTimer()
+        self.fired = []
+
+    def record(self, name):
+        self.fired.append(name)
+
+    async def test_order(self):
+        '''test_order: events fire in deadline order, not scheduling order'''
+        now = MultiTimer.now()
+        self.timer.schedule(now + 0.03, self.record, ["c"])
+        self.timer.schedule(now + 0.01, self.record, ["a"])
+        self.timer.schedule(now + 0.02, self.record, ["b"])
+        await asyncio.sleep(0.06)
+        assert self.fired == ["a", "b", "c"]
+
+    async def test_earlier_wakes(self):
+        '''test_earlier_wakes: an earlier deadline isn't stuck behind a later one'''
+        now = MultiTimer.now()
+        late = self.timer.schedule(now + 0.5, self.record, ["late"])
+        await asyncio.sleep(0.01)
+        self.timer.schedule(MultiTimer.now() + 0.01, self.record, ["early"])
+        await asyncio.sleep(0.05)
+        assert self.fired == ["early"]
+        self.timer.cancel(late)
+
+    async def test_coroutine_callback(self):
+        '''test_coroutine_callback: async callbacks are run'''
+        async def cb(name):
+            await asyncio.sleep(0)
+            self.record(name)
+
+        self.timer.schedule(MultiTimer.now(), cb, ["x"])
+        await asyncio.sleep(0.02)
+        assert self.fired == ["x"]
+
+    async def test_slow_callback(self):
+        '''test_slow_callback: a slow callback doesn't hold up later events'''
+        async def slow(name):
+            await asyncio.sleep(0.2)
+            self.record(name)
+
+        now = MultiTimer.now()
+        self.timer.schedule(now, slow, ["slow"])
+        self.timer.schedule(now + 0.01, self.record, ["fast"])
+        await asyncio.sleep(0.05)
+        assert self.fired == ["fast"]
+        await asyncio.sleep(0.2)
+        assert self.fired == ["fast", "slow"]
+
+    async def test_one_batch(self):
+        '''test_one_batch: DSP setparams from events due together go out in one batch'''
+        DSPBatch.pending = {}
+        proxy = FakeProxy(1)
+        obj_1 = DSPObjectProxy(proxy)
+        # same host, so the same batch
+        obj_2 = DSPObjectProxy(FakeProxy(2))
+
+        now = MultiTimer.now()
+        self.timer.schedule(now + 0.01, obj_1.setparam, ["_sig_1", 1.0])
+        self.timer.schedule(now + 0.01, obj_2.setparam, ["_sig_1", 2.0])
+        await asyncio.sleep(0.05)
+        assert proxy.posted == [[
+            ["setparam", 1, "_sig_1", 1.0],
+            ["setparam", 2, "_sig_1", 2.0],
+        ]]
+
+    async def test_cancel(self):
+        '''test_cancel: a cancelled event doesn't fire'''
+        now = MultiTimer.now()
+        item = self.timer.schedule(now + 0.01, self.record, ["a"])
+        self.timer.schedule(now + 0.02, self.record, ["b"])
+        assert self.timer.cancel(item)
+        assert not self.timer.cancel(item)
+        await asyncio.sleep(0.05)
+        assert self.fired == ["b"]
+
+    async def test_cancel_owner(self):
+        '''test_cancel_owner: everything for one owner goes at once'''
+        now = MultiTimer.now()
+        for n in range(10):
+            self.timer.schedule(now + 0.01, self.record, ["a"], owner="a")
+        self.timer.schedule(now + 0.01, self.record, ["b"], owner="b")
+        assert self.timer.pending("a") == 10
+        assert self.timer.cancel_owner("a") == 10
+        assert self.timer.pending("a") == 0
+        assert self.timer.pending() == 1
+        await asyncio.sleep(0.05)
+        assert self.fired == ["b"]
+
+    async def test_one_task(self):
+        '''test_one_task: many events share a single task'''
+        tasks_before = len(asyncio.all_tasks())
+        now = MultiTimer.now()
+        for n in range(1000):
+            self.timer.schedule(now + 0.01 + n * 0.00001, self.record, [n])
+        assert len(asyncio.all_tasks()) == tasks_before + 1
+        await asyncio.sleep(0.1)
+        assert self.fired == list(range(1000))
+        assert self.timer.pending() == 0
+        assert self.timer.task is None
+
+    async def test_heap_compacts(self):
+        '''test_heap_compacts: cancelled events don't pile up in the heap'''
+        now = MultiTimer.now()
+        for n in range(1000):
+            self.timer.cancel(self.timer.schedule(now + 10, self.record, [n]))
+        assert len(self.timer.heap) < 100
+
+    async def test_stats(self):
+        '''test_stats: lateness is measured per event'''
+        now = MultiTimer.now()
+        self.timer.schedule(now - 0.05, self.record, ["a"])
+        self.timer.schedule(now + 0.01, self.record, ["b"])
+        await asyncio.sleep(0.05)
+        stats = self.timer.stats()
+        assert stats["fired"] == 2
+        assert stats["pending"] == 0
+        assert stats["late_max"] >= 0.05
+        assert 0 < stats["late_avg"] <= stats["late_max"]
+
+    async def test_shared(self):
+        '''test_shared: one timer per event loop'''
+        assert MultiTimer.shared() is MultiTimer.shared()
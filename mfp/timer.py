@@ -5,34 +5,170 @@ Multi-timer implementation
 '''
 
 import asyncio
+import heapq
 import inspect
-from datetime import datetime
+import time
 
 from mfp import log
 
+
 class MultiTimer:
+    '''
+    Calls callbacks at deadlines, given as time.monotonic() seconds.
+
+    Deadlines are kept in a heap and a single task per event loop
+    sleeps until the earliest one, so scheduling an event doesn't
+    start a task. Callbacks are called in deadline order without
+    waiting for each other: a coroutine callback runs as its own task,
+    so a slow one doesn't hold up the rest, and everything that is due
+    starts in the same pass of the event loop (so its DSP requests go
+    out in one batch).
+
+    Cancelled events stay in the heap until they reach the top, where
+    they're skipped; the heap is rebuilt once they're most of it.
+    '''
+    _shared = {}
+
     def __init__(self):
         self.next_id = 0
+        self.heap = []
         self.scheduled = {}
+        self.owners = {}
+        self.task = None
+        self.wakeup = None
+        self.waiting_for = None
+
+        # coroutine callbacks still running
+        self.callbacks = set()
+
+        # lateness of events that have been run, in seconds
+        self.fired = 0
+        self.late_total = 0.0
+        self.late_max = 0.0
+
+    @classmethod
+    def shared(cls):
+        '''
+        The timer everything in this event loop uses
+        '''
+        loop = asyncio.get_running_loop()
+        timer = cls._shared.get(loop)
+        if timer is None:
+            for other in [lp for lp in cls._shared if lp.is_closed()]:
+                del cls._shared[other]
+            timer = cls._shared[loop] = MultiTimer()
+        return timer
 
-    async def _wait(self, item_id, deadline, callback, data):
-        await asyncio.sleep((deadline - datetime.now()).total_seconds())
-        cb = callback(*data)
-        if inspect.isawaitable(cb):
-            await cb
-        del self.scheduled[item_id]
+    @staticmethod
+    def now():
+        return time.monotonic()
 
-    def schedule(self, deadline, callback, data=[]):
+    def schedule(self, deadline, callback, data=[], owner=None):
         item_id = self.next_id
         self.next_id += 1
-        task = asyncio.create_task(
-            self._wait(item_id, deadline, callback, data)
-        )
-        self.scheduled[item_id] = (deadline, task, item_id)
+
+        self.scheduled[item_id] = (deadline, callback, data, owner)
+        heapq.heappush(self.heap, (deadline, item_id))
+        if owner is not None:
+            self.owners.setdefault(owner, set()).add(item_id)
+
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+        elif self.waiting_for is not None and deadline < self.waiting_for:
+            self._wake()
         return item_id
 
     def cancel(self, item_id):
-        if item_id in self.scheduled:
-            old_task = self.scheduled[item_id]
-            del self.scheduled[item_id]
-            old_task.cancel()
+        item = self.scheduled.pop(item_id, None)
+        if item is None:
+            return False
+
+        owner = item[3]
+        if owner is not None:
+            owned = self.owners.get(owner)
+            owned.discard(item_id)
+            if not owned:
+                del self.owners[owner]
+
+        if len(self.heap) > 2 * len(self.scheduled) + 64:
+            self.heap = [entry for entry in self.heap if entry[1] in self.scheduled]
+            heapq.heapify(self.heap)
+        return True
+
+    def cancel_owner(self, owner):
+        '''
+        Cancel everything scheduled with this owner. Returns how many
+        '''
+        owned = list(self.owners.get(owner, ()))
+        for item_id in owned:
+            self.cancel(item_id)
+        return len(owned)
+
+    def pending(self, owner=None):
+        if owner is None:
+            return len(self.scheduled)
+        return len(self.owners.get(owner, ()))
+
+    def stats(self):
+        return dict(
+            pending=len(self.scheduled),
+            fired=self.fired,
+            late_avg=(self.late_total / self.fired) if self.fired else 0.0,
+            late_max=self.late_max
+        )
+
+    def _callback_done(self, task, callback):
+        self.callbacks.discard(task)
+        if task.cancelled():
+            return
+        e = task.exception()
+        if e is not None:
+            log.error(f"[timer] error in callback {callback}: {e}")
+
+    def _wake(self):
+        if self.wakeup is not None and not self.wakeup.done():
+            self.wakeup.set_result(True)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+
+        while self.heap:
+            deadline, item_id = self.heap[0]
+            if item_id not in self.scheduled:
+                heapq.heappop(self.heap)
+                continue
+
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                self.wakeup = loop.create_future()
+                self.waiting_for = deadline
+                handle = loop.call_later(delay, self._wake)
+                try:
+                    await self.wakeup
+                finally:
+                    handle.cancel()
+                    self.wakeup = None
+                    self.waiting_for = None
+                continue
+
+            heapq.heappop(self.heap)
+            deadline, callback, data, owner = self.scheduled[item_id]
+            self.cancel(item_id)
+
+            late = -delay
+            self.fired += 1
+            self.late_total += late
+            self.late_max = max(self.late_max, late)
+
+            try:
+                cb = callback(*data)
+                if inspect.isawaitable(cb):
+                    task = asyncio.ensure_future(cb)
+                    self.callbacks.add(task)
+                    task.add_done_callback(
+                        lambda task, callback=callback: self._callback_done(task, callback))
+            except Exception as e:
+                log.error(f"[timer] error in callback {callback}: {e}")
+                log.debug_traceback()
+
+        self.task = None
@@ -31,3 +31,6 @@ extern mfp_procinfo * init_builtin_stepseq(void);
 extern mfp_procinfo * init_builtin_vc_quantize12(void);
 extern mfp_procinfo * init_builtin_vc_freq(void);
 extern mfp_procinfo * init_builtin_hold(void);
+extern mfp_procinfo * init_builtin_diskplay(void);
+
+extern void mfp_diskplay_status(mfp_processor * proc, int * filled, int * slots, int * underruns);
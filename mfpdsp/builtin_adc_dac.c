@@ -93,6 +93,7 @@ init_builtin_out(void) {
     mfp_procinfo * p = g_malloc0(sizeof(mfp_procinfo));
     p->name = strdup("out~");
     p->is_generator = 0;
+    p->serial_only = 1;
     p->process = process_out;
     p->init = init;
     p->destroy = destroy;
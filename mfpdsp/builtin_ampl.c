@@ -20,6 +20,7 @@ typedef struct {
     int       rms_pointer;
     double    last_peak;
     double    rms_accum;
+    int       rms_silent;
 } builtin_ampl_data;
 
 static int 
@@ -43,7 +44,20 @@ process_ampl(mfp_processor * proc)
     if ((in_sample == NULL) || (rms_sample == NULL) || (peak_sample == NULL)) {
         return 0;
     }
-    
+
+    /* silence in after both meters have decayed to 0: the outputs stay
+     * at 0 and the RMS window only needs clearing once */
+    if (mfp_block_is_zero(proc->inlet_buf[0]) && (peak == 0.0) && (rms_accum == 0.0)) {
+        if (!pdata->rms_silent) {
+            mfp_block_zero(pdata->rms_buffer);
+            pdata->rms_silent = 1;
+        }
+        mfp_block_set_const(proc->outlet_buf[0], 0.0);
+        mfp_block_set_const(proc->outlet_buf[1], 0.0);
+        return 0;
+    }
+    pdata->rms_silent = 0;
+
     for(scount = 0; scount < proc->context->blocksize; scount++) {
         sample = *in_sample++;
 
@@ -94,6 +108,7 @@ init(mfp_processor * proc)
     p->rms_alloc_ready = ALLOC_IDLE;
     p->rms_accum = 0.0;
     p->rms_pointer = 0;
+    p->rms_silent = 0;
 
     return;
 }
@@ -171,6 +186,7 @@ init_builtin_ampl(void) {
 
     p->name = strdup("ampl~");
     p->is_generator = 0;
+    p->transient_buffers = 1;
     p->process = process_ampl;
     p->init = init;
     p->destroy = destroy;
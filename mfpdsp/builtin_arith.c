@@ -205,6 +205,27 @@ iterate_lt(mfp_processor * proc, mfp_sample * in_0, mfp_sample * in_1,
     }
 }
 
+/* the result when both inputs are constant for the whole block */
+static mfp_sample
+scalar_arith(int op_type, mfp_sample in_0, mfp_sample in_1)
+{
+    switch (op_type) {
+        case ARITH_OP_ADD:
+            return in_0 + in_1;
+        case ARITH_OP_SUB:
+            return in_0 - in_1;
+        case ARITH_OP_MUL:
+            return in_0 * in_1;
+        case ARITH_OP_DIV:
+            return in_0 / in_1;
+        case ARITH_OP_GT:
+            return (in_0 > in_1) ? 1.0 : 0.0;
+        case ARITH_OP_LT:
+            return (in_0 < in_1) ? 1.0 : 0.0;
+    }
+    return 0.0;
+}
+
 static int 
 process_arith(mfp_processor * proc) 
 {
@@ -220,12 +241,36 @@ process_arith(mfp_processor * proc)
         return 0;
     }
 
-    /* pass NULL in_* if there is nothing connected */
-    if (!mfp_proc_has_input(proc, 0))
+    /* pass NULL in_* if there is nothing connected or the input is
+     * constant for this block, and use the constant instead */
+    if (!mfp_proc_has_input(proc, 0)) {
         in_0 = NULL;
+    }
+    else if (proc->inlet_buf[0]->is_const) {
+        in_0 = NULL;
+        const_in_0 = proc->inlet_buf[0]->const_value;
+    }
 
-    if (!mfp_proc_has_input(proc, 1))
+    if (!mfp_proc_has_input(proc, 1)) {
+        in_1 = NULL;
+    }
+    else if (proc->inlet_buf[1]->is_const) {
         in_1 = NULL;
+        const_in_1 = proc->inlet_buf[1]->const_value;
+    }
+
+    /* constant output: flag it so downstream can skip the samples */
+    if ((in_0 == NULL) && (in_1 == NULL)) {
+        mfp_block_set_const(proc->outlet_buf[0],
+                            scalar_arith(d->op_type, const_in_0, const_in_1));
+        return 1;
+    }
+    if ((d->op_type == ARITH_OP_MUL)
+        && (((in_0 == NULL) && (const_in_0 == 0.0))
+            || ((in_1 == NULL) && (const_in_1 == 0.0)))) {
+        mfp_block_set_const(proc->outlet_buf[0], 0.0);
+        return 1;
+    }
 
     switch (d->op_type) {
         case ARITH_OP_ADD:
@@ -351,6 +396,8 @@ init_builtin_add(void) {
     mfp_procinfo * p = g_malloc0(sizeof(mfp_procinfo));
     p->name = strdup("+~");
     p->is_generator = 0;
+    p->transient_buffers = 1;
+    p->sample_accurate = 1;
     p->process = process_arith;
     p->init = init_add;
     p->config = config;
@@ -366,6 +413,8 @@ init_builtin_sub(void) {
     mfp_procinfo * p = g_malloc0(sizeof(mfp_procinfo));
     p->name = strdup("-~");
     p->is_generator = 0;
+    p->transient_buffers = 1;
+    p->sample_accurate = 1;
     p->process = process_arith;
     p->init = init_sub;
     p->config = config;
@@ -381,6 +430,8 @@ init_builtin_mul(void) {
     mfp_procinfo * p = g_malloc0(sizeof(mfp_procinfo));
     p->name = strdup("*~");
     p->is_generator = 0;
+    p->transient_buffers = 1;
+    p->sample_accurate = 1;
     p->process = process_arith;
     p->init = init_mul;
     p->config = config;
@@ -396,6 +447,8 @@ init_builtin_div(void) {
     mfp_procinfo * p = g_malloc0(sizeof(mfp_procinfo));
     p->name = strdup("/~");
     p->is_generator = 0;
+    p->transient_buffers = 1;
+    p->sample_accurate = 1;
     p->process = process_arith;
     p->init = init_div;
     p->config = config;
@@ -411,6 +464,8 @@ init_builtin_lt(void) {
     mfp_procinfo * p = g_malloc0(sizeof(mfp_procinfo));
     p->name = strdup("<~");
     p->is_generator = 0;
+    p->transient_buffers = 1;
+    p->sample_accurate = 1;
     p->process = process_arith;
     p->init = init_lt;
     p->config = config;
@@ -426,6 +481,8 @@ init_builtin_gt(void) {
     mfp_procinfo * p = g_malloc0(sizeof(mfp_procinfo));
     p->name = strdup(">~");
     p->is_generator = 0;
+    p->transient_buffers = 1;
+    p->sample_accurate = 1;
     p->process = process_arith;
     p->init = init_gt;
     p->config = config;
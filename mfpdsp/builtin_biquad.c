@@ -6,39 +6,25 @@
 #include <math.h>
 
 #include "mfp_dsp.h"
+#include "mfp_block.h"
 
-typedef struct {
-    double b0;
-    double b1;
-    double b2;
-    double a1;
-    double a2;
-
-    double delay_1;
-    double delay_2;
-} builtin_biquad_data;
+typedef mfp_biquad builtin_biquad_data;
 
 static int
 process(mfp_processor * proc)
 {
     builtin_biquad_data * pdata = (builtin_biquad_data *)proc->data;
-    mfp_sample * in_sample = proc->inlet_buf[0]->data;
-    mfp_sample * out_sample = proc->outlet_buf[0]->data;
-    double tmp, w_n;
-    int scount=0;
-
-    for (; scount < proc->inlet_buf[0]->blocksize; scount++) {
-        tmp = *in_sample++;
-        w_n = tmp - (pdata->a1 * pdata->delay_1) - (pdata->a2 * pdata->delay_2);
-        *out_sample ++ = (pdata->b0 * w_n) + (pdata->b1 * pdata->delay_1) +
-            (pdata->b2 * pdata->delay_2);
-        pdata->delay_2 = pdata->delay_1;
-        pdata->delay_1 = w_n;
-    }
-    return 0;
-
 
+    /* silence in and nothing left ringing: silence out */
+    if (mfp_block_is_zero(proc->inlet_buf[0])
+        && (pdata->delay_1 == 0.0) && (pdata->delay_2 == 0.0)) {
+        mfp_block_set_const(proc->outlet_buf[0], 0.0);
+        return 0;
+    }
 
+    mfp_kernels->biquad(pdata, proc->inlet_buf[0]->data, proc->outlet_buf[0]->data,
+                        proc->inlet_buf[0]->blocksize);
+    return 0;
 }
 
 static void
@@ -120,6 +106,7 @@ init_builtin_biquad(void) {
 
     p->name = strdup("biquad~");
     p->is_generator = 0;
+    p->transient_buffers = 1;
     p->process = process;
     p->init = init;
     p->destroy = destroy;
@@ -29,6 +29,7 @@ process(mfp_processor * proc)
     mfp_sample * bufptr;
     int outpos; 
     int calcind;
+    int head, ringpos, wrap;
     int delay_samples = (int)(pdata->const_delay_ms * proc->context->samplerate / 1000.0);
     int delblk_size = pdata->delay_buffer->blocksize;
     int delblk;
@@ -51,17 +52,29 @@ process(mfp_processor * proc)
     bufptr = pdata->delay_buffer->data;
     delblk = pdata->delay_buffer->blocksize;
 
-    for(outpos=0; outpos < proc->context->blocksize; outpos++) {
-        if (delptr != NULL) {
+    if (delptr == NULL) {
+        /* constant delay: the oldest delay_samples come out of the ring
+         * (in at most two pieces), the rest straight from the input */
+        head = MIN(delay_samples, proc->context->blocksize);
+        if (head > 0) {
+            ringpos = (pdata->buf_zero + delblk - delay_samples) % delblk;
+            wrap = MIN(head, delblk - ringpos);
+            memcpy(outptr, bufptr + ringpos, wrap * sizeof(mfp_sample));
+            memcpy(outptr + wrap, bufptr, (head - wrap) * sizeof(mfp_sample));
+        }
+        memcpy(outptr + head, inptr, (proc->context->blocksize - head) * sizeof(mfp_sample));
+    }
+    else {
+        for(outpos=0; outpos < proc->context->blocksize; outpos++) {
             delay_samples = MIN(delblk_size-1, 
                                 MAX(0, (int)(*delptr * proc->context->samplerate / 1000.0)));
-        }
-        calcind = outpos - delay_samples;
-        if (calcind >= 0) {
-            *outptr++ = inptr[calcind];
-        }
-        else {
-            *outptr++ = bufptr[(pdata->buf_zero + delblk + calcind) % delblk]; 
+            calcind = outpos - delay_samples;
+            if (calcind >= 0) {
+                *outptr++ = inptr[calcind];
+            }
+            else {
+                *outptr++ = bufptr[(pdata->buf_zero + delblk + calcind) % delblk]; 
+            }
         }
     }
 
@@ -187,6 +200,7 @@ init_builtin_delay(void) {
 
     p->name = strdup("del~");
     p->is_generator = GENERATOR_NEVER;
+    p->transient_buffers = 1;
     p->process = process;
     p->init = init;
     p->destroy = destroy;
@@ -205,6 +219,7 @@ init_builtin_delblk(void) {
 
     p->name = strdup("delblk~");
     p->is_generator = GENERATOR_ALWAYS;
+    p->transient_buffers = 1;
     p->process = process;
     p->init = init_blk;
     p->destroy = destroy;
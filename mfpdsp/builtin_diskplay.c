@@ -0,0 +1,470 @@
+#include <stdio.h>
+#include <string.h>
+#include <unistd.h>
+#include <glib.h>
+#include <sndfile.h>
+
+#include "mfp_dsp.h"
+
+/*
+ * diskplay~: stream a sound file (anything libsndfile reads) from disk.
+ *
+ * Only a ring of slots of DISKPLAY_SLOT_FRAMES frames each is kept in
+ * memory.  Slots go round between two mfp_rings: the DSP thread plays
+ * "filled" ones and hands them back on "empty", and the prefetch
+ * handler, run on the mfp_alloc thread, reads the file into empty ones
+ * and passes them back on "filled".  The DSP thread never touches the
+ * file, and the prefetch side never touches the outlets.
+ *
+ * A seek or a new file bumps the generation.  Slots read for an older
+ * generation are thrown back as soon as the DSP thread sees them, and
+ * the prefetch handler seeks before reading anything for the new one.
+ *
+ * Running out of filled slots while playing is an underrun: the rest
+ * of the block is silent and the underrun count goes up.
+ *
+ * The processor can be destroyed (on the DSP thread) while a prefetch
+ * is queued or running, so the prefetch side never uses proc: it
+ * reports through "responder", which only carries the rpc_id.
+ * destroy() marks the data closing and queues teardown() on the
+ * mfp_alloc thread behind any prefetch, which closes the file and
+ * frees everything there.
+ *
+ * The one-shot parameters (filename, seek, play) are taken out of
+ * proc->params once acted on; their names and values are freed off
+ * the DSP thread with mfp_dsp_retire_param.
+ */
+
+#define DISKPLAY_SLOT_FRAMES 4096
+#define DISKPLAY_MIN_SLOTS 2
+#define DISKPLAY_DEFAULT_PREFETCH 1000.0
+
+typedef struct {
+    int generation;
+    int frames;
+    gint64 position;
+    mfp_sample * data;
+} diskplay_slot;
+
+typedef struct {
+    int channels;
+    int num_slots;
+    diskplay_slot * slots;
+    mfp_ring * filled;
+    mfp_ring * empty;
+
+    /* written by the DSP thread, read by the prefetch handler */
+    atomic_int generation;
+    _Atomic(gint64) seek_to;
+    _Atomic(char *) open_name;
+    atomic_int loop;
+    atomic_int closing;
+    int prefetch_status;
+
+    /* written by the prefetch handler, read by the DSP thread */
+    atomic_int file_generation;
+
+    /* prefetch side only */
+    mfp_processor responder;
+    int samplerate;
+    SNDFILE * file;
+    SF_INFO file_info;
+    int file_eof;
+    int eof_queued;
+    gint64 file_pos;
+    float * readbuf;
+
+    /* DSP side only */
+    int playing;
+    int primed;
+    int underruns;
+    int underruns_sent;
+    diskplay_slot * current;
+    int current_pos;
+} builtin_diskplay_data;
+
+/* response types */
+#define RESP_OPENED 0
+#define RESP_CHANNELS 1
+#define RESP_FRAMES 2
+#define RESP_RATE 3
+#define RESP_EOF 4
+#define RESP_UNDERRUNS 5
+#define RESP_ERROR 6
+
+static void
+init(mfp_processor * proc)
+{
+    builtin_diskplay_data * d = g_malloc0(sizeof(builtin_diskplay_data));
+    gpointer prefetch_ptr = g_hash_table_lookup(proc->params, "prefetch");
+    double prefetch = DISKPLAY_DEFAULT_PREFETCH;
+    diskplay_slot * slot;
+    int count;
+
+    if (prefetch_ptr != NULL) {
+        prefetch = *(double *)prefetch_ptr;
+    }
+
+    /* everything is allocated here, the ring never grows */
+    d->channels = proc->outlet_conn->len;
+    d->num_slots = MAX(DISKPLAY_MIN_SLOTS,
+                       (int)(prefetch * proc->context->samplerate / 1000.0
+                             / DISKPLAY_SLOT_FRAMES) + 1);
+    d->slots = g_malloc0(d->num_slots * sizeof(diskplay_slot));
+    d->filled = mfp_ring_new(d->num_slots, sizeof(diskplay_slot *));
+    d->empty = mfp_ring_new(d->num_slots, sizeof(diskplay_slot *));
+
+    for (count = 0; count < d->num_slots; count++) {
+        slot = d->slots + count;
+        slot->data = g_malloc0(MAX(d->channels, 1) * DISKPLAY_SLOT_FRAMES * sizeof(mfp_sample));
+        mfp_ring_push(d->empty, &slot);
+    }
+
+    d->responder.rpc_id = proc->rpc_id;
+    d->samplerate = proc->context->samplerate;
+    d->prefetch_status = ALLOC_IDLE;
+    proc->data = d;
+}
+
+/* run by the mfp_alloc thread, after any prefetch queued before it */
+static void
+teardown(mfp_processor * proc, void * alloc_data)
+{
+    builtin_diskplay_data * d = (builtin_diskplay_data *)alloc_data;
+    int count;
+
+    if (d->file != NULL) {
+        sf_close(d->file);
+    }
+    for (count = 0; count < d->num_slots; count++) {
+        g_free(d->slots[count].data);
+    }
+    g_free(d->slots);
+    g_free(d->readbuf);
+    g_free(atomic_exchange(&d->open_name, NULL));
+    mfp_ring_free(d->filled);
+    mfp_ring_free(d->empty);
+    g_free(d);
+}
+
+static void
+destroy(mfp_processor * proc)
+{
+    builtin_diskplay_data * d = (builtin_diskplay_data *)(proc->data);
+
+    atomic_store(&d->closing, 1);
+    proc->data = NULL;
+
+    if (!mfp_alloc_call(NULL, teardown, d, NULL)) {
+        /* the alloc queue is full, which shouldn't happen; leaking
+         * the buffers beats waiting on disk I/O in the DSP thread */
+        mfp_log_error("diskplay~: can't queue teardown, leaking %d slots", d->num_slots);
+    }
+}
+
+/* prefetch side: open a newly requested file */
+static void
+prefetch_open(builtin_diskplay_data * d, char * filename)
+{
+    mfp_processor * proc = &d->responder;
+
+    if (d->file != NULL) {
+        sf_close(d->file);
+        d->file = NULL;
+    }
+
+    memset(&d->file_info, 0, sizeof(SF_INFO));
+    d->file = sf_open(filename, SFM_READ, &d->file_info);
+    if (d->file == NULL) {
+        mfp_log_error("diskplay~: cannot open %s: %s", filename, sf_strerror(NULL));
+        mfp_dsp_send_response_str(proc, RESP_ERROR, (char *)sf_strerror(NULL));
+        g_free(filename);
+        return;
+    }
+
+    if (d->file_info.samplerate != d->samplerate) {
+        mfp_log_warning("diskplay~: %s is %d Hz, playing at %d Hz without resampling",
+                        filename, d->file_info.samplerate, d->samplerate);
+    }
+
+    g_free(d->readbuf);
+    d->readbuf = g_malloc(d->file_info.channels * DISKPLAY_SLOT_FRAMES * sizeof(float));
+
+    mfp_dsp_send_response_int(proc, RESP_CHANNELS, d->file_info.channels);
+    mfp_dsp_send_response_int(proc, RESP_FRAMES, d->file_info.frames);
+    mfp_dsp_send_response_int(proc, RESP_RATE, d->file_info.samplerate);
+    mfp_dsp_send_response_str(proc, RESP_OPENED, filename);
+    g_free(filename);
+}
+
+/* prefetch side: read the next slot's worth of frames, going round to
+ * the start if looping.  Fewer than a slot only at the end of the file */
+static int
+prefetch_read(builtin_diskplay_data * d, diskplay_slot * slot)
+{
+    int file_channels = d->file_info.channels;
+    int frames = 0;
+    int got;
+    int chan, frame;
+
+    while ((frames < DISKPLAY_SLOT_FRAMES) && !d->file_eof) {
+        got = sf_readf_float(d->file, d->readbuf + frames * file_channels,
+                             DISKPLAY_SLOT_FRAMES - frames);
+        frames += MAX(got, 0);
+        d->file_pos += MAX(got, 0);
+
+        if (got <= 0) {
+            if (atomic_load(&d->loop) && (d->file_pos > 0)) {
+                sf_seek(d->file, 0, SEEK_SET);
+                d->file_pos = 0;
+            }
+            else {
+                d->file_eof = 1;
+            }
+        }
+    }
+
+    /* de-interleave into the slot; missing channels are silent */
+    for (chan = 0; chan < d->channels; chan++) {
+        mfp_sample * dest = slot->data + chan * DISKPLAY_SLOT_FRAMES;
+        if (chan < file_channels) {
+            for (frame = 0; frame < frames; frame++) {
+                dest[frame] = d->readbuf[frame * file_channels + chan];
+            }
+        }
+        else {
+            memset(dest, 0, frames * sizeof(mfp_sample));
+        }
+    }
+    return frames;
+}
+
+/* the prefetch handler, run by the mfp_alloc thread.  proc may be gone
+ * already, see above */
+static void
+prefetch(mfp_processor * proc, void * alloc_data)
+{
+    builtin_diskplay_data * d = (builtin_diskplay_data *)alloc_data;
+    int generation = atomic_load(&d->generation);
+    char * filename;
+    diskplay_slot * slot;
+
+    if (atomic_load(&d->closing)) {
+        return;
+    }
+
+    if (generation != atomic_load(&d->file_generation)) {
+        filename = atomic_exchange(&d->open_name, NULL);
+        if (filename != NULL) {
+            prefetch_open(d, filename);
+        }
+        if (d->file != NULL) {
+            d->file_pos = MIN(atomic_load(&d->seek_to), d->file_info.frames);
+            sf_seek(d->file, d->file_pos, SEEK_SET);
+        }
+        d->file_eof = 0;
+        d->eof_queued = 0;
+        atomic_store(&d->file_generation, generation);
+    }
+
+    if (d->file == NULL) {
+        return;
+    }
+
+    /* one end-of-file slot (frames == 0) per generation is enough */
+    while (!d->eof_queued && mfp_ring_peek(d->empty, &slot)) {
+        /* a seek came in while reading: leave the rest for next time */
+        if ((atomic_load(&d->generation) != generation) || atomic_load(&d->closing)) {
+            break;
+        }
+        mfp_ring_advance(d->empty);
+
+        slot->position = d->file_pos;
+        slot->frames = prefetch_read(d, slot);
+        slot->generation = generation;
+        mfp_ring_push(d->filled, &slot);
+
+        if (slot->frames == 0) {
+            d->eof_queued = 1;
+        }
+    }
+}
+
+/* DSP side: everything after here runs on the DSP thread */
+
+static void
+release_current(builtin_diskplay_data * d)
+{
+    if (d->current != NULL) {
+        mfp_ring_push(d->empty, &d->current);
+        d->current = NULL;
+    }
+}
+
+static void
+start_generation(builtin_diskplay_data * d, gint64 position)
+{
+    release_current(d);
+    atomic_store(&d->seek_to, position);
+    atomic_fetch_add(&d->generation, 1);
+    d->primed = 0;
+}
+
+static int
+process(mfp_processor * proc)
+{
+    builtin_diskplay_data * d = (builtin_diskplay_data *)(proc->data);
+    int generation = atomic_load(&d->generation);
+    int blocksize = proc->context->blocksize;
+    int pos = 0;
+    int count, chan;
+
+    while (d->playing && (pos < blocksize)) {
+        if (d->current == NULL) {
+            if (!mfp_ring_pop(d->filled, &d->current)) {
+                /* nothing to play.  Waiting for the first slot after a
+                 * seek or open is expected, running dry after that isn't */
+                if (d->primed) {
+                    d->underruns ++;
+                }
+                break;
+            }
+            if (d->current->generation != generation) {
+                release_current(d);
+                continue;
+            }
+            d->primed = 1;
+            d->current_pos = 0;
+            if (d->current->frames == 0) {
+                release_current(d);
+                d->playing = 0;
+                mfp_dsp_send_response_bool(proc, RESP_EOF, 1);
+                break;
+            }
+        }
+
+        count = MIN(blocksize - pos, d->current->frames - d->current_pos);
+        for (chan = 0; chan < d->channels; chan++) {
+            memcpy(proc->outlet_buf[chan]->data + pos,
+                   d->current->data + chan * DISKPLAY_SLOT_FRAMES + d->current_pos,
+                   count * sizeof(mfp_sample));
+        }
+        pos += count;
+        d->current_pos += count;
+        if (d->current_pos >= d->current->frames) {
+            release_current(d);
+        }
+    }
+
+    for (chan = 0; chan < d->channels; chan++) {
+        memset(proc->outlet_buf[chan]->data + pos, 0, (blocksize - pos) * sizeof(mfp_sample));
+    }
+
+    if (d->underruns != d->underruns_sent) {
+        mfp_dsp_send_response_int(proc, RESP_UNDERRUNS, d->underruns);
+        d->underruns_sent = d->underruns;
+    }
+
+    /* keep the ring topped up */
+    if ((d->prefetch_status != ALLOC_WORKING)
+        && ((mfp_ring_count(d->empty) > 0)
+            || (generation != atomic_load(&d->file_generation)))) {
+        mfp_alloc_allocate(proc, d, &d->prefetch_status);
+    }
+    return 0;
+}
+
+/* take a one-shot parameter out of proc->params.  The caller retires
+ * the name (and the value, unless it keeps it) with
+ * mfp_dsp_retire_param */
+static gpointer
+take_param(mfp_processor * proc, const char * name, char ** key)
+{
+    gpointer value = NULL;
+
+    *key = NULL;
+    if (!g_hash_table_lookup_extended(proc->params, name, (gpointer *)key, &value)) {
+        return NULL;
+    }
+    g_hash_table_remove(proc->params, name);
+    return value;
+}
+
+static int
+config(mfp_processor * proc)
+{
+    builtin_diskplay_data * d = (builtin_diskplay_data *)(proc->data);
+    gpointer loop_ptr = g_hash_table_lookup(proc->params, "loop");
+    char * filename_key, * seek_key, * play_key;
+    gpointer filename_ptr = take_param(proc, "filename", &filename_key);
+    gpointer seek_ptr = take_param(proc, "seek", &seek_key);
+    gpointer play_ptr = take_param(proc, "play", &play_key);
+    char * old_name;
+
+    if (loop_ptr != NULL) {
+        atomic_store(&d->loop, (*(double *)loop_ptr) > 0.5);
+    }
+
+    /* the prefetch handler takes over the filename string */
+    if (filename_ptr != NULL) {
+        old_name = atomic_exchange(&d->open_name, (char *)filename_ptr);
+        mfp_dsp_retire_param(proc, filename_key, PARAMTYPE_STRING, old_name);
+        start_generation(d, 0);
+        d->playing = 0;
+    }
+
+    if (seek_ptr != NULL) {
+        start_generation(d, (gint64)(*(double *)seek_ptr * proc->context->samplerate / 1000.0));
+        mfp_dsp_retire_param(proc, seek_key, PARAMTYPE_FLT, seek_ptr);
+    }
+
+    if (play_ptr != NULL) {
+        d->playing = (*(double *)play_ptr) > 0.5;
+        d->primed = 0;
+        mfp_dsp_retire_param(proc, play_key, PARAMTYPE_FLT, play_ptr);
+    }
+
+    return 1;
+}
+
+static void
+reset(mfp_processor * proc)
+{
+    builtin_diskplay_data * d = (builtin_diskplay_data *)(proc->data);
+
+    d->playing = 0;
+    start_generation(d, 0);
+}
+
+/* status, for tests: filled slots, slot count, underruns */
+void
+mfp_diskplay_status(mfp_processor * proc, int * filled, int * slots, int * underruns)
+{
+    builtin_diskplay_data * d = (builtin_diskplay_data *)(proc->data);
+
+    *filled = mfp_ring_count(d->filled);
+    *slots = d->num_slots;
+    *underruns = d->underruns;
+}
+
+mfp_procinfo *
+init_builtin_diskplay(void) {
+    mfp_procinfo * p = g_malloc0(sizeof(mfp_procinfo));
+
+    p->name = strdup("diskplay~");
+    p->is_generator = GENERATOR_ALWAYS;
+    p->process = process;
+    p->init = init;
+    p->destroy = destroy;
+    p->config = config;
+    p->reset = reset;
+    p->alloc = prefetch;
+    p->params = g_hash_table_new_full(g_str_hash, g_str_equal, NULL, NULL);
+    g_hash_table_insert(p->params, "filename", (gpointer)PARAMTYPE_STRING);
+    g_hash_table_insert(p->params, "play", (gpointer)PARAMTYPE_FLT);
+    g_hash_table_insert(p->params, "seek", (gpointer)PARAMTYPE_FLT);
+    g_hash_table_insert(p->params, "loop", (gpointer)PARAMTYPE_FLT);
+    g_hash_table_insert(p->params, "prefetch", (gpointer)PARAMTYPE_FLT);
+
+    return p;
+}
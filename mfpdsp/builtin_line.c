@@ -4,6 +4,7 @@
 #include <glib.h>
 
 #include "mfp_dsp.h"
+#include "mfp_block.h"
 
 typedef struct {
     int start_frame;
@@ -100,11 +101,11 @@ process_line(mfp_processor * proc)
     segment * cseg = data->segv + data->cur_segment;
     int cframe = data->cur_frame;
     double slope, offset;
-    int scount;
+    int scount, run;
     mfp_sample * sample = proc->outlet_buf[0]->data;
 
     if ((sample == NULL) || (data == NULL) || (data->nsegs == 0)) {
-        mfp_block_zero(proc->outlet_buf[0]);
+        mfp_block_set_const(proc->outlet_buf[0], 0.0);
         return 0;
     }
     
@@ -113,7 +114,17 @@ process_line(mfp_processor * proc)
 
     /* iterate */ 
     for(scount=0; scount < proc->context->blocksize; scount++) {
-        if (cframe < cseg->start_frame) {
+        if ((cframe > cseg->start_frame) && (cframe < cseg->end_frame)) {
+            /* inside a segment it's a straight line up to end_frame */
+            run = MIN(cseg->end_frame - cframe, proc->context->blocksize - scount);
+            mfp_kernels->ramp(sample, (double)(cframe - cseg->start_frame)*slope + offset,
+                              slope, run);
+            sample += run;
+            cframe += run - 1;
+            scount += run - 1;
+            data->cur_val = (double)(cframe - cseg->start_frame)*slope + offset;
+        }
+        else if (cframe < cseg->start_frame) {
             *sample++ = data->cur_val;
         }
         else if (cframe > cseg->end_frame) {
@@ -133,10 +144,6 @@ process_line(mfp_processor * proc)
             offset = data->cur_val;
             *sample++ = data->cur_val;
         }
-        else {
-            data->cur_val = ((double)(cframe - cseg->start_frame)*slope + offset); 
-            *sample++ = data->cur_val; 
-        }
         cframe++;
         data->cur_frame = cframe;
     }
@@ -180,6 +187,7 @@ init_builtin_line(void) {
     mfp_procinfo * p = g_malloc0(sizeof(mfp_procinfo));
     p->name = strdup("line~");
     p->is_generator = GENERATOR_ALWAYS;
+    p->transient_buffers = 1;
     p->process = process_line;
     p->init = init;
     p->destroy = destroy;
@@ -6,34 +6,44 @@
 #include <glib.h>
 
 #include "mfp_dsp.h"
+#include "mfp_block.h"
+
+typedef struct {
+    guint32 state[MFP_NOISE_LANES];
+} builtin_noise_data;
 
 static int 
 process(mfp_processor * proc) 
 {
+    builtin_noise_data * pdata = (builtin_noise_data *)proc->data;
     mfp_sample * sample = proc->outlet_buf[0]->data;
-    int scount; 
 
     if (sample == NULL) {
         return 0;
     }
 
-    /* iterate */ 
-    for(scount=0; scount < proc->context->blocksize; scount++) {
-        *sample++ = (1.0 - 2.0*(double)random() / ((double)RAND_MAX));
-    }
-
+    mfp_kernels->noise(pdata->state, sample, proc->context->blocksize);
     return 0;
 }
 
 static void 
 init(mfp_processor * proc) 
 {
+    builtin_noise_data * p = g_malloc0(sizeof(builtin_noise_data));
+
+    /* every noise~ gets its own sequence */
+    mfp_kernel_noise_seed(p->state, (guint32)random());
+    proc->data = p;
     return;
 }
 
 static void
 destroy(mfp_processor * proc) 
 {
+    if (proc->data != NULL) {
+        g_free(proc->data);
+        proc->data = NULL;
+    }
     return;
 }
 
@@ -53,6 +63,7 @@ init_builtin_noise(void) {
     
     p->name = strdup("noise~");
     p->is_generator = 1;
+    p->transient_buffers = 1;
     p->process = process;
     p->init = init;
     p->destroy = destroy;
@@ -107,6 +107,7 @@ static mfp_procinfo *
 init_builtin_noop_wrapper(void) {
     mfp_procinfo * p = g_malloc0(sizeof(mfp_procinfo));
     p->is_generator = 1;
+    p->serial_only = 1;
     p->process = process;
     p->init = init;
     p->destroy = destroy;
@@ -33,34 +33,6 @@ table_load(void) {
 }
 
 
-static mfp_sample
-table_lookup(double phase) {
-
-    int index = (int)(phase * OSC_TABSCALE);
-    double rem, s1, s2;
-
-    if(index < 0) {
-        index = 0;
-        s1 = osc_table[index];
-        s2 = osc_table[index];
-        rem = 0.0;
-    }
-    else if (index > OSC_TABSIZE-1) {
-        index = OSC_TABSIZE;
-        s1 = osc_table[index];
-        s2 = osc_table[index];
-        rem = 0.0;
-    }
-    else {
-        s1 = osc_table[index];
-        s2 = osc_table[index+1];
-        rem = phase - index*OSC_TABINCR;
-    }
-
-    return (mfp_sample)(s1 + (s2-s1)*(rem*OSC_TABSCALE));
-
-}
-
 static int
 process_osc(mfp_processor * proc)
 {
@@ -68,7 +40,6 @@ process_osc(mfp_processor * proc)
     int mode_am = 0, mode_fm = 0;
     double phase_base;
     float newphase = 0.0;
-    int c;
 
 
     if (mfp_proc_has_input(proc, 0)) {
@@ -101,9 +72,8 @@ process_osc(mfp_processor * proc)
 
 
     /* now the real work */
-    for (c=0; c < proc->outlet_buf[0]->blocksize; c++) {
-        proc->outlet_buf[0]->data[c] = table_lookup(d->int_0->data[c]);
-    }
+    mfp_kernels->table_lookup(d->int_0->data, osc_table, OSC_TABSIZE, OSC_TABSCALE,
+                              proc->outlet_buf[0]->data, proc->outlet_buf[0]->blocksize);
 
     /* apply gain or amplitude modulation */
     if(mode_am == 1) {
@@ -182,6 +152,7 @@ init_builtin_osc(void) {
     mfp_procinfo * p = g_malloc0(sizeof(mfp_procinfo));
     p->name = strdup("osc~");
     p->is_generator = GENERATOR_CONDITIONAL;
+    p->transient_buffers = 1;
     p->process = process_osc;
     p->init = init;
     p->destroy = destroy;
@@ -120,6 +120,7 @@ init_builtin_phasor(void) {
 
     p->name = strdup("phasor~");
     p->is_generator = 1;
+    p->transient_buffers = 1;
 
     p->process = process;
     p->init = init;
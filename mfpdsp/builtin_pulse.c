@@ -214,6 +214,7 @@ init_builtin_pulse(void) {
     mfp_procinfo * p = g_malloc0(sizeof(mfp_procinfo));
     p->name = strdup("pulse~");
     p->is_generator = GENERATOR_CONDITIONAL;
+    p->transient_buffers = 1;
     p->process = process_pulse;
     p->init = init;
     p->destroy = destroy;
@@ -15,7 +15,6 @@ process_sig(mfp_processor * proc)
 {
     builtin_sig_data * d = (builtin_sig_data *)(proc->data);
     mfp_sample * sample; 
-    int scount; 
     
     if ((proc == NULL) || (proc->outlet_buf == NULL) || (proc->outlet_buf[0] == NULL)) {
         printf("sig~: critical error ((NULL pointers)\n");
@@ -27,11 +26,7 @@ process_sig(mfp_processor * proc)
         return 0;
     }
 
-    /* iterate */ 
-    for(scount=0; scount < proc->context->blocksize; scount++) {
-        *sample++ = d->sample;
-    }
-
+    mfp_block_set_const(proc->outlet_buf[0], d->sample);
     return 0;
 }
 
@@ -70,6 +65,8 @@ init_builtin_sig(void) {
     mfp_procinfo * p = g_malloc0(sizeof(mfp_procinfo));
     p->name = strdup("sig~");
     p->is_generator = 1;
+    p->transient_buffers = 1;
+    p->sample_accurate = 1;
     p->process = process_sig;
     p->init = init;
     p->destroy = destroy;
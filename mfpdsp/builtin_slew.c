@@ -105,6 +105,7 @@ init_builtin_slew(void)
     mfp_procinfo * p = g_malloc0(sizeof(mfp_procinfo));
     p->name = strdup("slew~");
     p->is_generator = 0;
+    p->transient_buffers = 1;
     p->process = process_slew;
     p->init = init;
     p->destroy = destroy;
@@ -240,6 +240,7 @@ init_builtin_stepseq(void) {
     p->init = init;
     p->destroy = destroy;
     p->config = config;
+    p->sample_accurate = 1;
     p->params = g_hash_table_new_full(g_str_hash, g_str_equal, NULL, NULL);
     g_hash_table_insert(p->params, "steps", (gpointer)PARAMTYPE_FLTARRAY);
     g_hash_table_insert(p->params, "position", (gpointer)PARAMTYPE_FLT);
@@ -89,6 +89,7 @@ init_builtin_vc_freq(void) {
     mfp_procinfo * p = g_malloc0(sizeof(mfp_procinfo));
     p->name = strdup("vcfreq~");
     p->is_generator = GENERATOR_CONDITIONAL;
+    p->transient_buffers = 1;
     p->process = process_vc_freq;
     p->init = init;
     p->destroy = destroy;
@@ -99,6 +99,7 @@ init_builtin_vc_quantize12(void) {
     mfp_procinfo * p = g_malloc0(sizeof(mfp_procinfo));
     p->name = strdup("vcq12~");
     p->is_generator = GENERATOR_NEVER;
+    p->transient_buffers = 1;
     p->process = process_quantize12;
     p->init = init;
     p->destroy = destroy;
@@ -36,9 +36,11 @@ mfp_init_all(char * sockname)
 {
     mfp_dsp_init();
     mfp_alloc_init();
+    mfp_sched_init();
     mfp_comm_init(sockname);
     mfp_rpc_init();
     mfp_api_init();
+    mfp_response_init();
     mfp_initialized = 1;
     return;
 }
@@ -47,12 +49,17 @@ void
 mfp_finish_all(void)
 {
     mfp_comm_io_finish();
+    mfp_pool_finish();
+    mfp_sched_finish();
     mfp_alloc_finish();
+    mfp_response_finish();
 }
 
 
 /* main() gets called only if this is a standalone JACK client
- * startup.  The MFP process will cause this to be run */
+ * startup.  The MFP process will cause this to be run.  Given a
+ * samplerate (mfp --render), it runs an offline context instead of
+ * connecting to JACK */
 int
 main(int argc, char ** argv)
 {
@@ -61,6 +68,8 @@ main(int argc, char ** argv)
     int max_blocksize = 4096;
     int num_inputs = 2;
     int num_outputs = 2;
+    int offline_samplerate = 0;
+    int offline_blocksize = 256;
     mfp_context * ctxt;
 
     if (argc < 2) {
@@ -89,6 +98,18 @@ main(int argc, char ** argv)
                 }
                 else {
                     num_outputs = strtod(argv[4], NULL);
+                    if (argc > 5) {
+                        mfp_request_queue_size = strtod(argv[5], NULL);
+                    }
+                    if (argc > 6) {
+                        mfp_dsp_threads = strtod(argv[6], NULL);
+                    }
+                    if (argc > 7) {
+                        offline_samplerate = strtod(argv[7], NULL);
+                    }
+                    if (argc > 8) {
+                        offline_blocksize = strtod(argv[8], NULL);
+                    }
                 }
             }
         }
@@ -110,11 +131,25 @@ main(int argc, char ** argv)
 
     /* set up global state */
     mfp_init_all(sockname);
+
+    if (offline_samplerate > 0) {
+        ctxt = mfp_offline_startup(num_inputs, num_outputs,
+                                   offline_samplerate, offline_blocksize);
+        mfp_context_init(ctxt);
+        mfp_offline_wait(ctxt);
+        mfp_comm_io_wait();
+        mfp_context_unlink_clocks();
+        mfp_response_finish();
+        return 0;
+    }
+
     ctxt = mfp_jack_startup("mfpdsp", num_inputs, num_outputs);
 
     mfp_context_init(ctxt);
     mfp_comm_io_wait();
     mfp_jack_shutdown();
+    mfp_context_unlink_clocks();
+    mfp_response_finish();
     return 0;
 
 }
@@ -21,29 +21,52 @@ int alloc_queue_write = 0;
 
 int mfp_alloc_quit = 0; 
 
+/* processors in different contexts can ask for allocations from
+ * different DSP threads at the same time; they take turns on the
+ * write side of alloc_queue */
+static atomic_flag alloc_queue_lock = ATOMIC_FLAG_INIT;
+
 pthread_t mfp_alloc_thread;
 
 int 
 mfp_alloc_allocate(mfp_processor * proc, void * req_data, int * req_status)
+{
+    return mfp_alloc_call(proc, proc->typeinfo->alloc, req_data, req_status);
+}
+
+/* run handler(proc, req_data) on the alloc thread, after anything
+ * queued before it.  req_status may be NULL, for jobs (like freeing a
+ * processor's data) where nobody is left to look at it */
+int
+mfp_alloc_call(mfp_processor * proc, void (* handler)(mfp_processor *, void *),
+               void * req_data, int * req_status)
 {
     mfp_alloc_reqinfo req; 
     
     req.proc = proc;
-    req.handler = proc->typeinfo->alloc; 
+    req.handler = handler;
     req.data = req_data;
     req.status = req_status; 
 
     if (req.handler == NULL) {
         return 0;
     }
-    
+
+    while (atomic_flag_test_and_set_explicit(&alloc_queue_lock, memory_order_acquire)) {
+    }
+
     if((alloc_queue_read == 0 && alloc_queue_write == ALLOC_LASTIND)
         || (alloc_queue_write + 1 == alloc_queue_read)) {
-        *req_status = ALLOC_IDLE;
+        atomic_flag_clear_explicit(&alloc_queue_lock, memory_order_release);
+        if (req_status != NULL) {
+            *req_status = ALLOC_IDLE;
+        }
         return 0;
     }
     else {
-        *req_status = ALLOC_WORKING;
+        if (req_status != NULL) {
+            *req_status = ALLOC_WORKING;
+        }
         alloc_queue[alloc_queue_write] = req;
         if(alloc_queue_write == ALLOC_LASTIND) {
             alloc_queue_write = 0;
@@ -51,6 +74,7 @@ mfp_alloc_allocate(mfp_processor * proc, void * req_data, int * req_status)
         else {
             alloc_queue_write += 1;
         }
+        atomic_flag_clear_explicit(&alloc_queue_lock, memory_order_release);
         return 1;
     }
 }
@@ -67,7 +91,9 @@ mfp_alloc_thread_func(void * data)
         while(alloc_queue_read != alloc_queue_write) {
             req = alloc_queue[alloc_queue_read];
             req.handler(req.proc, req.data);
-            *req.status = ALLOC_READY; 
+            if (req.status != NULL) {
+                *req.status = ALLOC_READY;
+            }
             alloc_queue_read = (alloc_queue_read+1) % ALLOC_BUFSIZE;
         }
         nanosleep(&sleeptime, NULL);
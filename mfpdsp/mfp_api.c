@@ -193,7 +193,7 @@ mfp_api_close_context(mfp_context * context)
     mfp_rpc_wait(request_id);
 
     /* handle any DSP config requests */
-    mfp_dsp_handle_requests();
+    mfp_dsp_handle_requests(context);
 }
 
 /* FIXME make mfp_api_exit_notify nonblocking */
@@ -9,8 +9,80 @@ typedef struct {
     int allocsize;
     int aligned;
     float * data;
+
+    /* is_const means every sample in data is const_value.  Only
+     * mfp_block_set_const() sets it, and outlet blocks are cleared
+     * before each process() call, so a processor that doesn't know
+     * about it never leaves a stale flag behind.  data is always
+     * valid whether or not the flag is set */
+    int is_const;
+    mfp_sample const_value;
 } mfp_block;
 
+#define mfp_block_is_zero(b) ((b)->is_const && ((b)->const_value == 0.0))
+
+/* biquad coefficients and state (direct form II) */
+typedef struct {
+    double b0;
+    double b1;
+    double b2;
+    double a1;
+    double a2;
+
+    double delay_1;
+    double delay_2;
+} mfp_biquad;
+
+/* inner loops over raw sample arrays.  There is one table per
+ * instruction set, and mfp_kernels points at the best one the CPU
+ * supports (see mfp_kernel.c).  Every kernel handles any count, not
+ * just multiples of the vector width, and doesn't care about alignment */
+typedef struct {
+    const char * name;
+    void (* add)(const mfp_sample * in_1, const mfp_sample * in_2, mfp_sample * out, int count);
+    void (* mul)(const mfp_sample * in_1, const mfp_sample * in_2, mfp_sample * out, int count);
+    void (* cmp)(const mfp_sample * in_1, const mfp_sample * in_2,
+                 mfp_sample trueval, mfp_sample falseval, mfp_sample * out, int count);
+    /* out += in_1 * in_2 (* in_3 if not NULL) */
+    void (* mac)(const mfp_sample * in_1, const mfp_sample * in_2, const mfp_sample * in_3,
+                 mfp_sample * out, int count);
+    void (* const_add)(const mfp_sample * in, mfp_sample constant, mfp_sample * out, int count);
+    void (* const_mul)(const mfp_sample * in, mfp_sample constant, mfp_sample * out, int count);
+    void (* fill)(mfp_sample * out, mfp_sample constant, int count);
+    void (* fmod)(const mfp_sample * in, mfp_sample modulus, mfp_sample * out, int count);
+    void (* trunc)(const mfp_sample * in, mfp_sample * out, int count);
+    void (* index_fetch)(const mfp_sample * indexes, const mfp_sample * base,
+                         mfp_sample * out, int count);
+    /* these return the value the next sample would have had */
+    double (* ramp)(mfp_sample * out, double initval, double incr, int count);
+    double (* phase)(mfp_sample * out, double initval, double incr, double phase_limit,
+                     int count);
+    double (* prefix_sum)(const mfp_sample * in, mfp_sample scale, mfp_sample initval,
+                          mfp_sample * out, int count);
+    /* linear interpolation in table[0..tabsize] at index in[n]*scale */
+    void (* table_lookup)(const mfp_sample * in, const double * table, int tabsize,
+                          double scale, mfp_sample * out, int count);
+    /* uniform in [-1, 1), sample n comes from state[n % MFP_NOISE_LANES] */
+    void (* noise)(guint32 * state, mfp_sample * out, int count);
+    void (* biquad)(mfp_biquad * filter, const mfp_sample * in, mfp_sample * out, int count);
+} mfp_kernel_table;
+
+#define MFP_KERNEL_SCALAR 0
+#define MFP_KERNEL_SSE 1
+#define MFP_KERNEL_AVX2 2
+#define MFP_KERNEL_LEVELS 3
+
+#define MFP_NOISE_LANES 8
+
+extern mfp_kernel_table * mfp_kernels;
+extern mfp_kernel_table mfp_kernels_scalar;
+
+extern void mfp_kernel_init(void);
+extern mfp_kernel_table * mfp_kernel_get(int level);
+extern void mfp_kernel_noise_seed(guint32 * state, guint32 seed);
+
+/* 0 makes the mfp_block_* operations use the scalar kernels whatever
+ * mfp_kernels is */
 extern int mfp_block_use_sse;
 
 extern mfp_block * mfp_block_new(int blocksize);
@@ -33,6 +105,8 @@ extern double mfp_block_phase(mfp_block * b, mfp_sample init, double incr, doubl
 extern int mfp_block_mac(mfp_block * in_1, mfp_block * in_2, mfp_block * in_3, mfp_block * out);
 extern int mfp_block_trunc(mfp_block * in, mfp_block * out); 
 extern int mfp_block_copy(mfp_block * in, mfp_block * out);
+extern int mfp_block_silent(mfp_block * in, mfp_sample threshold);
+extern void mfp_block_set_const(mfp_block * b, mfp_sample constant);
 extern double mfp_block_prefix_sum(mfp_block * deltas, mfp_sample scale, 
                                    mfp_sample initval, mfp_block * out);
 
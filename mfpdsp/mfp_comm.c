@@ -24,9 +24,14 @@ static int comm_io_writer_thread_ready = 0;
 static int comm_io_quitreq = 0;
 static pthread_mutex_t comm_io_lock = PTHREAD_MUTEX_INITIALIZER;
 
+/* responses come from the DSP threads as well as the RPC threads, so
+ * producers take turns on the outgoing ring.  This is only held for
+ * the push itself, never across a syscall */
+static atomic_flag comm_submit_lock = ATOMIC_FLAG_INIT;
+
 typedef struct {
     char bufdata[MFP_MAX_MSGSIZE];
-    int free;
+    atomic_int free;
 } comm_bufblock;
 
 static comm_bufblock comm_buffers[MFP_NUM_BUFFERS];
@@ -67,10 +72,10 @@ mfp_comm_connect(char * sockname)
 char *
 mfp_comm_get_buffer(void)
 {
-    /* FIXME mfp_comm_get_buffer implementation is naive */
+    /* FIXME mfp_comm_get_buffer implementation is naive.  Buffers are
+     * claimed with an atomic exchange since every DSP thread can ask */
     for(int bufnum=0; bufnum < MFP_NUM_BUFFERS; bufnum++) {
-        if(comm_buffers[bufnum].free) {
-            comm_buffers[bufnum].free = 0;
+        if(atomic_exchange(&comm_buffers[bufnum].free, 0)) {
             return comm_buffers[bufnum].bufdata;
         }
     }
@@ -85,7 +90,7 @@ mfp_comm_release_buffer(char * msgbuf)
     /* FIXME mfp_comm_get_buffer implementation is naive */
     for(int bufnum=0; bufnum < MFP_NUM_BUFFERS; bufnum++) {
         if(comm_buffers[bufnum].bufdata == msgbuf) {
-            comm_buffers[bufnum].free = 1;
+            atomic_store(&comm_buffers[bufnum].free, 1);
             return;
         }
     }
@@ -98,6 +103,7 @@ int
 mfp_comm_submit_buffer(char * msgbuf, int msglen)
 {
     mfp_out_data rd;
+    int pushed;
     rd.msgbuf = msgbuf;
     rd.msglen = msglen;
 
@@ -106,20 +112,18 @@ mfp_comm_submit_buffer(char * msgbuf, int msglen)
         return 0;
     }
 
-    if((outgoing_queue_read == 0 && outgoing_queue_write == REQ_LASTIND)
-        || (outgoing_queue_write + 1 == outgoing_queue_read)) {
-        return 0;
+    while (atomic_flag_test_and_set_explicit(&comm_submit_lock, memory_order_acquire)) {
     }
+    pushed = mfp_ring_push(outgoing_queue, &rd);
+    atomic_flag_clear_explicit(&comm_submit_lock, memory_order_release);
 
-    outgoing_queue[outgoing_queue_write] = rd;
-    if(outgoing_queue_write == REQ_LASTIND) {
-        outgoing_queue_write = 0;
-    }
-    else {
-        outgoing_queue_write += 1;
+    if (!pushed) {
+        /* counted in the ring's overflow stats */
+        mfp_comm_release_buffer(msgbuf);
+        return 0;
     }
 
-    pthread_cond_broadcast(&outgoing_cond);
+    sem_post(&outgoing_sem);
     return 1;
 }
 
@@ -230,67 +234,165 @@ mfp_comm_init(char * init_sockid)
     return 0;
 }
 
+/*
+ * The reader pulls whatever the socket has, up to MFP_COMM_READ_SIZE,
+ * and dispatches every complete frame in it.  A partial frame stays at
+ * the front of the buffer for the next read to finish.  Anything that
+ * isn't a frame header is skipped up to the next '[', which is also
+ * what happens to a frame longer than MFP_MAX_MSGSIZE.
+ */
+
+void
+mfp_comm_reader_init(mfp_comm_reader * reader, int (* dispatch)(const char *, int))
+{
+    /* one more byte so the last payload can be NUL-terminated */
+    reader->buf = g_malloc(MFP_COMM_READ_SIZE + 1);
+    reader->start = 0;
+    reader->end = 0;
+    reader->insync = 1;
+    reader->frames = 0;
+    reader->resyncs = 0;
+    reader->dispatch = dispatch;
+}
+
+void
+mfp_comm_reader_free(mfp_comm_reader * reader)
+{
+    g_free(reader->buf);
+    reader->buf = NULL;
+}
+
+int
+mfp_comm_reader_recv(mfp_comm_reader * reader, int fd)
+{
+    int bytesread;
+
+    if (reader->start > 0) {
+        memmove(reader->buf, reader->buf + reader->start, reader->end - reader->start);
+        reader->end -= reader->start;
+        reader->start = 0;
+    }
+
+    bytesread = recv(fd, reader->buf + reader->end, MFP_COMM_READ_SIZE - reader->end, 0);
+    if (bytesread > 0) {
+        reader->end += bytesread;
+    }
+    return bytesread;
+}
+
+static int
+frame_length(const char * header, int avail, int * hdrlen)
+{
+    const unsigned char * lenbytes = (const unsigned char *)header + MFP_COMM_SYNC_LEN;
+    int msglen = 0;
+    int digits = 0;
+
+    if (!memcmp(header, MFP_COMM_SYNC, MFP_COMM_SYNC_LEN)) {
+        *hdrlen = MFP_COMM_SYNC_LEN + 8;
+        if (avail < *hdrlen) {
+            return 0;
+        }
+        for (int i = 0; i < 8; i++) {
+            if (lenbytes[i] >= '0' && lenbytes[i] <= '9') {
+                msglen = msglen * 10 + (lenbytes[i] - '0');
+                digits++;
+            }
+            else if (lenbytes[i] != ' ' || digits > 0) {
+                return -1;
+            }
+        }
+        return digits ? msglen : -1;
+    }
+    else if (!memcmp(header, MFP_COMM_SYNC_BINARY, MFP_COMM_SYNC_LEN)) {
+        *hdrlen = MFP_COMM_SYNC_LEN + 4;
+        if (avail < *hdrlen) {
+            return 0;
+        }
+        if (lenbytes[0] != 0) {
+            return -1;
+        }
+        return (lenbytes[1] << 16) | (lenbytes[2] << 8) | lenbytes[3];
+    }
+    return -1;
+}
+
+/* dispatch each complete frame in the buffer, returning how many */
+int
+mfp_comm_reader_parse(mfp_comm_reader * reader)
+{
+    int dispatched = 0;
+
+    while (reader->end - reader->start >= MFP_COMM_SYNC_LEN) {
+        char * frame = reader->buf + reader->start;
+        int avail = reader->end - reader->start;
+        int hdrlen = 0;
+        int msglen = frame_length(frame, avail, &hdrlen);
+        char * skip;
+        char saved;
+
+        if ((msglen < 0) || (msglen > MFP_MAX_MSGSIZE)) {
+            if (reader->insync) {
+                mfp_log_warning("comm IO reader: bad frame header, skipping to the next");
+                reader->insync = 0;
+                reader->resyncs++;
+            }
+            skip = memchr(frame + 1, '[', avail - 1);
+            reader->start = (skip != NULL) ? skip - reader->buf : reader->end;
+            continue;
+        }
+        if ((avail < hdrlen) || (avail < hdrlen + msglen)) {
+            break;
+        }
+
+        /* the payload is handed over NUL-terminated, in place */
+        frame += hdrlen;
+        saved = frame[msglen];
+        frame[msglen] = 0;
+        reader->dispatch(frame, msglen);
+        frame[msglen] = saved;
+
+        reader->start += hdrlen + msglen;
+        reader->insync = 1;
+        reader->frames++;
+        dispatched++;
+    }
+
+    if (reader->start == reader->end) {
+        reader->start = reader->end = 0;
+    }
+    return dispatched;
+}
+
 static void *
 mfp_comm_io_reader_thread(void * tdata)
 {
+    mfp_comm_reader reader;
     int quitreq = 0;
-    int  phase=0;
-    int  mlen = 0;
-    char syncbuf[]={0,0,0,0,0,0,0,0,0,0};
-    char lenbuf[]={0,0,0,0,0,0,0,0,0,0};
-    char msgbuf[MFP_MAX_MSGSIZE+1];
     int bytesread;
-    int success = 0;
     int errstat = 0;
 
+    mfp_comm_reader_init(&reader, mfp_rpc_dispatch_request);
     comm_io_reader_thread_ready = 1;
 
     while(!quitreq) {
-        bzero(msgbuf, MFP_MAX_MSGSIZE+1);
-        if (phase == 0) {
-            bytesread = recv(comm_socket, syncbuf, 8, 0);
-            if (bytesread == 8) {
-                errstat = 0;
-                success = 1;
-                phase = 1;
-            }
-            else
-                success = 0;
-        }
-        else if (phase == 1) {
-            bytesread = recv(comm_socket, lenbuf, 8, 0);
-            if (bytesread == 8) {
-                errstat = 0;
-                mlen = atoi(lenbuf);
-                success = 1;
-                phase = 2;
-            }
-            else
-                success = 0;
+        bytesread = mfp_comm_reader_recv(&reader, comm_socket);
+        if (bytesread > 0) {
+            errstat = 0;
+            mfp_comm_reader_parse(&reader);
         }
-        else if (phase == 2) {
-            bytesread = recv(comm_socket, msgbuf, mlen, 0);
-            if (bytesread == mlen) {
-                errstat = 0;
-                mlen = atoi(lenbuf);
-                phase = 0;
-                success = 1;
-                mfp_rpc_dispatch_request(msgbuf, bytesread);
-            }
-            else
-                success = 0;
-        }
-
-        if (!success) {
-            if (errno != EWOULDBLOCK && errno != EAGAIN) {
-                if (errstat == 0) {
-                    printf("comm IO reader: error reading from socket %d\n", comm_socket);
-                    errstat = 1;
-                }
+        else if ((bytesread == 0)
+                 || (errno != EWOULDBLOCK && errno != EAGAIN && errno != EINTR)) {
+            if (errstat == 0) {
+                printf("comm IO reader: error reading from socket %d\n", comm_socket);
+                errstat = 1;
             }
+            /* the socket is gone; the receive timeout doesn't pace us */
+            usleep(100000);
         }
         quitreq = mfp_comm_quit_requested();
     }
+
+    mfp_comm_reader_free(&reader);
     return NULL;
 }
 
@@ -298,48 +400,20 @@ static void *
 mfp_comm_io_writer_thread(void * tdata)
 {
     int quitreq = 0;
-    char msgbuf[MFP_MAX_MSGSIZE];
-    GArray * rdata;
-    struct timespec alarmtime;
-    struct timeval nowtime;
     mfp_out_data r;
-    char pbuff[32];
 
-    rdata = g_array_new(TRUE, TRUE, sizeof(mfp_out_data));
     comm_io_writer_thread_ready = 1;
 
     while(!quitreq) {
-        /* wait for a signal that there's data to write */
-        pthread_mutex_lock(&outgoing_lock);
-        if (outgoing_queue_read == outgoing_queue_write) {
-            pthread_cond_wait(&outgoing_cond, &outgoing_lock);
+        /* wait for a signal that there's data to write.  Every submit
+         * posts once, so there's no need to poll */
+        if (sem_wait(&outgoing_sem) < 0 && errno == EINTR) {
+            continue;
         }
 
-        gettimeofday(&nowtime, NULL);
-        alarmtime.tv_sec = nowtime.tv_sec;
-        alarmtime.tv_nsec = nowtime.tv_usec*1000 + 10000000;
-
-        if (outgoing_queue_read == outgoing_queue_write) {
-            pthread_cond_timedwait(&outgoing_cond, &outgoing_lock, &alarmtime);
-        }
-
-        /* copy/clear C response objects */
-        if(outgoing_queue_read != outgoing_queue_write) {
-            while(outgoing_queue_read != outgoing_queue_write) {
-                r = outgoing_queue[outgoing_queue_read];
-                g_array_append_val(rdata, r);
-                outgoing_queue_read = (outgoing_queue_read+1) % REQ_BUFSIZE;
-            }
-        }
-        pthread_mutex_unlock(&outgoing_lock);
-
-        for(int reqno=0; reqno < rdata->len; reqno++) {
-            r = g_array_index(rdata, mfp_out_data, reqno);
+        while(mfp_ring_pop(outgoing_queue, &r)) {
             mfp_comm_send_buffer(r.msgbuf, r.msglen);
         }
-        if (rdata->len > 0) {
-            g_array_remove_range(rdata, 0, rdata->len);
-        }
 
         quitreq = mfp_comm_quit_requested();
     }
@@ -371,8 +445,8 @@ mfp_comm_io_finish(void)
 {
     pthread_mutex_lock(&comm_io_lock);
     comm_io_quitreq = 1;
-    pthread_cond_broadcast(&outgoing_cond);
     pthread_mutex_unlock(&comm_io_lock);
+    sem_post(&outgoing_sem);
     mfp_comm_io_wait();
 }
 
@@ -1,13 +1,60 @@
 
 #include <sys/types.h>
+#include <sys/stat.h>
+#include <sys/mman.h>
+#include <fcntl.h>
 #include <unistd.h>
 #include <glib.h>
 #include <stdio.h>
+#include <string.h>
 
 #include "mfp_dsp.h"
 
 int next_context_id = 0;
 
+/* the clock page goes in shared memory if it can, and in the heap if
+ * not, where only this process (and the clock RPC) can see it */
+static void
+clock_open(mfp_context * ctxt)
+{
+    int fd;
+    void * page;
+
+    snprintf(ctxt->clock_shm_id, 64, "/mfp_clock_%05d_%03d", (int)getpid(), ctxt->id);
+    fd = shm_open(ctxt->clock_shm_id, O_RDWR|O_CREAT, S_IRUSR|S_IWUSR);
+    if (fd > -1) {
+        if (ftruncate(fd, sizeof(mfp_clock_page)) == 0) {
+            page = mmap(NULL, sizeof(mfp_clock_page), PROT_READ|PROT_WRITE,
+                        MAP_SHARED, fd, 0);
+            if (page != MAP_FAILED) {
+                close(fd);
+                memset(page, 0, sizeof(mfp_clock_page));
+                ctxt->clock = (mfp_clock_page *)page;
+                return;
+            }
+        }
+        close(fd);
+        shm_unlink(ctxt->clock_shm_id);
+    }
+
+    mfp_log_warning("Can't share the clock of context %d, it's RPC only", ctxt->id);
+    ctxt->clock_shm_id[0] = 0;
+    ctxt->clock = g_malloc0(sizeof(mfp_clock_page));
+}
+
+static void
+clock_close(mfp_context * ctxt)
+{
+    if (ctxt->clock_shm_id[0] != 0) {
+        munmap(ctxt->clock, sizeof(mfp_clock_page));
+        shm_unlink(ctxt->clock_shm_id);
+    }
+    else {
+        g_free(ctxt->clock);
+    }
+    ctxt->clock = NULL;
+}
+
 mfp_context *
 mfp_context_new(int ctxt_type)
 {
@@ -26,6 +73,14 @@ mfp_context_new(int ctxt_type)
     else if (ctxt_type == CTYPE_LV2) {
         ctxt->info.lv2 = g_malloc0(sizeof(mfp_lv2_info));
     }
+    else if (ctxt_type == CTYPE_OFFLINE) {
+        ctxt->info.offline = g_malloc0(sizeof(mfp_offline_info));
+    }
+
+    ctxt->requests = mfp_ring_new(mfp_request_queue_size, sizeof(mfp_in_data *));
+    ctxt->request_cleanup = g_array_new(TRUE, TRUE, sizeof(mfp_in_data *));
+    ctxt->level_stats = g_malloc0(MFP_MAX_LEVEL_STATS * sizeof(mfp_level_stats));
+    clock_open(ctxt);
 
     g_hash_table_insert(mfp_contexts, GINT_TO_POINTER(ctxt->id), (gpointer)ctxt);
     return ctxt;
@@ -38,6 +93,14 @@ mfp_context_destroy(mfp_context * ctxt)
 
     g_hash_table_remove(mfp_contexts, GINT_TO_POINTER(ctxt->id));
 
+    mfp_dsp_free_requests(ctxt);
+    mfp_sched_free_context(ctxt);
+    g_free(ctxt->level_stats);
+    clock_close(ctxt);
+
+    if (ctxt->ctype == CTYPE_OFFLINE) {
+        mfp_offline_free(ctxt);
+    }
     g_free((gpointer)ctxt->info.lv2);
     ctxt->info.lv2 = NULL;
     g_free(ctxt);
@@ -48,6 +111,24 @@ mfp_context_destroy(mfp_context * ctxt)
     }
 }
 
+/* take the clock pages' names out of /dev/shm on the way out, for
+ * contexts that are never destroyed.  Anyone who has one mapped keeps it */
+void
+mfp_context_unlink_clocks(void)
+{
+    GHashTableIter iter;
+    gpointer key, value;
+    mfp_context * ctxt;
+
+    g_hash_table_iter_init(&iter, mfp_contexts);
+    while (g_hash_table_iter_next(&iter, &key, &value)) {
+        ctxt = (mfp_context *)value;
+        if (ctxt->clock_shm_id[0] != 0) {
+            shm_unlink(ctxt->clock_shm_id);
+        }
+    }
+}
+
 int
 mfp_context_init(mfp_context * context)
 {
@@ -83,7 +164,11 @@ mfp_context_default_io(mfp_context * context, int patch_id)
 
     printf("connect_default_io: finding inlet~ and outlet~\n");
 
-    for(p = (mfp_processor **)(mfp_proc_list->data); *p != NULL; p++) {
+    if (context->procs == NULL) {
+        return 0;
+    }
+
+    for(p = (mfp_processor **)(context->procs->data); *p != NULL; p++) {
         if (((*p)->patch_id == patch_id) && ((*p)->typeinfo == inlet_t)) {
             newval = g_malloc0(sizeof(float));
             *(float *)newval = 1.0;
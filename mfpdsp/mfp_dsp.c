@@ -35,21 +35,21 @@ mfp_dsp_init(void) {
         init_builtin_errtest, init_builtin_slew, init_builtin_pulse,
         init_builtin_pulsesel, init_builtin_stepseq,
         init_builtin_vc_quantize12, init_builtin_vc_freq,
-        init_builtin_hold
+        init_builtin_hold, init_builtin_diskplay
     };
     int num_initfuncs = ARRAY_LEN(initfuncs, sizeof(mfp_procinfo *(*)(void)));
 
     /* init global vars */
-    mfp_proc_list = g_array_new(TRUE, TRUE, sizeof(mfp_processor *));
+    mfp_kernel_init();
     mfp_proc_registry = g_hash_table_new(g_str_hash, g_str_equal);
     mfp_proc_objects = g_hash_table_new(g_direct_hash, g_direct_equal);
     mfp_contexts = g_hash_table_new(g_direct_hash, g_direct_equal);
     mfp_extensions = g_hash_table_new(g_str_hash, g_str_equal);
 
-    incoming_cleanup = g_array_new(TRUE, TRUE, sizeof(mfp_in_data *));
+    outgoing_queue = mfp_ring_new(mfp_request_queue_size, sizeof(mfp_out_data));
 
-    pthread_cond_init(&outgoing_cond, NULL);
-    pthread_mutex_init(&outgoing_lock, NULL);
+    sem_init(&outgoing_sem, 0, 0);
+    sem_init(&request_space_sem, 0, 0);
     pthread_mutex_init(&incoming_lock, NULL);
 
     mfp_log_info("mfpdsp: initializing %d builtin DSP processors\n", num_initfuncs);
@@ -71,6 +71,9 @@ mfp_get_input_buffer(mfp_context * ctxt, int chan) {
         return jack_port_get_buffer(g_array_index(ctxt->info.jack->input_ports,
                                     jack_port_t *, chan), ctxt->blocksize);
     }
+    else if (ctxt->ctype == CTYPE_OFFLINE) {
+        return g_array_index(ctxt->info.offline->input_buffers, mfp_block *, chan)->data;
+    }
     else {
         int port = g_array_index(ctxt->info.lv2->input_ports, int, chan);
         mfp_sample * ptr = mfp_lv2_get_port_data(ctxt->info.lv2, port);
@@ -90,6 +93,9 @@ mfp_get_output_buffer(mfp_context * ctxt, int chan) {
             ctxt->blocksize
         );
     }
+    else if (ctxt->ctype == CTYPE_OFFLINE) {
+        return g_array_index(ctxt->info.offline->output_buffers, mfp_block *, chan)->data;
+    }
     else {
         mfp_block * blk = g_array_index(ctxt->info.lv2->output_buffers, mfp_block *, chan);
         if (blk != NULL) {
@@ -110,6 +116,9 @@ mfp_num_output_buffers(mfp_context * ctxt) {
             ports = ctxt->info.jack->output_ports;
         }
     }
+    else if (ctxt->ctype == CTYPE_OFFLINE) {
+        ports = ctxt->info.offline->output_buffers;
+    }
     else {
         ports = ctxt->info.lv2->output_ports;
     }
@@ -131,6 +140,9 @@ mfp_num_input_buffers(mfp_context * ctxt) {
             ports = ctxt->info.jack->input_ports;
         }
     }
+    else if (ctxt->ctype == CTYPE_OFFLINE) {
+        ports = ctxt->info.offline->input_buffers;
+    }
     else {
         ports = ctxt->info.lv2->input_ports;
     }
@@ -144,139 +156,10 @@ mfp_num_input_buffers(mfp_context * ctxt) {
 }
 
 
-static int
-depth_cmp_func(const void * a, const void *b)
-{
-    if ((*(mfp_processor **) a)->depth < (*(mfp_processor **)b)->depth)
-        return -1;
-    else if ((*(mfp_processor **) a)->depth == (*(mfp_processor **)b)->depth)
-        return 0;
-    else
-        return 1;
-}
-
-
-static int
-ready_to_schedule(mfp_processor * p)
-{
-    int icount;
-    int ready = 1;
-    GArray * infan;
-    mfp_connection ** ip;
-    int maxdepth = -1;
-
-    if (p == NULL) {
-        return -1;
-    }
-    if (p->typeinfo == NULL) {
-        return -1;
-    }
-
-    if (p->typeinfo->is_generator == GENERATOR_ALWAYS) {
-        return 0;
-    }
-
-    /* conditional generator is a generator if nothing connected to dsp inlets */
-    if (p->typeinfo->is_generator == GENERATOR_CONDITIONAL) {
-        ready = 0;
-        for (icount = 0; icount < p->inlet_conn->len; icount++) {
-            infan = g_array_index(p->inlet_conn, GArray *, icount);
-            if(infan && infan->len) {
-                ready = 1;
-                break;
-            }
-        }
-        if (ready == 0)
-            return 0;
-    }
-
-    for (icount = 0; icount < p->inlet_conn->len; icount++) {
-        infan = g_array_index(p->inlet_conn, GArray *, icount);
-        for(ip = (mfp_connection **)(infan->data); *ip != NULL; ip++) {
-            if ((*ip)->dest_proc->depth < 0) {
-                ready = 0;
-                break;
-            }
-            else if ((*ip)->dest_proc->depth > maxdepth) {
-                maxdepth = (*ip)->dest_proc->depth;
-            }
-        }
-        if (ready == 0) {
-            break;
-        }
-    }
-
-    if (ready > 0) {
-        return maxdepth + 1;
-    }
-    else {
-        return -1;
-    }
-}
-
-int
-mfp_dsp_schedule(mfp_context * ctxt)
-{
-    int pass = 0;
-    int lastpass_unsched = -1;
-    int thispass_unsched = 0;
-    int another_pass = 1;
-    int proc_count = 0;
-    int depth = -1;
-    mfp_processor ** p;
-
-    /* unschedule everything */
-    for (p = (mfp_processor **)(mfp_proc_list->data); *p != NULL; p++) {
-        if ((*p)->context == ctxt) {
-            (*p)->depth = -1;
-            proc_count ++;
-        }
-    }
-
-    /* calculate scheduling order */
-    while (another_pass == 1) {
-        for (p = (mfp_processor **)(mfp_proc_list->data); *p != NULL; p++) {
-            if ((*p)->context == ctxt) {
-                if ((*p)->depth < 0) {
-                    depth = ready_to_schedule(*p);
-                    if (depth >= 0) {
-                        (*p)->depth = depth;
-                    }
-                    else {
-                        thispass_unsched++;
-                    }
-                }
-            }
-        }
-        if ((thispass_unsched > 0) &&
-            (lastpass_unsched < 0 || (thispass_unsched < lastpass_unsched))) {
-            another_pass = 1;
-        }
-        else {
-            another_pass = 0;
-        }
-        lastpass_unsched = thispass_unsched;
-        thispass_unsched = 0;
-        pass ++;
-    }
-
-    /* conclusion: either success, or a DSP loop */
-    if (lastpass_unsched > 0) {
-        /* DSP loop: some processors not scheduled */
-        return 0;
-    }
-    else {
-        /* sort processors in place by depth */
-        g_array_sort(mfp_proc_list, depth_cmp_func);
-        return 1;
-    }
-}
-
-
 /*
  * mfp_dsp_run is the bridge between JACK/LV2 processing and the MFP DSP
  * network.  It is called once per JACK/LV2 block from the process()
- * callback.
+ * callback, or in a loop by mfp_offline_render.
  */
 
 void
@@ -287,9 +170,21 @@ mfp_dsp_run(mfp_context * ctxt)
     int chan;
     int chancount = mfp_num_output_buffers(ctxt);
 
-    /* handle any DSP config requests */
-    /* FIXME only handle requests for this context */
-    mfp_dsp_handle_requests();
+    /* the clock other threads see is the start of this block */
+    if (ctxt->clock != NULL) {
+        atomic_fetch_add(&ctxt->clock->seq, 1);
+        ctxt->clock->samplerate = ctxt->samplerate;
+        ctxt->clock->blocksize = ctxt->blocksize;
+        atomic_store(&ctxt->clock->frame, ctxt->frame_count);
+        atomic_store(&ctxt->clock->usec, g_get_monotonic_time());
+        atomic_fetch_add(&ctxt->clock->seq, 1);
+    }
+
+    /* pick up a new run order if the scheduler thread has one */
+    mfp_sched_swap(ctxt);
+
+    /* handle any DSP config requests for this context */
+    mfp_dsp_handle_requests(ctxt);
 
     /* zero output buffers ... out~ will accumulate into them */
     for(chan=0; chan < chancount; chan++) {
@@ -299,20 +194,47 @@ mfp_dsp_run(mfp_context * ctxt)
         }
     }
 
+    /* graph changed, build a new run order off the DSP thread */
     if (ctxt->needs_reschedule == 1) {
-        if (!mfp_dsp_schedule(ctxt)) {
-            mfp_log_error("Some processors could not be scheduled, check for cycles!");
-        }
-        ctxt->needs_reschedule = 0;
+        mfp_sched_request(ctxt);
     }
 
-    /* the proclist is already scheduled, so iterating in order is OK */
-    for(p = (mfp_processor **)(mfp_proc_list->data); *p != NULL; p++) {
-        if ((*p)->context == ctxt) {
+    if (mfp_dsp_threads > 0) {
+        mfp_pool_run(ctxt);
+    }
+    else if (ctxt->schedule != NULL) {
+        for(p = ctxt->schedule->procs; *p != NULL; p++) {
             mfp_proc_process(*p);
         }
     }
+
+    /* patches whose autosleep output went quiet stop here */
+    mfp_proc_sleep_idle(ctxt);
     ctxt->proc_count ++;
+    ctxt->frame_count += ctxt->blocksize;
+}
+
+/* the context clock as [frame, monotonic usec, samplerate, shm id]:
+ * the frame at the start of the latest block, when it started, and
+ * the shared memory segment to read it from without asking */
+void
+mfp_dsp_clock(mfp_context * ctxt, mfp_rpc_args * arglist)
+{
+    gint64 frame = 0, usec = 0;
+    unsigned int seq;
+
+    if (ctxt->clock != NULL) {
+        do {
+            seq = atomic_load(&ctxt->clock->seq);
+            frame = atomic_load(&ctxt->clock->frame);
+            usec = atomic_load(&ctxt->clock->usec);
+        } while ((seq & 1) || (seq != atomic_load(&ctxt->clock->seq)));
+    }
+
+    mfp_rpc_args_append_double(arglist, (double)frame);
+    mfp_rpc_args_append_double(arglist, (double)usec);
+    mfp_rpc_args_append_int(arglist, ctxt->samplerate);
+    mfp_rpc_args_append_string(arglist, ctxt->clock_shm_id);
 }
 
 void
@@ -327,14 +249,17 @@ mfp_dsp_set_blocksize(mfp_context * ctxt, int nsamples)
         nsamples = mfp_max_blocksize;
     }
 
-    if (nsamples != ctxt->blocksize) {
-        for(p = (mfp_processor **)(mfp_proc_list->data); *p != NULL; p++) {
-            /* i/o buffers are pre-allocated to mfp_max_blocksize */
+    if ((nsamples != ctxt->blocksize) && (ctxt->procs != NULL)) {
+        for(p = (mfp_processor **)(ctxt->procs->data); *p != NULL; p++) {
+            /* i/o buffers are pre-allocated to mfp_max_blocksize.
+             * Shared ones not in use are resized when they're handed out */
             for (count = 0; count < (*p)->inlet_conn->len; count ++) {
-                mfp_block_resize((*p)->inlet_buf[count], nsamples);
+                mfp_block_resize((*p)->inlet_buf_own[count], nsamples);
+                mfp_block_resize((*p)->inlet_buf_alloc[count], nsamples);
             }
 
             for (count = 0; count < (*p)->outlet_conn->len; count ++) {
+                mfp_block_resize((*p)->outlet_buf_own[count], nsamples);
                 mfp_block_resize((*p)->outlet_buf[count], nsamples);
             }
 
@@ -352,6 +277,18 @@ mfp_dsp_set_blocksize(mfp_context * ctxt, int nsamples)
                                  nsamples);
             }
         }
+        else if (ctxt->ctype == CTYPE_OFFLINE) {
+            for (count = 0; count < ctxt->info.offline->input_buffers->len; count ++) {
+                mfp_block_resize(g_array_index(ctxt->info.offline->input_buffers,
+                                               mfp_block *, count),
+                                 nsamples);
+            }
+            for (count = 0; count < ctxt->info.offline->output_buffers->len; count ++) {
+                mfp_block_resize(g_array_index(ctxt->info.offline->output_buffers,
+                                               mfp_block *, count),
+                                 nsamples);
+            }
+        }
     }
 }
 
@@ -6,6 +6,8 @@
 #include <glib.h>
 #include <jack/jack.h>
 #include <pthread.h>
+#include <semaphore.h>
+#include <stdatomic.h>
 #include <json-glib/json-glib.h>
 #ifndef M_PI
 #    define M_PI 3.14159265358979323846
@@ -18,6 +20,7 @@ typedef jack_default_audio_sample_t mfp_sample;
 
 struct mfp_procinfo_struct;
 struct mfp_context_struct;
+struct mfp_in_data_struct;
 
 typedef struct {
     /* type, settable parameters, and internal state */
@@ -31,21 +34,44 @@ typedef struct {
     int needs_config;
     int needs_reset;
 
+    /* an inactive processor is skipped and its outlets are silent */
+    int active;
+
+    /* sleeping is the same, but set by the DSP engine itself when an
+     * autosleep processor's output has been silent for sleep_blocks
+     * blocks (see mfp_proc_autosleep) */
+    int sleeping;
+    int sleep_blocks;
+    int silent_blocks;
+
     /* inlet and outlet connections (g_array of g_array) */
     GArray * inlet_conn;
     GArray * outlet_conn;
 
-    /* input/output buffers */
+    /* input/output buffers.  inlet_buf_alloc (the fan-in accumulators)
+     * and outlet_buf point at the processor's own blocks or at blocks
+     * from the context's shared pool (see mfp_sched.c).  The *_next
+     * arrays are the scheduler thread's assignment for the next run
+     * order */
     mfp_block ** inlet_buf;
     mfp_block ** inlet_buf_alloc;
     mfp_block ** outlet_buf;
+    mfp_block ** inlet_buf_own;
+    mfp_block ** outlet_buf_own;
+    mfp_block ** inlet_buf_next;
+    mfp_block ** outlet_buf_next;
 
     /* scheduling information */
     int depth;
 
+    /* setparams waiting for a later frame, earliest first (see
+     * mfp_request.c) */
+    struct mfp_in_data_struct * timed_params;
+    int timed_count;
+
 } mfp_processor;
 
-typedef struct {
+typedef struct mfp_in_data_struct {
     int reqtype;
     int src_proc;
     int src_port;
@@ -54,11 +80,19 @@ typedef struct {
     gpointer param_name;
     int param_type;
     gpointer param_value;
+    /* REQTYPE_SETPARAM: the context frame to apply it at, 0 (or any
+     * frame already past) for the start of the next block */
+    gint64 frame;
 } mfp_in_data;
 
 typedef struct mfp_procinfo_struct {
     char * name;
     int  is_generator;
+    int  serial_only;   /* writes context buffers, never run in parallel */
+    int  transient_buffers; /* process() writes all of every outlet and keeps no
+                               buffer pointers, so buffers can be shared */
+    int  sample_accurate;   /* process() works on any part of a block, so timed
+                               setparams can take effect mid-block */
     GHashTable * params;
     void (* init)(mfp_processor *);
     void (* destroy)(mfp_processor *);
@@ -79,6 +113,64 @@ typedef struct {
     int msglen;
 } mfp_out_data;
 
+typedef struct {
+    unsigned int capacity;
+    unsigned int mask;
+    int eltsize;
+    char * data;
+    atomic_uint read;
+    atomic_uint write;
+    atomic_uint overflows;
+    atomic_uint high_water;
+} mfp_ring;
+
+/* frames arriving on the RPC socket, parsed out of large reads
+ * (see mfp_comm.c) */
+typedef struct {
+    char * buf;
+    int start;
+    int end;
+    int insync;
+    int frames;
+    int resyncs;
+    int (* dispatch)(const char * msgbuf, int msglen);
+} mfp_comm_reader;
+
+/* DSP responses to the Python side, in a POSIX shared memory ring
+ * (see mfp_response.c).  The layout is read by dsp_response.py */
+#define MFP_RESPONSE_RING_SIZE 4096
+#define MFP_RESPONSE_STR_MAX MFP_MAX_MSGSIZE
+
+/* records float responses can't use, kept for events */
+#define MFP_RESPONSE_EVENT_RESERVE 1024
+
+#define RESPONSE_INT 0
+#define RESPONSE_FLOAT 1
+#define RESPONSE_STR 2
+
+typedef struct {
+    int proc_id;
+    int resp_type;
+    int value_type;
+    int length;
+    double value;
+} mfp_response_record;
+
+typedef struct {
+    /* written by the DSP side */
+    atomic_uint head;
+    unsigned int capacity;
+    unsigned int record_size;
+    atomic_uint overflows;
+    char pad_0[48];
+
+    /* written by the reader.  Nothing goes in the ring until it has
+     * set reader_pid */
+    atomic_uint tail;
+    atomic_int reader_pid;
+    char pad_1[56];
+} mfp_response_header;
+
 typedef struct {
     char * filename;
     void * dlinfo;
@@ -116,8 +208,73 @@ typedef struct {
     GArray * output_ports;
 } mfp_jack_info;
 
+/* a context with no audio host, run as fast as the CPU allows by
+ * mfp_offline_wait() to render to a file, see mfp_offline.c */
+typedef struct {
+    GArray * input_buffers;
+    GArray * output_buffers;
+
+    /* a render handed over by the RPC thread */
+    pthread_mutex_t lock;
+    pthread_cond_t cond;
+    int pending;
+    char * infile;
+    char * outfile;
+    gint64 frames;
+
+    /* result of the last render */
+    int result;
+    gint64 frames_done;
+    double elapsed;
+} mfp_offline_info;
+
 #define CTYPE_JACK 0
 #define CTYPE_LV2 1
+#define CTYPE_OFFLINE 2
+
+/* a context's run order, see mfp_sched.c.  procs is NULL-terminated;
+ * depths[n] is procs[n]'s depth when the order was built, since the
+ * scheduler thread changes the processors' own while it runs */
+typedef struct {
+    int len;
+    int * depths;
+    mfp_processor * procs[];
+} mfp_run_order;
+
+/* timing for one depth level of a context's run order, see mfp_pool.c */
+#define MFP_MAX_LEVEL_STATS 256
+
+typedef struct {
+    int depth;
+    int procs;
+    int parallel;
+    int blocks;
+    gint64 total_nsec;
+    gint64 max_nsec;
+} mfp_level_stats;
+
+/* signal buffers used by one block of a context's run order: unshared
+ * is how many there would be with one per outlet and accumulator,
+ * shared is pool blocks plus processors' own blocks still in use */
+typedef struct {
+    int unshared;
+    int pool;
+    int own;
+} mfp_buffer_stats;
+
+/* a context's clock, published at the start of every block in a POSIX
+ * shared memory segment so other processes (DSPContext on the Python
+ * side) can read it without a round trip.  frame and usec
+ * (g_get_monotonic_time) are the same instant; seq is odd while
+ * they're being written.  The layout is read by dsp_clock.py */
+typedef struct {
+    atomic_uint seq;
+    int samplerate;
+    _Atomic(gint64) frame;
+    _Atomic(gint64) usec;
+    int blocksize;
+    int reserved;
+} mfp_clock_page;
 
 typedef struct mfp_context_struct {
     int ctype;
@@ -130,9 +287,43 @@ typedef struct mfp_context_struct {
     int needs_reschedule;
     int default_obj_id;
 
+    /* frame_count is the context frame at the start of the current
+     * block, published to other threads and processes in the clock
+     * page.  clock_shm_id is empty if the page isn't shared */
+    gint64 frame_count;
+    mfp_clock_page * clock;
+    char clock_shm_id[64];
+
+    /* scheduling, see mfp_sched.c */
+    GArray * procs;
+    GArray * sched_dirty;
+    int sched_pending;
+    mfp_run_order * schedule;
+    mfp_run_order * old_schedule;
+    _Atomic(mfp_run_order *) next_schedule;
+
+    /* shared signal buffers, see mfp_sched.c */
+    GArray * buf_pool;
+    mfp_buffer_stats buf_stats;
+    mfp_buffer_stats buf_stats_next;
+
+    /* requests for this context's processors, see mfp_request.c */
+    mfp_ring * requests;
+    GArray * request_cleanup;
+    mfp_ring * request_retired;
+
+    /* per-level timing when mfp_dsp_threads is set */
+    mfp_level_stats * level_stats;
+    int num_level_stats;
+
+    /* set by autosleep processors that want their patch put to sleep
+     * at the end of the block */
+    atomic_int sleep_requests;
+
     union {
         mfp_jack_info * jack;
         mfp_lv2_info * lv2;
+        mfp_offline_info * offline;
     } info;
 } mfp_context;
 
@@ -164,6 +355,16 @@ typedef struct mfp_rpc_argblock_struct {
 #define REQTYPE_EXTLOAD 6
 #define REQTYPE_GETPARAM 7
 #define REQTYPE_RESET 8
+/* REQTYPE_BATCH: param_value is a GArray of mfp_in_data, all applied
+ * in the same DSP cycle */
+#define REQTYPE_BATCH 9
+/* REQTYPE_ACTIVATE: src_port is the new active state */
+#define REQTYPE_ACTIVATE 10
+/* REQTYPE_AUTOSLEEP: src_port is the number of silent blocks, 0 for off */
+#define REQTYPE_AUTOSLEEP 11
+
+/* peak level below which a block counts as silent (about -100 dB) */
+#define MFP_SILENCE_THRESHOLD 1.0e-5
 
 #define ALLOC_IDLE 0
 #define ALLOC_WORKING 1
@@ -178,7 +379,7 @@ typedef struct mfp_rpc_argblock_struct {
 #define EXTINFO_READY 2
 
 #define REQ_BUFSIZE 2048
-#define REQ_LASTIND (REQ_BUFSIZE-1)
+#define MFP_TIMED_PARAMS 16
 
 #define MFP_DEFAULT_SOCKET "/tmp/mfp_rpcsock"
 #define MFP_EXEC_NAME "mfp"
@@ -186,6 +387,14 @@ typedef struct mfp_rpc_argblock_struct {
 #define MFP_MAX_MSGSIZE 8192
 #define MFP_NUM_BUFFERS 8192
 
+/* an RPC frame is MFP_COMM_SYNC and the payload length as "% 8d", or
+ * MFP_COMM_SYNC_BINARY and the length as a 4-byte big-endian int,
+ * then the payload */
+#define MFP_COMM_SYNC "[ SYNC ]"
+#define MFP_COMM_SYNC_BINARY "[ SYNB ]"
+#define MFP_COMM_SYNC_LEN 8
+#define MFP_COMM_READ_SIZE (8 * MFP_MAX_MSGSIZE)
+
 #define MAX_PEER_ID_LEN 128
 
 /* Logging helpers */
@@ -207,15 +416,12 @@ extern GHashTable * mfp_proc_objects;
 extern GHashTable * mfp_contexts;
 extern GHashTable * mfp_extensions;
 
-extern GArray * mfp_proc_list;
-extern GArray * incoming_cleanup;
-
 extern pthread_mutex_t incoming_lock;
-extern pthread_mutex_t outgoing_lock;
-extern pthread_cond_t outgoing_cond;
-extern int outgoing_queue_read;
-extern int outgoing_queue_write;
-extern mfp_out_data outgoing_queue[REQ_BUFSIZE];
+extern mfp_ring * outgoing_queue;
+extern sem_t outgoing_sem;
+extern sem_t request_space_sem;
+extern int mfp_request_queue_size;
+extern int mfp_dsp_threads;
 
 extern char rpc_node_id[MAX_PEER_ID_LEN];
 
@@ -231,12 +437,23 @@ extern mfp_sample * mfp_get_output_buffer(mfp_context *, int);
 extern int mfp_num_output_buffers(mfp_context * ctxt);
 extern int mfp_num_input_buffers(mfp_context * ctxt);
 
+/* mfp_offline.c */
+extern mfp_context * mfp_offline_startup(int num_inputs, int num_outputs,
+                                         int samplerate, int blocksize);
+extern void mfp_offline_free(mfp_context * ctxt);
+extern int mfp_offline_render(mfp_context * ctxt, const char * infile,
+                              const char * outfile, gint64 frames);
+extern void mfp_offline_wait(mfp_context * ctxt);
+extern int mfp_offline_request(mfp_context * ctxt, const char * infile,
+                               const char * outfile, gint64 frames,
+                               mfp_rpc_args * arglist);
+
 
 /* mfp_dsp.c */
 extern void mfp_dsp_init(void);
-extern int mfp_dsp_schedule(mfp_context * ctxt);
 extern void mfp_dsp_run(mfp_context * ctxt);
 extern void mfp_dsp_set_blocksize(mfp_context * ctxt, int nsamples);
+extern void mfp_dsp_clock(mfp_context * ctxt, mfp_rpc_args * arglist);
 extern void mfp_dsp_accum(mfp_sample *, mfp_sample *, int count);
 extern void mfp_dsp_push_request(mfp_in_data rd);
 extern void mfp_dsp_send_response_str(mfp_processor * proc, int msg_type, char * response);
@@ -247,6 +464,25 @@ extern void mfp_dsp_send_response_float(mfp_processor * proc, int msg_type, doub
 extern int mfp_num_input_buffers(mfp_context * ctxt);
 extern int mfp_num_output_buffers(mfp_context * ctxt);
 
+/* mfp_sched.c */
+extern void mfp_sched_init(void);
+extern void mfp_sched_finish(void);
+extern void mfp_sched_free_context(mfp_context * ctxt);
+extern int mfp_sched_busy(mfp_context * ctxt);
+extern void mfp_sched_add_proc(mfp_processor * p);
+extern void mfp_sched_remove_proc(mfp_processor * p);
+extern void mfp_sched_mark(mfp_processor * p);
+extern void mfp_sched_request(mfp_context * ctxt);
+extern void mfp_sched_swap(mfp_context * ctxt);
+extern int mfp_dsp_schedule(mfp_context * ctxt);
+extern void mfp_sched_buffer_stats(mfp_context * ctxt, mfp_rpc_args * arglist);
+
+/* mfp_pool.c */
+extern void mfp_pool_init(int num_threads, int rt_priority);
+extern void mfp_pool_finish(void);
+extern void mfp_pool_run(mfp_context * ctxt);
+extern void mfp_pool_level_stats(mfp_context * ctxt, int first_level, mfp_rpc_args * arglist);
+
 /* mfp_proc.c */
 extern mfp_processor * mfp_proc_lookup(int proc_id);
 extern int mfp_proc_param_type(mfp_processor * p, char * pname);
@@ -255,10 +491,17 @@ extern mfp_processor * mfp_proc_create(mfp_procinfo *, int, int, mfp_context *);
 extern mfp_processor * mfp_proc_alloc(mfp_procinfo *, int, int, mfp_context *);
 extern int mfp_proc_alloc_buffers(mfp_processor *, int, int, int);
 extern void mfp_proc_free_buffers(mfp_processor *);
+extern void mfp_proc_add(mfp_processor * p);
 extern mfp_processor * mfp_proc_init(mfp_processor *, int rpc_id, int patch_id);
+extern void mfp_proc_init_request(mfp_processor *, int rpc_id, int patch_id,
+                                  mfp_in_data * rd);
 extern int mfp_proc_error(mfp_processor * self, const char * message);
 extern void mfp_proc_process(mfp_processor *);
 extern void mfp_proc_reset(mfp_processor *);
+extern void mfp_proc_activate(mfp_processor *, int active);
+extern void mfp_proc_autosleep(mfp_processor *, int blocks);
+extern void mfp_proc_wake(mfp_processor *);
+extern void mfp_proc_sleep_idle(mfp_context *);
 extern void mfp_proc_destroy(mfp_processor *);
 extern int mfp_proc_connect(mfp_processor *, int, mfp_processor *, int);
 extern int mfp_proc_disconnect(mfp_processor *, int, mfp_processor *, int);
@@ -271,6 +514,8 @@ extern int mfp_proc_setparam_req(mfp_processor * self, mfp_in_data * rd) ;
 extern void mfp_alloc_init(void);
 extern void mfp_alloc_finish(void);
 extern int mfp_alloc_allocate(mfp_processor *, void * data, int * status);
+extern int mfp_alloc_call(mfp_processor *, void (* handler)(mfp_processor *, void *),
+                          void * data, int * status);
 
 /* mfp_ext.c */
 extern mfp_extinfo * mfp_ext_load(char *);
@@ -291,13 +536,44 @@ extern char * mfp_comm_get_buffer(void);
 extern int mfp_comm_submit_buffer(char * msgbuf, int msglen);
 extern void mfp_comm_release_buffer(char * msgbuf);
 extern int mfp_comm_send_buffer(char * msg, int msglen);
+extern void mfp_comm_reader_init(mfp_comm_reader * reader,
+                                 int (* dispatch)(const char *, int));
+extern void mfp_comm_reader_free(mfp_comm_reader * reader);
+extern int mfp_comm_reader_recv(mfp_comm_reader * reader, int fd);
+extern int mfp_comm_reader_parse(mfp_comm_reader * reader);
+
+/* mfp_response.c */
+extern int mfp_response_init(void);
+extern void mfp_response_finish(void);
+extern int mfp_response_push(int proc_id, int resp_type, int value_type,
+                             double value, const char * str);
+extern mfp_response_header * mfp_response_ring;
 
 /* mfp_request.c */
 extern void mfp_rpc_init(void);
 
 /* incoming data processing */
 extern void mfp_dsp_push_request(mfp_in_data rd);
-extern void mfp_dsp_handle_requests(void);
+extern void mfp_dsp_route_proc(mfp_processor * proc);
+extern void mfp_dsp_handle_requests(mfp_context * ctxt);
+extern void mfp_dsp_free_requests(mfp_context * ctxt);
+extern int mfp_dsp_apply_timed(mfp_processor * proc, gint64 until);
+extern void mfp_dsp_free_timed(mfp_processor * proc);
+extern void mfp_dsp_retire_param(mfp_processor * proc, char * param_name, int param_type,
+                                 void * param_value);
+extern void mfp_dsp_request_stats(mfp_rpc_args * arglist);
+
+/* mfp_ring.c */
+extern mfp_ring * mfp_ring_new(int capacity, int eltsize);
+extern void mfp_ring_free(mfp_ring * ring);
+extern int mfp_ring_push(mfp_ring * ring, const void * elt);
+extern int mfp_ring_try_push(mfp_ring * ring, const void * elt);
+extern int mfp_ring_pop(mfp_ring * ring, void * elt);
+extern int mfp_ring_peek(mfp_ring * ring, void * elt);
+extern void mfp_ring_advance(mfp_ring * ring);
+extern int mfp_ring_count(mfp_ring * ring);
+extern int mfp_ring_full(mfp_ring * ring);
+extern void mfp_ring_stats(mfp_ring * ring, mfp_rpc_args * arglist);
 
 /* outgoing data processing */
 extern int mfp_rpc_request(
@@ -331,6 +607,7 @@ extern void mfp_rpc_args_append_double(mfp_rpc_args *, double);
 extern mfp_context * mfp_context_new(int ctype);
 extern int mfp_context_init(mfp_context * context);
 extern void mfp_context_destroy(mfp_context * context);
+extern void mfp_context_unlink_clocks(void);
 extern int mfp_context_default_io(mfp_context * context, int obj_id);
 
 /* mfp_api.c */
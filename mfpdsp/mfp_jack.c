@@ -160,6 +160,10 @@ mfp_jack_startup(char * client_name, int num_inputs, int num_outputs)
         ctxt->activated = 1;
     }
 
+    /* DSP workers run at the same priority as the JACK process thread */
+    mfp_pool_init(mfp_dsp_threads,
+                  jack_client_real_time_priority(ctxt->info.jack->client));
+
     return ctxt;
 
 }
@@ -0,0 +1,752 @@
+#include <math.h>
+#include <stdlib.h>
+#include <string.h>
+#include <glib.h>
+#ifdef MFP_USE_SSE
+#include <immintrin.h>
+#endif
+
+#include "mfp_dsp.h"
+#include "mfp_block.h"
+
+/*
+ * Block kernels, one table per instruction set.
+ *
+ * The scalar table is always there.  With MFP_USE_SSE (x86 builds) the
+ * SSE and AVX2/FMA tables are compiled too, each function with its own
+ * target attribute, so the library as a whole still runs on any x86
+ * and mfp_kernel_init() picks a table from what the CPU reports at
+ * run time.  MFP_KERNELS=scalar|sse|avx2 in the environment picks a
+ * lower level than the best one, for debugging or benchmarks.
+ *
+ * Kernels that are recurrences (phase, biquad) stay scalar in every
+ * table; the AVX2 biquad is the same loop compiled for FMA.
+ */
+
+mfp_kernel_table * mfp_kernels = &mfp_kernels_scalar;
+
+static inline guint32
+noise_step(guint32 * state)
+{
+    guint32 x = *state;
+    x ^= x << 13;
+    x ^= x >> 17;
+    x ^= x << 5;
+    *state = x;
+    return x;
+}
+
+#define NOISE_SCALE (1.0f / 2147483648.0f)
+
+static inline mfp_sample
+lookup_one(mfp_sample in, const double * table, int tabsize, double scale)
+{
+    double pos = in * scale;
+    int index;
+
+    if (pos < 0.0) {
+        pos = 0.0;
+    }
+    else if (pos > tabsize) {
+        pos = tabsize;
+    }
+    index = MIN((int)pos, tabsize - 1);
+    return (mfp_sample)(table[index] + (table[index+1] - table[index])*(pos - index));
+}
+
+/* inlined into the scalar and FMA biquads */
+static inline __attribute__((always_inline)) void
+biquad_loop(mfp_biquad * f, const mfp_sample * in, mfp_sample * out, int count)
+{
+    double w_n, d1 = f->delay_1, d2 = f->delay_2;
+    int n;
+
+    for (n = 0; n < count; n++) {
+        w_n = in[n] - (f->a1 * d1) - (f->a2 * d2);
+        out[n] = (f->b0 * w_n) + (f->b1 * d1) + (f->b2 * d2);
+        d2 = d1;
+        d1 = w_n;
+    }
+    f->delay_1 = d1;
+    f->delay_2 = d2;
+}
+
+/*
+ * scalar
+ */
+
+static void
+scalar_add(const mfp_sample * in_1, const mfp_sample * in_2, mfp_sample * out, int count)
+{
+    int n;
+    for (n = 0; n < count; n++) {
+        out[n] = in_1[n] + in_2[n];
+    }
+}
+
+static void
+scalar_mul(const mfp_sample * in_1, const mfp_sample * in_2, mfp_sample * out, int count)
+{
+    int n;
+    for (n = 0; n < count; n++) {
+        out[n] = in_1[n] * in_2[n];
+    }
+}
+
+static void
+scalar_cmp(const mfp_sample * in_1, const mfp_sample * in_2,
+           mfp_sample trueval, mfp_sample falseval, mfp_sample * out, int count)
+{
+    int n;
+    for (n = 0; n < count; n++) {
+        out[n] = (in_1[n] > in_2[n]) ? trueval : falseval;
+    }
+}
+
+static void
+scalar_mac(const mfp_sample * in_1, const mfp_sample * in_2, const mfp_sample * in_3,
+           mfp_sample * out, int count)
+{
+    int n;
+    if (in_3 != NULL) {
+        for (n = 0; n < count; n++) {
+            out[n] = out[n] + in_1[n] * in_2[n] * in_3[n];
+        }
+    }
+    else {
+        for (n = 0; n < count; n++) {
+            out[n] = out[n] + in_1[n] * in_2[n];
+        }
+    }
+}
+
+static void
+scalar_const_add(const mfp_sample * in, mfp_sample constant, mfp_sample * out, int count)
+{
+    int n;
+    for (n = 0; n < count; n++) {
+        out[n] = in[n] + constant;
+    }
+}
+
+static void
+scalar_const_mul(const mfp_sample * in, mfp_sample constant, mfp_sample * out, int count)
+{
+    int n;
+    for (n = 0; n < count; n++) {
+        out[n] = in[n] * constant;
+    }
+}
+
+static void
+scalar_fill(mfp_sample * out, mfp_sample constant, int count)
+{
+    int n;
+    for (n = 0; n < count; n++) {
+        out[n] = constant;
+    }
+}
+
+static void
+scalar_fmod(const mfp_sample * in, mfp_sample modulus, mfp_sample * out, int count)
+{
+    int n;
+    for (n = 0; n < count; n++) {
+        out[n] = fmodf(in[n], modulus);
+    }
+}
+
+static void
+scalar_trunc(const mfp_sample * in, mfp_sample * out, int count)
+{
+    int n;
+    for (n = 0; n < count; n++) {
+        out[n] = truncf(in[n]);
+    }
+}
+
+static void
+scalar_index_fetch(const mfp_sample * indexes, const mfp_sample * base,
+                   mfp_sample * out, int count)
+{
+    int n;
+    for (n = 0; n < count; n++) {
+        out[n] = base[(int)(indexes[n])];
+    }
+}
+
+static double
+scalar_ramp(mfp_sample * out, double initval, double incr, int count)
+{
+    double scratch = initval;
+    int n;
+    for (n = 0; n < count; n++) {
+        out[n] = (mfp_sample)scratch;
+        scratch += incr;
+    }
+    return scratch;
+}
+
+static double
+scalar_phase(mfp_sample * out, double initval, double incr, double phase_limit, int count)
+{
+    double scratch = initval;
+    int n;
+    for (n = 0; n < count; n++) {
+        out[n] = (mfp_sample)scratch;
+        scratch += incr;
+        if (scratch > phase_limit) {
+            scratch = fmod(scratch, phase_limit);
+        }
+    }
+    return scratch;
+}
+
+static double
+scalar_prefix_sum(const mfp_sample * in, mfp_sample scale, mfp_sample initval,
+                  mfp_sample * out, int count)
+{
+    mfp_sample accum = initval;
+    int n;
+    for (n = 0; n < count; n++) {
+        accum += in[n] * scale;
+        out[n] = accum;
+    }
+    return accum;
+}
+
+static void
+scalar_table_lookup(const mfp_sample * in, const double * table, int tabsize,
+                    double scale, mfp_sample * out, int count)
+{
+    int n;
+    for (n = 0; n < count; n++) {
+        out[n] = lookup_one(in[n], table, tabsize, scale);
+    }
+}
+
+static void
+scalar_noise(guint32 * state, mfp_sample * out, int count)
+{
+    int n;
+    for (n = 0; n < count; n++) {
+        out[n] = (gint32)noise_step(state + (n % MFP_NOISE_LANES)) * NOISE_SCALE;
+    }
+}
+
+static void
+scalar_biquad(mfp_biquad * filter, const mfp_sample * in, mfp_sample * out, int count)
+{
+    biquad_loop(filter, in, out, count);
+}
+
+mfp_kernel_table mfp_kernels_scalar = {
+    .name = "scalar",
+    .add = scalar_add,
+    .mul = scalar_mul,
+    .cmp = scalar_cmp,
+    .mac = scalar_mac,
+    .const_add = scalar_const_add,
+    .const_mul = scalar_const_mul,
+    .fill = scalar_fill,
+    .fmod = scalar_fmod,
+    .trunc = scalar_trunc,
+    .index_fetch = scalar_index_fetch,
+    .ramp = scalar_ramp,
+    .phase = scalar_phase,
+    .prefix_sum = scalar_prefix_sum,
+    .table_lookup = scalar_table_lookup,
+    .noise = scalar_noise,
+    .biquad = scalar_biquad
+};
+
+#ifdef MFP_USE_SSE
+
+/*
+ * SSE (SSE2 for the integer and double conversions)
+ */
+
+#define TARGET_SSE __attribute__((target("sse2")))
+
+TARGET_SSE static void
+sse_add(const mfp_sample * in_1, const mfp_sample * in_2, mfp_sample * out, int count)
+{
+    int n = 0;
+    for (; n + 4 <= count; n += 4) {
+        _mm_storeu_ps(out + n, _mm_add_ps(_mm_loadu_ps(in_1 + n), _mm_loadu_ps(in_2 + n)));
+    }
+    scalar_add(in_1 + n, in_2 + n, out + n, count - n);
+}
+
+TARGET_SSE static void
+sse_mul(const mfp_sample * in_1, const mfp_sample * in_2, mfp_sample * out, int count)
+{
+    int n = 0;
+    for (; n + 4 <= count; n += 4) {
+        _mm_storeu_ps(out + n, _mm_mul_ps(_mm_loadu_ps(in_1 + n), _mm_loadu_ps(in_2 + n)));
+    }
+    scalar_mul(in_1 + n, in_2 + n, out + n, count - n);
+}
+
+TARGET_SSE static void
+sse_cmp(const mfp_sample * in_1, const mfp_sample * in_2,
+        mfp_sample trueval, mfp_sample falseval, mfp_sample * out, int count)
+{
+    __m128 tv = _mm_set1_ps(trueval);
+    __m128 fv = _mm_set1_ps(falseval);
+    __m128 mask;
+    int n = 0;
+
+    for (; n + 4 <= count; n += 4) {
+        mask = _mm_cmpgt_ps(_mm_loadu_ps(in_1 + n), _mm_loadu_ps(in_2 + n));
+        _mm_storeu_ps(out + n, _mm_or_ps(_mm_and_ps(mask, tv), _mm_andnot_ps(mask, fv)));
+    }
+    scalar_cmp(in_1 + n, in_2 + n, trueval, falseval, out + n, count - n);
+}
+
+TARGET_SSE static void
+sse_mac(const mfp_sample * in_1, const mfp_sample * in_2, const mfp_sample * in_3,
+        mfp_sample * out, int count)
+{
+    __m128 prod;
+    int n = 0;
+
+    for (; n + 4 <= count; n += 4) {
+        prod = _mm_mul_ps(_mm_loadu_ps(in_1 + n), _mm_loadu_ps(in_2 + n));
+        if (in_3 != NULL) {
+            prod = _mm_mul_ps(prod, _mm_loadu_ps(in_3 + n));
+        }
+        _mm_storeu_ps(out + n, _mm_add_ps(_mm_loadu_ps(out + n), prod));
+    }
+    scalar_mac(in_1 + n, in_2 + n, in_3 ? in_3 + n : NULL, out + n, count - n);
+}
+
+TARGET_SSE static void
+sse_const_add(const mfp_sample * in, mfp_sample constant, mfp_sample * out, int count)
+{
+    __m128 cval = _mm_set1_ps(constant);
+    int n = 0;
+    for (; n + 4 <= count; n += 4) {
+        _mm_storeu_ps(out + n, _mm_add_ps(_mm_loadu_ps(in + n), cval));
+    }
+    scalar_const_add(in + n, constant, out + n, count - n);
+}
+
+TARGET_SSE static void
+sse_const_mul(const mfp_sample * in, mfp_sample constant, mfp_sample * out, int count)
+{
+    __m128 cval = _mm_set1_ps(constant);
+    int n = 0;
+    for (; n + 4 <= count; n += 4) {
+        _mm_storeu_ps(out + n, _mm_mul_ps(_mm_loadu_ps(in + n), cval));
+    }
+    scalar_const_mul(in + n, constant, out + n, count - n);
+}
+
+TARGET_SSE static void
+sse_fill(mfp_sample * out, mfp_sample constant, int count)
+{
+    __m128 cval = _mm_set1_ps(constant);
+    int n = 0;
+    for (; n + 4 <= count; n += 4) {
+        _mm_storeu_ps(out + n, cval);
+    }
+    scalar_fill(out + n, constant, count - n);
+}
+
+/* x - trunc(x/m)*m, two at a time in double */
+TARGET_SSE static void
+sse_fmod(const mfp_sample * in, mfp_sample modulus, mfp_sample * out, int count)
+{
+    __m128d mval = _mm_set1_pd(modulus);
+    __m128d x, q;
+    int n = 0;
+
+    for (; n + 2 <= count; n += 2) {
+        x = _mm_cvtps_pd(_mm_castsi128_ps(_mm_loadl_epi64((const __m128i *)(in + n))));
+        q = _mm_cvtepi32_pd(_mm_cvttpd_epi32(_mm_div_pd(x, mval)));
+        x = _mm_sub_pd(x, _mm_mul_pd(q, mval));
+        _mm_storel_epi64((__m128i *)(out + n), _mm_castps_si128(_mm_cvtpd_ps(x)));
+    }
+    scalar_fmod(in + n, modulus, out + n, count - n);
+}
+
+TARGET_SSE static void
+sse_trunc(const mfp_sample * in, mfp_sample * out, int count)
+{
+    int n = 0;
+    for (; n + 4 <= count; n += 4) {
+        _mm_storeu_ps(out + n, _mm_cvtepi32_ps(_mm_cvttps_epi32(_mm_loadu_ps(in + n))));
+    }
+    scalar_trunc(in + n, out + n, count - n);
+}
+
+TARGET_SSE static double
+sse_prefix_sum(const mfp_sample * in, mfp_sample scale, mfp_sample initval,
+               mfp_sample * out, int count)
+{
+    __m128 sval = _mm_set1_ps(scale);
+    __m128 carry = _mm_set1_ps(initval);
+    __m128 x;
+    int n = 0;
+
+    for (; n + 4 <= count; n += 4) {
+        /* A, B, C, D -> A, A+B, A+B+C, A+B+C+D, then add the carry */
+        x = _mm_mul_ps(_mm_loadu_ps(in + n), sval);
+        x = _mm_add_ps(x, _mm_castsi128_ps(_mm_slli_si128(_mm_castps_si128(x), 4)));
+        x = _mm_add_ps(x, _mm_castsi128_ps(_mm_slli_si128(_mm_castps_si128(x), 8)));
+        x = _mm_add_ps(x, carry);
+        _mm_storeu_ps(out + n, x);
+        carry = _mm_shuffle_ps(x, x, 0xff);
+    }
+    return scalar_prefix_sum(in + n, scale, _mm_cvtss_f32(carry), out + n, count - n);
+}
+
+TARGET_SSE static void
+sse_noise(guint32 * state, mfp_sample * out, int count)
+{
+    __m128i lo = _mm_loadu_si128((__m128i *)state);
+    __m128i hi = _mm_loadu_si128((__m128i *)(state + 4));
+    __m128 scale = _mm_set1_ps(NOISE_SCALE);
+    int n = 0;
+
+    for (; n + 8 <= count; n += 8) {
+        lo = _mm_xor_si128(lo, _mm_slli_epi32(lo, 13));
+        lo = _mm_xor_si128(lo, _mm_srli_epi32(lo, 17));
+        lo = _mm_xor_si128(lo, _mm_slli_epi32(lo, 5));
+        hi = _mm_xor_si128(hi, _mm_slli_epi32(hi, 13));
+        hi = _mm_xor_si128(hi, _mm_srli_epi32(hi, 17));
+        hi = _mm_xor_si128(hi, _mm_slli_epi32(hi, 5));
+        _mm_storeu_ps(out + n, _mm_mul_ps(_mm_cvtepi32_ps(lo), scale));
+        _mm_storeu_ps(out + n + 4, _mm_mul_ps(_mm_cvtepi32_ps(hi), scale));
+    }
+    _mm_storeu_si128((__m128i *)state, lo);
+    _mm_storeu_si128((__m128i *)(state + 4), hi);
+    scalar_noise(state, out + n, count - n);
+}
+
+static mfp_kernel_table mfp_kernels_sse = {
+    .name = "sse",
+    .add = sse_add,
+    .mul = sse_mul,
+    .cmp = sse_cmp,
+    .mac = sse_mac,
+    .const_add = sse_const_add,
+    .const_mul = sse_const_mul,
+    .fill = sse_fill,
+    .fmod = sse_fmod,
+    .trunc = sse_trunc,
+    .index_fetch = scalar_index_fetch,
+    .ramp = scalar_ramp,
+    .phase = scalar_phase,
+    .prefix_sum = sse_prefix_sum,
+    .table_lookup = scalar_table_lookup,
+    .noise = sse_noise,
+    .biquad = scalar_biquad
+};
+
+/*
+ * AVX2 + FMA
+ */
+
+#define TARGET_AVX2 __attribute__((target("avx2,fma")))
+
+TARGET_AVX2 static void
+avx2_add(const mfp_sample * in_1, const mfp_sample * in_2, mfp_sample * out, int count)
+{
+    int n = 0;
+    for (; n + 8 <= count; n += 8) {
+        _mm256_storeu_ps(out + n, _mm256_add_ps(_mm256_loadu_ps(in_1 + n),
+                                                _mm256_loadu_ps(in_2 + n)));
+    }
+    scalar_add(in_1 + n, in_2 + n, out + n, count - n);
+}
+
+TARGET_AVX2 static void
+avx2_mul(const mfp_sample * in_1, const mfp_sample * in_2, mfp_sample * out, int count)
+{
+    int n = 0;
+    for (; n + 8 <= count; n += 8) {
+        _mm256_storeu_ps(out + n, _mm256_mul_ps(_mm256_loadu_ps(in_1 + n),
+                                                _mm256_loadu_ps(in_2 + n)));
+    }
+    scalar_mul(in_1 + n, in_2 + n, out + n, count - n);
+}
+
+TARGET_AVX2 static void
+avx2_cmp(const mfp_sample * in_1, const mfp_sample * in_2,
+         mfp_sample trueval, mfp_sample falseval, mfp_sample * out, int count)
+{
+    __m256 tv = _mm256_set1_ps(trueval);
+    __m256 fv = _mm256_set1_ps(falseval);
+    __m256 mask;
+    int n = 0;
+
+    for (; n + 8 <= count; n += 8) {
+        mask = _mm256_cmp_ps(_mm256_loadu_ps(in_1 + n), _mm256_loadu_ps(in_2 + n), _CMP_GT_OQ);
+        _mm256_storeu_ps(out + n, _mm256_blendv_ps(fv, tv, mask));
+    }
+    scalar_cmp(in_1 + n, in_2 + n, trueval, falseval, out + n, count - n);
+}
+
+TARGET_AVX2 static void
+avx2_mac(const mfp_sample * in_1, const mfp_sample * in_2, const mfp_sample * in_3,
+         mfp_sample * out, int count)
+{
+    __m256 prod;
+    int n = 0;
+
+    if (in_3 != NULL) {
+        for (; n + 8 <= count; n += 8) {
+            prod = _mm256_mul_ps(_mm256_loadu_ps(in_1 + n), _mm256_loadu_ps(in_2 + n));
+            _mm256_storeu_ps(out + n, _mm256_fmadd_ps(prod, _mm256_loadu_ps(in_3 + n),
+                                                      _mm256_loadu_ps(out + n)));
+        }
+    }
+    else {
+        for (; n + 8 <= count; n += 8) {
+            _mm256_storeu_ps(out + n, _mm256_fmadd_ps(_mm256_loadu_ps(in_1 + n),
+                                                      _mm256_loadu_ps(in_2 + n),
+                                                      _mm256_loadu_ps(out + n)));
+        }
+    }
+    scalar_mac(in_1 + n, in_2 + n, in_3 ? in_3 + n : NULL, out + n, count - n);
+}
+
+TARGET_AVX2 static void
+avx2_const_add(const mfp_sample * in, mfp_sample constant, mfp_sample * out, int count)
+{
+    __m256 cval = _mm256_set1_ps(constant);
+    int n = 0;
+    for (; n + 8 <= count; n += 8) {
+        _mm256_storeu_ps(out + n, _mm256_add_ps(_mm256_loadu_ps(in + n), cval));
+    }
+    scalar_const_add(in + n, constant, out + n, count - n);
+}
+
+TARGET_AVX2 static void
+avx2_const_mul(const mfp_sample * in, mfp_sample constant, mfp_sample * out, int count)
+{
+    __m256 cval = _mm256_set1_ps(constant);
+    int n = 0;
+    for (; n + 8 <= count; n += 8) {
+        _mm256_storeu_ps(out + n, _mm256_mul_ps(_mm256_loadu_ps(in + n), cval));
+    }
+    scalar_const_mul(in + n, constant, out + n, count - n);
+}
+
+TARGET_AVX2 static void
+avx2_fill(mfp_sample * out, mfp_sample constant, int count)
+{
+    __m256 cval = _mm256_set1_ps(constant);
+    int n = 0;
+    for (; n + 8 <= count; n += 8) {
+        _mm256_storeu_ps(out + n, cval);
+    }
+    scalar_fill(out + n, constant, count - n);
+}
+
+TARGET_AVX2 static void
+avx2_fmod(const mfp_sample * in, mfp_sample modulus, mfp_sample * out, int count)
+{
+    __m256d mval = _mm256_set1_pd(modulus);
+    __m256d x, q;
+    int n = 0;
+
+    for (; n + 4 <= count; n += 4) {
+        x = _mm256_cvtps_pd(_mm_loadu_ps(in + n));
+        q = _mm256_round_pd(_mm256_div_pd(x, mval), _MM_FROUND_TO_ZERO | _MM_FROUND_NO_EXC);
+        _mm_storeu_ps(out + n, _mm256_cvtpd_ps(_mm256_fnmadd_pd(q, mval, x)));
+    }
+    scalar_fmod(in + n, modulus, out + n, count - n);
+}
+
+TARGET_AVX2 static void
+avx2_trunc(const mfp_sample * in, mfp_sample * out, int count)
+{
+    int n = 0;
+    for (; n + 8 <= count; n += 8) {
+        _mm256_storeu_ps(out + n, _mm256_round_ps(_mm256_loadu_ps(in + n),
+                                                  _MM_FROUND_TO_ZERO | _MM_FROUND_NO_EXC));
+    }
+    scalar_trunc(in + n, out + n, count - n);
+}
+
+TARGET_AVX2 static void
+avx2_index_fetch(const mfp_sample * indexes, const mfp_sample * base,
+                 mfp_sample * out, int count)
+{
+    __m256i index;
+    int n = 0;
+
+    for (; n + 8 <= count; n += 8) {
+        index = _mm256_cvttps_epi32(_mm256_loadu_ps(indexes + n));
+        _mm256_storeu_ps(out + n, _mm256_i32gather_ps(base, index, 4));
+    }
+    scalar_index_fetch(indexes + n, base, out + n, count - n);
+}
+
+/* initval + n*incr rather than a running sum, so the lanes are
+ * independent */
+TARGET_AVX2 static double
+avx2_ramp(mfp_sample * out, double initval, double incr, int count)
+{
+    __m256d step = _mm256_set1_pd(4.0 * incr);
+    __m256d val = _mm256_fmadd_pd(_mm256_set_pd(3.0, 2.0, 1.0, 0.0), _mm256_set1_pd(incr),
+                                  _mm256_set1_pd(initval));
+    int n = 0;
+
+    for (; n + 4 <= count; n += 4) {
+        _mm_storeu_ps(out + n, _mm256_cvtpd_ps(val));
+        val = _mm256_add_pd(val, step);
+    }
+    return scalar_ramp(out + n, initval + n * incr, incr, count - n);
+}
+
+TARGET_AVX2 static double
+avx2_prefix_sum(const mfp_sample * in, mfp_sample scale, mfp_sample initval,
+                mfp_sample * out, int count)
+{
+    __m256 sval = _mm256_set1_ps(scale);
+    __m256 carry = _mm256_set1_ps(initval);
+    __m256 x, low;
+    int n = 0;
+
+    for (; n + 8 <= count; n += 8) {
+        /* scan each 128-bit half, then add the low half's total to
+         * the high half */
+        x = _mm256_mul_ps(_mm256_loadu_ps(in + n), sval);
+        x = _mm256_add_ps(x, _mm256_castsi256_ps(_mm256_slli_si256(_mm256_castps_si256(x), 4)));
+        x = _mm256_add_ps(x, _mm256_castsi256_ps(_mm256_slli_si256(_mm256_castps_si256(x), 8)));
+        low = _mm256_permute_ps(x, 0xff);
+        x = _mm256_add_ps(x, _mm256_permute2f128_ps(low, low, 0x08));
+        x = _mm256_add_ps(x, carry);
+        _mm256_storeu_ps(out + n, x);
+        carry = _mm256_permute_ps(x, 0xff);
+        carry = _mm256_permute2f128_ps(carry, carry, 0x11);
+    }
+    return scalar_prefix_sum(in + n, scale, _mm256_cvtss_f32(carry), out + n, count - n);
+}
+
+TARGET_AVX2 static void
+avx2_table_lookup(const mfp_sample * in, const double * table, int tabsize,
+                  double scale, mfp_sample * out, int count)
+{
+    __m256d sval = _mm256_set1_pd(scale);
+    __m256d top = _mm256_set1_pd(tabsize);
+    __m128i last = _mm_set1_epi32(tabsize - 1);
+    __m256d pos, s1, s2;
+    __m128i index;
+    int n = 0;
+
+    for (; n + 4 <= count; n += 4) {
+        pos = _mm256_mul_pd(_mm256_cvtps_pd(_mm_loadu_ps(in + n)), sval);
+        pos = _mm256_min_pd(_mm256_max_pd(pos, _mm256_setzero_pd()), top);
+        index = _mm_min_epi32(_mm256_cvttpd_epi32(pos), last);
+        s1 = _mm256_i32gather_pd(table, index, 8);
+        s2 = _mm256_i32gather_pd(table + 1, index, 8);
+        pos = _mm256_sub_pd(pos, _mm256_cvtepi32_pd(index));
+        _mm_storeu_ps(out + n, _mm256_cvtpd_ps(_mm256_fmadd_pd(_mm256_sub_pd(s2, s1), pos, s1)));
+    }
+    scalar_table_lookup(in + n, table, tabsize, scale, out + n, count - n);
+}
+
+TARGET_AVX2 static void
+avx2_noise(guint32 * state, mfp_sample * out, int count)
+{
+    __m256i x = _mm256_loadu_si256((__m256i *)state);
+    __m256 scale = _mm256_set1_ps(NOISE_SCALE);
+    int n = 0;
+
+    for (; n + 8 <= count; n += 8) {
+        x = _mm256_xor_si256(x, _mm256_slli_epi32(x, 13));
+        x = _mm256_xor_si256(x, _mm256_srli_epi32(x, 17));
+        x = _mm256_xor_si256(x, _mm256_slli_epi32(x, 5));
+        _mm256_storeu_ps(out + n, _mm256_mul_ps(_mm256_cvtepi32_ps(x), scale));
+    }
+    _mm256_storeu_si256((__m256i *)state, x);
+    scalar_noise(state, out + n, count - n);
+}
+
+TARGET_AVX2 static void
+avx2_biquad(mfp_biquad * filter, const mfp_sample * in, mfp_sample * out, int count)
+{
+    biquad_loop(filter, in, out, count);
+}
+
+static mfp_kernel_table mfp_kernels_avx2 = {
+    .name = "avx2",
+    .add = avx2_add,
+    .mul = avx2_mul,
+    .cmp = avx2_cmp,
+    .mac = avx2_mac,
+    .const_add = avx2_const_add,
+    .const_mul = avx2_const_mul,
+    .fill = avx2_fill,
+    .fmod = avx2_fmod,
+    .trunc = avx2_trunc,
+    .index_fetch = avx2_index_fetch,
+    .ramp = avx2_ramp,
+    .phase = scalar_phase,
+    .prefix_sum = avx2_prefix_sum,
+    .table_lookup = avx2_table_lookup,
+    .noise = avx2_noise,
+    .biquad = avx2_biquad
+};
+
+#endif
+
+/* the table for level, or NULL if it isn't compiled in or this CPU
+ * can't run it */
+mfp_kernel_table *
+mfp_kernel_get(int level)
+{
+    switch (level) {
+    case MFP_KERNEL_SCALAR:
+        return &mfp_kernels_scalar;
+#ifdef MFP_USE_SSE
+    case MFP_KERNEL_SSE:
+        __builtin_cpu_init();
+        if (__builtin_cpu_supports("sse2")) {
+            return &mfp_kernels_sse;
+        }
+        break;
+    case MFP_KERNEL_AVX2:
+        __builtin_cpu_init();
+        if (__builtin_cpu_supports("avx2") && __builtin_cpu_supports("fma")) {
+            return &mfp_kernels_avx2;
+        }
+        break;
+#endif
+    }
+    return NULL;
+}
+
+void
+mfp_kernel_init(void)
+{
+    const char * request = getenv("MFP_KERNELS");
+    mfp_kernel_table * table;
+    int level;
+
+    mfp_kernels = &mfp_kernels_scalar;
+    for (level = MFP_KERNEL_LEVELS-1; level > MFP_KERNEL_SCALAR; level--) {
+        table = mfp_kernel_get(level);
+        if ((table != NULL) && ((request == NULL) || !strcmp(request, table->name))) {
+            mfp_kernels = table;
+            break;
+        }
+    }
+    mfp_log_info("mfpdsp: using %s block kernels\n", mfp_kernels->name);
+}
+
+void
+mfp_kernel_noise_seed(guint32 * state, guint32 seed)
+{
+    int lane;
+
+    for (lane = 0; lane < MFP_NOISE_LANES; lane++) {
+        /* xorshift state must not be 0 */
+        state[lane] = (seed + 0x9e3779b9 * (lane + 1)) | 1;
+    }
+}
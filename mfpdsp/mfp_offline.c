@@ -0,0 +1,499 @@
+#include <glib.h>
+#include <stdio.h>
+#include <stdint.h>
+#include <string.h>
+#include <errno.h>
+#include <time.h>
+#include <pthread.h>
+
+#include "mfp_dsp.h"
+
+/*
+ * Offline contexts.
+ *
+ * An offline context has no audio host.  Its input and output "ports"
+ * are plain blocks, and mfp_offline_render runs mfp_dsp_run on them
+ * in a loop as fast as the CPU allows, reading the inputs from a file
+ * and writing the outputs to another.  That gives non-realtime
+ * bouncing of a patch, audio regression tests without a JACK server,
+ * and a blocks/second figure for the DSP network on its own.
+ *
+ * mfpdsp runs an offline context from its main thread (see main.c).
+ * While there is nothing to render, mfp_offline_wait keeps handling
+ * requests so that the patch can be built; a DSPObject.render() call
+ * hands a render over to it with mfp_offline_request and waits for the
+ * result.
+ *
+ * Files ending in .wav are RIFF WAVE: inputs may be 16, 24 or 32 bit
+ * integer PCM or 32 bit float, outputs are always 32 bit float.  Any
+ * other file is raw interleaved 32 bit float with one channel per
+ * context input or output.  Sample data is read and written in host
+ * byte order, which is little-endian everywhere mfp runs.
+ */
+
+#define WAV_FORMAT_PCM 1
+#define WAV_FORMAT_FLOAT 3
+#define WAV_FORMAT_EXTENSIBLE 0xfffe
+
+/* how often an idle context looks for requests */
+#define OFFLINE_IDLE_USEC 5000
+
+typedef struct {
+    FILE * file;
+    int wav;
+    int format;
+    int channels;
+    int bytes_per_sample;
+    long data_start;
+    gint64 frames;
+} offline_file;
+
+static int
+is_wav(const char * filename)
+{
+    int len = strlen(filename);
+    return (len > 4) && !g_ascii_strcasecmp(filename + len - 4, ".wav");
+}
+
+static void
+put_le16(unsigned char * dest, int value)
+{
+    dest[0] = value & 0xff;
+    dest[1] = (value >> 8) & 0xff;
+}
+
+static void
+put_le32(unsigned char * dest, uint32_t value)
+{
+    dest[0] = value & 0xff;
+    dest[1] = (value >> 8) & 0xff;
+    dest[2] = (value >> 16) & 0xff;
+    dest[3] = (value >> 24) & 0xff;
+}
+
+static int
+get_le16(const unsigned char * src)
+{
+    return src[0] | (src[1] << 8);
+}
+
+static uint32_t
+get_le32(const unsigned char * src)
+{
+    return src[0] | (src[1] << 8) | (src[2] << 16) | ((uint32_t)src[3] << 24);
+}
+
+/* the header is written again with the real sizes when the file is closed */
+static void
+wav_write_header(offline_file * wf, int samplerate)
+{
+    unsigned char header[44];
+    uint32_t databytes = wf->frames * wf->channels * wf->bytes_per_sample;
+
+    memcpy(header, "RIFF", 4);
+    put_le32(header + 4, 36 + databytes);
+    memcpy(header + 8, "WAVEfmt ", 8);
+    put_le32(header + 16, 16);
+    put_le16(header + 20, wf->format);
+    put_le16(header + 22, wf->channels);
+    put_le32(header + 24, samplerate);
+    put_le32(header + 28, samplerate * wf->channels * wf->bytes_per_sample);
+    put_le16(header + 32, wf->channels * wf->bytes_per_sample);
+    put_le16(header + 34, 8 * wf->bytes_per_sample);
+    memcpy(header + 36, "data", 4);
+    put_le32(header + 40, databytes);
+
+    fseek(wf->file, 0, SEEK_SET);
+    fwrite(header, 1, sizeof(header), wf->file);
+}
+
+/* find the fmt and data chunks, leaving the file at the start of the data */
+static int
+wav_read_header(offline_file * wf, const char * filename, int samplerate)
+{
+    unsigned char buf[40];
+    uint32_t chunksize;
+    int wav_rate = 0;
+
+    if ((fread(buf, 1, 12, wf->file) != 12)
+        || memcmp(buf, "RIFF", 4) || memcmp(buf + 8, "WAVE", 4)) {
+        mfp_log_error("offline: %s is not a WAVE file", filename);
+        return 0;
+    }
+
+    while (fread(buf, 1, 8, wf->file) == 8) {
+        chunksize = get_le32(buf + 4);
+
+        if (!memcmp(buf, "fmt ", 4)) {
+            if ((chunksize < 16) || (fread(buf, 1, MIN(chunksize, 40), wf->file)
+                                     != MIN(chunksize, 40))) {
+                break;
+            }
+            wf->format = get_le16(buf);
+            wf->channels = get_le16(buf + 2);
+            wav_rate = get_le32(buf + 4);
+            wf->bytes_per_sample = get_le16(buf + 14) / 8;
+
+            /* WAVE_FORMAT_EXTENSIBLE has the real format in its subformat GUID */
+            if ((wf->format == WAV_FORMAT_EXTENSIBLE) && (chunksize >= 26)) {
+                wf->format = get_le16(buf + 24);
+            }
+            fseek(wf->file, chunksize - MIN(chunksize, 40) + (chunksize & 1), SEEK_CUR);
+        }
+        else if (!memcmp(buf, "data", 4)) {
+            if (wf->channels == 0) {
+                break;
+            }
+            if (!(((wf->format == WAV_FORMAT_PCM) && (wf->bytes_per_sample >= 2)
+                   && (wf->bytes_per_sample <= 4))
+                  || ((wf->format == WAV_FORMAT_FLOAT) && (wf->bytes_per_sample == 4)))) {
+                mfp_log_error("offline: %s: unsupported sample format %d/%d bits",
+                              filename, wf->format, 8 * wf->bytes_per_sample);
+                return 0;
+            }
+            if (wav_rate != samplerate) {
+                mfp_log_warning("offline: %s is %d Hz, rendering at %d Hz without resampling",
+                                filename, wav_rate, samplerate);
+            }
+            wf->data_start = ftell(wf->file);
+            wf->frames = chunksize / (wf->channels * wf->bytes_per_sample);
+            return 1;
+        }
+        else {
+            fseek(wf->file, chunksize + (chunksize & 1), SEEK_CUR);
+        }
+    }
+
+    mfp_log_error("offline: %s has no usable fmt/data chunks", filename);
+    return 0;
+}
+
+static int
+offline_open_read(offline_file * wf, const char * filename, mfp_context * ctxt)
+{
+    memset(wf, 0, sizeof(offline_file));
+    if ((wf->file = fopen(filename, "rb")) == NULL) {
+        mfp_log_error("offline: cannot open %s: %s", filename, strerror(errno));
+        return 0;
+    }
+
+    wf->wav = is_wav(filename);
+    if (wf->wav) {
+        if (!wav_read_header(wf, filename, ctxt->samplerate)) {
+            fclose(wf->file);
+            wf->file = NULL;
+            return 0;
+        }
+    }
+    else {
+        wf->format = WAV_FORMAT_FLOAT;
+        wf->channels = mfp_num_input_buffers(ctxt);
+        wf->bytes_per_sample = sizeof(float);
+    }
+    return 1;
+}
+
+static int
+offline_open_write(offline_file * wf, const char * filename, mfp_context * ctxt)
+{
+    memset(wf, 0, sizeof(offline_file));
+    if ((wf->file = fopen(filename, "wb")) == NULL) {
+        mfp_log_error("offline: cannot create %s: %s", filename, strerror(errno));
+        return 0;
+    }
+
+    wf->wav = is_wav(filename);
+    wf->format = WAV_FORMAT_FLOAT;
+    wf->channels = mfp_num_output_buffers(ctxt);
+    wf->bytes_per_sample = sizeof(float);
+    if (wf->wav) {
+        wav_write_header(wf, ctxt->samplerate);
+    }
+    return 1;
+}
+
+static void
+offline_close(offline_file * wf, mfp_context * ctxt, int writing)
+{
+    if (wf->file == NULL) {
+        return;
+    }
+    if (writing && wf->wav) {
+        wav_write_header(wf, ctxt->samplerate);
+    }
+    fclose(wf->file);
+    wf->file = NULL;
+}
+
+/* read up to nframes into the context's input blocks.  Channels the file
+ * doesn't have and anything past its end are silent */
+static void
+offline_read(offline_file * wf, mfp_context * ctxt, unsigned char * rawbuf, int nframes)
+{
+    int num_inputs = mfp_num_input_buffers(ctxt);
+    int frames_read = 0;
+    int chan, frame;
+    mfp_sample * buf;
+    unsigned char * sp;
+    int32_t ival;
+
+    if (wf->file != NULL) {
+        frames_read = fread(rawbuf, wf->channels * wf->bytes_per_sample, nframes, wf->file);
+        if (wf->wav) {
+            frames_read = MIN(frames_read, wf->frames);
+            wf->frames -= frames_read;
+        }
+    }
+
+    for (chan = 0; chan < num_inputs; chan++) {
+        buf = mfp_get_input_buffer(ctxt, chan);
+        if (chan >= wf->channels) {
+            frames_read = 0;
+        }
+        for (frame = 0; frame < frames_read; frame++) {
+            sp = rawbuf + (frame * wf->channels + chan) * wf->bytes_per_sample;
+            if (wf->format == WAV_FORMAT_FLOAT) {
+                buf[frame] = *(float *)sp;
+            }
+            else {
+                /* left-justify into 32 bits, then scale to +/- 1.0 */
+                ival = 0;
+                memcpy((unsigned char *)&ival + 4 - wf->bytes_per_sample, sp,
+                       wf->bytes_per_sample);
+                buf[frame] = ival / 2147483648.0;
+            }
+        }
+        memset(buf + frames_read, 0, (ctxt->blocksize - frames_read) * sizeof(mfp_sample));
+    }
+}
+
+static int
+offline_write(offline_file * wf, mfp_context * ctxt, float * interleaved, int nframes)
+{
+    int chan, frame;
+    mfp_sample * buf;
+
+    for (chan = 0; chan < wf->channels; chan++) {
+        buf = mfp_get_output_buffer(ctxt, chan);
+        for (frame = 0; frame < nframes; frame++) {
+            interleaved[frame * wf->channels + chan] = buf[frame];
+        }
+    }
+    if (fwrite(interleaved, wf->channels * sizeof(float), nframes, wf->file) != nframes) {
+        return 0;
+    }
+    wf->frames += nframes;
+    return 1;
+}
+
+/* bring the run order up to date with every request so far, so that a
+ * render never starts with the blocks of an old graph */
+static void
+offline_settle(mfp_context * ctxt)
+{
+    /* a run order already being built has to land first */
+    while (mfp_sched_busy(ctxt)) {
+        mfp_sched_swap(ctxt);
+        g_usleep(100);
+    }
+    mfp_dsp_handle_requests(ctxt);
+    if (ctxt->needs_reschedule) {
+        mfp_dsp_schedule(ctxt);
+    }
+}
+
+mfp_context *
+mfp_offline_startup(int num_inputs, int num_outputs, int samplerate, int blocksize)
+{
+    mfp_context * ctxt = mfp_context_new(CTYPE_OFFLINE);
+    mfp_offline_info * info = ctxt->info.offline;
+    mfp_block * blk;
+    int count;
+
+    if (blocksize > mfp_max_blocksize) {
+        mfp_log_warning("offline: blocksize %d larger than mfp_max_blocksize (%d)",
+                        blocksize, mfp_max_blocksize);
+        blocksize = mfp_max_blocksize;
+    }
+
+    pthread_mutex_init(&info->lock, NULL);
+    pthread_cond_init(&info->cond, NULL);
+
+    info->input_buffers = g_array_new(FALSE, TRUE, sizeof(mfp_block *));
+    info->output_buffers = g_array_new(FALSE, TRUE, sizeof(mfp_block *));
+    for (count = 0; count < num_inputs; count++) {
+        blk = mfp_block_new(mfp_max_blocksize);
+        mfp_block_resize(blk, blocksize);
+        g_array_append_val(info->input_buffers, blk);
+    }
+    for (count = 0; count < num_outputs; count++) {
+        blk = mfp_block_new(mfp_max_blocksize);
+        mfp_block_resize(blk, blocksize);
+        g_array_append_val(info->output_buffers, blk);
+    }
+
+    ctxt->samplerate = samplerate;
+    ctxt->blocksize = blocksize;
+    mfp_in_latency = mfp_out_latency = 0.0;
+    ctxt->activated = 1;
+
+    mfp_log_debug("offline context started: samplerate=%d, blocksize=%d\n",
+                  ctxt->samplerate, ctxt->blocksize);
+
+    mfp_pool_init(mfp_dsp_threads, 0);
+    return ctxt;
+}
+
+void
+mfp_offline_free(mfp_context * ctxt)
+{
+    mfp_offline_info * info = ctxt->info.offline;
+    int count;
+
+    for (count = 0; count < info->input_buffers->len; count++) {
+        mfp_block_free(g_array_index(info->input_buffers, mfp_block *, count));
+    }
+    for (count = 0; count < info->output_buffers->len; count++) {
+        mfp_block_free(g_array_index(info->output_buffers, mfp_block *, count));
+    }
+    g_array_free(info->input_buffers, TRUE);
+    g_array_free(info->output_buffers, TRUE);
+    pthread_mutex_destroy(&info->lock);
+    pthread_cond_destroy(&info->cond);
+}
+
+/* render frames of the context's output into outfile, with infile (if
+ * any) as its input.  Either file may be NULL or "", and with no outfile
+ * it's only a benchmark.  Returns the number of blocks run, or -1 if a
+ * file couldn't be opened or written */
+int
+mfp_offline_render(mfp_context * ctxt, const char * infile,
+                   const char * outfile, gint64 frames)
+{
+    mfp_offline_info * info = ctxt->info.offline;
+    offline_file in, out;
+    unsigned char * rawbuf;
+    float * interleaved;
+    struct timespec start, end;
+    gint64 done = 0;
+    int blocks = 0;
+    int nframes;
+    int ok = 1;
+
+    memset(&in, 0, sizeof(offline_file));
+    memset(&out, 0, sizeof(offline_file));
+
+    if ((infile != NULL) && (*infile != 0) && !offline_open_read(&in, infile, ctxt)) {
+        return -1;
+    }
+    if ((outfile != NULL) && (*outfile != 0) && !offline_open_write(&out, outfile, ctxt)) {
+        offline_close(&in, ctxt, 0);
+        return -1;
+    }
+
+    rawbuf = g_malloc(ctxt->blocksize * MAX(in.channels, 1) * MAX(in.bytes_per_sample, 1));
+    interleaved = g_malloc(ctxt->blocksize * MAX(out.channels, 1) * sizeof(float));
+
+    offline_settle(ctxt);
+
+    clock_gettime(CLOCK_MONOTONIC, &start);
+    while (ok && (done < frames)) {
+        nframes = MIN(ctxt->blocksize, frames - done);
+
+        offline_read(&in, ctxt, rawbuf, nframes);
+        mfp_dsp_run(ctxt);
+        if (out.file != NULL) {
+            ok = offline_write(&out, ctxt, interleaved, nframes);
+        }
+
+        done += nframes;
+        blocks ++;
+    }
+    clock_gettime(CLOCK_MONOTONIC, &end);
+
+    offline_close(&in, ctxt, 0);
+    offline_close(&out, ctxt, 1);
+    g_free(rawbuf);
+    g_free(interleaved);
+
+    info->frames_done = done;
+    info->elapsed = (end.tv_sec - start.tv_sec) + (end.tv_nsec - start.tv_nsec) / 1.0e9;
+
+    if (!ok) {
+        mfp_log_error("offline: error writing %s: %s", outfile, strerror(errno));
+        return -1;
+    }
+
+    mfp_log_debug("offline: %d blocks (%" G_GINT64_FORMAT " frames) in %.3f s, "
+                  "%.0f blocks/s\n", blocks, done, info->elapsed,
+                  blocks / MAX(info->elapsed, 1.0e-9));
+    return blocks;
+}
+
+/* mfpdsp's main thread for an offline context: keep the patch's requests
+ * moving until a render is requested, run it, and go back to waiting */
+void
+mfp_offline_wait(mfp_context * ctxt)
+{
+    mfp_offline_info * info = ctxt->info.offline;
+    struct timespec waketime;
+
+    pthread_mutex_lock(&info->lock);
+    while (!mfp_comm_quit_requested()) {
+        if (info->pending) {
+            info->result = mfp_offline_render(ctxt, info->infile, info->outfile,
+                                              info->frames);
+            info->pending = 0;
+            pthread_cond_broadcast(&info->cond);
+            continue;
+        }
+
+        offline_settle(ctxt);
+
+        clock_gettime(CLOCK_REALTIME, &waketime);
+        waketime.tv_nsec += OFFLINE_IDLE_USEC * 1000;
+        if (waketime.tv_nsec >= 1000000000) {
+            waketime.tv_sec += 1;
+            waketime.tv_nsec -= 1000000000;
+        }
+        pthread_cond_timedwait(&info->cond, &info->lock, &waketime);
+    }
+    pthread_mutex_unlock(&info->lock);
+}
+
+/* called from the RPC thread: hand a render to mfp_offline_wait and
+ * wait for it to finish.  Appends frames rendered, blocks run and
+ * elapsed seconds, or nothing if the render failed */
+int
+mfp_offline_request(mfp_context * ctxt, const char * infile, const char * outfile,
+                    gint64 frames, mfp_rpc_args * arglist)
+{
+    mfp_offline_info * info = ctxt->info.offline;
+    int result;
+
+    pthread_mutex_lock(&info->lock);
+    while (info->pending) {
+        pthread_cond_wait(&info->cond, &info->lock);
+    }
+    info->infile = g_strdup(infile);
+    info->outfile = g_strdup(outfile);
+    info->frames = frames;
+    info->pending = 1;
+    pthread_cond_broadcast(&info->cond);
+
+    while (info->pending) {
+        pthread_cond_wait(&info->cond, &info->lock);
+    }
+    result = info->result;
+    g_free(info->infile);
+    g_free(info->outfile);
+    info->infile = info->outfile = NULL;
+
+    if (result >= 0) {
+        mfp_rpc_args_append_int(arglist, info->frames_done);
+        mfp_rpc_args_append_int(arglist, result);
+        mfp_rpc_args_append_double(arglist, info->elapsed);
+    }
+    pthread_mutex_unlock(&info->lock);
+    return result;
+}
@@ -0,0 +1,314 @@
+#include <glib.h>
+#include <stdio.h>
+#include <string.h>
+#include <errno.h>
+#include <time.h>
+#include <sched.h>
+#include <pthread.h>
+#include <semaphore.h>
+
+#include "mfp_dsp.h"
+
+/*
+ * Level-parallel execution of a context's run order.
+ *
+ * Processors with the same depth don't depend on each other, so each
+ * depth level of ctxt->schedule can be split across a fixed set of
+ * worker threads.  The DSP thread works on the level too, then waits
+ * for the others (a spin barrier) before starting the next level.
+ * Workers sleep on pool_start_sem between parallel levels, so serial
+ * levels and idle time don't keep them spinning on a core.
+ *
+ * Processors whose type is serial_only (they write buffers shared by
+ * the whole context, like out~) are skipped by the workers and run by
+ * the DSP thread once the rest of the level is done.
+ *
+ * mfp_dsp_threads is the total number of threads including the DSP
+ * thread.  0 (the default) runs the schedule in a plain loop; 1 runs
+ * it level by level on the DSP thread, which gives the per-level
+ * timing without any parallelism to compare against.
+ *
+ * There is one pool per process.  If another context is already using
+ * it, a block is run on its own thread only.
+ */
+
+int mfp_dsp_threads = 0;
+
+static pthread_t * pool_threads = NULL;
+static int pool_num_threads = 0;
+static int pool_quit = 0;
+static sem_t pool_start_sem;
+static atomic_flag pool_busy = ATOMIC_FLAG_INIT;
+
+/* the level being worked on.  pool_next holds a level generation in
+ * the high 32 bits and the next unclaimed index in the low 32, so a
+ * worker that is late for one level can't claim a slot in the next.
+ * A new level is published with pool_level_len at 0 until pool_next
+ * has its generation: a worker that sees the new length then can
+ * only claim against the new pool_next */
+#define POOL_INDEX_MASK 0xffffffffULL
+static mfp_processor ** pool_level = NULL;
+static atomic_int pool_level_len;
+static _Atomic(guint64) pool_next;
+static atomic_int pool_done;
+static guint32 pool_generation = 0;
+
+static inline gint64
+pool_now(void)
+{
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return (gint64)ts.tv_sec * 1000000000 + ts.tv_nsec;
+}
+
+/* take processors off the current level until there are none left.
+ * Returns the number processed */
+static int
+pool_work(void)
+{
+    guint64 claim = atomic_load(&pool_next);
+    mfp_processor * p;
+    int worked = 0;
+
+    while ((int)(claim & POOL_INDEX_MASK) < atomic_load(&pool_level_len)) {
+        if (!atomic_compare_exchange_weak(&pool_next, &claim, claim + 1)) {
+            continue;
+        }
+        /* the level can't move on until this slot is done */
+        p = pool_level[claim & POOL_INDEX_MASK];
+        if (!p->typeinfo->serial_only) {
+            mfp_proc_process(p);
+        }
+        atomic_fetch_add(&pool_done, 1);
+        worked ++;
+        claim = atomic_load(&pool_next);
+    }
+    return worked;
+}
+
+static void *
+pool_thread_func(void * data)
+{
+    while (!pool_quit) {
+        if (sem_wait(&pool_start_sem) < 0 && errno == EINTR) {
+            continue;
+        }
+        if (!pool_quit) {
+            pool_work();
+        }
+    }
+    return NULL;
+}
+
+void
+mfp_pool_init(int num_threads, int rt_priority)
+{
+    pthread_attr_t attr;
+    struct sched_param param;
+    int count;
+
+    if ((num_threads < 2) || (pool_threads != NULL)) {
+        return;
+    }
+
+    pool_num_threads = num_threads - 1;
+    pool_threads = g_malloc0(pool_num_threads * sizeof(pthread_t));
+    pool_quit = 0;
+    atomic_init(&pool_level_len, 0);
+    atomic_init(&pool_next, 0);
+    atomic_init(&pool_done, 0);
+    sem_init(&pool_start_sem, 0, 0);
+
+    pthread_attr_init(&attr);
+    if (rt_priority > 0) {
+        pthread_attr_setinheritsched(&attr, PTHREAD_EXPLICIT_SCHED);
+        pthread_attr_setschedpolicy(&attr, SCHED_FIFO);
+        param.sched_priority = rt_priority;
+        pthread_attr_setschedparam(&attr, &param);
+    }
+
+    for (count = 0; count < pool_num_threads; count++) {
+        if (pthread_create(&pool_threads[count], &attr, pool_thread_func, NULL) != 0) {
+            /* no realtime permissions, run them at normal priority */
+            mfp_log_warning("mfp_pool_init: could not create realtime worker, "
+                            "using normal priority");
+            pthread_create(&pool_threads[count], NULL, pool_thread_func, NULL);
+        }
+    }
+    pthread_attr_destroy(&attr);
+
+    mfp_log_info("mfpdsp: %d DSP worker threads\n", pool_num_threads);
+}
+
+void
+mfp_pool_finish(void)
+{
+    int count;
+
+    if (pool_threads == NULL) {
+        return;
+    }
+
+    pool_quit = 1;
+    for (count = 0; count < pool_num_threads; count++) {
+        sem_post(&pool_start_sem);
+    }
+    for (count = 0; count < pool_num_threads; count++) {
+        pthread_join(pool_threads[count], NULL);
+    }
+    g_free(pool_threads);
+    pool_threads = NULL;
+    pool_num_threads = 0;
+}
+
+static void
+level_run_serial(mfp_processor ** level, int len)
+{
+    int count;
+    for (count = 0; count < len; count++) {
+        mfp_proc_process(level[count]);
+    }
+}
+
+static void
+level_run_parallel(mfp_processor ** level, int len)
+{
+    int count;
+    int waiting;
+
+    atomic_store(&pool_level_len, 0);
+    pool_level = level;
+    pool_generation ++;
+    atomic_store(&pool_done, 0);
+    atomic_store(&pool_next, (guint64)pool_generation << 32);
+    atomic_store(&pool_level_len, len);
+
+    /* wake as many workers as there's work for.  Wakeups that come too
+     * late for this level find nothing to claim and go back to sleep;
+     * don't let them pile up past one per worker */
+    for (count = 0; count < MIN(len - 1, pool_num_threads); count++) {
+        if ((sem_getvalue(&pool_start_sem, &waiting) == 0) && (waiting >= pool_num_threads)) {
+            break;
+        }
+        sem_post(&pool_start_sem);
+    }
+
+    pool_work();
+    while (atomic_load(&pool_done) < len) {
+    }
+
+    for (count = 0; count < len; count++) {
+        if (level[count]->typeinfo->serial_only) {
+            mfp_proc_process(level[count]);
+        }
+    }
+}
+
+static void
+level_stats_update(mfp_context * ctxt, int level, int depth, int procs,
+                   int parallel, gint64 elapsed)
+{
+    mfp_level_stats * stats;
+
+    if ((ctxt->level_stats == NULL) || (level >= MFP_MAX_LEVEL_STATS)) {
+        return;
+    }
+    if (level >= ctxt->num_level_stats) {
+        ctxt->num_level_stats = level + 1;
+    }
+
+    stats = ctxt->level_stats + level;
+    if ((stats->depth != depth) || (stats->procs != procs)) {
+        memset(stats, 0, sizeof(mfp_level_stats));
+        stats->depth = depth;
+        stats->procs = procs;
+    }
+    stats->parallel = parallel;
+    stats->blocks ++;
+    stats->total_nsec += elapsed;
+    if (elapsed > stats->max_nsec) {
+        stats->max_nsec = elapsed;
+    }
+}
+
+/* run ctxt->schedule one depth level at a time.  Called from
+ * mfp_dsp_run when mfp_dsp_threads is set.  Levels come from the
+ * depths saved with the run order; the processors' own may already be
+ * changing for the next one */
+void
+mfp_pool_run(mfp_context * ctxt)
+{
+    mfp_run_order * order = ctxt->schedule;
+    int have_pool = 0;
+    int level_num = 0;
+    int parallel;
+    int depth;
+    int pos, end;
+    int len;
+    gint64 start;
+
+    if (order == NULL) {
+        return;
+    }
+
+    if ((pool_threads != NULL) && !atomic_flag_test_and_set(&pool_busy)) {
+        have_pool = 1;
+    }
+
+    for (pos = 0; pos < order->len; pos = end) {
+        /* processors in a loop (depth -1) are at the end, run them in
+         * order as a single level */
+        depth = order->depths[pos];
+        for (end = pos; (end < order->len) && (order->depths[end] == depth); end++) {
+        }
+        len = end - pos;
+        parallel = have_pool && (len > 1) && (depth >= 0);
+
+        start = pool_now();
+        if (parallel) {
+            level_run_parallel(order->procs + pos, len);
+        }
+        else {
+            level_run_serial(order->procs + pos, len);
+        }
+        level_stats_update(ctxt, level_num, depth, len, parallel, pool_now() - start);
+
+        level_num ++;
+    }
+
+    if (level_num < ctxt->num_level_stats) {
+        ctxt->num_level_stats = level_num;
+    }
+
+    if (have_pool) {
+        atomic_store(&pool_level_len, 0);
+        atomic_flag_clear(&pool_busy);
+    }
+}
+
+/* per-level stats for a context, 6 ints per level (see
+ * mfp_level_stats) starting at first_level, as many levels as fit in
+ * one mfp_rpc_argblock */
+void
+mfp_pool_level_stats(mfp_context * ctxt, int first_level, mfp_rpc_args * arglist)
+{
+    mfp_level_stats * stats;
+    int level;
+
+    if (ctxt->level_stats == NULL) {
+        return;
+    }
+
+    for (level = first_level;
+         (level < ctxt->num_level_stats) && (arglist->n_items + 6 <= MFP_RPC_ARGBLOCK_SIZE);
+         level++) {
+        stats = ctxt->level_stats + level;
+        mfp_rpc_args_append_int(arglist, stats->depth);
+        mfp_rpc_args_append_int(arglist, stats->procs);
+        mfp_rpc_args_append_int(arglist, stats->parallel);
+        mfp_rpc_args_append_int(arglist, stats->blocks);
+        mfp_rpc_args_append_int(arglist,
+            (stats->blocks > 0) ? (int)(stats->total_nsec / stats->blocks) : 0);
+        mfp_rpc_args_append_int(arglist, (int)stats->max_nsec);
+    }
+}
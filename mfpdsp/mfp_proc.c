@@ -7,7 +7,6 @@
 #include "mfp_dsp.h"
 #include "mfp_block.h"
 
-GArray          * mfp_proc_list = NULL;       /* all mfp_processors */
 GHashTable      * mfp_proc_registry = NULL;   /* hash of names to mfp_procinfo */
 GHashTable      * mfp_proc_objects = NULL;    /* hash of int ID to mfp_processor * */
 GHashTable      * mfp_contexts = NULL;        /* hash of int ID to mfp_context */
@@ -18,14 +17,38 @@ mfp_proc_lookup(int rpcid)
     return g_hash_table_lookup(mfp_proc_objects, GINT_TO_POINTER(rpcid));
 }
 
-/* Note: mfp_proc_create is a shortcut used by tests only */
+static void
+proc_setup(mfp_processor * p, int rpc_id, int patch_id)
+{
+    p->rpc_id = rpc_id;
+    p->patch_id = patch_id;
+
+    /* call type-specific initializer */
+    if (p->typeinfo->init)
+        p->typeinfo->init(p);
+
+    p->needs_config = 1;
+    p->active = 1;
+    g_hash_table_insert(mfp_proc_objects, GINT_TO_POINTER(p->rpc_id), p);
+}
+
+/* Note: mfp_proc_create is a shortcut used by tests only.  There's no
+ * DSP thread running, so the processor is added to its context
+ * directly instead of through the request queue */
 mfp_processor *
 mfp_proc_create(mfp_procinfo * typeinfo, int num_inlets, int num_outlets,
                 mfp_context * ctxt)
 {
+    mfp_processor * p;
+
     if (typeinfo == NULL)
         return NULL;
-    return mfp_proc_init(mfp_proc_alloc(typeinfo, num_inlets, num_outlets, ctxt), 0, 0);
+
+    p = mfp_proc_alloc(typeinfo, num_inlets, num_outlets, ctxt);
+    proc_setup(p, 0, 0);
+    mfp_proc_add(p);
+    mfp_dsp_route_proc(p);
+    return p;
 }
 
 
@@ -50,6 +73,8 @@ mfp_proc_alloc(mfp_procinfo * typeinfo, int num_inlets, int num_outlets,
     p->needs_reset = 0;
     p->inlet_conn = NULL;
     p->outlet_conn = NULL;
+    p->timed_params = g_malloc0(MFP_TIMED_PARAMS * sizeof(mfp_in_data));
+    p->timed_count = 0;
 
     mfp_proc_alloc_buffers(p, num_inlets, num_outlets, ctxt->blocksize);
 
@@ -79,20 +104,30 @@ mfp_proc_alloc_buffers(mfp_processor * p, int num_inlets, int num_outlets, int b
         g_array_append_val(p->outlet_conn, out);
     }
 
-    /* create input and output buffers (will be reallocated if blocksize changes */
+    /* create input and output buffers (will be reallocated if blocksize
+     * changes).  They're used until a run order gives the processor
+     * shared ones */
     p->inlet_buf = g_malloc0(num_inlets * sizeof(mfp_block *));
     p->inlet_buf_alloc = g_malloc0(num_inlets * sizeof(mfp_block *));
+    p->inlet_buf_own = g_malloc0(num_inlets * sizeof(mfp_block *));
+    p->inlet_buf_next = g_malloc0(num_inlets * sizeof(mfp_block *));
 
     for (count = 0; count < num_inlets; count ++) {
-        p->inlet_buf_alloc[count] = mfp_block_new(mfp_max_blocksize);
-        mfp_block_resize(p->inlet_buf_alloc[count], blocksize);
+        p->inlet_buf_own[count] = mfp_block_new(mfp_max_blocksize);
+        mfp_block_resize(p->inlet_buf_own[count], blocksize);
+        p->inlet_buf_alloc[count] = p->inlet_buf_own[count];
+        p->inlet_buf_next[count] = p->inlet_buf_own[count];
     }
 
-    p->outlet_buf = g_malloc(num_outlets * sizeof(mfp_sample *));
+    p->outlet_buf = g_malloc(num_outlets * sizeof(mfp_block *));
+    p->outlet_buf_own = g_malloc(num_outlets * sizeof(mfp_block *));
+    p->outlet_buf_next = g_malloc(num_outlets * sizeof(mfp_block *));
 
     for (count = 0; count < num_outlets; count ++) {
-        p->outlet_buf[count] = mfp_block_new(mfp_max_blocksize);
-        mfp_block_resize(p->outlet_buf[count], blocksize);
+        p->outlet_buf_own[count] = mfp_block_new(mfp_max_blocksize);
+        mfp_block_resize(p->outlet_buf_own[count], blocksize);
+        p->outlet_buf[count] = p->outlet_buf_own[count];
+        p->outlet_buf_next[count] = p->outlet_buf_own[count];
     }
     return success;
 }
@@ -115,37 +150,130 @@ mfp_proc_free_buffers(mfp_processor * self)
     }
     g_array_free(self->outlet_conn, TRUE);
 
+    /* shared blocks belong to the context */
     for (b=0; b < num_inlets; b++) {
-        mfp_block_free(self->inlet_buf_alloc[b]);
+        mfp_block_free(self->inlet_buf_own[b]);
     }
     g_free(self->inlet_buf);
     g_free(self->inlet_buf_alloc);
+    g_free(self->inlet_buf_own);
+    g_free(self->inlet_buf_next);
 
     for (b=0; b < num_outlets; b++) {
-        mfp_block_free(self->outlet_buf[b]);
+        mfp_block_free(self->outlet_buf_own[b]);
     }
     g_free(self->outlet_buf);
+    g_free(self->outlet_buf_own);
+    g_free(self->outlet_buf_next);
 }
 
 
+/* set up p and fill in the create request that hands it to its
+ * context, without pushing it, e.g. to go in a batch */
+void
+mfp_proc_init_request(mfp_processor * p, int rpc_id, int patch_id, mfp_in_data * rd)
+{
+    proc_setup(p, rpc_id, patch_id);
+
+    /* the DSP thread adds it to the processor lists (mfp_proc_add) */
+    memset(rd, 0, sizeof(mfp_in_data));
+    rd->reqtype = REQTYPE_CREATE;
+    rd->src_proc = rpc_id;
+    rd->param_value = (gpointer)p;
+}
+
 mfp_processor *
 mfp_proc_init(mfp_processor * p, int rpc_id, int patch_id)
 {
-    p->rpc_id = rpc_id;
-    p->patch_id = patch_id;
+    mfp_in_data rd;
 
-    /* call type-specific initializer */
-    if (p->typeinfo->init)
-        p->typeinfo->init(p);
+    mfp_proc_init_request(p, rpc_id, patch_id, &rd);
+    mfp_dsp_push_request(rd);
+    return p;
+}
 
-    p->needs_config = 1;
+/* add proc to its context's processor list.  Runs in the thread
+ * running the context */
+void
+mfp_proc_add(mfp_processor * p)
+{
+    mfp_sched_add_proc(p);
+}
 
-    /* add proc to global list */
-    g_array_append_val(mfp_proc_list, p);
-    g_hash_table_insert(mfp_proc_objects, GINT_TO_POINTER(p->rpc_id), p);
+/* run process() on count frames of the block starting at offset.  It
+ * sees blocks and a context that are just that part */
+static void
+proc_process_part(mfp_processor * self, int offset, int count)
+{
+    int num_inlets = self->inlet_conn->len;
+    int num_outlets = self->outlet_conn->len;
+    mfp_block inlet_part[MAX(num_inlets, 1)];
+    mfp_block outlet_part[MAX(num_outlets, 1)];
+    mfp_block * inlet_whole[MAX(num_inlets, 1)];
+    mfp_block * outlet_whole[MAX(num_outlets, 1)];
+    mfp_context * context_whole = self->context;
+    mfp_context context_part = *context_whole;
+    int xlet;
+
+    context_part.blocksize = count;
+
+    for (xlet = 0; xlet < num_inlets; xlet++) {
+        inlet_whole[xlet] = self->inlet_buf[xlet];
+        inlet_part[xlet] = *inlet_whole[xlet];
+        inlet_part[xlet].data += offset;
+        inlet_part[xlet].blocksize = count;
+        self->inlet_buf[xlet] = &inlet_part[xlet];
+    }
+    for (xlet = 0; xlet < num_outlets; xlet++) {
+        outlet_whole[xlet] = self->outlet_buf[xlet];
+        outlet_part[xlet] = *outlet_whole[xlet];
+        outlet_part[xlet].data += offset;
+        outlet_part[xlet].blocksize = count;
+        self->outlet_buf[xlet] = &outlet_part[xlet];
+    }
 
-    p->context->needs_reschedule = 1;
-    return p;
+    self->context = &context_part;
+    self->typeinfo->process(self);
+    self->context = context_whole;
+
+    for (xlet = 0; xlet < num_inlets; xlet++) {
+        self->inlet_buf[xlet] = inlet_whole[xlet];
+    }
+    for (xlet = 0; xlet < num_outlets; xlet++) {
+        self->outlet_buf[xlet] = outlet_whole[xlet];
+    }
+}
+
+/* process a block of a sample_accurate processor with timed setparams
+ * inside it, split at the frame of each one.  A part may have flagged
+ * its outlets constant, but the block as a whole isn't */
+static void
+proc_process_split(mfp_processor * self)
+{
+    mfp_context * ctxt = self->context;
+    gint64 block_end = ctxt->frame_count + ctxt->blocksize;
+    int start = 0;
+    int end;
+    int outlet_num;
+
+    while (start < ctxt->blocksize) {
+        if ((self->timed_count > 0) && (self->timed_params[0].frame < block_end)) {
+            end = (int)(self->timed_params[0].frame - ctxt->frame_count);
+        }
+        else {
+            end = ctxt->blocksize;
+        }
+        proc_process_part(self, start, end - start);
+        start = end;
+
+        if (mfp_dsp_apply_timed(self, ctxt->frame_count + start + 1) > 0) {
+            self->needs_config = (self->typeinfo->config(self) == 0);
+        }
+    }
+
+    for (outlet_num = 0; outlet_num < self->outlet_conn->len; outlet_num++) {
+        self->outlet_buf[outlet_num]->is_const = 0;
+    }
 }
 
 void
@@ -161,7 +289,34 @@ mfp_proc_process(mfp_processor * self)
 
     int config_rv;
     int inlet_num;
+    int outlet_num;
     int connect_num;
+    int have_signal;
+    mfp_sample const_sum;
+    gint64 block_end = self->context->frame_count + self->context->blocksize;
+
+    if (!self->active || self->sleeping) {
+        /* timed setparams still happen, for when it's back */
+        if (self->timed_count > 0) {
+            mfp_dsp_apply_timed(self, block_end);
+        }
+
+        /* a shared outlet block was written by someone else since */
+        for (outlet_num = 0; outlet_num < self->outlet_conn->len; outlet_num++) {
+            if (self->outlet_buf[outlet_num] != self->outlet_buf_own[outlet_num]) {
+                mfp_block_set_const(self->outlet_buf[outlet_num], 0);
+            }
+        }
+        return;
+    }
+
+    /* timed setparams due in this block.  A sample_accurate processor
+     * takes the ones at its first frame now and the rest at their own
+     * frames (proc_process_split); any other takes them all now */
+    if (self->timed_count > 0) {
+        mfp_dsp_apply_timed(self, self->typeinfo->sample_accurate ?
+                                  self->context->frame_count + 1 : block_end);
+    }
 
     /* run config() if params have changed */
     if (self->needs_config) {
@@ -196,21 +351,23 @@ mfp_proc_process(mfp_processor * self)
             self->inlet_buf[inlet_num] = upstream_outlet_buf;
         }
         else {
-            inlet_buf = self->inlet_buf_alloc[inlet_num];
-            self->inlet_buf[inlet_num] = inlet_buf;
-            mfp_block_fill(inlet_buf, 0);
+            self->inlet_buf[inlet_num] = self->inlet_buf_alloc[inlet_num];
         }
 
     }
 
-    /* now self->inlet_buf points to the right buffer for each inlet,
-     * zeroed if needed.  Get inputs into the buffers that need it. */
+    /* now self->inlet_buf points to the right buffer for each inlet.
+     * Get inputs into the buffers that need it.  Constant upstream
+     * blocks (silent ones included) are summed as scalars, so they
+     * cost nothing per sample */
     for (inlet_num = 0; inlet_num < self->inlet_conn->len; inlet_num++) {
         inlet_conn = g_array_index(self->inlet_conn, GArray *, inlet_num);
         inlet_buf = self->inlet_buf[inlet_num];
         if (inlet_buf != self->inlet_buf_alloc[inlet_num]) {
             continue;
         }
+        const_sum = 0.0;
+        have_signal = 0;
         for(connect_num = 0; connect_num < inlet_conn->len; connect_num++) {
             curr_inlet = g_array_index(inlet_conn, mfp_connection *, connect_num);
             upstream_proc = curr_inlet->dest_proc;
@@ -222,12 +379,52 @@ mfp_proc_process(mfp_processor * self)
                 mfp_log_debug("ERROR: self=%p, other=%p", self, upstream_proc);
 
             }
-            mfp_block_add(inlet_buf, upstream_outlet_buf, inlet_buf);
+            if (upstream_outlet_buf->is_const) {
+                const_sum += upstream_outlet_buf->const_value;
+            }
+            else if (!have_signal) {
+                mfp_block_copy(upstream_outlet_buf, inlet_buf);
+                have_signal = 1;
+            }
+            else {
+                mfp_block_add(inlet_buf, upstream_outlet_buf, inlet_buf);
+            }
+        }
+
+        if (!have_signal) {
+            mfp_block_set_const(inlet_buf, const_sum);
+        }
+        else {
+            inlet_buf->is_const = 0;
+            if (const_sum != 0.0) {
+                mfp_block_const_add(inlet_buf, const_sum, inlet_buf);
+            }
         }
     }
 
+    /* process() sets the flag again if its output is constant */
+    for (outlet_num = 0; outlet_num < self->outlet_conn->len; outlet_num++) {
+        self->outlet_buf[outlet_num]->is_const = 0;
+    }
+
     /* perform processing */
-    self->typeinfo->process(self);
+    if ((self->timed_count > 0) && (self->timed_params[0].frame < block_end)) {
+        proc_process_split(self);
+    }
+    else {
+        self->typeinfo->process(self);
+    }
+
+    /* this may run on a pool worker, so the patch is put to sleep by
+     * mfp_proc_sleep_idle() once the whole block is done */
+    if ((self->sleep_blocks > 0) && (self->outlet_conn->len > 0)) {
+        if (!mfp_block_silent(self->outlet_buf[0], MFP_SILENCE_THRESHOLD)) {
+            self->silent_blocks = 0;
+        }
+        else if (++self->silent_blocks == self->sleep_blocks) {
+            atomic_fetch_add(&self->context->sleep_requests, 1);
+        }
+    }
 }
 
 
@@ -237,11 +434,97 @@ mfp_proc_reset(mfp_processor * self)
     self->needs_reset = 1;
 }
 
+/* an inactive processor keeps its connections and state but isn't
+ * processed.  Its outlets are cleared once so anything downstream
+ * sees silence */
+void
+mfp_proc_activate(mfp_processor * self, int active)
+{
+    int outlet_num;
+
+    if (self->active == active) {
+        return;
+    }
+
+    self->active = active;
+    if (!active) {
+        for (outlet_num = 0; outlet_num < self->outlet_conn->len; outlet_num++) {
+            mfp_block_set_const(self->outlet_buf[outlet_num], 0);
+        }
+    }
+}
+
+/* sleeping and waking apply to every processor in the same patch and
+ * context, so a voice subpatch sleeps as a whole */
+static void
+proc_set_sleeping(mfp_processor * self, int sleeping)
+{
+    mfp_processor ** p;
+    int outlet_num;
+
+    if (self->context->procs == NULL) {
+        return;
+    }
+
+    for (p = (mfp_processor **)(self->context->procs->data); *p != NULL; p++) {
+        if ((*p)->patch_id != self->patch_id) {
+            continue;
+        }
+        (*p)->sleeping = sleeping;
+        (*p)->silent_blocks = 0;
+        if (sleeping) {
+            for (outlet_num = 0; outlet_num < (*p)->outlet_conn->len; outlet_num++) {
+                mfp_block_set_const((*p)->outlet_buf[outlet_num], 0);
+            }
+        }
+    }
+}
+
+/* put self's patch to sleep after its outlet 0 has been silent for
+ * blocks blocks in a row (an envelope or VCA output is the usual
+ * place).  0 turns autosleep off and wakes the patch */
+void
+mfp_proc_autosleep(mfp_processor * self, int blocks)
+{
+    self->sleep_blocks = (blocks > 0) ? blocks : 0;
+    self->silent_blocks = 0;
+    if (self->sleep_blocks == 0) {
+        mfp_proc_wake(self);
+    }
+}
+
+/* any request for a sleeping processor wakes its patch up */
+void
+mfp_proc_wake(mfp_processor * self)
+{
+    if (self->sleeping) {
+        proc_set_sleeping(self, 0);
+    }
+}
+
+/* called at the end of mfp_dsp_run.  Puts to sleep the patches of
+ * autosleep processors that have been silent long enough */
+void
+mfp_proc_sleep_idle(mfp_context * ctxt)
+{
+    mfp_processor ** p;
+
+    if ((atomic_exchange(&ctxt->sleep_requests, 0) == 0) || (ctxt->procs == NULL)) {
+        return;
+    }
+
+    for (p = (mfp_processor **)(ctxt->procs->data); *p != NULL; p++) {
+        if (((*p)->sleep_blocks > 0) && !(*p)->sleeping
+            && ((*p)->silent_blocks >= (*p)->sleep_blocks)) {
+            proc_set_sleeping(*p, 1);
+        }
+    }
+}
+
 
 void
 mfp_proc_destroy(mfp_processor * self)
 {
-    int procpos;
     int xlet_num;
     int conn_num;
     GArray * xlet_connlist;
@@ -266,20 +549,15 @@ mfp_proc_destroy(mfp_processor * self)
         }
     }
 
-    /* remove from global processor list */
-    for(procpos=0; procpos < mfp_proc_list->len; procpos++) {
-        if (g_array_index(mfp_proc_list, mfp_processor *, procpos) == self) {
-            g_array_remove_index(mfp_proc_list, procpos);
-            break;
-        }
-    }
+    /* remove from context processor list */
+    mfp_sched_remove_proc(self);
     g_hash_table_remove(mfp_proc_objects, GINT_TO_POINTER(self->rpc_id));
 
     self->typeinfo->destroy(self);
+    mfp_dsp_free_timed(self);
     g_hash_table_destroy(self->params);
 
     mfp_proc_free_buffers(self);
-    self->context->needs_reschedule = 1;
     g_free(self);
     return;
 }
@@ -336,7 +614,16 @@ mfp_proc_connect(mfp_processor * self, int my_outlet,
     xlets =  g_array_index(target->inlet_conn, GArray *, targ_inlet);
     g_array_append_val(xlets, targ_conn);
 
-    self->context->needs_reschedule = 1;
+    /* a shared block's lifetime was worked out without this reader, so
+     * go back to the processor's own until the next run order */
+    if (self->outlet_buf[my_outlet] != self->outlet_buf_own[my_outlet]) {
+        self->outlet_buf[my_outlet] = self->outlet_buf_own[my_outlet];
+        if (!self->active || self->sleeping) {
+            mfp_block_set_const(self->outlet_buf[my_outlet], 0);
+        }
+    }
+
+    mfp_sched_mark(target);
     return 0;
 }
 
@@ -389,8 +676,7 @@ mfp_proc_disconnect(mfp_processor * self, int my_outlet,
         }
     }
 
-
-    self->context->needs_reschedule = 1;
+    mfp_sched_mark(target);
     return 0;
 }
 
@@ -9,151 +9,616 @@
 
 #include <time.h>
 
-GArray      * incoming_cleanup = NULL;
-mfp_in_data * incoming_queue[REQ_BUFSIZE];
-int         incoming_queue_write = 0;
-int         incoming_queue_read = 0;
 pthread_mutex_t incoming_lock = PTHREAD_MUTEX_INITIALIZER;
 
-mfp_out_data outgoing_queue[REQ_BUFSIZE];
-int          outgoing_queue_write = 0;
-int          outgoing_queue_read = 0;
+/* each context has its own request ring (ctxt->requests, holding
+ * mfp_in_data *) so contexts can run in separate threads; the only
+ * consumer of a ring is the thread running that context.
+ * outgoing_queue holds mfp_out_data.  Rings are created with
+ * mfp_request_queue_size slots */
+int mfp_request_queue_size = REQ_BUFSIZE;
+mfp_ring * outgoing_queue = NULL;
+sem_t outgoing_sem;
 
-pthread_mutex_t outgoing_lock = PTHREAD_MUTEX_INITIALIZER;
-pthread_cond_t  outgoing_cond = PTHREAD_COND_INITIALIZER;
+/* when a request ring is full, the pushing thread sets
+ * request_space_wanted and waits on request_space_sem, which a DSP
+ * thread posts once it has taken requests off its ring */
+sem_t request_space_sem;
+static atomic_int request_space_wanted = 0;
 
-void
-mfp_dsp_push_request(mfp_in_data rd)
+/* timed setparams are applied by whichever thread processes their
+ * processor, so with mfp_dsp_threads there can be several at once
+ * retiring the values they replaced */
+static atomic_flag retire_lock = ATOMIC_FLAG_INIT;
+
+static void handle_request(mfp_in_data * cmd);
+
+static void
+cleanup_request(mfp_in_data * cmd)
 {
     int count;
-    int cleanup = 0;
-    gpointer newreq = g_malloc0(sizeof(mfp_in_data));
-    struct timespec shorttime;
 
-    shorttime.tv_sec = 0; shorttime.tv_nsec = 1000;
-    memcpy(newreq, &rd, sizeof(mfp_in_data));
+    if (cmd->reqtype == REQTYPE_SETPARAM) {
+        if (cmd->param_value != NULL) {
+            /* FIXME g_free broken for fltarrays */
+            switch(cmd->param_type) {
+                case PARAMTYPE_INT:
+                case PARAMTYPE_FLT:
+                case PARAMTYPE_STRING:
+                case PARAMTYPE_BOOL:
+                    g_free(cmd->param_value);
+                    break;
+                case PARAMTYPE_FLTARRAY:
+                    g_array_free((GArray *)cmd->param_value, TRUE);
+                    break;
+            }
+            cmd->param_value = NULL;
+        }
+        if (cmd->param_name != NULL) {
+            g_free(cmd->param_name);
+            cmd->param_name = NULL;
+        }
+    }
+    else if (cmd->reqtype == REQTYPE_BATCH) {
+        GArray * batch = (GArray *)cmd->param_value;
+        if (batch != NULL) {
+            for(count=0; count < batch->len; count++) {
+                cleanup_request(&g_array_index(batch, mfp_in_data, count));
+            }
+            g_array_free(batch, TRUE);
+            cmd->param_value = NULL;
+        }
+    }
+}
+
+/* the context of each processor, by rpc_id, for the thread pushing
+ * requests.  Only used with incoming_lock held, so routing a request
+ * never reads a processor that a DSP thread may be destroying */
+static GHashTable * request_routes = NULL;
 
-    /* note: this mutex just keeps a single writer thread with access
-     * to the requests data, it doesn't block the JACK callback thread */
+static void
+request_routes_init(void)
+{
+    if (request_routes == NULL) {
+        request_routes = g_hash_table_new(g_direct_hash, g_direct_equal);
+    }
+}
+
+/* route requests for proc to its context.  Processors made with
+ * mfp_proc_init are routed by their create request; this is for ones
+ * that skip it (mfp_proc_create) */
+void
+mfp_dsp_route_proc(mfp_processor * proc)
+{
     pthread_mutex_lock(&incoming_lock);
-    if (incoming_queue_read == incoming_queue_write) {
-        cleanup = 1;
+    request_routes_init();
+    g_hash_table_insert(request_routes, GINT_TO_POINTER(proc->rpc_id), proc->context);
+    pthread_mutex_unlock(&incoming_lock);
+}
+
+/* the context whose DSP thread has to handle this request, or NULL
+ * if it doesn't belong to any context.  Called with incoming_lock
+ * held */
+static mfp_context *
+request_context(mfp_in_data * rd)
+{
+    mfp_context * ctxt;
+
+    request_routes_init();
+
+    switch (rd->reqtype) {
+    case REQTYPE_CREATE:
+        /* the DSP thread doesn't have it yet, so it's safe to read */
+        ctxt = ((mfp_processor *)rd->param_value)->context;
+        g_hash_table_insert(request_routes, GINT_TO_POINTER(rd->src_proc), ctxt);
+        return ctxt;
+
+    case REQTYPE_EXTLOAD:
+        return NULL;
+
+    case REQTYPE_DESTROY:
+        ctxt = g_hash_table_lookup(request_routes, GINT_TO_POINTER(rd->src_proc));
+        g_hash_table_remove(request_routes, GINT_TO_POINTER(rd->src_proc));
+        return ctxt;
+
+    default:
+        return g_hash_table_lookup(request_routes, GINT_TO_POINTER(rd->src_proc));
     }
+}
+
+static gboolean
+route_in_context(gpointer key, gpointer value, gpointer ctxt)
+{
+    return value == ctxt;
+}
 
-    while((incoming_queue_read == 0 && incoming_queue_write == REQ_LASTIND)
-        || (incoming_queue_write + 1 == incoming_queue_read)) {
-        nanosleep(&shorttime, NULL);
+static void
+request_context_init(mfp_context * ctxt)
+{
+    if (ctxt->request_cleanup == NULL) {
+        ctxt->request_cleanup = g_array_new(TRUE, TRUE, sizeof(mfp_in_data *));
     }
+    if (ctxt->requests == NULL) {
+        ctxt->requests = mfp_ring_new(mfp_request_queue_size, sizeof(mfp_in_data *));
+    }
+    if (ctxt->request_retired == NULL) {
+        ctxt->request_retired = mfp_ring_new(mfp_request_queue_size, sizeof(mfp_in_data));
+    }
+}
 
-    incoming_queue[incoming_queue_write] = newreq;
-    if(incoming_queue_write == REQ_LASTIND) {
-        incoming_queue_write = 0;
+/* called with incoming_lock held */
+static void
+cleanup_retired(mfp_context * ctxt)
+{
+    mfp_in_data retired;
+
+    while (mfp_ring_pop(ctxt->request_retired, &retired)) {
+        cleanup_request(&retired);
     }
-    else {
-        incoming_queue_write += 1;
+}
+
+/* push to a ring that was full, once there's room.  The DSP thread
+ * wakes us when it takes requests off; the timeout covers a context
+ * that stops running meanwhile (and any wakeup that came early) */
+static void
+wait_request_space(mfp_context * ctxt, mfp_in_data ** newreq)
+{
+    struct timespec timeout;
+
+    while (1) {
+        atomic_store(&request_space_wanted, 1);
+        if (mfp_ring_try_push(ctxt->requests, newreq)) {
+            return;
+        }
+        clock_gettime(CLOCK_REALTIME, &timeout);
+        timeout.tv_nsec += 10000000;
+        if (timeout.tv_nsec >= 1000000000) {
+            timeout.tv_sec += 1;
+            timeout.tv_nsec -= 1000000000;
+        }
+        sem_timedwait(&request_space_sem, &timeout);
+    }
+}
+
+/* called with incoming_lock held */
+static void
+push_context_request(mfp_context * ctxt, mfp_in_data * rd)
+{
+    int count;
+    int cleanup = 0;
+    mfp_in_data * newreq;
+
+    if (ctxt == NULL) {
+        if (rd->reqtype == REQTYPE_EXTLOAD) {
+            /* nothing in a DSP thread can be using it, handle it here */
+            handle_request(rd);
+        }
+        else {
+            /* for a processor that's gone, or going: a DSP thread may
+             * still have it, so it can't be handled here */
+            mfp_log_debug("[request] dropped request type %d for processor %d",
+                          rd->reqtype, rd->src_proc);
+        }
+        cleanup_request(rd);
+        return;
+    }
+
+    request_context_init(ctxt);
+    cleanup_retired(ctxt);
+    newreq = g_malloc0(sizeof(mfp_in_data));
+    memcpy(newreq, rd, sizeof(mfp_in_data));
+
+    if (mfp_ring_count(ctxt->requests) == 0) {
+        cleanup = 1;
+    }
+
+    /* if the DSP thread is behind, wait for it rather than dropping the
+     * request.  The request is counted once in the ring's overflow
+     * stats, however long it waits */
+    if (!mfp_ring_push(ctxt->requests, &newreq)) {
+        wait_request_space(ctxt, &newreq);
     }
 
     if (cleanup == 1) {
-        /* now that JACK has finished with the new data, we can clean up
-         * the old data at our leisure.  mfp_dsp_handle_requests will
-         * put any old values that need to be freed into cmd.param_value */
-        for(count=0; count < incoming_cleanup->len; count++) {
-            mfp_in_data * cmd = g_array_index(incoming_cleanup, gpointer, count);
-            if (cmd->reqtype == REQTYPE_SETPARAM) {
-                if (cmd->param_value != NULL) {
-                    /* FIXME g_free broken for fltarrays */
-                    switch(cmd->param_type) {
-                        case PARAMTYPE_INT:
-                        case PARAMTYPE_FLT:
-                        case PARAMTYPE_STRING:
-                        case PARAMTYPE_BOOL:
-                            g_free(cmd->param_value);
-                            break;
-                        case PARAMTYPE_FLTARRAY:
-                            g_array_free((GArray *)cmd->param_value, TRUE);
-                            break;
-                    }
-                    cmd->param_value = NULL;
-                }
-                if (cmd->param_name != NULL) {
-                    g_free(cmd->param_name);
-                    cmd->param_name = NULL;
-                }
-            }
+        /* now that the DSP thread has finished with the new data, we
+         * can clean up the old data at our leisure.
+         * mfp_dsp_handle_requests will put any old values that need to
+         * be freed into cmd.param_value */
+        for(count=0; count < ctxt->request_cleanup->len; count++) {
+            mfp_in_data * cmd = g_array_index(ctxt->request_cleanup, gpointer, count);
+            cleanup_request(cmd);
             g_free(cmd);
         }
 
-        if (incoming_cleanup->len > 0)  {
-            g_array_set_size(incoming_cleanup, 0);
+        if (ctxt->request_cleanup->len > 0)  {
+            g_array_set_size(ctxt->request_cleanup, 0);
         }
     }
 
     /* we will clean this one up at some time in the future */
-    g_array_append_val(incoming_cleanup, newreq);
+    g_array_append_val(ctxt->request_cleanup, newreq);
+}
+
+/* a batch normally belongs to one context, but a host running several
+ * contexts can send one that spans them.  Split it so that each
+ * context gets its own part, still applied in a single block */
+static void
+push_batch_request(mfp_in_data * rd)
+{
+    GArray * batch = (GArray *)rd->param_value;
+    GHashTable * parts = g_hash_table_new(g_direct_hash, g_direct_equal);
+    GList * order = NULL;
+    GList * lp;
+    GArray * part;
+    mfp_in_data part_rd;
+    mfp_in_data * op;
+    mfp_context * ctxt;
+    int count;
+
+    for(count=0; count < batch->len; count++) {
+        op = &g_array_index(batch, mfp_in_data, count);
+        ctxt = request_context(op);
+        part = g_hash_table_lookup(parts, ctxt);
+        if (part == NULL) {
+            part = g_array_new(FALSE, TRUE, sizeof(mfp_in_data));
+            g_hash_table_insert(parts, ctxt, part);
+            order = g_list_append(order, ctxt);
+        }
+        g_array_append_val(part, *op);
+    }
+
+    /* the sub-requests now belong to the parts */
+    g_array_free(batch, TRUE);
 
+    for(lp = order; lp != NULL; lp = lp->next) {
+        memset(&part_rd, 0, sizeof(mfp_in_data));
+        part_rd.reqtype = REQTYPE_BATCH;
+        part_rd.param_value = g_hash_table_lookup(parts, lp->data);
+        push_context_request((mfp_context *)lp->data, &part_rd);
+    }
+
+    g_list_free(order);
+    g_hash_table_destroy(parts);
+}
+
+void
+mfp_dsp_push_request(mfp_in_data rd)
+{
+    /* note: this mutex just keeps a single writer thread with access
+     * to the requests data, it doesn't block the DSP threads */
+    pthread_mutex_lock(&incoming_lock);
+    if (rd.reqtype == REQTYPE_BATCH) {
+        push_batch_request(&rd);
+    }
+    else {
+        push_context_request(request_context(&rd), &rd);
+    }
     pthread_mutex_unlock(&incoming_lock);
 }
 
+/* requests that change the DSP graph have to wait while the scheduler
+ * thread is building a new run order */
+static int
+changes_graph(mfp_in_data * cmd)
+{
+    GArray * batch;
+    int count;
+
+    switch (cmd->reqtype) {
+    case REQTYPE_CREATE:
+    case REQTYPE_CONNECT:
+    case REQTYPE_DISCONNECT:
+    case REQTYPE_DESTROY:
+        return 1;
+
+    case REQTYPE_BATCH:
+        batch = (GArray *)cmd->param_value;
+        for(count=0; count < batch->len; count++) {
+            if (changes_graph(&g_array_index(batch, mfp_in_data, count))) {
+                return 1;
+            }
+        }
+        return 0;
+
+    default:
+        return 0;
+    }
+}
+
+/* keep a setparam for a later frame in the processor's timed_params,
+ * in frame order.  The copy takes over the name and value.  Returns 0
+ * if there's no room, and the caller should apply it now */
+static int
+defer_setparam(mfp_processor * proc, mfp_in_data * cmd)
+{
+    int pos = proc->timed_count;
+
+    if (proc->timed_count == MFP_TIMED_PARAMS) {
+        return 0;
+    }
+
+    while ((pos > 0) && (proc->timed_params[pos-1].frame > cmd->frame)) {
+        pos--;
+    }
+    memmove(proc->timed_params + pos + 1, proc->timed_params + pos,
+            (proc->timed_count - pos) * sizeof(mfp_in_data));
+    proc->timed_params[pos] = *cmd;
+    proc->timed_count++;
+
+    cmd->param_name = NULL;
+    cmd->param_value = NULL;
+    return 1;
+}
+
+/* queue a finished setparam's old name and value for the RPC side to
+ * free.  If the ring is full there's no choice but to free it here */
+static void
+retire_request(mfp_context * ctxt, mfp_in_data * event)
+{
+    int pushed = 0;
+
+    while (atomic_flag_test_and_set_explicit(&retire_lock, memory_order_acquire)) {
+    }
+    if (ctxt->request_retired != NULL) {
+        pushed = mfp_ring_push(ctxt->request_retired, event);
+    }
+    atomic_flag_clear_explicit(&retire_lock, memory_order_release);
+
+    if (!pushed) {
+        cleanup_request(event);
+    }
+}
+
+/* for processors that take a parameter out of proc->params on the DSP
+ * thread: free its name and value off the DSP thread.  Either may be
+ * NULL */
 void
-mfp_dsp_handle_requests(void)
-{
-    while(incoming_queue_read != incoming_queue_write) {
-        mfp_in_data * cmd = incoming_queue[incoming_queue_read];
-        mfp_processor * src_proc, * dest_proc;
-        int type = cmd->reqtype;
-
-        switch (type) {
-        case REQTYPE_CONNECT:
-            src_proc = mfp_proc_lookup(cmd->src_proc);
-            dest_proc = mfp_proc_lookup(cmd->dest_proc);
-            if (src_proc != NULL && dest_proc != NULL)
-                mfp_proc_connect(src_proc, cmd->src_port, dest_proc, cmd->dest_port);
-            break;
+mfp_dsp_retire_param(mfp_processor * proc, char * param_name, int param_type,
+                     void * param_value)
+{
+    mfp_in_data event;
 
-        case REQTYPE_DISCONNECT:
-            src_proc = mfp_proc_lookup(cmd->src_proc);
-            dest_proc = mfp_proc_lookup(cmd->dest_proc);
-            if (src_proc != NULL && dest_proc != NULL)
-                mfp_proc_disconnect(src_proc, cmd->src_port, dest_proc, cmd->dest_port);
-            break;
+    memset(&event, 0, sizeof(mfp_in_data));
+    event.reqtype = REQTYPE_SETPARAM;
+    event.param_name = param_name;
+    event.param_type = param_type;
+    event.param_value = param_value;
+    retire_request(proc->context, &event);
+}
 
-        case REQTYPE_DESTROY:
-            src_proc = mfp_proc_lookup(cmd->src_proc);
-            if (src_proc != NULL)
-                mfp_proc_destroy(src_proc);
-            break;
+/* apply the timed setparams of proc for frames before until.  The
+ * values they replace go on the context's retired ring, to be freed
+ * by the thread pushing requests.  Returns the number applied */
+int
+mfp_dsp_apply_timed(mfp_processor * proc, gint64 until)
+{
+    mfp_in_data * event;
+    int count = 0;
+
+    while ((count < proc->timed_count) && (proc->timed_params[count].frame < until)) {
+        event = proc->timed_params + count;
+        mfp_proc_setparam_req(proc, event);
+        retire_request(proc->context, event);
+        count++;
+    }
+
+    if (count > 0) {
+        proc->timed_count -= count;
+        memmove(proc->timed_params, proc->timed_params + count,
+                proc->timed_count * sizeof(mfp_in_data));
+        proc->needs_config = 1;
+    }
+    return count;
+}
+
+/* drop the timed setparams of a processor that is going away */
+void
+mfp_dsp_free_timed(mfp_processor * proc)
+{
+    int count;
+
+    for(count=0; count < proc->timed_count; count++) {
+        cleanup_request(proc->timed_params + count);
+    }
+    g_free(proc->timed_params);
+    proc->timed_params = NULL;
+    proc->timed_count = 0;
+}
+
+static void
+handle_request(mfp_in_data * cmd)
+{
+    mfp_processor * src_proc, * dest_proc;
+    GArray * batch;
+    int count;
+
+    switch (cmd->reqtype) {
+    case REQTYPE_CREATE:
+        mfp_proc_add((mfp_processor *)cmd->param_value);
+        break;
 
-        case REQTYPE_SETPARAM:
-            src_proc = mfp_proc_lookup(cmd->src_proc);
-            if (src_proc != NULL) {
+    case REQTYPE_CONNECT:
+        src_proc = mfp_proc_lookup(cmd->src_proc);
+        dest_proc = mfp_proc_lookup(cmd->dest_proc);
+        if (src_proc != NULL && dest_proc != NULL)
+            mfp_proc_connect(src_proc, cmd->src_port, dest_proc, cmd->dest_port);
+        break;
+
+    case REQTYPE_DISCONNECT:
+        src_proc = mfp_proc_lookup(cmd->src_proc);
+        dest_proc = mfp_proc_lookup(cmd->dest_proc);
+        if (src_proc != NULL && dest_proc != NULL)
+            mfp_proc_disconnect(src_proc, cmd->src_port, dest_proc, cmd->dest_port);
+        break;
+
+    case REQTYPE_DESTROY:
+        src_proc = mfp_proc_lookup(cmd->src_proc);
+        if (src_proc != NULL)
+            mfp_proc_destroy(src_proc);
+        break;
+
+    case REQTYPE_SETPARAM:
+        src_proc = mfp_proc_lookup(cmd->src_proc);
+        if (src_proc != NULL) {
+            mfp_proc_wake(src_proc);
+            if ((cmd->frame <= src_proc->context->frame_count)
+                || !defer_setparam(src_proc, cmd)) {
                 mfp_proc_setparam_req(src_proc, cmd);
                 src_proc->needs_config = 1;
             }
-            break;
+        }
+        break;
 
-        case REQTYPE_GETPARAM:
-            printf("FIXME: getparam unimplemented\n");
-            break;
+    case REQTYPE_GETPARAM:
+        printf("FIXME: getparam unimplemented\n");
+        break;
 
-        case REQTYPE_RESET:
-            printf("FIXME: reset unimplemented\n");
-            break;
+    case REQTYPE_RESET:
+        src_proc = mfp_proc_lookup(cmd->src_proc);
+        if (src_proc != NULL) {
+            mfp_proc_wake(src_proc);
+            mfp_proc_reset(src_proc);
+        }
+        break;
+
+    case REQTYPE_ACTIVATE:
+        src_proc = mfp_proc_lookup(cmd->src_proc);
+        if (src_proc != NULL) {
+            if (cmd->src_port) {
+                mfp_proc_wake(src_proc);
+            }
+            mfp_proc_activate(src_proc, cmd->src_port);
+        }
+        break;
+
+    case REQTYPE_AUTOSLEEP:
+        src_proc = mfp_proc_lookup(cmd->src_proc);
+        if (src_proc != NULL)
+            mfp_proc_autosleep(src_proc, cmd->src_port);
+        break;
 
-        case REQTYPE_EXTLOAD:
-            mfp_ext_init((mfp_extinfo *)cmd->param_value);
+    case REQTYPE_EXTLOAD:
+        mfp_ext_init((mfp_extinfo *)cmd->param_value);
+        break;
+
+    case REQTYPE_BATCH:
+        /* sub-requests are applied in order, all before the next
+         * block is processed */
+        batch = (GArray *)cmd->param_value;
+        for(count=0; count < batch->len; count++) {
+            handle_request(&g_array_index(batch, mfp_in_data, count));
+        }
+        break;
+    }
+}
+
+/* handle the queued requests for one context.  Called only from the
+ * thread running that context */
+void
+mfp_dsp_handle_requests(mfp_context * ctxt)
+{
+    mfp_in_data * cmd;
+    int handled = 0;
+
+    if (ctxt->requests == NULL) {
+        return;
+    }
+
+    /* the slot isn't released until the request has been handled, so
+     * mfp_dsp_push_request can't clean it up out from under us */
+    while(mfp_ring_peek(ctxt->requests, &cmd)) {
+        if (mfp_sched_busy(ctxt) && changes_graph(cmd)) {
             break;
         }
-        incoming_queue_read = (incoming_queue_read+1) % REQ_BUFSIZE;
+        handle_request(cmd);
+        mfp_ring_advance(ctxt->requests);
+        handled++;
+    }
+
+    /* there's room now for a push that found the ring full */
+    if ((handled > 0) && atomic_exchange(&request_space_wanted, 0)) {
+        sem_post(&request_space_sem);
     }
 }
 
+/* release the request ring of a context that is going away.  Nothing
+ * may be running the context any more */
+void
+mfp_dsp_free_requests(mfp_context * ctxt)
+{
+    mfp_in_data * cmd;
+    int count;
+
+    pthread_mutex_lock(&incoming_lock);
+    if (ctxt->request_cleanup != NULL) {
+        for(count=0; count < ctxt->request_cleanup->len; count++) {
+            cmd = g_array_index(ctxt->request_cleanup, gpointer, count);
+            cleanup_request(cmd);
+            g_free(cmd);
+        }
+        g_array_free(ctxt->request_cleanup, TRUE);
+        ctxt->request_cleanup = NULL;
+    }
+    if (ctxt->requests != NULL) {
+        mfp_ring_free(ctxt->requests);
+        ctxt->requests = NULL;
+    }
+    if (ctxt->request_retired != NULL) {
+        cleanup_retired(ctxt);
+        mfp_ring_free(ctxt->request_retired);
+        ctxt->request_retired = NULL;
+    }
+    if (request_routes != NULL) {
+        g_hash_table_foreach_remove(request_routes, route_in_context, ctxt);
+    }
+    pthread_mutex_unlock(&incoming_lock);
+}
+
+/* request ring stats summed over all contexts, in the same layout as
+ * mfp_ring_stats: capacity of one ring, largest current fill, largest
+ * high water mark, total overflows */
+void
+mfp_dsp_request_stats(mfp_rpc_args * arglist)
+{
+    GHashTableIter iter;
+    gpointer key, value;
+    mfp_ring * ring;
+    int capacity = mfp_request_queue_size;
+    int count = 0, high_water = 0, overflows = 0;
+
+    pthread_mutex_lock(&incoming_lock);
+    g_hash_table_iter_init(&iter, mfp_contexts);
+    while (g_hash_table_iter_next(&iter, &key, &value)) {
+        ring = ((mfp_context *)value)->requests;
+        if (ring == NULL) {
+            continue;
+        }
+        capacity = ring->capacity;
+        count = MAX(count, mfp_ring_count(ring));
+        high_water = MAX(high_water,
+            atomic_load_explicit(&ring->high_water, memory_order_relaxed));
+        overflows += atomic_load_explicit(&ring->overflows, memory_order_relaxed);
+    }
+    pthread_mutex_unlock(&incoming_lock);
+
+    mfp_rpc_args_append_int(arglist, capacity);
+    mfp_rpc_args_append_int(arglist, count);
+    mfp_rpc_args_append_int(arglist, high_water);
+    mfp_rpc_args_append_int(arglist, overflows);
+}
+
 void
 mfp_dsp_send_response_str(mfp_processor * proc, int msg_type, char * response)
 {
-    char * msgbuf = mfp_comm_get_buffer();
+    char * msgbuf;
     int msglen = 0;
     char tbuf[MFP_MAX_MSGSIZE];
 
+    if (mfp_response_push(proc->rpc_id, msg_type, RESPONSE_STR, 0, response) >= 0) {
+        return;
+    }
+
+    msgbuf = mfp_comm_get_buffer();
     snprintf(tbuf, MFP_MAX_MSGSIZE, "\"%s\"", response);
     mfp_api_dsp_response(proc->rpc_id, tbuf, msg_type, msgbuf, &msglen);
     mfp_comm_submit_buffer(msgbuf, msglen);
@@ -162,9 +627,15 @@ mfp_dsp_send_response_str(mfp_processor * proc, int msg_type, char * response)
 void
 mfp_dsp_send_response_bool(mfp_processor * proc, int msg_type, int response)
 {
-    char * msgbuf = mfp_comm_get_buffer();
+    char * msgbuf;
     int msglen = 0;
     char tbuf[MFP_MAX_MSGSIZE];
+
+    if (mfp_response_push(proc->rpc_id, msg_type, RESPONSE_INT, response, NULL) >= 0) {
+        return;
+    }
+
+    msgbuf = mfp_comm_get_buffer();
     snprintf(tbuf, MFP_MAX_MSGSIZE, "%d", response);
     mfp_api_dsp_response(proc->rpc_id, tbuf, msg_type, msgbuf, &msglen);
     mfp_comm_submit_buffer(msgbuf, msglen);
@@ -173,9 +644,15 @@ mfp_dsp_send_response_bool(mfp_processor * proc, int msg_type, int response)
 void
 mfp_dsp_send_response_int(mfp_processor * proc, int msg_type, int response)
 {
-    char * msgbuf = mfp_comm_get_buffer();
+    char * msgbuf;
     int msglen = 0;
     char tbuf[MFP_MAX_MSGSIZE];
+
+    if (mfp_response_push(proc->rpc_id, msg_type, RESPONSE_INT, response, NULL) >= 0) {
+        return;
+    }
+
+    msgbuf = mfp_comm_get_buffer();
     snprintf(tbuf, MFP_MAX_MSGSIZE, "%d", response);
     mfp_api_dsp_response(proc->rpc_id, tbuf, msg_type, msgbuf, &msglen);
     mfp_comm_submit_buffer(msgbuf, msglen);
@@ -184,9 +661,15 @@ mfp_dsp_send_response_int(mfp_processor * proc, int msg_type, int response)
 void
 mfp_dsp_send_response_float(mfp_processor * proc, int msg_type, double response)
 {
-    char * msgbuf = mfp_comm_get_buffer();
+    char * msgbuf;
     int msglen = 0;
     char tbuf[MFP_MAX_MSGSIZE];
+
+    if (mfp_response_push(proc->rpc_id, msg_type, RESPONSE_FLOAT, response, NULL) >= 0) {
+        return;
+    }
+
+    msgbuf = mfp_comm_get_buffer();
     snprintf(tbuf, MFP_MAX_MSGSIZE, "%f", response);
     mfp_api_dsp_response(proc->rpc_id, tbuf, msg_type, msgbuf, &msglen);
     mfp_comm_submit_buffer(msgbuf, msglen);
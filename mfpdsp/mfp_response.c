@@ -0,0 +1,175 @@
+#include <glib.h>
+#include <stdio.h>
+#include <string.h>
+#include <unistd.h>
+#include <fcntl.h>
+#include <semaphore.h>
+#include <stdatomic.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+
+#include "mfp_dsp.h"
+
+/*
+ * Responses from DSP processors (mfp_dsp_send_response_*) go to the
+ * Python side through a ring of fixed-size records in POSIX shared
+ * memory, /mfp_response_<pid>, instead of one RPC message each.  A
+ * string response takes a record and as many more as its bytes need.
+ *
+ * Any DSP or RPC thread can respond, so producers take turns with a
+ * spin lock held only for the copy.  There is one reader, which
+ * advances tail.  After publishing head, a producer looks at tail; if
+ * the reader had caught up to the record before, it may be asleep, so
+ * the producer posts the /mfp_response_<pid> semaphore.  The reader
+ * does the mirror image: store tail, then look at head again before
+ * it waits.  Both are seq_cst, so one of them sees the other.
+ *
+ * Until the reader sets reader_pid, mfp_response_push returns -1 and
+ * responses go over the socket as before.
+ *
+ * Float responses are levels and values, where only the latest
+ * matters, so when the reader falls behind they are dropped first:
+ * they can't use the last MFP_RESPONSE_EVENT_RESERVE records.  Int and
+ * string responses are events (triggered, loop start, end of file...)
+ * and are never dropped.  If even the reserve is full, or a string is
+ * too long for the ring, they go over the socket instead.
+ */
+
+mfp_response_header * mfp_response_ring = NULL;
+
+static char response_shm_id[64];
+static sem_t * response_sem = SEM_FAILED;
+static size_t response_size = 0;
+static atomic_flag response_lock = ATOMIC_FLAG_INIT;
+
+int
+mfp_response_init(void)
+{
+    int fd;
+    void * page;
+
+    if (mfp_response_ring != NULL) {
+        return 1;
+    }
+
+    snprintf(response_shm_id, 64, "/mfp_response_%05d", (int)getpid());
+    response_size = sizeof(mfp_response_header)
+        + MFP_RESPONSE_RING_SIZE * sizeof(mfp_response_record);
+
+    response_sem = sem_open(response_shm_id, O_CREAT, S_IRUSR|S_IWUSR, 0);
+    if (response_sem == SEM_FAILED) {
+        mfp_log_warning("Can't open semaphore %s, responses go by RPC", response_shm_id);
+        return 0;
+    }
+
+    fd = shm_open(response_shm_id, O_RDWR|O_CREAT, S_IRUSR|S_IWUSR);
+    if (fd > -1) {
+        if (ftruncate(fd, response_size) == 0) {
+            page = mmap(NULL, response_size, PROT_READ|PROT_WRITE, MAP_SHARED, fd, 0);
+            if (page != MAP_FAILED) {
+                close(fd);
+                memset(page, 0, response_size);
+                mfp_response_ring = (mfp_response_header *)page;
+                mfp_response_ring->capacity = MFP_RESPONSE_RING_SIZE;
+                mfp_response_ring->record_size = sizeof(mfp_response_record);
+                return 1;
+            }
+        }
+        close(fd);
+        shm_unlink(response_shm_id);
+    }
+
+    mfp_log_warning("Can't share %s, responses go by RPC", response_shm_id);
+    sem_close(response_sem);
+    sem_unlink(response_shm_id);
+    response_sem = SEM_FAILED;
+    return 0;
+}
+
+void
+mfp_response_finish(void)
+{
+    if (mfp_response_ring == NULL) {
+        return;
+    }
+
+    munmap(mfp_response_ring, response_size);
+    mfp_response_ring = NULL;
+    shm_unlink(response_shm_id);
+    sem_close(response_sem);
+    sem_unlink(response_shm_id);
+    response_sem = SEM_FAILED;
+}
+
+/* returns 1 if the response was queued, 0 if it's a float response
+ * and the ring is full (it's dropped and counted in overflows), -1 if
+ * it should be sent by RPC: there's no reader yet, or it's an event
+ * that doesn't fit */
+int
+mfp_response_push(int proc_id, int resp_type, int value_type,
+                  double value, const char * str)
+{
+    mfp_response_header * ring = mfp_response_ring;
+    mfp_response_record * records;
+    mfp_response_record * rec;
+    unsigned int head, tail, slots = 1;
+    unsigned int room;
+    int length = 0;
+    int offset, chunk;
+
+    if ((ring == NULL) || (atomic_load(&ring->reader_pid) == 0)) {
+        return -1;
+    }
+
+    if (value_type == RESPONSE_STR) {
+        length = strlen(str);
+        if (length > MFP_RESPONSE_STR_MAX) {
+            return -1;
+        }
+        slots += (length + sizeof(mfp_response_record) - 1) / sizeof(mfp_response_record);
+    }
+
+    records = (mfp_response_record *)(ring + 1);
+
+    while (atomic_flag_test_and_set_explicit(&response_lock, memory_order_acquire)) {
+    }
+
+    head = atomic_load_explicit(&ring->head, memory_order_relaxed);
+    tail = atomic_load_explicit(&ring->tail, memory_order_acquire);
+    room = ring->capacity;
+    if (value_type == RESPONSE_FLOAT) {
+        room -= MFP_RESPONSE_EVENT_RESERVE;
+    }
+    if (head + slots - tail > room) {
+        atomic_flag_clear_explicit(&response_lock, memory_order_release);
+        if (value_type != RESPONSE_FLOAT) {
+            return -1;
+        }
+        atomic_fetch_add_explicit(&ring->overflows, 1, memory_order_relaxed);
+        return 0;
+    }
+
+    rec = records + (head % ring->capacity);
+    rec->proc_id = proc_id;
+    rec->resp_type = resp_type;
+    rec->value_type = value_type;
+    rec->length = length;
+    rec->value = value;
+
+    /* the string's bytes run on through the following records,
+     * wrapping at the end of the ring like they do */
+    for (offset = 0; offset < length; offset += chunk) {
+        chunk = MIN(length - offset, sizeof(mfp_response_record));
+        rec = records + ((head + 1 + offset / sizeof(mfp_response_record)) % ring->capacity);
+        memcpy(rec, str + offset, chunk);
+    }
+
+    atomic_store(&ring->head, head + slots);
+    tail = atomic_load(&ring->tail);
+    atomic_flag_clear_explicit(&response_lock, memory_order_release);
+
+    if (tail == head) {
+        sem_post(response_sem);
+    }
+    return 1;
+}
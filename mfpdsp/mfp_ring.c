@@ -0,0 +1,139 @@
+#include <glib.h>
+#include <string.h>
+#include <stdatomic.h>
+
+#include "mfp_dsp.h"
+
+/*
+ * mfp_ring is a single-producer, single-consumer ring of fixed-size
+ * elements.  The producer only writes "write" and the consumer only
+ * writes "read", so neither side ever takes a lock; the acquire/release
+ * pairs make sure the element data is visible before the index that
+ * publishes it.
+ *
+ * Indices increase without wrapping to the capacity (which is rounded
+ * up to a power of 2), so write - read is always the fill level.
+ */
+
+mfp_ring *
+mfp_ring_new(int capacity, int eltsize)
+{
+    mfp_ring * ring = g_malloc0(sizeof(mfp_ring));
+    unsigned int size = 2;
+
+    while (size < capacity) {
+        size <<= 1;
+    }
+
+    ring->capacity = size;
+    ring->mask = size - 1;
+    ring->eltsize = eltsize;
+    ring->data = g_malloc0(size * eltsize);
+
+    atomic_init(&ring->read, 0);
+    atomic_init(&ring->write, 0);
+    atomic_init(&ring->overflows, 0);
+    atomic_init(&ring->high_water, 0);
+    return ring;
+}
+
+void
+mfp_ring_free(mfp_ring * ring)
+{
+    g_free(ring->data);
+    g_free(ring);
+}
+
+/* returns 1 if the element was queued, 0 if the ring is full.  A
+ * full ring counts as an overflow */
+int
+mfp_ring_push(mfp_ring * ring, const void * elt)
+{
+    if (mfp_ring_try_push(ring, elt)) {
+        return 1;
+    }
+    atomic_fetch_add_explicit(&ring->overflows, 1, memory_order_relaxed);
+    return 0;
+}
+
+/* mfp_ring_push without counting a full ring, for retrying an element
+ * whose overflow has already been counted */
+int
+mfp_ring_try_push(mfp_ring * ring, const void * elt)
+{
+    unsigned int write = atomic_load_explicit(&ring->write, memory_order_relaxed);
+    unsigned int read = atomic_load_explicit(&ring->read, memory_order_acquire);
+    unsigned int count = write - read;
+
+    if (count >= ring->capacity) {
+        return 0;
+    }
+
+    memcpy(ring->data + (write & ring->mask) * ring->eltsize, elt, ring->eltsize);
+    atomic_store_explicit(&ring->write, write + 1, memory_order_release);
+
+    count += 1;
+    if (count > atomic_load_explicit(&ring->high_water, memory_order_relaxed)) {
+        atomic_store_explicit(&ring->high_water, count, memory_order_relaxed);
+    }
+    return 1;
+}
+
+/* returns 1 if the oldest element was copied to elt, 0 if the ring
+ * is empty.  The slot stays owned by the consumer until
+ * mfp_ring_advance() */
+int
+mfp_ring_peek(mfp_ring * ring, void * elt)
+{
+    unsigned int read = atomic_load_explicit(&ring->read, memory_order_relaxed);
+    unsigned int write = atomic_load_explicit(&ring->write, memory_order_acquire);
+
+    if (read == write) {
+        return 0;
+    }
+
+    memcpy(elt, ring->data + (read & ring->mask) * ring->eltsize, ring->eltsize);
+    return 1;
+}
+
+void
+mfp_ring_advance(mfp_ring * ring)
+{
+    unsigned int read = atomic_load_explicit(&ring->read, memory_order_relaxed);
+    atomic_store_explicit(&ring->read, read + 1, memory_order_release);
+}
+
+int
+mfp_ring_pop(mfp_ring * ring, void * elt)
+{
+    if (mfp_ring_peek(ring, elt)) {
+        mfp_ring_advance(ring);
+        return 1;
+    }
+    return 0;
+}
+
+int
+mfp_ring_count(mfp_ring * ring)
+{
+    unsigned int read = atomic_load_explicit(&ring->read, memory_order_acquire);
+    unsigned int write = atomic_load_explicit(&ring->write, memory_order_acquire);
+    return write - read;
+}
+
+int
+mfp_ring_full(mfp_ring * ring)
+{
+    return mfp_ring_count(ring) >= ring->capacity;
+}
+
+void
+mfp_ring_stats(mfp_ring * ring, mfp_rpc_args * arglist)
+{
+    mfp_rpc_args_append_int(arglist, ring->capacity);
+    mfp_rpc_args_append_int(arglist, mfp_ring_count(ring));
+    mfp_rpc_args_append_int(arglist,
+        atomic_load_explicit(&ring->high_water, memory_order_relaxed));
+    mfp_rpc_args_append_int(arglist,
+        atomic_load_explicit(&ring->overflows, memory_order_relaxed));
+}
@@ -157,53 +157,67 @@ init_param_helper(const gchar * key, Carp__PythonValue * val, gpointer udata)
 }
 
 
-void
-dispatch_create(Carp__PythonArray * args, Carp__PythonDict * kwargs, Carp__PythonValue * response)
+/* allocate the processor for a create, from [rpc_id, typename,
+ * num_inlets, num_outlets, createprms, ctxt_id, patch_id], with its
+ * parameters set.  NULL if the type or context isn't known */
+static mfp_processor *
+create_proc(Carp__PythonValue ** items, int n_items)
 {
     int num_inlets, num_outlets;
     int ctxt_id;
-    int rpc_id, patch_id;
     mfp_procinfo * pinfo;
     mfp_processor * proc;
     mfp_context * ctxt;
     Carp__PythonDict * createprms;
-    const char * typename = args->items[1]->_string;
-    pinfo = (mfp_procinfo *)g_hash_table_lookup(mfp_proc_registry, typename);
+    const char * typename;
+
+    if (n_items < 7) {
+        mfp_log_debug("[create] expected 7 arguments, got %d\n", n_items);
+        return NULL;
+    }
 
+    typename = items[1]->_string;
+    pinfo = (mfp_procinfo *)g_hash_table_lookup(mfp_proc_registry, typename);
     if (pinfo == NULL) {
         mfp_log_debug("[create] could not find type info for type '%s'\n", typename);
-        return;
+        return NULL;
     }
-    else {
-        rpc_id = (int)args->items[0]->_int;
-        num_inlets = (int)args->items[2]->_int;
-        num_outlets = (int)args->items[3]->_int;
-        createprms = args->items[4]->_dict;
-        ctxt_id = (int)args->items[5]->_int;
-        patch_id = (int)args->items[6]->_int;
-
-        ctxt = (mfp_context *)g_hash_table_lookup(mfp_contexts, GINT_TO_POINTER(ctxt_id));
-        if (ctxt == NULL) {
-            mfp_log_debug("[create] cannot find context %d\n", ctxt_id);
-            return;
-        }
 
-        proc = mfp_proc_alloc(pinfo, num_inlets, num_outlets, ctxt);
+    num_inlets = (int)items[2]->_int;
+    num_outlets = (int)items[3]->_int;
+    createprms = items[4]->_dict;
+    ctxt_id = (int)items[5]->_int;
 
-        for(int prm=0; prm < createprms->n_items; prm++) {
-            init_param_helper(
-                createprms->items[prm]->key->_string,
-                createprms->items[prm]->value,
-                (gpointer)proc
-            );
+    ctxt = (mfp_context *)g_hash_table_lookup(mfp_contexts, GINT_TO_POINTER(ctxt_id));
+    if (ctxt == NULL) {
+        mfp_log_debug("[create] cannot find context %d\n", ctxt_id);
+        return NULL;
+    }
 
-        }
-        mfp_proc_init(proc, rpc_id, patch_id);
-        response->value_types_case = CARP__PYTHON_VALUE__VALUE_TYPES__INT;
-        response->_int = proc->rpc_id;
+    proc = mfp_proc_alloc(pinfo, num_inlets, num_outlets, ctxt);
 
+    for(int prm=0; createprms != NULL && prm < createprms->n_items; prm++) {
+        init_param_helper(
+            createprms->items[prm]->key->_string,
+            createprms->items[prm]->value,
+            (gpointer)proc
+        );
+    }
+    return proc;
+}
+
+void
+dispatch_create(Carp__PythonArray * args, Carp__PythonDict * kwargs, Carp__PythonValue * response)
+{
+    mfp_processor * proc = create_proc(args->items, args->n_items);
+
+    if (proc == NULL) {
         return;
     }
+
+    mfp_proc_init(proc, (int)args->items[0]->_int, (int)args->items[6]->_int);
+    response->value_types_case = CARP__PYTHON_VALUE__VALUE_TYPES__INT;
+    response->_int = proc->rpc_id;
 }
 
 
@@ -310,6 +324,130 @@ mfp_rpc_wait(int request_id)
 }
 
 
+/* build_request results */
+#define BUILD_OK 1
+#define BUILD_UNHANDLED 0
+#define BUILD_NO_PROC -1
+
+/* fill in a request struct for one of the queued DSPObject methods.
+ * returns BUILD_UNHANDLED if the method isn't one that goes through
+ * the request queue, and BUILD_NO_PROC if it needs the processor and
+ * there isn't one */
+static int
+build_request(const char * method, int obj_id, Carp__PythonValue ** items, int n_items,
+              mfp_in_data * rd)
+{
+    mfp_processor * src_proc;
+
+    memset(rd, 0, sizeof(mfp_in_data));
+    rd->src_proc = obj_id;
+
+    if(!strcmp(method, "connect")) {
+        rd->reqtype = REQTYPE_CONNECT;
+        rd->src_port = items[0]->_int;
+        rd->dest_proc = items[1]->_int;
+        rd->dest_port = items[2]->_int;
+    }
+    else if (!strcmp(method, "disconnect")) {
+        rd->reqtype = REQTYPE_DISCONNECT;
+        rd->src_port = items[0]->_int;
+        rd->dest_proc = items[1]->_int;
+        rd->dest_port = items[2]->_int;
+    }
+    else if (!strcmp(method, "setparam")) {
+        src_proc = mfp_proc_lookup(obj_id);
+        if (src_proc == NULL) {
+            return BUILD_NO_PROC;
+        }
+        rd->reqtype = REQTYPE_SETPARAM;
+        rd->param_name = g_strdup(items[0]->_string);
+        rd->param_type = mfp_proc_param_type(src_proc, rd->param_name);
+        rd->param_value = (gpointer)extract_param_value(
+            src_proc, rd->param_name, items[1]
+        );
+        /* setparam(param, value, frame) waits for that context frame */
+        if (n_items > 2) {
+            rd->frame = items[2]->_int;
+        }
+    }
+    else if (!strcmp(method, "delete")) {
+        rd->reqtype = REQTYPE_DESTROY;
+    }
+    else if (!strcmp(method, "reset")) {
+        rd->reqtype = REQTYPE_RESET;
+    }
+    else if (!strcmp(method, "activate")) {
+        rd->reqtype = REQTYPE_ACTIVATE;
+        rd->src_port = items[0]->_int;
+    }
+    else if (!strcmp(method, "autosleep")) {
+        rd->reqtype = REQTYPE_AUTOSLEEP;
+        rd->src_port = items[0]->_int;
+    }
+    else {
+        return BUILD_UNHANDLED;
+    }
+    return BUILD_OK;
+}
+
+static void
+log_build_error(const char * where, int result, const char * method, int obj_id)
+{
+    if (result == BUILD_NO_PROC) {
+        mfp_log_debug("[%s] %s: no processor with id %d", where, method, obj_id);
+    }
+    else {
+        mfp_log_debug("[%s] unhandled method '%s'", where, method);
+    }
+}
+
+/* DSPObject.post(ops): each op is [method, obj_id, *args].  The whole
+ * batch takes one slot in the request queue and is applied in a single
+ * DSP cycle.  post has no reply, so the Python side doesn't wait a
+ * round trip for it.
+ *
+ * A "create" op takes the DSPObject constructor's arguments, with the
+ * obj_id picked by the Python side.  The processor is set up here, so
+ * later ops in the batch can find it, and added to its context in
+ * order with the rest of the batch */
+static void
+dispatch_batch(Carp__PythonArray * ops)
+{
+    mfp_in_data rd;
+    mfp_in_data op_rd;
+    int result;
+    GArray * batch = g_array_sized_new(FALSE, TRUE, sizeof(mfp_in_data), ops->n_items);
+
+    for(int i=0; i < ops->n_items; i++) {
+        Carp__PythonArray * op = ops->items[i]->_array;
+        if (op == NULL || op->n_items < 2) {
+            continue;
+        }
+        if (!strcmp(op->items[0]->_string, "create")) {
+            mfp_processor * proc = create_proc(op->items + 1, op->n_items - 1);
+            if (proc != NULL) {
+                mfp_proc_init_request(proc, (int)op->items[1]->_int,
+                                      (int)op->items[7]->_int, &op_rd);
+                g_array_append_val(batch, op_rd);
+            }
+            continue;
+        }
+        result = build_request(op->items[0]->_string, op->items[1]->_int, op->items + 2,
+                               op->n_items - 2, &op_rd);
+        if (result == BUILD_OK) {
+            g_array_append_val(batch, op_rd);
+        }
+        else {
+            log_build_error("batch", result, op->items[0]->_string, op->items[1]->_int);
+        }
+    }
+
+    memset(&rd, 0, sizeof(mfp_in_data));
+    rd.reqtype = REQTYPE_BATCH;
+    rd.param_value = (gpointer)batch;
+    mfp_dsp_push_request(rd);
+}
+
 static void *
 dispatch_methodcall(
     const char * service_name,
@@ -319,26 +457,11 @@ dispatch_methodcall(
     Carp__PythonValue * rval)
 {
     mfp_in_data rd;
+    int result;
     void * to_free = NULL;
+    const char * method = service_name + strlen("DSPObject.");
 
-    if(!strcmp(service_name, "DSPObject.connect")) {
-        rd.reqtype = REQTYPE_CONNECT;
-        rd.src_proc = obj_id;
-        rd.src_port = args->items[0]->_int;
-        rd.dest_proc = args->items[1]->_int;
-        rd.dest_port = args->items[2]->_int;
-        mfp_dsp_push_request(rd);
-    }
-    else if (!strcmp(service_name, "DSPObject.disconnect")) {
-        rd.reqtype = REQTYPE_DISCONNECT;
-        rd.src_proc = obj_id;
-        rd.src_port = args->items[0]->_int;
-        rd.dest_proc = args->items[1]->_int;
-        rd.dest_port = args->items[2]->_int;
-
-        mfp_dsp_push_request(rd);
-    }
-    else if (!strcmp(service_name, "DSPObject.getparam")) {
+    if (!strcmp(method, "getparam")) {
         mfp_processor * src_proc = mfp_proc_lookup(obj_id);
         const char * param_name = g_strdup(args->items[0]->_string);
         const void * param_value = g_hash_table_lookup(src_proc->params, param_name);
@@ -346,29 +469,77 @@ dispatch_methodcall(
             src_proc, param_name, param_value, rval
         );
     }
-    else if (!strcmp(service_name, "DSPObject.setparam")) {
-        mfp_processor * src_proc = mfp_proc_lookup(obj_id);
-        rd.reqtype = REQTYPE_SETPARAM;
-        rd.src_proc = obj_id;
-        rd.param_name = g_strdup(args->items[0]->_string);
-        rd.param_type = mfp_proc_param_type(src_proc, rd.param_name);
-        rd.param_value = (gpointer)extract_param_value(
-            src_proc, rd.param_name, args->items[1]
-        );
-        mfp_dsp_push_request(rd);
+    else if (!strcmp(method, "post")) {
+        dispatch_batch(args->items[0]->_array);
     }
-    else if (!strcmp(service_name, "DSPObject.delete")) {
-        rd.reqtype = REQTYPE_DESTROY;
-        rd.src_proc = obj_id;
-        mfp_dsp_push_request(rd);
-    }
-    else if (!strcmp(service_name, "DSPObject.reset")) {
-        rd.reqtype = REQTYPE_RESET;
-        rd.src_proc = obj_id;
-        mfp_dsp_push_request(rd);
+    else if (!strcmp(method, "level_stats")) {
+        mfp_context * ctxt = (mfp_context *)g_hash_table_lookup(
+            mfp_contexts, GINT_TO_POINTER((int)args->items[0]->_int));
+        mfp_rpc_argblock * resp = g_malloc0(sizeof(mfp_rpc_argblock));
+        mfp_rpc_args * arglist = mfp_rpc_args_init(resp);
+        if (ctxt != NULL) {
+            mfp_pool_level_stats(ctxt, (int)args->items[1]->_int, arglist);
+        }
+        rval->value_types_case = CARP__PYTHON_VALUE__VALUE_TYPES__ARRAY;
+        rval->_array = arglist;
+        to_free = resp;
+    }
+    else if (!strcmp(method, "buffer_stats")) {
+        mfp_context * ctxt = (mfp_context *)g_hash_table_lookup(
+            mfp_contexts, GINT_TO_POINTER((int)args->items[0]->_int));
+        mfp_rpc_argblock * resp = g_malloc0(sizeof(mfp_rpc_argblock));
+        mfp_rpc_args * arglist = mfp_rpc_args_init(resp);
+        if (ctxt != NULL) {
+            mfp_sched_buffer_stats(ctxt, arglist);
+        }
+        rval->value_types_case = CARP__PYTHON_VALUE__VALUE_TYPES__ARRAY;
+        rval->_array = arglist;
+        to_free = resp;
+    }
+    else if (!strcmp(method, "clock")) {
+        mfp_context * ctxt = (mfp_context *)g_hash_table_lookup(
+            mfp_contexts, GINT_TO_POINTER((int)args->items[0]->_int));
+        mfp_rpc_argblock * resp = g_malloc0(sizeof(mfp_rpc_argblock));
+        mfp_rpc_args * arglist = mfp_rpc_args_init(resp);
+        if (ctxt != NULL) {
+            mfp_dsp_clock(ctxt, arglist);
+        }
+        rval->value_types_case = CARP__PYTHON_VALUE__VALUE_TYPES__ARRAY;
+        rval->_array = arglist;
+        to_free = resp;
+    }
+    else if (!strcmp(method, "render")) {
+        /* blocks this thread until the render is done; nothing else
+         * should be sent to an offline context meanwhile */
+        mfp_context * ctxt = (mfp_context *)g_hash_table_lookup(
+            mfp_contexts, GINT_TO_POINTER((int)args->items[0]->_int));
+        mfp_rpc_argblock * resp = g_malloc0(sizeof(mfp_rpc_argblock));
+        mfp_rpc_args * arglist = mfp_rpc_args_init(resp);
+        if ((ctxt != NULL) && (ctxt->ctype == CTYPE_OFFLINE)) {
+            mfp_offline_request(ctxt, args->items[3]->_string, args->items[2]->_string,
+                                args->items[1]->_int, arglist);
+        }
+        rval->value_types_case = CARP__PYTHON_VALUE__VALUE_TYPES__ARRAY;
+        rval->_array = arglist;
+        to_free = resp;
+    }
+    else if (!strcmp(method, "queue_stats")) {
+        mfp_rpc_argblock * resp = g_malloc0(sizeof(mfp_rpc_argblock));
+        mfp_rpc_args * arglist = mfp_rpc_args_init(resp);
+        mfp_dsp_request_stats(arglist);
+        mfp_ring_stats(outgoing_queue, arglist);
+        rval->value_types_case = CARP__PYTHON_VALUE__VALUE_TYPES__ARRAY;
+        rval->_array = arglist;
+        to_free = resp;
     }
     else {
-        mfp_log_debug("[method] unhandled method '%s'", service_name);
+        result = build_request(method, obj_id, args->items, args->n_items, &rd);
+        if (result == BUILD_OK) {
+            mfp_dsp_push_request(rd);
+        }
+        else {
+            log_build_error("method", result, service_name, obj_id);
+        }
     }
 
     return to_free;
@@ -389,12 +560,13 @@ mfp_rpc_dispatch_pb2(const char * msgbuf, int msglen)
             carp__call_data__unpack(NULL, envelope->content.len, envelope->content.data);
 
         Carp__PythonValue response = CARP__PYTHON_VALUE__INIT;
+        void * to_free = NULL;
 
         if (!strcmp(calldata->service_name, "DSPObject")) {
             dispatch_create(calldata->args, calldata->kwargs, &response);
         }
         else if (!strncmp(calldata->service_name, "DSPObject", 9)) {
-            dispatch_methodcall(
+            to_free = dispatch_methodcall(
                 calldata->service_name,
                 calldata->instance_id,
                 calldata->args,
@@ -403,7 +575,7 @@ mfp_rpc_dispatch_pb2(const char * msgbuf, int msglen)
             );
         }
 
-        if (calldata->call_id > -1) {
+        if ((calldata->call_id > -1) && strcmp(calldata->service_name, "DSPObject.post")) {
             char * msgbuf = mfp_comm_get_buffer();
             int msglen = 0;
             mfp_rpc_response(
@@ -415,6 +587,9 @@ mfp_rpc_dispatch_pb2(const char * msgbuf, int msglen)
             );
             mfp_comm_submit_buffer(msgbuf, msglen);
         }
+        if (to_free != NULL) {
+            g_free(to_free);
+        }
         carp__call_data__free_unpacked(calldata, NULL);
     }
     else if (!strcmp(envelope->content_type, "CallResponse")) {
@@ -0,0 +1,631 @@
+#include <glib.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <errno.h>
+#include <pthread.h>
+#include <semaphore.h>
+
+#include "mfp_dsp.h"
+
+/*
+ * DSP scheduling.
+ *
+ * Each context keeps its own list of processors (ctxt->procs) and a
+ * NULL-terminated run order (ctxt->schedule) used by mfp_dsp_run.
+ *
+ * When the graph changes (create, connect, disconnect, destroy) the
+ * affected processors are marked dirty.  At the end of request
+ * handling the context is handed to the scheduler thread, which
+ * recomputes depths only for the dirty processors and whatever is
+ * downstream of a changed depth, builds a new run order and leaves it
+ * in ctxt->next_schedule.  mfp_dsp_run swaps it in at the top of the
+ * next block.
+ *
+ * The run order keeps a copy of the depths it was built from
+ * (mfp_run_order), since the scheduler thread rewrites the processors'
+ * own depths while the DSP thread is still running the previous order.
+ *
+ * While a schedule is being built, requests that change the graph are
+ * left in the request queue (see mfp_dsp_handle_requests) so the
+ * scheduler thread never sees the graph change under it.
+ *
+ * Contexts share nothing here except the scheduler thread, so each
+ * one can be run from its own thread (separate JACK clients, several
+ * LV2 instances in one host).
+ *
+ * Signal buffers are assigned along with each run order.  Without
+ * sharing, every outlet and every fan-in accumulator has its own block
+ * and a big patch runs through all of them each block.  Once depths
+ * are known, an outlet block is live from its processor's depth to the
+ * largest depth of anything reading it, and an accumulator only at its
+ * processor's depth.  Blocks from a per-context pool are handed out in
+ * depth order and reused once the last level reading them is done.
+ * Working by level rather than by position in the run order keeps this
+ * safe when a level is split across pool threads (mfp_pool.c).
+ *
+ * Only types with transient_buffers set take part, and only outlets
+ * whose readers all have a depth; in a DSP loop a block is read before
+ * it is written, so it has to keep its contents.  Everything else
+ * keeps its own blocks.  The scheduler thread leaves the assignment in
+ * the processors' *_buf_next arrays and mfp_sched_swap installs it
+ * with the run order.
+ */
+
+static mfp_ring * sched_queue = NULL;
+static sem_t sched_sem;
+static pthread_t sched_thread;
+static int sched_thread_running = 0;
+static int sched_quit = 0;
+static atomic_flag sched_queue_lock = ATOMIC_FLAG_INIT;
+
+static void
+sched_context_init(mfp_context * ctxt)
+{
+    if (ctxt->procs == NULL) {
+        ctxt->procs = g_array_new(TRUE, TRUE, sizeof(mfp_processor *));
+    }
+    if (ctxt->sched_dirty == NULL) {
+        ctxt->sched_dirty = g_array_sized_new(TRUE, TRUE, sizeof(mfp_processor *), 64);
+    }
+}
+
+static int
+depth_cmp_func(const void * a, const void *b)
+{
+    int adepth = (*(mfp_processor **)a)->depth;
+    int bdepth = (*(mfp_processor **)b)->depth;
+
+    /* unschedulable processors (in a loop) go last */
+    if (adepth < 0)
+        adepth = G_MAXINT;
+    if (bdepth < 0)
+        bdepth = G_MAXINT;
+
+    if (adepth < bdepth)
+        return -1;
+    else if (adepth == bdepth)
+        return 0;
+    else
+        return 1;
+}
+
+
+static int
+ready_to_schedule(mfp_processor * p)
+{
+    int icount;
+    int ready = 1;
+    GArray * infan;
+    mfp_connection ** ip;
+    int maxdepth = -1;
+
+    if (p == NULL) {
+        return -1;
+    }
+    if (p->typeinfo == NULL) {
+        return -1;
+    }
+
+    if (p->typeinfo->is_generator == GENERATOR_ALWAYS) {
+        return 0;
+    }
+
+    /* conditional generator is a generator if nothing connected to dsp inlets */
+    if (p->typeinfo->is_generator == GENERATOR_CONDITIONAL) {
+        ready = 0;
+        for (icount = 0; icount < p->inlet_conn->len; icount++) {
+            infan = g_array_index(p->inlet_conn, GArray *, icount);
+            if(infan && infan->len) {
+                ready = 1;
+                break;
+            }
+        }
+        if (ready == 0)
+            return 0;
+    }
+
+    for (icount = 0; icount < p->inlet_conn->len; icount++) {
+        infan = g_array_index(p->inlet_conn, GArray *, icount);
+        for(ip = (mfp_connection **)(infan->data); *ip != NULL; ip++) {
+            if ((*ip)->dest_proc->depth < 0) {
+                ready = 0;
+                break;
+            }
+            else if ((*ip)->dest_proc->depth > maxdepth) {
+                maxdepth = (*ip)->dest_proc->depth;
+            }
+        }
+        if (ready == 0) {
+            break;
+        }
+    }
+
+    if (ready > 0) {
+        return maxdepth + 1;
+    }
+    else {
+        return -1;
+    }
+}
+
+/* full reschedule of every processor in the context.  Returns 0 if
+ * some processors could not be scheduled (a DSP loop) */
+static int
+sched_full(mfp_context * ctxt)
+{
+    int lastpass_unsched = -1;
+    int thispass_unsched = 0;
+    int another_pass = 1;
+    int depth = -1;
+    mfp_processor ** p;
+
+    sched_context_init(ctxt);
+
+    /* unschedule everything */
+    for (p = (mfp_processor **)(ctxt->procs->data); *p != NULL; p++) {
+        (*p)->depth = -1;
+    }
+
+    /* calculate scheduling order */
+    while (another_pass == 1) {
+        for (p = (mfp_processor **)(ctxt->procs->data); *p != NULL; p++) {
+            if ((*p)->depth < 0) {
+                depth = ready_to_schedule(*p);
+                if (depth >= 0) {
+                    (*p)->depth = depth;
+                }
+                else {
+                    thispass_unsched++;
+                }
+            }
+        }
+        if ((thispass_unsched > 0) &&
+            (lastpass_unsched < 0 || (thispass_unsched < lastpass_unsched))) {
+            another_pass = 1;
+        }
+        else {
+            another_pass = 0;
+        }
+        lastpass_unsched = thispass_unsched;
+        thispass_unsched = 0;
+    }
+
+    g_array_set_size(ctxt->sched_dirty, 0);
+    return (lastpass_unsched > 0) ? 0 : 1;
+}
+
+/* recompute depths starting from the dirty processors, following
+ * outlets only where a depth actually changed.  Returns 0 if a depth
+ * grows past the number of processors, which means a DSP loop was
+ * created; the caller falls back to sched_full() */
+static int
+sched_incremental(mfp_context * ctxt)
+{
+    GArray * work = ctxt->sched_dirty;
+    GArray * outfan;
+    mfp_connection ** op;
+    mfp_processor * p;
+    int maxdepth = ctxt->procs->len;
+    int depth;
+    int pos;
+    int ocount;
+
+    for (pos = 0; pos < work->len; pos++) {
+        p = g_array_index(work, mfp_processor *, pos);
+        depth = ready_to_schedule(p);
+
+        if (depth == p->depth) {
+            continue;
+        }
+        if (depth > maxdepth) {
+            g_array_set_size(work, 0);
+            return 0;
+        }
+
+        p->depth = depth;
+        for (ocount = 0; ocount < p->outlet_conn->len; ocount++) {
+            outfan = g_array_index(p->outlet_conn, GArray *, ocount);
+            for(op = (mfp_connection **)(outfan->data); *op != NULL; op++) {
+                g_array_append_val(work, (*op)->dest_proc);
+            }
+        }
+    }
+
+    g_array_set_size(work, 0);
+    return 1;
+}
+
+/* a pool block free for depths first..last.  Blocks are only added to
+ * the pool, since the running order may still be using any of them */
+static mfp_block *
+pool_take(mfp_context * ctxt, GArray * busy_until, int first, int last)
+{
+    mfp_block * block;
+    int pos;
+
+    for (pos = 0; pos < busy_until->len; pos++) {
+        if (g_array_index(busy_until, int, pos) < first) {
+            g_array_index(busy_until, int, pos) = last;
+            return g_array_index(ctxt->buf_pool, mfp_block *, pos);
+        }
+    }
+
+    block = mfp_block_new(mfp_max_blocksize);
+    mfp_block_resize(block, ctxt->blocksize);
+    g_array_append_val(ctxt->buf_pool, block);
+    g_array_append_val(busy_until, last);
+    return block;
+}
+
+/* largest depth reading an outlet, or -1 if a reader isn't scheduled
+ * or runs first (a block delay's input is last block's output) */
+static int
+outlet_last_read(mfp_processor * p, int outlet)
+{
+    GArray * outfan = g_array_index(p->outlet_conn, GArray *, outlet);
+    mfp_connection ** op;
+    int last = p->depth;
+
+    for(op = (mfp_connection **)(outfan->data); *op != NULL; op++) {
+        if ((*op)->dest_proc->depth <= p->depth) {
+            return -1;
+        }
+        last = MAX(last, (*op)->dest_proc->depth);
+    }
+    return last;
+}
+
+/* fill in the *_buf_next arrays for the processors in order */
+static void
+sched_assign_buffers(mfp_context * ctxt, mfp_processor ** order)
+{
+    GArray * busy_until;
+    GArray * infan;
+    mfp_processor ** pp;
+    mfp_processor * p;
+    mfp_buffer_stats stats = { 0, 0, 0 };
+    int shareable;
+    int count;
+    int last;
+    int unused = -1;
+
+    if (ctxt->buf_pool == NULL) {
+        ctxt->buf_pool = g_array_new(TRUE, TRUE, sizeof(mfp_block *));
+    }
+    busy_until = g_array_sized_new(FALSE, FALSE, sizeof(int), ctxt->buf_pool->len);
+    for (count = 0; count < ctxt->buf_pool->len; count++) {
+        g_array_append_val(busy_until, unused);
+    }
+
+    for (pp = order; *pp != NULL; pp++) {
+        p = *pp;
+        shareable = p->typeinfo->transient_buffers && (p->depth >= 0);
+
+        for (count = 0; count < p->inlet_conn->len; count++) {
+            infan = g_array_index(p->inlet_conn, GArray *, count);
+            p->inlet_buf_next[count] = p->inlet_buf_own[count];
+
+            /* a single connection is read straight from the upstream outlet */
+            if (infan->len == 1) {
+                continue;
+            }
+            stats.unshared++;
+            if (shareable) {
+                p->inlet_buf_next[count] = pool_take(ctxt, busy_until, p->depth, p->depth);
+            }
+            else {
+                stats.own++;
+            }
+        }
+
+        for (count = 0; count < p->outlet_conn->len; count++) {
+            p->outlet_buf_next[count] = p->outlet_buf_own[count];
+            stats.unshared++;
+            last = shareable ? outlet_last_read(p, count) : -1;
+            if (last >= 0) {
+                p->outlet_buf_next[count] = pool_take(ctxt, busy_until, p->depth, last);
+            }
+            else {
+                stats.own++;
+            }
+        }
+    }
+
+    for (count = 0; count < busy_until->len; count++) {
+        if (g_array_index(busy_until, int, count) >= 0) {
+            stats.pool++;
+        }
+    }
+    g_array_free(busy_until, TRUE);
+    ctxt->buf_stats_next = stats;
+}
+
+/* make the assignment from sched_assign_buffers current.  Runs in the
+ * thread running the context, between blocks */
+static void
+sched_install_buffers(mfp_context * ctxt)
+{
+    mfp_processor ** pp;
+    mfp_processor * p;
+    int count;
+
+    for (pp = ctxt->schedule->procs; *pp != NULL; pp++) {
+        p = *pp;
+        for (count = 0; count < p->inlet_conn->len; count++) {
+            if (p->inlet_buf_next[count]->blocksize != ctxt->blocksize) {
+                mfp_block_resize(p->inlet_buf_next[count], ctxt->blocksize);
+            }
+            p->inlet_buf_alloc[count] = p->inlet_buf_next[count];
+        }
+        for (count = 0; count < p->outlet_conn->len; count++) {
+            if (p->outlet_buf_next[count]->blocksize != ctxt->blocksize) {
+                mfp_block_resize(p->outlet_buf_next[count], ctxt->blocksize);
+            }
+            p->outlet_buf[count] = p->outlet_buf_next[count];
+
+            /* nothing will write it, so downstream has to see silence */
+            if (!p->active || p->sleeping) {
+                mfp_block_set_const(p->outlet_buf[count], 0.0);
+            }
+        }
+    }
+    ctxt->buf_stats = ctxt->buf_stats_next;
+}
+
+/* build a run order from the current depths, keeping a copy of them
+ * for mfp_pool_run.  One allocation, freed with g_free */
+static mfp_run_order *
+sched_build(mfp_context * ctxt)
+{
+    int count = ctxt->procs->len;
+    mfp_run_order * order = g_malloc0(sizeof(mfp_run_order)
+                                      + (count + 1) * sizeof(mfp_processor *)
+                                      + count * sizeof(int));
+
+    order->len = count;
+    order->depths = (int *)(order->procs + count + 1);
+    memcpy(order->procs, ctxt->procs->data, count * sizeof(mfp_processor *));
+    qsort(order->procs, count, sizeof(mfp_processor *), depth_cmp_func);
+    for (int pos = 0; pos < count; pos++) {
+        order->depths[pos] = order->procs[pos]->depth;
+    }
+    return order;
+}
+
+static void
+sched_compute(mfp_context * ctxt)
+{
+    mfp_run_order * old_schedule = ctxt->old_schedule;
+    mfp_run_order * next;
+
+    ctxt->old_schedule = NULL;
+    g_free(old_schedule);
+
+    if (!sched_incremental(ctxt) && !sched_full(ctxt)) {
+        mfp_log_error("Some processors could not be scheduled, check for cycles!");
+    }
+    next = sched_build(ctxt);
+    sched_assign_buffers(ctxt, next->procs);
+    atomic_store(&ctxt->next_schedule, next);
+}
+
+static void *
+sched_thread_func(void * data)
+{
+    mfp_context * ctxt;
+
+    while (!sched_quit) {
+        if (sem_wait(&sched_sem) < 0 && errno == EINTR) {
+            continue;
+        }
+        while (mfp_ring_pop(sched_queue, &ctxt)) {
+            sched_compute(ctxt);
+        }
+    }
+    return NULL;
+}
+
+void
+mfp_sched_init(void)
+{
+    sched_queue = mfp_ring_new(64, sizeof(mfp_context *));
+    sem_init(&sched_sem, 0, 0);
+    sched_quit = 0;
+    pthread_create(&sched_thread, NULL, sched_thread_func, NULL);
+    sched_thread_running = 1;
+}
+
+void
+mfp_sched_finish(void)
+{
+    if (!sched_thread_running) {
+        return;
+    }
+    sched_quit = 1;
+    sem_post(&sched_sem);
+    pthread_join(sched_thread, NULL);
+    sched_thread_running = 0;
+}
+
+/* free a context's scheduling state.  Nothing may be running it */
+void
+mfp_sched_free_context(mfp_context * ctxt)
+{
+    mfp_run_order * next;
+    int pos;
+
+    /* let the scheduler thread finish with it first */
+    while (ctxt->sched_pending && (atomic_load(&ctxt->next_schedule) == NULL)) {
+        g_usleep(100);
+    }
+
+    next = atomic_exchange(&ctxt->next_schedule, NULL);
+    g_free(next);
+    g_free(ctxt->schedule);
+    g_free(ctxt->old_schedule);
+    ctxt->schedule = ctxt->old_schedule = NULL;
+
+    if (ctxt->procs != NULL) {
+        g_array_free(ctxt->procs, TRUE);
+        ctxt->procs = NULL;
+    }
+    if (ctxt->sched_dirty != NULL) {
+        g_array_free(ctxt->sched_dirty, TRUE);
+        ctxt->sched_dirty = NULL;
+    }
+    if (ctxt->buf_pool != NULL) {
+        for (pos = 0; pos < ctxt->buf_pool->len; pos++) {
+            mfp_block_free(g_array_index(ctxt->buf_pool, mfp_block *, pos));
+        }
+        g_array_free(ctxt->buf_pool, TRUE);
+        ctxt->buf_pool = NULL;
+    }
+}
+
+/* nonzero while ctxt is waiting on the scheduler thread.  Other
+ * contexts are not held up */
+int
+mfp_sched_busy(mfp_context * ctxt)
+{
+    return ctxt->sched_pending;
+}
+
+void
+mfp_sched_add_proc(mfp_processor * p)
+{
+    sched_context_init(p->context);
+    g_array_append_val(p->context->procs, p);
+    mfp_sched_mark(p);
+}
+
+void
+mfp_sched_remove_proc(mfp_processor * p)
+{
+    mfp_context * ctxt = p->context;
+    mfp_run_order * order = ctxt->schedule;
+    int pos;
+
+    sched_context_init(ctxt);
+
+    for (pos = 0; pos < ctxt->procs->len; pos++) {
+        if (g_array_index(ctxt->procs, mfp_processor *, pos) == p) {
+            g_array_remove_index(ctxt->procs, pos);
+            break;
+        }
+    }
+    for (pos = ctxt->sched_dirty->len - 1; pos >= 0; pos--) {
+        if (g_array_index(ctxt->sched_dirty, mfp_processor *, pos) == p) {
+            g_array_remove_index(ctxt->sched_dirty, pos);
+        }
+    }
+
+    /* the current run order has to stop using p right away */
+    if (order != NULL) {
+        for (pos = 0; pos < order->len; pos++) {
+            if (order->procs[pos] == p) {
+                memmove(order->procs + pos, order->procs + pos + 1,
+                        (order->len - pos) * sizeof(mfp_processor *));
+                memmove(order->depths + pos, order->depths + pos + 1,
+                        (order->len - pos - 1) * sizeof(int));
+                order->len--;
+                break;
+            }
+        }
+    }
+    ctxt->needs_reschedule = 1;
+}
+
+/* p's inputs changed, so its depth may need to change */
+void
+mfp_sched_mark(mfp_processor * p)
+{
+    sched_context_init(p->context);
+    g_array_append_val(p->context->sched_dirty, p);
+    p->context->needs_reschedule = 1;
+}
+
+/* called from mfp_dsp_run after requests are handled */
+void
+mfp_sched_request(mfp_context * ctxt)
+{
+    int queued;
+
+    if (!ctxt->needs_reschedule || ctxt->sched_pending) {
+        return;
+    }
+    ctxt->needs_reschedule = 0;
+    sched_context_init(ctxt);
+
+    if (!sched_thread_running) {
+        /* no scheduler thread (tests): do it in place */
+        sched_compute(ctxt);
+        ctxt->sched_pending = 1;
+        mfp_sched_swap(ctxt);
+        return;
+    }
+
+    ctxt->sched_pending = 1;
+
+    while (atomic_flag_test_and_set_explicit(&sched_queue_lock, memory_order_acquire)) {
+    }
+    queued = mfp_ring_push(sched_queue, &ctxt);
+    atomic_flag_clear_explicit(&sched_queue_lock, memory_order_release);
+
+    if (queued) {
+        sem_post(&sched_sem);
+    }
+    else {
+        /* try again next block */
+        ctxt->sched_pending = 0;
+        ctxt->needs_reschedule = 1;
+    }
+}
+
+/* called from mfp_dsp_run before requests are handled */
+void
+mfp_sched_swap(mfp_context * ctxt)
+{
+    mfp_run_order * next;
+
+    if (!ctxt->sched_pending) {
+        return;
+    }
+
+    next = atomic_exchange(&ctxt->next_schedule, NULL);
+    if (next != NULL) {
+        ctxt->old_schedule = ctxt->schedule;
+        ctxt->schedule = next;
+        ctxt->sched_pending = 0;
+        sched_install_buffers(ctxt);
+    }
+}
+
+/* synchronous full reschedule, replacing the current run order */
+int
+mfp_dsp_schedule(mfp_context * ctxt)
+{
+    int success = sched_full(ctxt);
+
+    g_free(ctxt->schedule);
+    ctxt->schedule = sched_build(ctxt);
+    sched_assign_buffers(ctxt, ctxt->schedule->procs);
+    sched_install_buffers(ctxt);
+    ctxt->needs_reschedule = 0;
+    return success;
+}
+
+/* buffer count and bytes per block without and with sharing, then the
+ * pool size */
+void
+mfp_sched_buffer_stats(mfp_context * ctxt, mfp_rpc_args * arglist)
+{
+    mfp_buffer_stats * stats = &ctxt->buf_stats;
+    int blockbytes = ctxt->blocksize * sizeof(mfp_sample);
+
+    mfp_rpc_args_append_int(arglist, stats->unshared);
+    mfp_rpc_args_append_int(arglist, stats->unshared * blockbytes);
+    mfp_rpc_args_append_int(arglist, stats->pool + stats->own);
+    mfp_rpc_args_append_int(arglist, (stats->pool + stats->own) * blockbytes);
+    mfp_rpc_args_append_int(arglist, stats->pool);
+}
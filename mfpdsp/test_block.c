@@ -404,5 +404,212 @@ test_block_fmod(void)
 
 TEST_NOSSE(test_block_fmod)
 
+/* odd length, so the scalar tails after the vector loops get used too */
+#define KTEST_LEN 1027
 
+static int
+kernel_compare(const char * kname, const char * tname, mfp_sample * ref, mfp_sample * out,
+               int count, double tolerance)
+{
+    int i;
+
+    for (i = 0; i < count; i++) {
+        if (fabs(ref[i] - out[i]) > tolerance * MAX(1.0, fabs(ref[i]))) {
+            printf("FAIL: %s %s [%d] %f != %f\n", tname, kname, i, out[i], ref[i]);
+            return 0;
+        }
+    }
+    return 1;
+}
+
+/* every kernel table this CPU supports gives what the scalar one does */
+int
+test_block_kernels(void)
+{
+    mfp_kernel_table * ref = mfp_kernel_get(MFP_KERNEL_SCALAR);
+    mfp_kernel_table * k;
+    mfp_sample in_1[KTEST_LEN], in_2[KTEST_LEN], in_3[KTEST_LEN];
+    mfp_sample expect[KTEST_LEN], out[KTEST_LEN];
+    double table[65];
+    guint32 state_1[MFP_NOISE_LANES], state_2[MFP_NOISE_LANES];
+    mfp_biquad f_1 = { 0.2, 0.4, 0.2, -0.5, 0.25, 0.0, 0.0 };
+    mfp_biquad f_2 = f_1;
+    int level, i;
+    int ok = 1;
+
+    for (i = 0; i < KTEST_LEN; i++) {
+        in_1[i] = (random() % 20000) / 1000.0 - 10.0;
+        in_2[i] = (random() % 20000) / 1000.0 - 10.0;
+        in_3[i] = (random() % 2000) / 1000.0;
+    }
+    for (i = 0; i < 65; i++) {
+        table[i] = sin(i * 2.0 * M_PI / 64.0);
+    }
+
+    for (level = MFP_KERNEL_SCALAR + 1; level < MFP_KERNEL_LEVELS; level++) {
+        k = mfp_kernel_get(level);
+        if (k == NULL) {
+            printf("     (kernel level %d not available)\n", level);
+            continue;
+        }
+
+        ref->add(in_1, in_2, expect, KTEST_LEN);
+        k->add(in_1, in_2, out, KTEST_LEN);
+        ok &= kernel_compare(k->name, "add", expect, out, KTEST_LEN, 0.0);
+
+        ref->mul(in_1, in_2, expect, KTEST_LEN);
+        k->mul(in_1, in_2, out, KTEST_LEN);
+        ok &= kernel_compare(k->name, "mul", expect, out, KTEST_LEN, 0.0);
+
+        ref->cmp(in_1, in_2, 1.0, -1.0, expect, KTEST_LEN);
+        k->cmp(in_1, in_2, 1.0, -1.0, out, KTEST_LEN);
+        ok &= kernel_compare(k->name, "cmp", expect, out, KTEST_LEN, 0.0);
+
+        ref->fill(expect, 1.0, KTEST_LEN);
+        k->fill(out, 1.0, KTEST_LEN);
+        ref->mac(in_1, in_2, in_3, expect, KTEST_LEN);
+        k->mac(in_1, in_2, in_3, out, KTEST_LEN);
+        ref->mac(in_1, in_2, NULL, expect, KTEST_LEN);
+        k->mac(in_1, in_2, NULL, out, KTEST_LEN);
+        ok &= kernel_compare(k->name, "mac", expect, out, KTEST_LEN, 1e-5);
+
+        ref->const_add(in_1, 0.5, expect, KTEST_LEN);
+        k->const_add(in_1, 0.5, out, KTEST_LEN);
+        ok &= kernel_compare(k->name, "const_add", expect, out, KTEST_LEN, 0.0);
+
+        ref->const_mul(in_1, 0.5, expect, KTEST_LEN);
+        k->const_mul(in_1, 0.5, out, KTEST_LEN);
+        ok &= kernel_compare(k->name, "const_mul", expect, out, KTEST_LEN, 0.0);
+
+        ref->fmod(in_1, 3.0, expect, KTEST_LEN);
+        k->fmod(in_1, 3.0, out, KTEST_LEN);
+        ok &= kernel_compare(k->name, "fmod", expect, out, KTEST_LEN, 1e-5);
+
+        ref->trunc(in_1, expect, KTEST_LEN);
+        k->trunc(in_1, out, KTEST_LEN);
+        ok &= kernel_compare(k->name, "trunc", expect, out, KTEST_LEN, 0.0);
+
+        ref->index_fetch(in_3, in_1, expect, KTEST_LEN);
+        k->index_fetch(in_3, in_1, out, KTEST_LEN);
+        ok &= kernel_compare(k->name, "index_fetch", expect, out, KTEST_LEN, 0.0);
+
+        ref->ramp(expect, -1.0, 0.001, KTEST_LEN);
+        k->ramp(out, -1.0, 0.001, KTEST_LEN);
+        ok &= kernel_compare(k->name, "ramp", expect, out, KTEST_LEN, 1e-6);
+
+        ref->prefix_sum(in_3, 0.1, 1.0, expect, KTEST_LEN);
+        k->prefix_sum(in_3, 0.1, 1.0, out, KTEST_LEN);
+        ok &= kernel_compare(k->name, "prefix_sum", expect, out, KTEST_LEN, 1e-4);
+
+        ref->table_lookup(in_3, table, 64, 32.0 / M_PI, expect, KTEST_LEN);
+        k->table_lookup(in_3, table, 64, 32.0 / M_PI, out, KTEST_LEN);
+        ok &= kernel_compare(k->name, "table_lookup", expect, out, KTEST_LEN, 1e-6);
+
+        mfp_kernel_noise_seed(state_1, 1234);
+        mfp_kernel_noise_seed(state_2, 1234);
+        ref->noise(state_1, expect, KTEST_LEN);
+        k->noise(state_2, out, KTEST_LEN);
+        ok &= kernel_compare(k->name, "noise", expect, out, KTEST_LEN, 0.0);
+
+        f_1.delay_1 = f_1.delay_2 = f_2.delay_1 = f_2.delay_2 = 0.0;
+        ref->biquad(&f_1, in_1, expect, KTEST_LEN);
+        k->biquad(&f_2, in_1, out, KTEST_LEN);
+        ok &= kernel_compare(k->name, "biquad", expect, out, KTEST_LEN, 1e-5);
+    }
+    return ok;
+}
+
+/* noise is uniform in [-1, 1) */
+int
+test_block_kernel_noise(void)
+{
+    mfp_sample out[KTEST_LEN];
+    guint32 state[MFP_NOISE_LANES];
+    double sum = 0.0;
+    int i;
+
+    mfp_kernel_noise_seed(state, 1);
+    mfp_kernels->noise(state, out, KTEST_LEN);
+
+    for (i = 0; i < KTEST_LEN; i++) {
+        if ((out[i] < -1.0) || (out[i] >= 1.0)) {
+            printf("FAIL: noise[%d] = %f\n", i, out[i]);
+            return 0;
+        }
+        sum += out[i];
+    }
+    if (fabs(sum / KTEST_LEN) > 0.1) {
+        printf("FAIL: noise mean %f\n", sum / KTEST_LEN);
+        return 0;
+    }
+    return 1;
+}
+
+#define KBENCH_LEN 1024
+#define KBENCH_REPS 20000
+
+static double
+kbench_ns(struct timeval * start, struct timeval * end)
+{
+    return ((end->tv_sec - start->tv_sec) * 1.0e9 + (end->tv_usec - start->tv_usec) * 1.0e3)
+        / ((double)KBENCH_LEN * KBENCH_REPS);
+}
+
+#define KBENCH(KNAME, CALL) { \
+    gettimeofday(&start, NULL); \
+    for (rep = 0; rep < KBENCH_REPS; rep++) { CALL; } \
+    gettimeofday(&end, NULL); \
+    printf("     %-14s %-8s %7.3f ns/sample\n", KNAME, k->name, kbench_ns(&start, &end)); \
+}
+
+int
+benchmark_block_kernels(void)
+{
+    struct timeval start, end;
+    mfp_kernel_table * k;
+    mfp_block * in_1 = mfp_block_new(KBENCH_LEN);
+    mfp_block * in_2 = mfp_block_new(KBENCH_LEN);
+    mfp_block * out = mfp_block_new(KBENCH_LEN);
+    double table[2049];
+    guint32 state[MFP_NOISE_LANES];
+    mfp_biquad f = { 0.2, 0.4, 0.2, -0.5, 0.25, 0.0, 0.0 };
+    int level, rep, i;
+
+    for (i = 0; i < KBENCH_LEN; i++) {
+        in_1->data[i] = (random() % 20000) / 1000.0;
+        in_2->data[i] = (random() % 20000) / 1000.0;
+    }
+    for (i = 0; i < 2049; i++) {
+        table[i] = sin(i * 2.0 * M_PI / 2048.0);
+    }
+    mfp_kernel_noise_seed(state, 1);
+
+    printf("\n");
+    for (level = MFP_KERNEL_SCALAR; level < MFP_KERNEL_LEVELS; level++) {
+        k = mfp_kernel_get(level);
+        if (k == NULL) {
+            continue;
+        }
+        KBENCH("add", k->add(in_1->data, in_2->data, out->data, KBENCH_LEN));
+        KBENCH("mul", k->mul(in_1->data, in_2->data, out->data, KBENCH_LEN));
+        KBENCH("cmp", k->cmp(in_1->data, in_2->data, 1.0, 0.0, out->data, KBENCH_LEN));
+        KBENCH("mac", k->mac(in_1->data, in_2->data, NULL, out->data, KBENCH_LEN));
+        KBENCH("const_mul", k->const_mul(in_1->data, 0.5, out->data, KBENCH_LEN));
+        KBENCH("fill", k->fill(out->data, 0.5, KBENCH_LEN));
+        KBENCH("fmod", k->fmod(in_1->data, 2.0*M_PI, out->data, KBENCH_LEN));
+        KBENCH("trunc", k->trunc(in_1->data, out->data, KBENCH_LEN));
+        KBENCH("index_fetch", k->index_fetch(in_1->data, in_2->data, out->data, KBENCH_LEN));
+        KBENCH("ramp", k->ramp(out->data, 0.0, 0.01, KBENCH_LEN));
+        KBENCH("phase", k->phase(out->data, 0.0, 0.01, 2.0*M_PI, KBENCH_LEN));
+        KBENCH("prefix_sum", k->prefix_sum(in_1->data, 0.01, 0.0, out->data, KBENCH_LEN));
+        KBENCH("table_lookup", k->table_lookup(in_1->data, table, 2048, 2048.0 / 20.0,
+                                               out->data, KBENCH_LEN));
+        KBENCH("noise", k->noise(state, out->data, KBENCH_LEN));
+        KBENCH("biquad", k->biquad(&f, in_1->data, out->data, KBENCH_LEN));
+    }
 
+    mfp_block_free(in_1);
+    mfp_block_free(in_2);
+    mfp_block_free(out);
+    return 1;
+}
@@ -119,6 +119,62 @@ test_plus_multi(void * data)
     }
 }
 
+int
+test_const_blocks(void * data)
+{
+    mfp_procinfo * sigtype = g_hash_table_lookup(mfp_proc_registry, "sig~");
+    mfp_procinfo * osctype = g_hash_table_lookup(mfp_proc_registry, "osc~");
+    mfp_procinfo * plustype = g_hash_table_lookup(mfp_proc_registry, "+~");
+    mfp_procinfo * multype = g_hash_table_lookup(mfp_proc_registry, "*~");
+
+    mfp_processor * sig_1 = mfp_proc_create(sigtype, 1, 1, (mfp_context *)data);
+    mfp_processor * sig_2 = mfp_proc_create(sigtype, 1, 1, (mfp_context *)data);
+    mfp_processor * osc = mfp_proc_create(osctype, 2, 1, (mfp_context *)data);
+    mfp_processor * plus = mfp_proc_create(plustype, 2, 1, (mfp_context *)data);
+    mfp_processor * mul = mfp_proc_create(multype, 2, 1, (mfp_context *)data);
+    int snum;
+
+    printf("   test_const_blocks... ");
+
+    /* signal + constant fan-in, then multiplied by a constant 0 */
+    mfp_proc_connect(sig_1, 0, plus, 0);
+    mfp_proc_connect(osc, 0, plus, 0);
+    mfp_proc_connect(plus, 0, mul, 0);
+    mfp_proc_connect(sig_2, 0, mul, 1);
+
+    setparam_double(sig_1, "value", 3.0);
+    setparam_double(sig_2, "value", 0.0);
+    setparam_double(osc, "_sig_1", 1000.0);
+
+    /* buffers are shared once they've been read, so check each stage
+     * as soon as it has run */
+    mfp_dsp_schedule((mfp_context *)data);
+    mfp_proc_process(sig_1);
+    mfp_proc_process(sig_2);
+    mfp_proc_process(osc);
+    mfp_proc_process(plus);
+
+    if (!sig_1->outlet_buf[0]->is_const || plus->inlet_buf[0]->is_const
+        || plus->outlet_buf[0]->is_const) {
+        printf("FAIL (flags)\n");
+        return 0;
+    }
+    for (snum=0; snum < plus->outlet_buf[0]->blocksize; snum++) {
+        if (plus->outlet_buf[0]->data[snum] != (mfp_sample)(osc->outlet_buf[0]->data[snum] + 3.0)) {
+            printf("FAIL (fan-in at %d)\n", snum);
+            return 0;
+        }
+    }
+    mfp_proc_process(mul);
+    if (!mfp_block_is_zero(mul->outlet_buf[0]) || (mul->outlet_buf[0]->data[0] != 0.0)) {
+        printf("FAIL (zero product)\n");
+        return 0;
+    }
+
+    printf("ok\n");
+    return 1;
+}
+
 
 int
 test_line_1(void * data) 
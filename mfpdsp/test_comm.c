@@ -0,0 +1,170 @@
+#include <stdio.h>
+#include <string.h>
+#include <unistd.h>
+#include <pthread.h>
+#include <sys/time.h>
+#include <sys/socket.h>
+
+#include "mfp_dsp.h"
+
+#define STRESS_MESSAGES 100000
+
+static int stress_received = 0;
+static int stress_errors = 0;
+
+static int
+stress_dispatch(const char * msgbuf, int msglen)
+{
+    int num = -1;
+
+    if (msglen == MFP_MAX_MSGSIZE) {
+        /* the biggest frame there can be, in the middle of it all */
+        if (msgbuf[0] != 'x' || msgbuf[msglen - 1] != 'x') {
+            stress_errors++;
+        }
+        return 0;
+    }
+
+    if ((strlen(msgbuf) != msglen)
+        || (sscanf(msgbuf, "json:{\"n\": %d}", &num) != 1)
+        || (num != stress_received)) {
+        if (stress_errors == 0) {
+            printf("FAIL (message %d is '%s')\n", stress_received, msgbuf);
+        }
+        stress_errors++;
+    }
+    stress_received++;
+    return 0;
+}
+
+static int
+stress_frame(char * buf, const char * payload, int msglen, int binary)
+{
+    if (binary) {
+        memcpy(buf, MFP_COMM_SYNC_BINARY, MFP_COMM_SYNC_LEN);
+        buf[8] = 0;
+        buf[9] = (msglen >> 16) & 0xff;
+        buf[10] = (msglen >> 8) & 0xff;
+        buf[11] = msglen & 0xff;
+        memcpy(buf + 12, payload, msglen);
+        return 12 + msglen;
+    }
+    else {
+        memcpy(buf, MFP_COMM_SYNC, MFP_COMM_SYNC_LEN);
+        snprintf(buf + 8, 9, "% 8d", msglen);
+        memcpy(buf + 16, payload, msglen);
+        return 16 + msglen;
+    }
+}
+
+static void
+stress_send(int fd, const char * buf, int len)
+{
+    /* odd sizes, so frames and headers are cut everywhere */
+    const int sizes[] = { 1, 7, 333, 4093, 65536 };
+    int offset = 0;
+    int count = 0;
+    int sent;
+
+    while (offset < len) {
+        sent = send(fd, buf + offset, MIN(sizes[count++ % 5], len - offset), 0);
+        if (sent < 0) {
+            return;
+        }
+        offset += sent;
+    }
+}
+
+static void *
+stress_writer(void * data)
+{
+    int fd = *(int *)data;
+    char * out = g_malloc(MFP_COMM_READ_SIZE);
+    char * big = g_malloc(MFP_MAX_MSGSIZE + 1);
+    char payload[64];
+    int outlen = 0;
+    int msglen;
+
+    memset(big, 'x', MFP_MAX_MSGSIZE + 1);
+
+    for (int num = 0; num < STRESS_MESSAGES; num++) {
+        if (outlen > MFP_COMM_READ_SIZE - 3 * MFP_MAX_MSGSIZE) {
+            stress_send(fd, out, outlen);
+            outlen = 0;
+        }
+        if (num == STRESS_MESSAGES / 4) {
+            outlen += stress_frame(out + outlen, big, MFP_MAX_MSGSIZE, 0);
+            memcpy(out + outlen, "garbage", 7);
+            outlen += 7;
+        }
+        if (num == STRESS_MESSAGES / 2) {
+            outlen += stress_frame(out + outlen, big, MFP_MAX_MSGSIZE + 1, 1);
+        }
+        msglen = snprintf(payload, 64, "json:{\"n\": %d}", num);
+        outlen += stress_frame(out + outlen, payload, msglen, num % 2);
+    }
+    stress_send(fd, out, outlen);
+
+    g_free(big);
+    g_free(out);
+    return NULL;
+}
+
+int
+test_comm_reader_stress(void * data)
+{
+    mfp_comm_reader reader;
+    pthread_t writer;
+    struct timeval tv = { 1, 0 };
+    struct timeval start, end;
+    double elapsed;
+    int fds[2];
+
+    printf("   test_comm_reader_stress... ");
+
+    if (socketpair(AF_UNIX, SOCK_STREAM, 0, fds) < 0) {
+        printf("FAIL (socketpair)\n");
+        return 0;
+    }
+    setsockopt(fds[0], SOL_SOCKET, SO_RCVTIMEO, (char *)&tv, sizeof(struct timeval));
+
+    mfp_comm_reader_init(&reader, stress_dispatch);
+    gettimeofday(&start, NULL);
+    pthread_create(&writer, NULL, stress_writer, fds + 1);
+
+    while (stress_received < STRESS_MESSAGES) {
+        if (mfp_comm_reader_recv(&reader, fds[0]) <= 0) {
+            break;
+        }
+        mfp_comm_reader_parse(&reader);
+    }
+
+    gettimeofday(&end, NULL);
+    pthread_join(writer, NULL);
+    close(fds[0]);
+    close(fds[1]);
+    mfp_comm_reader_free(&reader);
+
+    elapsed = (end.tv_sec - start.tv_sec) + (end.tv_usec - start.tv_usec) / 1000000.0;
+
+    if (stress_errors > 0) {
+        printf("FAIL (%d bad messages)\n", stress_errors);
+        return 0;
+    }
+    if (stress_received != STRESS_MESSAGES) {
+        printf("FAIL (%d of %d messages)\n", stress_received, STRESS_MESSAGES);
+        return 0;
+    }
+    /* the garbage, and the frame that's too long */
+    if (reader.resyncs != 2) {
+        printf("FAIL (%d resyncs)\n", reader.resyncs);
+        return 0;
+    }
+    if (elapsed > 1.0) {
+        printf("FAIL (%d messages took %.2f sec)\n", STRESS_MESSAGES, elapsed);
+        return 0;
+    }
+
+    printf("ok\n");
+    return 1;
+}
@@ -0,0 +1,172 @@
+#include <stdio.h>
+#include <string.h>
+#include <unistd.h>
+#include <sys/time.h>
+#include <sndfile.h>
+
+#include "mfp_dsp.h"
+#include "builtin.h"
+
+/* a bit more than 3 slots' worth, so the last slot is a short one */
+#define DISKPLAY_TEST_FRAMES (3*4096 + 500)
+
+static void
+setparam_double(mfp_processor * proc, char * param_name, double value)
+{
+    gpointer val = g_malloc(sizeof(double));
+    *(double *)val = value;
+    mfp_proc_setparam(proc, g_strdup(param_name), val);
+    proc->needs_config = 1;
+}
+
+/* channel 0 counts up from 0 and channel 1 down, so every sample
+ * says where in the file it came from */
+static int
+write_test_file(char * filename)
+{
+    SF_INFO info;
+    SNDFILE * file;
+    float frame[2];
+    int count;
+
+    memset(&info, 0, sizeof(SF_INFO));
+    info.samplerate = 44100;
+    info.channels = 2;
+    info.format = SF_FORMAT_WAV | SF_FORMAT_FLOAT;
+
+    if ((file = sf_open(filename, SFM_WRITE, &info)) == NULL) {
+        return 0;
+    }
+    for (count = 0; count < DISKPLAY_TEST_FRAMES; count++) {
+        frame[0] = count;
+        frame[1] = -count;
+        sf_writef_float(file, frame, 1);
+    }
+    sf_close(file);
+    return 1;
+}
+
+static int
+check_block(mfp_processor * proc, int start, int blocksize)
+{
+    mfp_sample * left = proc->outlet_buf[0]->data;
+    mfp_sample * right = proc->outlet_buf[1]->data;
+    int count;
+
+    for (count = 0; count < blocksize; count++) {
+        mfp_sample want = (start + count < DISKPLAY_TEST_FRAMES) ? start + count : 0;
+        if ((left[count] != want) || (right[count] != -want)) {
+            printf("FAIL ([%d] %f %f, should be %f)\n", start + count,
+                   left[count], right[count], want);
+            return 0;
+        }
+    }
+    return 1;
+}
+
+static void
+stall(mfp_processor * proc, void * data)
+{
+    usleep(200000);
+}
+
+int
+test_diskplay(void * data)
+{
+    mfp_context * ctxt = (mfp_context *)data;
+    mfp_procinfo * disk_t = g_hash_table_lookup(mfp_proc_registry, "diskplay~");
+    mfp_processor * disk = mfp_proc_create(disk_t, 1, 2, ctxt);
+    mfp_procinfo stall_t = { .alloc = stall };
+    mfp_processor staller = { .typeinfo = &stall_t };
+    int stall_status;
+    int filled, slots, underruns;
+    struct timeval start, end;
+    char filename[64];
+    int pos;
+
+    printf("   test_diskplay... ");
+
+    snprintf(filename, 64, "/tmp/test_diskplay_%d.wav", getpid());
+    if (!write_test_file(filename)) {
+        printf("FAIL (can't write %s)\n", filename);
+        return 0;
+    }
+
+    /* opening reads ahead before anything plays: here the whole file,
+     * 4 slots and the end-of-file marker */
+    mfp_proc_setparam(disk, g_strdup("filename"), g_strdup(filename));
+    disk->needs_config = 1;
+    mfp_proc_process(disk);
+    usleep(50000);
+    mfp_diskplay_status(disk, &filled, &slots, &underruns);
+    if (filled != MIN(slots, 5)) {
+        printf("FAIL (prefetch, %d of %d slots)\n", filled, slots);
+        return 0;
+    }
+
+    /* play to the end.  The DSP thread only ever copies slots */
+    setparam_double(disk, "play", 1.0);
+    for (pos = 0; pos < DISKPLAY_TEST_FRAMES + ctxt->blocksize; pos += ctxt->blocksize) {
+        mfp_proc_process(disk);
+        if (!check_block(disk, pos, ctxt->blocksize)) {
+            return 0;
+        }
+        usleep(5000);
+    }
+
+    /* seek to 100 ms and play again, looping this time.  The first
+     * block waits for the prefetch and is silent, but isn't an underrun */
+    setparam_double(disk, "loop", 1.0);
+    setparam_double(disk, "seek", 100.0);
+    setparam_double(disk, "play", 1.0);
+    mfp_proc_process(disk);
+    usleep(50000);
+    mfp_proc_process(disk);
+    if (!check_block(disk, 4410, ctxt->blocksize)) {
+        return 0;
+    }
+
+    /* hold up the prefetch while the DSP side plays through more than
+     * the whole ring */
+    mfp_diskplay_status(disk, &filled, &slots, &underruns);
+    mfp_alloc_allocate(&staller, NULL, &stall_status);
+    for (pos = 0; pos < (slots + 2) * 4096 / ctxt->blocksize; pos++) {
+        mfp_proc_process(disk);
+    }
+    mfp_diskplay_status(disk, &filled, &slots, &underruns);
+
+    if (underruns == 0) {
+        printf("FAIL (no underruns)\n");
+        return 0;
+    }
+
+    /* one-shot parameters leave proc->params and are freed off the
+     * DSP thread: name and value go back as one retired setparam */
+    ctxt->request_retired = mfp_ring_new(16, sizeof(mfp_in_data));
+    setparam_double(disk, "seek", 0.0);
+    mfp_proc_process(disk);
+    if ((g_hash_table_lookup(disk->params, "seek") != NULL)
+        || (mfp_ring_count(ctxt->request_retired) != 1)) {
+        printf("FAIL (seek not retired)\n");
+        return 0;
+    }
+
+    /* deleting it mid-prefetch doesn't wait for the disk */
+    usleep(250000);
+    mfp_alloc_allocate(&staller, NULL, &stall_status);
+    setparam_double(disk, "seek", 0.0);
+    mfp_proc_process(disk);
+    gettimeofday(&start, NULL);
+    mfp_proc_destroy(disk);
+    gettimeofday(&end, NULL);
+    unlink(filename);
+
+    if ((end.tv_sec - start.tv_sec) * 1000000 + (end.tv_usec - start.tv_usec) > 10000) {
+        printf("FAIL (destroy waited for the prefetch)\n");
+        return 0;
+    }
+    usleep(250000);
+
+    printf("ok\n");
+    return 1;
+}
@@ -0,0 +1,138 @@
+#include <stdio.h>
+#include <string.h>
+#include <unistd.h>
+#include <sys/mman.h>
+
+#include "mfp_dsp.h"
+#include "builtin.h"
+
+#define OFFLINE_FRAMES 1000
+
+static int
+check_samples(float * samples, int start, int end, float value)
+{
+    int count;
+
+    for (count = start; count < end; count++) {
+        if (samples[count] != value) {
+            printf("FAIL ([%d] %f != %f)\n", count, samples[count], value);
+            return 0;
+        }
+    }
+    return 1;
+}
+
+int
+test_offline_render(void * data)
+{
+    mfp_procinfo * sigtype = g_hash_table_lookup(mfp_proc_registry, "sig~");
+    mfp_procinfo * intype = g_hash_table_lookup(mfp_proc_registry, "in~");
+    mfp_procinfo * outtype = g_hash_table_lookup(mfp_proc_registry, "out~");
+    mfp_context * ctxt = mfp_offline_startup(1, 1, 44100, 256);
+    mfp_processor * sig = mfp_proc_create(sigtype, 1, 1, ctxt);
+    mfp_processor * in = mfp_proc_create(intype, 0, 1, ctxt);
+    mfp_processor * out = mfp_proc_create(outtype, 1, 0, ctxt);
+    double * val = g_malloc(sizeof(double));
+    float samples[OFFLINE_FRAMES + 200];
+    unsigned char header[44];
+    char wavname[64], rawname[64];
+    FILE * f;
+    int blocks;
+
+    printf("   test_offline_render... ");
+
+    snprintf(wavname, 64, "/tmp/test_offline_%d.wav", getpid());
+    snprintf(rawname, 64, "/tmp/test_offline_%d.raw", getpid());
+
+    *val = 0.25;
+    mfp_proc_setparam(sig, g_strdup("value"), val);
+    sig->needs_config = 1;
+    mfp_proc_connect(sig, 0, out, 0);
+    mfp_dsp_schedule(ctxt);
+
+    /* sig~ alone into a WAV file, with a short last block */
+    blocks = mfp_offline_render(ctxt, NULL, wavname, OFFLINE_FRAMES);
+    f = fopen(wavname, "rb");
+    if ((blocks != 4) || (f == NULL)
+        || (fread(header, 1, 44, f) != 44)
+        || (fread(samples, sizeof(float), OFFLINE_FRAMES + 1, f) != OFFLINE_FRAMES)) {
+        printf("FAIL (wav render, %d blocks)\n", blocks);
+        return 0;
+    }
+    fclose(f);
+    if (memcmp(header, "RIFF", 4) || memcmp(header + 36, "data", 4)
+        || (*(int *)(header + 40) != OFFLINE_FRAMES * sizeof(float))) {
+        printf("FAIL (wav header)\n");
+        return 0;
+    }
+    if (!check_samples(samples, 0, OFFLINE_FRAMES, 0.25)) {
+        return 0;
+    }
+
+    /* that file as the input, mixed with sig~ again into a raw file.
+     * Past the end of the input there is only sig~ */
+    mfp_proc_connect(in, 0, out, 0);
+    mfp_dsp_schedule(ctxt);
+
+    blocks = mfp_offline_render(ctxt, wavname, rawname, OFFLINE_FRAMES + 200);
+    f = fopen(rawname, "rb");
+    if ((blocks != 5) || (f == NULL)
+        || (fread(samples, sizeof(float), OFFLINE_FRAMES + 201, f) != OFFLINE_FRAMES + 200)) {
+        printf("FAIL (raw render, %d blocks)\n", blocks);
+        return 0;
+    }
+    fclose(f);
+    unlink(wavname);
+    unlink(rawname);
+    shm_unlink(ctxt->clock_shm_id);
+
+    if (!check_samples(samples, 0, OFFLINE_FRAMES, 0.5)
+        || !check_samples(samples, OFFLINE_FRAMES, OFFLINE_FRAMES + 200, 0.25)) {
+        return 0;
+    }
+
+    if (mfp_offline_render(ctxt, "/nonexistent/input.wav", NULL, OFFLINE_FRAMES) != -1) {
+        printf("FAIL (missing input)\n");
+        return 0;
+    }
+
+    printf("ok\n");
+    return 1;
+}
+
+#define BENCH_CHAIN 32
+#define BENCH_SECONDS 10
+
+/* blocks/second for osc~ into a chain of *~ into out~, with no file */
+int
+benchmark_offline_render(void * data)
+{
+    mfp_procinfo * osctype = g_hash_table_lookup(mfp_proc_registry, "osc~");
+    mfp_procinfo * multype = g_hash_table_lookup(mfp_proc_registry, "*~");
+    mfp_procinfo * outtype = g_hash_table_lookup(mfp_proc_registry, "out~");
+    int sizes[] = { 64, 256, 1024 };
+    mfp_context * ctxt;
+    mfp_processor * last;
+    mfp_processor * next;
+    int blocks;
+    int count, size;
+
+    printf("\n");
+    for (size = 0; size < 3; size++) {
+        ctxt = mfp_offline_startup(0, 1, 44100, sizes[size]);
+        last = mfp_proc_create(osctype, 2, 1, ctxt);
+        for (count = 1; count < BENCH_CHAIN; count++) {
+            next = mfp_proc_create(multype, 2, 1, ctxt);
+            mfp_proc_connect(last, 0, next, 0);
+            last = next;
+        }
+        mfp_proc_connect(last, 0, mfp_proc_create(outtype, 1, 0, ctxt), 0);
+        mfp_dsp_schedule(ctxt);
+
+        blocks = mfp_offline_render(ctxt, NULL, NULL, BENCH_SECONDS * 44100);
+        printf("     blocksize %4d: %.0f blocks/s, %.0fx realtime\n", sizes[size],
+               blocks / ctxt->info.offline->elapsed,
+               BENCH_SECONDS / ctxt->info.offline->elapsed);
+    }
+    return 1;
+}
@@ -0,0 +1,143 @@
+#include <stdio.h>
+#include <string.h>
+#include <unistd.h>
+#include <fcntl.h>
+#include <semaphore.h>
+#include <sys/mman.h>
+
+#include "mfp_dsp.h"
+
+static int
+check_record(mfp_response_record * rec, int proc_id, int resp_type, int value_type,
+             double value)
+{
+    if ((rec->proc_id != proc_id) || (rec->resp_type != resp_type)
+        || (rec->value_type != value_type) || (rec->value != value)) {
+        printf("FAIL (record %d %d %d %f)\n", rec->proc_id, rec->resp_type,
+               rec->value_type, rec->value);
+        return 0;
+    }
+    return 1;
+}
+
+int
+test_response_ring(void * data)
+{
+    char shm_id[64];
+    char longstr[MFP_RESPONSE_STR_MAX + 2];
+    unsigned int overflows;
+    mfp_response_header * ring;
+    mfp_response_record * records;
+    sem_t * sem;
+    int posted;
+    int count;
+    int fd;
+
+    printf("   test_response_ring... ");
+
+    if (!mfp_response_init()) {
+        printf("FAIL (init)\n");
+        return 0;
+    }
+
+    /* nobody reading yet, so it's the socket's job */
+    if (mfp_response_push(1, 0, RESPONSE_FLOAT, 1.0, NULL) != -1) {
+        printf("FAIL (pushed with no reader)\n");
+        return 0;
+    }
+
+    /* mapped the way the Python side does */
+    snprintf(shm_id, 64, "/mfp_response_%05d", (int)getpid());
+    fd = shm_open(shm_id, O_RDWR, 0);
+    ring = mmap(NULL, sizeof(mfp_response_header)
+                + MFP_RESPONSE_RING_SIZE * sizeof(mfp_response_record),
+                PROT_READ|PROT_WRITE, MAP_SHARED, fd, 0);
+    close(fd);
+    sem = sem_open(shm_id, 0);
+    if ((ring == MAP_FAILED) || (sem == SEM_FAILED)
+        || (ring->capacity != MFP_RESPONSE_RING_SIZE)
+        || (ring->record_size != sizeof(mfp_response_record))) {
+        printf("FAIL (can't map %s)\n", shm_id);
+        return 0;
+    }
+    records = (mfp_response_record *)(ring + 1);
+    atomic_store(&ring->reader_pid, getpid());
+
+    /* only the first push into an empty ring rings the bell */
+    mfp_response_push(7, 0, RESPONSE_FLOAT, 0.5, NULL);
+    mfp_response_push(7, 1, RESPONSE_INT, 3, NULL);
+    mfp_response_push(8, 2, RESPONSE_STR, 0, "hello, world, this is 35 bytes long");
+    sem_getvalue(sem, &posted);
+    if ((posted != 1) || (ring->head != 5)) {
+        printf("FAIL (posted %d, head %u)\n", posted, ring->head);
+        return 0;
+    }
+    if (!check_record(records, 7, 0, RESPONSE_FLOAT, 0.5)
+        || !check_record(records + 1, 7, 1, RESPONSE_INT, 3)
+        || !check_record(records + 2, 8, 2, RESPONSE_STR, 0)) {
+        return 0;
+    }
+    if ((records[2].length != 35)
+        || memcmp(records + 3, "hello, world, this is 35 bytes long", 35)) {
+        printf("FAIL (string response)\n");
+        return 0;
+    }
+
+    /* the reader catches up, so the next push rings again */
+    sem_wait(sem);
+    atomic_store(&ring->tail, 5);
+    mfp_response_push(7, 0, RESPONSE_FLOAT, 0.25, NULL);
+    sem_getvalue(sem, &posted);
+    if (posted != 1) {
+        printf("FAIL (no post after catching up)\n");
+        return 0;
+    }
+
+    /* strings as long as an RPC message fit; longer ones go by RPC,
+     * not cut short */
+    memset(longstr, 'x', sizeof(longstr) - 1);
+    longstr[sizeof(longstr) - 1] = 0;
+    if (mfp_response_push(9, 0, RESPONSE_STR, 0, longstr) != -1) {
+        printf("FAIL (too long a string pushed)\n");
+        return 0;
+    }
+    longstr[MFP_RESPONSE_STR_MAX] = 0;
+    mfp_response_push(9, 0, RESPONSE_STR, 0, longstr);
+    if (records[6].length != MFP_RESPONSE_STR_MAX) {
+        printf("FAIL (long string length %d)\n", records[6].length);
+        return 0;
+    }
+
+    /* float responses are dropped short of the reserve... */
+    for (count = 0; count < MFP_RESPONSE_RING_SIZE; count++) {
+        mfp_response_push(7, 0, RESPONSE_FLOAT, count, NULL);
+    }
+    overflows = ring->overflows;
+    if ((ring->head - ring->tail != MFP_RESPONSE_RING_SIZE - MFP_RESPONSE_EVENT_RESERVE)
+        || (overflows == 0)) {
+        printf("FAIL (full ring, %u in it, %u dropped)\n", ring->head - ring->tail,
+               overflows);
+        return 0;
+    }
+
+    /* ...which events can still use, and past that they go by RPC */
+    for (count = 0; count < MFP_RESPONSE_EVENT_RESERVE; count++) {
+        if (mfp_response_push(7, 1, RESPONSE_INT, count, NULL) != 1) {
+            printf("FAIL (event %d not queued)\n", count);
+            return 0;
+        }
+    }
+    if ((mfp_response_push(7, 1, RESPONSE_INT, 0, NULL) != -1)
+        || (mfp_response_push(7, 2, RESPONSE_STR, 0, "eof") != -1)
+        || (ring->overflows != overflows)) {
+        printf("FAIL (event on a full ring)\n");
+        return 0;
+    }
+
+    sem_close(sem);
+    munmap(ring, sizeof(mfp_response_header)
+           + MFP_RESPONSE_RING_SIZE * sizeof(mfp_response_record));
+    mfp_response_finish();
+    printf("ok\n");
+    return 1;
+}
@@ -1,4 +1,11 @@
 #include <stdio.h>
+#include <string.h>
+#include <pthread.h>
+#include <sys/time.h>
+#include <sys/resource.h>
+#include <sys/mman.h>
+#include <fcntl.h>
+#include <unistd.h>
 
 #include "mfp_dsp.h"
 #include "builtin.h"
@@ -58,3 +65,631 @@ test_sched_y_conn(void * data)
 }
 
 
+
+int
+test_sched_incremental(void * data)
+{
+    mfp_context * ctxt = (mfp_context *)data;
+    mfp_procinfo * dactype = g_hash_table_lookup(mfp_proc_registry, "out~");
+    mfp_procinfo * osctype = g_hash_table_lookup(mfp_proc_registry, "osc~");
+
+    mfp_processor * osc = mfp_proc_create(osctype, 2, 1, ctxt);
+    mfp_processor * dac = mfp_proc_create(dactype, 1, 0, ctxt);
+    mfp_processor ** sp;
+    int osc_pos = -1, dac_pos = -1, pos = 0;
+
+    printf("   test_sched_incremental... ");
+
+    mfp_dsp_schedule(ctxt);
+
+    /* no scheduler thread in tests, so this builds and swaps in place */
+    mfp_proc_connect(osc, 0, dac, 0);
+    mfp_sched_request(ctxt);
+
+    for (sp = ctxt->schedule->procs; *sp != NULL; sp++, pos++) {
+        if (*sp == osc)
+            osc_pos = pos;
+        else if (*sp == dac)
+            dac_pos = pos;
+    }
+
+    if ((osc->depth != 0) || (dac->depth != 1) || (osc_pos < 0) || (dac_pos < osc_pos)) {
+        printf("FAIL (connect)\n");
+        return 0;
+    }
+
+    mfp_proc_disconnect(osc, 0, dac, 0);
+    mfp_sched_request(ctxt);
+
+    if ((osc->depth == 0) && (dac->depth == 0) && !ctxt->needs_reschedule) {
+        printf("ok\n");
+        return 1;
+    }
+    else {
+        printf("FAIL (disconnect)\n");
+        return 0;
+    }
+}
+
+int
+test_proc_autosleep(void * data)
+{
+    mfp_context * ctxt = (mfp_context *)data;
+    mfp_procinfo * sigtype = g_hash_table_lookup(mfp_proc_registry, "sig~");
+    mfp_procinfo * multype = g_hash_table_lookup(mfp_proc_registry, "*~");
+
+    mfp_processor * sig = mfp_proc_create(sigtype, 1, 1, ctxt);
+    mfp_processor * env = mfp_proc_create(multype, 2, 1, ctxt);
+    double * val = g_malloc(sizeof(double));
+    int count;
+
+    printf("   test_proc_autosleep... ");
+
+    mfp_proc_connect(sig, 0, env, 0);
+    mfp_dsp_schedule(ctxt);
+    mfp_proc_autosleep(env, 2);
+
+    /* sig~ is 0, so env's output is silent from the first block */
+    mfp_dsp_run(ctxt);
+    if (sig->sleeping || env->sleeping) {
+        printf("FAIL (asleep too soon)\n");
+        return 0;
+    }
+    mfp_dsp_run(ctxt);
+    if (!sig->sleeping || !env->sleeping) {
+        printf("FAIL (not asleep)\n");
+        return 0;
+    }
+
+    /* a request for any processor in the patch wakes all of it */
+    mfp_proc_wake(sig);
+    *val = 1.0;
+    mfp_proc_setparam(sig, g_strdup("value"), val);
+    mfp_proc_setparam(env, g_strdup("_sig_1"), g_memdup(val, sizeof(double)));
+    sig->needs_config = env->needs_config = 1;
+    for (count = 0; count < 4; count++) {
+        mfp_dsp_run(ctxt);
+    }
+
+    if (sig->sleeping || env->sleeping || (env->outlet_buf[0]->data[0] != 1.0)) {
+        printf("FAIL (not awake)\n");
+        return 0;
+    }
+
+    mfp_proc_autosleep(env, 0);
+    mfp_proc_disconnect(sig, 0, env, 0);
+    printf("ok\n");
+    return 1;
+}
+
+static void
+push_timed_setparam(mfp_processor * proc, char * param, double value, gint64 frame)
+{
+    mfp_in_data rd;
+
+    memset(&rd, 0, sizeof(mfp_in_data));
+    rd.reqtype = REQTYPE_SETPARAM;
+    rd.src_proc = proc->rpc_id;
+    rd.param_name = g_strdup(param);
+    rd.param_type = PARAMTYPE_FLT;
+    rd.param_value = g_malloc(sizeof(double));
+    *(double *)rd.param_value = value;
+    rd.frame = frame;
+    mfp_dsp_push_request(rd);
+}
+
+static int
+check_run(mfp_sample * samples, int start, int end, mfp_sample value)
+{
+    int count;
+
+    for (count = start; count < end; count++) {
+        if (samples[count] != value) {
+            printf("FAIL ([%d] %f != %f)\n", count, samples[count], value);
+            return 0;
+        }
+    }
+    return 1;
+}
+
+int
+test_timed_setparam(void * data)
+{
+    mfp_context * ctxt = (mfp_context *)data;
+    mfp_procinfo * multype = g_hash_table_lookup(mfp_proc_registry, "*~");
+    mfp_processor * mul = mfp_proc_create(multype, 2, 1, ctxt);
+    mfp_sample * out;
+    int blocksize = ctxt->blocksize;
+    gint64 start;
+
+    printf("   test_timed_setparam... ");
+
+    mfp_dsp_schedule(ctxt);
+    mfp_dsp_run(ctxt);
+    start = ctxt->frame_count;
+
+    /* *~ is sample accurate, so each value starts at its own frame,
+     * pushed in any order and across a block boundary */
+    push_timed_setparam(mul, "_sig_1", 3.0, start + 500);
+    push_timed_setparam(mul, "_sig_1", 2.0, start + 100);
+    push_timed_setparam(mul, "_sig_1", 5.0, start + blocksize + 10);
+
+    mfp_dsp_run(ctxt);
+    out = mul->outlet_buf[0]->data;
+    if (!check_run(out, 0, 100, 1.0) || !check_run(out, 100, 500, 2.0)
+        || !check_run(out, 500, blocksize, 3.0) || mul->outlet_buf[0]->is_const) {
+        return 0;
+    }
+
+    mfp_dsp_run(ctxt);
+    out = mul->outlet_buf[0]->data;
+    if (!check_run(out, 0, 10, 3.0) || !check_run(out, 10, blocksize, 5.0)
+        || (mul->timed_count != 0)) {
+        return 0;
+    }
+
+    /* a frame already past is the next block, like an untimed one */
+    push_timed_setparam(mul, "_sig_1", 7.0, start);
+    mfp_dsp_run(ctxt);
+    out = mul->outlet_buf[0]->data;
+    if (!check_run(out, 0, blocksize, 7.0) || !mul->outlet_buf[0]->is_const) {
+        return 0;
+    }
+
+    printf("ok\n");
+    return 1;
+}
+
+int
+test_request_routes(void * data)
+{
+    mfp_context * ctxt = (mfp_context *)data;
+    mfp_procinfo * multype = g_hash_table_lookup(mfp_proc_registry, "*~");
+    mfp_processor * mul = mfp_proc_alloc(multype, 2, 1, ctxt);
+    mfp_in_data rd;
+
+    printf("   test_request_routes... ");
+
+    /* created through the request queue, like one from the RPC side */
+    mfp_proc_init(mul, 9001, 0);
+    mfp_dsp_run(ctxt);
+    if (mfp_proc_lookup(9001) != mul) {
+        printf("FAIL (not created)\n");
+        return 0;
+    }
+
+    /* once it's deleted, later requests for it are dropped without
+     * looking at it, though the DSP thread hasn't freed it yet */
+    memset(&rd, 0, sizeof(mfp_in_data));
+    rd.reqtype = REQTYPE_DESTROY;
+    rd.src_proc = 9001;
+    mfp_dsp_push_request(rd);
+    push_timed_setparam(mul, "_sig_1", 3.0, 0);
+    if (mfp_ring_count(ctxt->requests) != 1) {
+        printf("FAIL (%d requests queued)\n", mfp_ring_count(ctxt->requests));
+        return 0;
+    }
+
+    mfp_dsp_run(ctxt);
+    if (mfp_proc_lookup(9001) != NULL) {
+        printf("FAIL (not destroyed)\n");
+        return 0;
+    }
+
+    printf("ok\n");
+    return 1;
+}
+
+static volatile int backpressure_done;
+
+static void *
+backpressure_consumer(void * data)
+{
+    mfp_context * ctxt = (mfp_context *)data;
+
+    while (!backpressure_done) {
+        usleep(2000);
+        mfp_dsp_handle_requests(ctxt);
+    }
+    mfp_dsp_handle_requests(ctxt);
+    return NULL;
+}
+
+int
+test_request_backpressure(void * data)
+{
+    mfp_context * ctxt = (mfp_context *)data;
+    mfp_procinfo * multype = g_hash_table_lookup(mfp_proc_registry, "*~");
+    mfp_processor * mul;
+    pthread_t consumer;
+    double * value;
+    int overflows;
+
+    printf("   test_request_backpressure... ");
+
+    /* a tiny ring, so most pushes find it full */
+    mfp_dsp_free_requests(ctxt);
+    ctxt->requests = mfp_ring_new(4, sizeof(mfp_in_data *));
+    mul = mfp_proc_create(multype, 2, 1, ctxt);
+
+    backpressure_done = 0;
+    pthread_create(&consumer, NULL, backpressure_consumer, ctxt);
+    for (int count = 1; count <= 64; count++) {
+        push_timed_setparam(mul, "_sig_1", (double)count, 0);
+    }
+    backpressure_done = 1;
+    pthread_join(consumer, NULL);
+
+    /* nothing dropped, and each full ring counted once however long
+     * the push waited */
+    value = g_hash_table_lookup(mul->params, "_sig_1");
+    overflows = atomic_load(&ctxt->requests->overflows);
+    if ((value == NULL) || (*value != 64.0)) {
+        printf("FAIL (last value %f)\n", value ? *value : -1.0);
+        return 0;
+    }
+    if ((overflows == 0) || (overflows > 64 - 4)) {
+        printf("FAIL (%d overflows)\n", overflows);
+        return 0;
+    }
+
+    printf("ok\n");
+    return 1;
+}
+
+int
+test_clock_page(void * data)
+{
+    mfp_context * ctxt = mfp_context_new(CTYPE_LV2);
+    mfp_clock_page * page;
+    int fd;
+
+    printf("   test_clock_page... ");
+
+    ctxt->blocksize = 256;
+    ctxt->samplerate = 48000;
+    if (ctxt->clock_shm_id[0] == 0) {
+        printf("FAIL (clock page isn't shared)\n");
+        return 0;
+    }
+
+    /* mapped the way another process would see it */
+    fd = shm_open(ctxt->clock_shm_id, O_RDONLY, 0);
+    page = mmap(NULL, sizeof(mfp_clock_page), PROT_READ, MAP_SHARED, fd, 0);
+    close(fd);
+    if (page == MAP_FAILED) {
+        printf("FAIL (can't map %s)\n", ctxt->clock_shm_id);
+        return 0;
+    }
+
+    mfp_dsp_run(ctxt);
+    mfp_dsp_run(ctxt);
+    mfp_dsp_run(ctxt);
+
+    /* the start of the third block */
+    if ((page->frame != 512) || (page->samplerate != 48000) || (page->blocksize != 256)
+        || (page->seq != 6) || (page->usec == 0) || (page->usec > g_get_monotonic_time())) {
+        printf("FAIL (frame %ld rate %d seq %u)\n", (long)page->frame,
+               page->samplerate, page->seq);
+        return 0;
+    }
+
+    munmap(page, sizeof(mfp_clock_page));
+    shm_unlink(ctxt->clock_shm_id);
+    printf("ok\n");
+    return 1;
+}
+
+int
+test_sched_shared_buffers(void * data)
+{
+    mfp_context * ctxt = (mfp_context *)data;
+    mfp_procinfo * osctype = g_hash_table_lookup(mfp_proc_registry, "osc~");
+    mfp_procinfo * multype = g_hash_table_lookup(mfp_proc_registry, "*~");
+    mfp_procinfo * inlettype = g_hash_table_lookup(mfp_proc_registry, "inlet~");
+    mfp_processor * osc = mfp_proc_create(osctype, 2, 1, ctxt);
+    mfp_processor * ref = mfp_proc_create(osctype, 2, 1, ctxt);
+    mfp_processor * hold = mfp_proc_create(inlettype, 1, 1, ctxt);
+    mfp_processor * last = osc;
+    mfp_processor * next;
+    mfp_buffer_stats * stats = &ctxt->buf_stats;
+    double * freq;
+    int count;
+
+    printf("   test_sched_shared_buffers... ");
+
+    for (count = 0; count < 16; count++) {
+        next = mfp_proc_create(multype, 2, 1, ctxt);
+        mfp_proc_connect(last, 0, next, 0);
+        last = next;
+    }
+
+    /* the same oscillator again, copied into a buffer nobody shares */
+    mfp_proc_connect(ref, 0, hold, 0);
+    freq = g_malloc(sizeof(double));
+    *freq = 1000.0;
+    mfp_proc_setparam(osc, g_strdup("_sig_1"), freq);
+    mfp_proc_setparam(ref, g_strdup("_sig_1"), g_memdup(freq, sizeof(double)));
+    osc->needs_config = ref->needs_config = 1;
+
+    mfp_dsp_schedule(ctxt);
+    mfp_dsp_run(ctxt);
+    mfp_dsp_run(ctxt);
+
+    if ((stats->pool + stats->own) * 4 > stats->unshared) {
+        printf("FAIL (%d pool + %d own of %d)\n", stats->pool, stats->own, stats->unshared);
+        return 0;
+    }
+    if (hold->outlet_buf[0] != hold->outlet_buf_own[0]) {
+        printf("FAIL (inlet~ outlet shared)\n");
+        return 0;
+    }
+    for (count = 0; count < ctxt->blocksize; count++) {
+        if (last->outlet_buf[0]->data[count] != hold->outlet_buf[0]->data[count]) {
+            printf("FAIL ([%d] %f != %f)\n", count, last->outlet_buf[0]->data[count],
+                   hold->outlet_buf[0]->data[count]);
+            return 0;
+        }
+    }
+    if (hold->outlet_buf[0]->data[ctxt->blocksize-1] == 0.0) {
+        printf("FAIL (no signal)\n");
+        return 0;
+    }
+
+    printf("ok\n");
+    return 1;
+}
+
+int
+test_sched_level_snapshot(void * data)
+{
+    mfp_context * ctxt = (mfp_context *)data;
+    mfp_procinfo * osctype = g_hash_table_lookup(mfp_proc_registry, "osc~");
+    mfp_procinfo * multype = g_hash_table_lookup(mfp_proc_registry, "*~");
+    mfp_processor * osc_1 = mfp_proc_create(osctype, 2, 1, ctxt);
+    mfp_processor * osc_2 = mfp_proc_create(osctype, 2, 1, ctxt);
+    mfp_processor * mul = mfp_proc_create(multype, 2, 1, ctxt);
+
+    printf("   test_sched_level_snapshot... ");
+
+    /* test_SETUP's context doesn't come from mfp_context_new */
+    ctxt->level_stats = g_malloc0(MFP_MAX_LEVEL_STATS * sizeof(mfp_level_stats));
+
+    mfp_proc_connect(osc_1, 0, mul, 0);
+    mfp_proc_connect(osc_2, 0, mul, 1);
+    mfp_dsp_schedule(ctxt);
+
+    /* a full reschedule on the scheduler thread starts like this */
+    osc_1->depth = osc_2->depth = mul->depth = -1;
+    mfp_pool_run(ctxt);
+
+    if ((ctxt->num_level_stats != 2)
+        || (ctxt->level_stats[0].depth != 0) || (ctxt->level_stats[0].procs != 2)
+        || (ctxt->level_stats[1].depth != 1) || (ctxt->level_stats[1].procs != 1)) {
+        printf("FAIL (%d levels)\n", ctxt->num_level_stats);
+        return 0;
+    }
+
+    printf("ok\n");
+    return 1;
+}
+
+#define POOL_TEST_WIDTH 8
+#define POOL_TEST_LEVELS 16
+#define POOL_TEST_BLOCKS 2000
+
+typedef struct {
+    atomic_int calls;
+    atomic_int running;
+    int sleep_usec;
+} pool_test_data;
+
+static atomic_int pool_test_overlaps;
+
+static int
+pool_test_process(mfp_processor * proc)
+{
+    pool_test_data * d = (pool_test_data *)proc->data;
+
+    if (atomic_exchange(&d->running, 1)) {
+        atomic_fetch_add(&pool_test_overlaps, 1);
+    }
+    atomic_fetch_add(&d->calls, 1);
+    if (d->sleep_usec > 0) {
+        usleep(d->sleep_usec);
+    }
+    atomic_store(&d->running, 0);
+    return 0;
+}
+
+/* a run order of levels procs deep and width wide, of processors that
+ * only count how often they run */
+static mfp_run_order *
+pool_test_order(mfp_context * ctxt, mfp_procinfo * info, int width, int levels,
+                int sleep_usec)
+{
+    int len = width * levels;
+    mfp_run_order * order = g_malloc0(sizeof(mfp_run_order)
+                                      + (len + 1) * sizeof(mfp_processor *));
+    mfp_processor * p;
+    pool_test_data * d;
+    int count;
+
+    order->len = len;
+    order->depths = g_malloc0(len * sizeof(int));
+    for (count = 0; count < len; count++) {
+        p = mfp_proc_alloc(info, 0, 0, ctxt);
+        d = g_malloc0(sizeof(pool_test_data));
+        d->sleep_usec = sleep_usec;
+        p->data = d;
+        p->active = 1;
+        order->procs[count] = p;
+        order->depths[count] = count / width;
+    }
+    return order;
+}
+
+static double
+cpu_seconds(void)
+{
+    struct rusage usage;
+
+    getrusage(RUSAGE_SELF, &usage);
+    return usage.ru_utime.tv_sec + usage.ru_utime.tv_usec / 1000000.0
+        + usage.ru_stime.tv_sec + usage.ru_stime.tv_usec / 1000000.0;
+}
+
+int
+test_pool_claims(void * data)
+{
+    mfp_context * ctxt = (mfp_context *)data;
+    mfp_procinfo info = { .name = "pool_test", .process = pool_test_process };
+    mfp_run_order * order;
+    mfp_run_order * saved = ctxt->schedule;
+    struct timeval start, end;
+    double cpu, wall;
+    int count;
+
+    printf("   test_pool_claims... ");
+
+    info.params = g_hash_table_new(g_str_hash, g_str_equal);
+    mfp_pool_init(4, 0);
+
+    /* every processor runs exactly once a block, never on two threads
+     * at once, however the levels are handed over */
+    order = pool_test_order(ctxt, &info, POOL_TEST_WIDTH, POOL_TEST_LEVELS, 0);
+    ctxt->schedule = order;
+    for (count = 0; count < POOL_TEST_BLOCKS; count++) {
+        mfp_pool_run(ctxt);
+    }
+    for (count = 0; count < order->len; count++) {
+        int calls = atomic_load(&((pool_test_data *)order->procs[count]->data)->calls);
+        if (calls != POOL_TEST_BLOCKS) {
+            printf("FAIL (proc %d ran %d times)\n", count, calls);
+            ctxt->schedule = saved;
+            mfp_pool_finish();
+            return 0;
+        }
+    }
+    if (atomic_load(&pool_test_overlaps) != 0) {
+        printf("FAIL (%d overlapping runs)\n", atomic_load(&pool_test_overlaps));
+        ctxt->schedule = saved;
+        mfp_pool_finish();
+        return 0;
+    }
+
+    /* serial levels leave the workers asleep, not spinning */
+    order = pool_test_order(ctxt, &info, 1, POOL_TEST_LEVELS, 1000);
+    ctxt->schedule = order;
+    cpu = cpu_seconds();
+    gettimeofday(&start, NULL);
+    for (count = 0; count < 10; count++) {
+        mfp_pool_run(ctxt);
+    }
+    gettimeofday(&end, NULL);
+    cpu = cpu_seconds() - cpu;
+    wall = (end.tv_sec - start.tv_sec) + (end.tv_usec - start.tv_usec) / 1000000.0;
+
+    ctxt->schedule = saved;
+    mfp_pool_finish();
+
+    if (cpu > wall / 2) {
+        printf("FAIL (%.3f sec CPU in %.3f sec of serial levels)\n", cpu, wall);
+        return 0;
+    }
+
+    printf("ok\n");
+    return 1;
+}
+
+#define BENCH_CHAIN 32
+#define BENCH_BLOCKS 1000
+
+static mfp_context *
+bench_context(int blocksize)
+{
+    mfp_procinfo * osctype = g_hash_table_lookup(mfp_proc_registry, "osc~");
+    mfp_procinfo * multype = g_hash_table_lookup(mfp_proc_registry, "*~");
+    mfp_context * ctxt = mfp_context_new(CTYPE_LV2);
+    mfp_processor * last;
+    mfp_processor * next;
+    int count;
+
+    ctxt->blocksize = blocksize;
+    ctxt->samplerate = 44100;
+
+    /* osc~ into a chain of *~ */
+    last = mfp_proc_create(osctype, 2, 1, ctxt);
+    for (count = 1; count < BENCH_CHAIN; count++) {
+        next = mfp_proc_create(multype, 2, 1, ctxt);
+        mfp_proc_connect(last, 0, next, 0);
+        last = next;
+    }
+    mfp_dsp_schedule(ctxt);
+    return ctxt;
+}
+
+static void *
+bench_context_thread(void * data)
+{
+    mfp_context * ctxt = (mfp_context *)data;
+    int count;
+
+    for (count = 0; count < BENCH_BLOCKS; count++) {
+        mfp_dsp_run(ctxt);
+    }
+    return NULL;
+}
+
+/* every context in its own thread, the way separate JACK clients or
+ * LV2 instances are run by their hosts */
+static double
+bench_contexts(int num_contexts, int blocksize)
+{
+    struct timeval start, end;
+    mfp_context ** contexts = g_malloc0(num_contexts * sizeof(mfp_context *));
+    pthread_t * threads = g_malloc0(num_contexts * sizeof(pthread_t));
+    int count;
+
+    for (count = 0; count < num_contexts; count++) {
+        contexts[count] = bench_context(blocksize);
+    }
+
+    gettimeofday(&start, NULL);
+    for (count = 0; count < num_contexts; count++) {
+        pthread_create(&threads[count], NULL, bench_context_thread, contexts[count]);
+    }
+    for (count = 0; count < num_contexts; count++) {
+        pthread_join(threads[count], NULL);
+    }
+    gettimeofday(&end, NULL);
+
+    g_free(threads);
+    g_free(contexts);
+
+    return ((end.tv_sec + end.tv_usec/1000000.0)
+            - (start.tv_sec + start.tv_usec/1000000.0)) / BENCH_BLOCKS;
+}
+
+int
+benchmark_sched_contexts(void * data)
+{
+    int blocksize = ((mfp_context *)data)->blocksize;
+    int sizes[] = { 1, 4, 16 };
+    int count;
+    double per_block;
+    mfp_context * ctxt = bench_context(blocksize);
+
+    printf("\n     %d procs: %d buffers (%d bytes) unshared, %d (%d bytes) shared\n",
+           BENCH_CHAIN, ctxt->buf_stats.unshared,
+           ctxt->buf_stats.unshared * blocksize * (int)sizeof(mfp_sample),
+           ctxt->buf_stats.pool + ctxt->buf_stats.own,
+           (ctxt->buf_stats.pool + ctxt->buf_stats.own) * blocksize * (int)sizeof(mfp_sample));
+    for (count = 0; count < 3; count++) {
+        per_block = bench_contexts(sizes[count], blocksize);
+        printf("     %2d contexts x %d procs: %.1f usec/block (%.1f usec/block/context)\n",
+               sizes[count], BENCH_CHAIN, per_block * 1000000.0,
+               per_block * 1000000.0 / sizes[count]);
+    }
+    return 1;
+}